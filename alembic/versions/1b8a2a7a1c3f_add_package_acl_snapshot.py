@@ -0,0 +1,69 @@
+"""Add the PackageAclSnapshot table
+
+Revision ID: 1b8a2a7a1c3f
+Revises: 7fa622e911d
+Create Date: 2014-07-08 10:12:45.203198
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b8a2a7a1c3f'
+down_revision = '7fa622e911d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the PackageAclSnapshot table and fill it. """
+    op.create_table(
+        'PackageAclSnapshot',
+        sa.Column('id', sa.Integer, nullable=False, primary_key=True),
+        sa.Column(
+            'packagelisting_id',
+            sa.Integer,
+            sa.ForeignKey(
+                'PackageListing.id', ondelete='CASCADE',
+                onupdate='CASCADE'),
+            nullable=False,
+            index=True),
+        sa.Column('package_id', sa.Integer, nullable=False, index=True),
+        sa.Column('package_name', sa.Text, nullable=False, index=True),
+        sa.Column('package_summary', sa.Text, nullable=False),
+        sa.Column('package_status', sa.String(50), nullable=False),
+        sa.Column('point_of_contact', sa.Text, nullable=False),
+        sa.Column('pkglist_status', sa.String(50), nullable=False),
+        sa.Column('collection_id', sa.Integer, nullable=False, index=True),
+        sa.Column('collection_name', sa.Text, nullable=False),
+        sa.Column('collection_version', sa.Text, nullable=False),
+        sa.Column('collection_status', sa.String(50), nullable=False),
+        sa.Column('branchname', sa.String(32), nullable=False),
+        sa.Column('fas_name', sa.String(32), nullable=True),
+        sa.Column('acl', sa.String(50), nullable=True),
+        sa.Column('acl_status', sa.String(50), nullable=True),
+    )
+
+    op.execute("""
+INSERT INTO "PackageAclSnapshot" (
+    packagelisting_id, package_id, package_name, package_summary,
+    package_status, point_of_contact, pkglist_status, collection_id,
+    collection_name, collection_version, collection_status, branchname,
+    fas_name, acl, acl_status)
+SELECT
+    "PackageListing".id, "Package".id, "Package".name, "Package".summary,
+    "Package".status, "PackageListing".point_of_contact,
+    "PackageListing".status, "Collection".id, "Collection".name,
+    "Collection".version, "Collection".status, "Collection".branchname,
+    "PackageListingAcl".fas_name, "PackageListingAcl".acl,
+    "PackageListingAcl".status
+FROM "PackageListing"
+JOIN "Package" ON "Package".id = "PackageListing".package_id
+JOIN "Collection" ON "Collection".id = "PackageListing".collection_id
+LEFT OUTER JOIN "PackageListingAcl"
+    ON "PackageListingAcl".packagelisting_id = "PackageListing".id;
+   """)
+
+
+def downgrade():
+    """ Drop the PackageAclSnapshot table. """
+    op.drop_table('PackageAclSnapshot')
@@ -0,0 +1,30 @@
+"""Add the Generation table
+
+Revision ID: 3c5e0b3d3f02
+Revises: 1b8a2a7a1c3f
+Create Date: 2014-07-10 15:40:21.563077
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c5e0b3d3f02'
+down_revision = '1b8a2a7a1c3f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the Generation table holding the ``acls`` counter. """
+    op.create_table(
+        'Generation',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('value', sa.Integer, nullable=False, default=0),
+    )
+    op.execute(
+        """INSERT INTO "Generation" (name, value) VALUES ('acls', 0);""")
+
+
+def downgrade():
+    """ Drop the Generation table. """
+    op.drop_table('Generation')
@@ -0,0 +1,70 @@
+"""Add the CollectionStats and PackagerStats tables
+
+Revision ID: 4d2f8c61a9e7
+Revises: 3c5e0b3d3f02
+Create Date: 2014-07-15 09:27:12.804511
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4d2f8c61a9e7'
+down_revision = '3c5e0b3d3f02'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the CollectionStats and PackagerStats tables and fill them
+    from the PackageAclSnapshot table. """
+    op.create_table(
+        'CollectionStats',
+        sa.Column(
+            'collection_id',
+            sa.Integer,
+            sa.ForeignKey(
+                'Collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+            primary_key=True),
+        sa.Column('packages', sa.Integer, nullable=False, default=0),
+    )
+    op.create_table(
+        'PackagerStats',
+        sa.Column('fas_name', sa.String(255), primary_key=True),
+        sa.Column('kind', sa.String(10), primary_key=True),
+        sa.Column('packages', sa.Integer, nullable=False, default=0),
+    )
+
+    op.execute("""
+INSERT INTO "CollectionStats" (collection_id, packages)
+SELECT collection_id, COUNT(DISTINCT package_id)
+FROM "PackageAclSnapshot"
+WHERE package_status = 'Approved'
+    AND pkglist_status = 'Approved'
+GROUP BY collection_id;
+   """)
+    op.execute("""
+INSERT INTO "PackagerStats" (fas_name, kind, packages)
+SELECT fas_name, 'commit', COUNT(DISTINCT package_id)
+FROM "PackageAclSnapshot"
+WHERE acl = 'commit'
+    AND acl_status = 'Approved'
+    AND package_status = 'Approved'
+    AND pkglist_status = 'Approved'
+    AND collection_status != 'EOL'
+GROUP BY fas_name;
+   """)
+    op.execute("""
+INSERT INTO "PackagerStats" (fas_name, kind, packages)
+SELECT point_of_contact, 'poc', COUNT(DISTINCT package_id)
+FROM "PackageAclSnapshot"
+WHERE package_status = 'Approved'
+    AND pkglist_status = 'Approved'
+    AND collection_status != 'EOL'
+GROUP BY point_of_contact;
+   """)
+
+
+def downgrade():
+    """ Drop the CollectionStats and PackagerStats tables. """
+    op.drop_table('PackagerStats')
+    op.drop_table('CollectionStats')
@@ -0,0 +1,89 @@
+"""Add the indexes used to search the packages
+
+Revision ID: 5a1c9e3f7b20
+Revises: 4d2f8c61a9e7
+Create Date: 2014-07-17 14:02:36.118342
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a1c9e3f7b20'
+down_revision = '4d2f8c61a9e7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def _has_fts5(bind):
+    """ Return whether SQLite supports the FTS5 table, as checked by
+    ``pkgdb2.lib.model`` which otherwise falls back to LIKE queries. """
+    # The trigram tokenizer appeared in SQLite 3.34
+    return bind.dialect.dbapi.sqlite_version_info >= (3, 34, 0) \
+        and bool(bind.execute(
+            "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+        ).scalar())
+
+
+def upgrade():
+    """ Create the trigram indexes on the name and summary of the packages
+    on PostgreSQL, the FTS5 table and its triggers on SQLite if it
+    supports them. """
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX "Package_name_trgm_idx" ON "Package" '
+            'USING gin (name gin_trgm_ops)')
+        op.execute(
+            'CREATE INDEX "Package_summary_trgm_idx" ON "Package" '
+            'USING gin (summary gin_trgm_ops)')
+
+    elif dialect == 'sqlite' and _has_fts5(bind):
+        op.execute("""
+CREATE VIRTUAL TABLE "PackageSearch" USING fts5(
+    name, summary, description,
+    content="Package", content_rowid="id", tokenize="trigram");
+   """)
+        op.execute("""
+CREATE TRIGGER "Package_search_insert" AFTER INSERT ON "Package" BEGIN
+    INSERT INTO "PackageSearch" (rowid, name, summary, description)
+    VALUES (new.id, new.name, new.summary, new.description);
+END;
+   """)
+        op.execute("""
+CREATE TRIGGER "Package_search_delete" AFTER DELETE ON "Package" BEGIN
+    INSERT INTO "PackageSearch" (
+        "PackageSearch", rowid, name, summary, description)
+    VALUES ('delete', old.id, old.name, old.summary, old.description);
+END;
+   """)
+        op.execute("""
+CREATE TRIGGER "Package_search_update" AFTER UPDATE ON "Package" BEGIN
+    INSERT INTO "PackageSearch" (
+        "PackageSearch", rowid, name, summary, description)
+    VALUES ('delete', old.id, old.name, old.summary, old.description);
+    INSERT INTO "PackageSearch" (rowid, name, summary, description)
+    VALUES (new.id, new.name, new.summary, new.description);
+END;
+   """)
+        op.execute(
+            'INSERT INTO "PackageSearch" ("PackageSearch") '
+            'VALUES (\'rebuild\')')
+
+
+def downgrade():
+    """ Drop the search indexes. """
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX "Package_summary_trgm_idx"')
+        op.execute('DROP INDEX "Package_name_trgm_idx"')
+
+    elif dialect == 'sqlite':
+        # Nothing was created if SQLite did not support it
+        op.execute('DROP TRIGGER IF EXISTS "Package_search_update"')
+        op.execute('DROP TRIGGER IF EXISTS "Package_search_delete"')
+        op.execute('DROP TRIGGER IF EXISTS "Package_search_insert"')
+        op.execute('DROP TABLE IF EXISTS "PackageSearch"')
@@ -0,0 +1,36 @@
+"""Add the Outbox table
+
+Revision ID: 6b3d1f0e2c84
+Revises: 5a1c9e3f7b20
+Create Date: 2014-07-22 10:12:48.310275
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6b3d1f0e2c84'
+down_revision = '5a1c9e3f7b20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the Outbox table queuing the notifications. """
+    op.create_table(
+        'Outbox',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('kind', sa.String(10), nullable=False),
+        sa.Column('payload', sa.Text, nullable=False),
+        sa.Column('created', sa.DateTime, nullable=False),
+        sa.Column('attempts', sa.Integer, nullable=False, default=0),
+        sa.Column('next_attempt', sa.DateTime, nullable=False),
+        sa.Column('last_error', sa.Text, nullable=True),
+    )
+    op.create_index(
+        'ix_Outbox_next_attempt', 'Outbox', ['next_attempt'])
+
+
+def downgrade():
+    """ Drop the Outbox table. """
+    op.drop_index('ix_Outbox_next_attempt', table_name='Outbox')
+    op.drop_table('Outbox')
@@ -0,0 +1,37 @@
+"""Add the BugzillaJob table
+
+Revision ID: 7e2a5c9d1b36
+Revises: 6b3d1f0e2c84
+Create Date: 2014-07-24 14:37:05.118420
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7e2a5c9d1b36'
+down_revision = '6b3d1f0e2c84'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the BugzillaJob table queuing the bugzilla reassignments. """
+    op.create_table(
+        'BugzillaJob',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('status', sa.String(10), nullable=False,
+                  default='Pending'),
+        sa.Column('payload', sa.Text, nullable=False),
+        sa.Column('created', sa.DateTime, nullable=False),
+        sa.Column('finished', sa.DateTime, nullable=True),
+        sa.Column('bugs', sa.Integer, nullable=False, default=0),
+        sa.Column('error', sa.Text, nullable=True),
+    )
+    op.create_index(
+        'ix_BugzillaJob_status', 'BugzillaJob', ['status'])
+
+
+def downgrade():
+    """ Drop the BugzillaJob table. """
+    op.drop_index('ix_BugzillaJob_status', table_name='BugzillaJob')
+    op.drop_table('BugzillaJob')
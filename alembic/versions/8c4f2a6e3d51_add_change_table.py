@@ -0,0 +1,40 @@
+"""Add the Change table
+
+Revision ID: 8c4f2a6e3d51
+Revises: 7e2a5c9d1b36
+Create Date: 2014-07-28 13:02:47.542139
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c4f2a6e3d51'
+down_revision = '7e2a5c9d1b36'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """ Create the Change table sequencing the changes for /api/changes/.
+    """
+    op.create_table(
+        'Change',
+        sa.Column('seq', sa.Integer, primary_key=True),
+        sa.Column('topic', sa.String(50), nullable=False),
+        sa.Column('change_time', sa.DateTime, nullable=False),
+        sa.Column('agent', sa.String(32), nullable=False),
+        sa.Column('package', sa.Text, nullable=True),
+        sa.Column('branch', sa.String(32), nullable=True),
+        sa.Column('acl', sa.String(50), nullable=True),
+        sa.Column('fas_name', sa.Text, nullable=True),
+        sa.Column('old_value', sa.Text, nullable=True),
+        sa.Column('new_value', sa.Text, nullable=True),
+    )
+    op.create_index(
+        'ix_Change_package', 'Change', ['package'])
+
+
+def downgrade():
+    """ Drop the Change table. """
+    op.drop_index('ix_Change_package', table_name='Change')
+    op.drop_table('Change')
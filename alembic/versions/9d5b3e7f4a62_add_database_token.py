@@ -0,0 +1,28 @@
+"""Add the database token to the Generation table
+
+Revision ID: 9d5b3e7f4a62
+Revises: 8c4f2a6e3d51
+Create Date: 2014-07-30 10:12:05.318452
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d5b3e7f4a62'
+down_revision = '8c4f2a6e3d51'
+
+import random
+
+from alembic import op
+
+
+def upgrade():
+    """ Add the ``database`` counter, the random token telling this
+    database apart from the others sharing the same cache. """
+    op.execute(
+        """INSERT INTO "Generation" (name, value) VALUES ('database', %s);"""
+        % random.randint(1, 2 ** 31 - 1))
+
+
+def downgrade():
+    """ Remove the ``database`` counter. """
+    op.execute("""DELETE FROM "Generation" WHERE name = 'database';""")
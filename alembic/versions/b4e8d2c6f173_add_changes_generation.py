@@ -0,0 +1,26 @@
+"""Add the changes counter to the Generation table
+
+Revision ID: b4e8d2c6f173
+Revises: 9d5b3e7f4a62
+Create Date: 2014-07-31 09:41:27.604135
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8d2c6f173'
+down_revision = '9d5b3e7f4a62'
+
+from alembic import op
+
+
+def upgrade():
+    """ Add the ``changes`` counter, giving their sequence number to the
+    changes recorded from now on, starting after the last one. """
+    op.execute(
+        """INSERT INTO "Generation" (name, value) """
+        """SELECT 'changes', COALESCE(MAX(seq), 0) FROM "Change";""")
+
+
+def downgrade():
+    """ Remove the ``changes`` counter. """
+    op.execute("""DELETE FROM "Generation" WHERE name = 'changes';""")
@@ -23,6 +23,7 @@
 Top level of the pkgdb Flask application.
 '''
 
+import hashlib
 import logging
 import logging.handlers
 import os
@@ -56,8 +57,19 @@ if APP.config.get('LOGGER_CONFIG_FILE') \
 # Set up FAS extension
 FAS = FAS(APP)
 
+
+def _mangle_key(key):
+    """ Hash the cache keys, they are built from the arguments of the
+    cached functions and may contain characters memcached does not accept
+    (spaces, non-ascii...).
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
 # Initialize the cache.
-CACHE = dogpile.cache.make_region().configure(
+CACHE = dogpile.cache.make_region(key_mangler=_mangle_key).configure(
     APP.config.get('PKGDB2_CACHE_BACKEND', 'dogpile.cache.memory'),
     **APP.config.get('PKGDB2_CACHE_KWARGS', {})
 )
@@ -77,10 +89,25 @@ LOG = APP.logger
 
 import pkgdb2.lib as pkgdblib
 import pkgdb2.proxy
+import pkgdb2.query_stats
+import pkgdb2.replicas
 
 APP.wsgi_app = pkgdb2.proxy.ReverseProxied(APP.wsgi_app)
 
-SESSION = pkgdblib.create_session(APP.config['DB_URL'])
+SESSION = pkgdblib.create_session(
+    APP.config['DB_URL'],
+    pool_recycle=APP.config.get('DB_POOL_RECYCLE', 3600),
+    pool_size=APP.config.get('DB_POOL_SIZE'),
+    max_overflow=APP.config.get('DB_MAX_OVERFLOW'),
+    pool_timeout=APP.config.get('DB_POOL_TIMEOUT'),
+    pre_ping=APP.config.get('DB_POOL_PRE_PING', False),
+    statement_timeout=APP.config.get('DB_STATEMENT_TIMEOUT'),
+    replica_urls=APP.config.get('DB_REPLICA_URLS'),
+    router=pkgdb2.replicas.RequestRouter(APP, CACHE),
+)
+
+if APP.config.get('PKGDB2_QUERY_STATS', True):
+    pkgdb2.query_stats.setup(APP)
 
 
 def is_authenticated():
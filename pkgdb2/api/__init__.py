@@ -28,24 +28,175 @@ import flask
 
 API = flask.Blueprint('api_ns', __name__, url_prefix='/api')
 
+import pkgdb2.lib as pkgdblib
 from pkgdb2 import __version__, __api_version__, APP
 from pkgdb2.doc_utils import load_doc
 
 
-def get_limit():
-    """ Retrieve the limit used to limit the output retrieved. """
-    limit = flask.request.args.get('limit', 250)
+def get_limit(default=250, maximum=500, stream=False):
+    """ Retrieve the limit used to limit the output retrieved.
+
+    :kwarg default: the limit used if none or an invalid one is provided.
+    :kwarg maximum: the highest limit accepted.
+    :kwarg stream: a boolean to not cap the limit to ``maximum``, for the
+        outputs streamed (see :func:`stream_json`) since the memory used
+        then does not depend on the number of results returned. Defaults
+        to False.
+
+    """
+    limit = flask.request.args.get('limit', default)
     try:
         limit = abs(int(limit))
     except ValueError:
-        limit = 250
+        limit = default
 
-    if limit > 500:
-        limit = 500
+    if limit > maximum and not stream:
+        limit = maximum
 
     return limit
 
 
+def get_cursor():
+    """ Retrieve the position after which to return the results when the
+    cursor-based pagination is requested, via the ``next`` argument.
+
+    :returns: ``False`` if the ``next`` argument is not provided, ``None``
+        if it is empty (first page) or the list of values encoded in it.
+    :raises pkgdb2.lib.PkgdbException: The ``next`` argument is not a
+        token returned by a previous page.
+
+    """
+    if 'next' not in flask.request.args:
+        return False
+    token = flask.request.args.get('next')
+    if not token:
+        return None
+    return pkgdblib.decode_cursor(token)
+
+
+def want_total():
+    """ Return whether the total number of results was requested when
+    using the cursor-based pagination, via the ``total`` argument.
+    """
+    total = flask.request.args.get('total', False)
+    return str(total).lower() in ['1', 'true']
+
+
+def get_fields():
+    """ Retrieve the fields of the results requested via the ``fields``
+    argument, either separated by commas or as several arguments.
+
+    :returns: ``None`` if the argument is not provided, all the fields are
+        then returned, or the list of the fields requested.
+
+    """
+    if 'fields' not in flask.request.args:
+        return None
+    fields = []
+    for value in flask.request.args.getlist('fields'):
+        fields.extend(
+            field.strip() for field in value.split(',') if field.strip())
+    return fields
+
+
+def select_fields(data, fields):
+    """ Return the specified fields of a result.
+
+    :arg data: the dictionary representing the result.
+    :arg fields: the list of the keys to return, ``<key>.<subkey>``
+        returns only the ``subkey`` of the dictionary under ``key``, or
+        ``None`` to return all the keys.
+
+    """
+    if fields is None:
+        return data
+
+    output = {}
+    for field in fields:
+        key, _, subkey = field.partition('.')
+        if key not in data:
+            continue
+        if not subkey:
+            output[key] = data[key]
+        elif isinstance(data[key], dict) and subkey in data[key]:
+            if not isinstance(output.get(key), dict):
+                output[key] = {}
+            elif output[key] is data[key]:
+                # The whole dictionary was requested already
+                continue
+            output[key][subkey] = data[key][subkey]
+    return output
+
+
+def is_stream():
+    """ Return whether the output was requested as a stream, using the
+    ``stream`` argument of the request.
+    """
+    stream = flask.request.args.get('stream', False)
+    return str(stream).lower() in ['1', 'true']
+
+
+def stream_json(output, key, items, mapping=False):
+    """ Return a response streaming the provided JSON.
+
+    The response has the same shape as ``flask.jsonify`` would produce,
+    but the entries are serialized one at a time while the ``items``
+    iterable is consumed instead of being built in memory first.
+
+    :arg output: a dictionary containing the fields of the JSON object
+        returned before the streamed entries.
+    :arg key: the key under which the streamed entries are returned.
+    :arg items: an iterable of entries to serialize.
+    :kwarg mapping: a boolean specifying whether ``items`` yields
+        ``(key, value)`` tuples to return as a JSON object rather than
+        values to return as a JSON list. Defaults to ``False``.
+
+    """
+    dumps = flask.json.dumps
+
+    def _generate():
+        """ Generate the JSON output chunk by chunk. """
+        yield '{\n'
+        for field in sorted(output):
+            yield '  %s: %s,\n' % (dumps(field), dumps(output[field]))
+        yield '  %s: %s' % (dumps(key), '{' if mapping else '[')
+        sep = '\n    '
+        for item in items:
+            if mapping:
+                item = '%s: %s' % (dumps(item[0]), dumps(item[1]))
+            else:
+                item = dumps(item)
+            yield sep + item
+            sep = ',\n    '
+        yield '\n  %s\n}' % ('}' if mapping else ']')
+
+    return flask.Response(
+        flask.stream_with_context(_generate()),
+        content_type='application/json')
+
+
+def stream_text(intro, lines):
+    """ Return a response streaming the provided lines of text.
+
+    :arg intro: a string returned before the lines.
+    :arg lines: an iterable of the lines to return, joined by a new line
+        character.
+
+    """
+
+    def _generate():
+        """ Generate the text output line by line. """
+        yield intro
+        sep = ''
+        for line in lines:
+            yield sep + line
+            sep = '\n'
+
+    return flask.Response(
+        flask.stream_with_context(_generate()),
+        content_type='text/plain;charset=UTF-8')
+
+
 from pkgdb2.api import acls
 from pkgdb2.api import collections
 from pkgdb2.api import extras
@@ -93,6 +244,8 @@ def api():
     api_packager_package = load_doc(packagers.api_packager_package)
     api_packager_list = load_doc(packagers.api_packager_list)
     api_packager_stats = load_doc(packagers.api_packager_stats)
+    api_packagers_stats = load_doc(packagers.api_packagers_stats)
+    api_packager_complete = load_doc(packagers.api_packager_complete)
 
     api_package_info = load_doc(packages.api_package_info)
     api_package_new = load_doc(packages.api_package_new)
@@ -103,12 +256,15 @@ def api():
     api_package_retire = load_doc(packages.api_package_retire)
     api_package_unretire = load_doc(packages.api_package_unretire)
     api_package_list = load_doc(packages.api_package_list)
+    api_package_complete = load_doc(packages.api_package_complete)
 
     api_acl_update = load_doc(acls.api_acl_update)
     api_acl_reassign = load_doc(acls.api_acl_reassign)
 
     api_version_doc = load_doc(api_version)
     api_extras_bugzilla = load_doc(extras.api_bugzilla)
+    api_extras_bugzilla_job = load_doc(extras.api_bugzilla_job)
+    api_extras_changes = load_doc(extras.api_changes)
     api_extras_critpath = load_doc(extras.api_critpath)
     api_extras_notify = load_doc(extras.api_notify)
     api_extras_notify_all = load_doc(extras.api_notify_all)
@@ -124,10 +280,10 @@ def api():
         ],
         packagers=[
             api_packager_list, api_packager_acl, api_packager_package,
-            api_packager_stats
+            api_packager_stats, api_packagers_stats, api_packager_complete,
         ],
         packages=[
-            api_package_info, api_package_list,
+            api_package_info, api_package_list, api_package_complete,
             api_package_new, api_package_edit,
             api_package_critpath,
             api_package_orphan, api_package_unorphan,
@@ -140,7 +296,8 @@ def api():
             api_version_doc,
         ],
         extras=[
-            api_extras_bugzilla, api_extras_critpath,
+            api_extras_bugzilla, api_extras_bugzilla_job, api_extras_changes,
+            api_extras_critpath,
             api_extras_notify, api_extras_notify_all,
             api_extras_vcs, api_extras_pendingacls
         ]
@@ -32,6 +32,7 @@ import flask
 import pkgdb2
 import pkgdb2.forms as forms
 import pkgdb2.lib as pkgdblib
+import pkgdb2.lib.bugzilla_jobs as bugzilla_jobs
 from pkgdb2 import SESSION, APP
 from pkgdb2.api import API
 
@@ -56,7 +57,8 @@ Update package ACL
 
     Accept POST queries only.
 
-    :arg pkgname: String of the package name.
+    :arg pkgname: String of the package name, can be specified several
+        times to update the ACLs of several packages at once.
     :arg branches: List of strings with the name of the branches to change,
         update.
     :arg acl: List of strings of the ACL to change/update. Possible acl
@@ -107,27 +109,36 @@ Update package ACL
         acl_status = form.acl_status.data
         pkg_user = form.user.data
 
-        try:
-            messages = []
-            for (branch, acl) in itertools.product(pkg_branch, pkg_acl):
-
-                acl_status2 = acl_status
+        # Several packages can be updated at once
+        pkg_names = flask.request.form.getlist('pkgname') or [pkg_name]
 
-                if acl_status2 == 'Awaiting Review' and \
-                        acl in APP.config['AUTO_APPROVE']:
-                    acl_status2 = 'Approved'
+        acls = []
+        for acl in pkg_acl:
+            acl_status2 = acl_status
+            if acl_status2 == 'Awaiting Review' and \
+                    acl in APP.config['AUTO_APPROVE']:
+                acl_status2 = 'Approved'
+            acls.append((acl, acl_status2))
 
-                message = pkgdblib.set_acl_package(
-                    SESSION,
-                    pkg_name=pkg_name,
-                    pkg_branch=branch,
-                    acl=acl,
-                    status=acl_status2,
-                    pkg_user=pkg_user,
-                    user=flask.g.fas_user,
-                )
+        try:
+            results = pkgdblib.set_acl_packages(
+                SESSION,
+                pkg_names=pkg_names,
+                pkg_branches=pkg_branch,
+                pkg_user=pkg_user,
+                acls=acls,
+                user=flask.g.fas_user,
+            )
+            messages = []
+            for (name, branch, acl), message in zip(
+                    itertools.product(pkg_names, pkg_branch, pkg_acl),
+                    results):
                 if message:
                     messages.append(message)
+                elif len(pkg_names) > 1:
+                    messages.append(
+                        'Nothing to update on branch: %s for acl: %s of '
+                        'package: %s' % (branch, acl, name))
                 else:
                     messages.append(
                         'Nothing to update on branch: %s for acl: %s' %
@@ -175,6 +186,10 @@ Reassign packages
         which to reassign the point of contact.
     :arg poc: User name of the new point of contact.
 
+    When ``PKGDB2_BUGZILLA_JOBS`` is set, the bugs are reassigned in the
+    background and ``bugzilla_jobs`` lists the identifiers of the jobs
+    doing it, see ``/api/bugzilla/job/<job_id>/``.
+
     Sample response:
 
     ::
@@ -206,6 +221,7 @@ Reassign packages
     else:
         messages = []
         errors = set()
+        jobs = []
         for (package, branch) in itertools.product(packages, branches):
             try:
                 message = pkgdblib.update_pkg_poc(
@@ -215,8 +231,11 @@ Reassign packages
                     pkg_poc=user_target,
                     user=flask.g.fas_user
                 )
+                job_id = bugzilla_jobs.get_current_job(SESSION)
                 SESSION.commit()
                 messages.append(message)
+                if job_id:
+                    jobs.append(job_id)
             except pkgdblib.PkgdbBugzillaException, err:  # pragma: no cover
                 APP.logger.exception(err)
                 SESSION.rollback()
@@ -228,6 +247,8 @@ Reassign packages
         if messages:
             output['messages'] = messages
             output['output'] = 'ok'
+            if jobs:
+                output['bugzilla_jobs'] = jobs
         else:
             # If messages is empty that means that we failed all the
             # unorphans so output is `notok`, otherwise it means that we
@@ -24,10 +24,15 @@ Extras API endpoints for the Flask application.
 '''
 
 import flask
+import itertools
 
+from sqlalchemy.orm.exc import NoResultFound
+
+import pkgdb2
 import pkgdb2.lib as pkgdblib
 from pkgdb2 import SESSION
-from pkgdb2.api import API
+from pkgdb2.api import API, get_limit, is_stream, stream_json, stream_text
+from pkgdb2.lib import model
 
 
 def request_wants_json():
@@ -39,10 +44,12 @@ def request_wants_json():
         flask.request.accept_mimetypes['text/html']
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
-def _bz_acls_cached(name=None, out_format='text'):
+@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
+def _bz_acls_cached(cache_key, name=None, out_format='text'):
     '''Return the package attributes used by bugzilla.
 
+    :arg cache_key: the current cache key of the exports, see
+        ``pkgdb2.lib.get_cache_key``, only used to invalidate the cache.
     :kwarg collection: Name of the bugzilla collection to gather data on.
     :kwarg out_format: Specify if the output if text or json.
 
@@ -103,14 +110,16 @@ def _bz_acls_cached(name=None, out_format='text'):
     return output
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
-def _bz_notify_cache(
-        name=None, version=None, eol=False, out_format='text', acls=None):
+@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
+def _bz_notify_cache(cache_key, name=None, version=None, eol=False,
+                     out_format='text', acls=None):
     '''List of usernames that should be notified of changes to a package.
 
     For the collections specified we want to retrieve all of the owners,
     watchbugzilla, and watchcommits accounts.
 
+    :arg cache_key: the current cache key of the exports, see
+        ``pkgdb2.lib.get_cache_key``, only used to invalidate the cache.
     :kwarg name: Set to a collection name to filter the results for that
     :kwarg version: Set to a collection version to further filter results
         for a single version
@@ -139,45 +148,104 @@ def _bz_notify_cache(
     return output
 
 
-#@pkgdb.CACHE.cache_on_arguments(expiration_time=3600)
-def _vcs_acls_cache(out_format='text', eol=False):
+@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
+def _vcs_acls_cache(cache_key, out_format='text', eol=False):
     '''Return ACLs for the version control system.
 
+    :arg cache_key: the current cache key of the exports, see
+        ``pkgdb2.lib.get_cache_key``, only used to invalidate the cache.
     :kwarg out_format: Specify if the output if text or json.
     :kwarg eol: A boolean specifying whether to include information about
         End Of Life collections or not. Defaults to ``False``.
 
     '''
-    packages = pkgdblib.vcs_acls(session=SESSION, eol=eol)
-    output = []
+    acls = pkgdblib.vcs_acls(session=SESSION, eol=eol)
     if out_format == 'json':
-        output = {'packageAcls': {},
+        output = {'packageAcls': dict(_vcs_acls_json(acls)),
                   'title': 'Fedora Package Database -- VCS ACLs'}
-    for package in sorted(packages):
-        for branch in sorted(packages[package]):
-            if out_format == 'json':
-                if package not in output['packageAcls']:
-                    output['packageAcls'][package] = {}
-                groups = []
-                if packages[package][branch]['group']:
-                    groups = packages[package][branch]['group'].replace(
-                        '@', '').split(',')
-                users = []
-                if packages[package][branch]['user']:
-                    users = packages[package][branch]['user'].split(',')
-                output['packageAcls'][package][branch] = {
-                    'commit': {
-                        'groups': groups,
-                        'people': users
-                    }
+    else:
+        output = list(_vcs_acls_text(acls))
+    return output
+
+
+def _vcs_acls_text(acls):
+    '''Yield the lines of the text output of the VCS ACLs.
+
+    :arg acls: an iterable of ACLs as returned by `pkgdb2.lib.vcs_acls`.
+
+    '''
+    for acl in acls:
+        yield 'avail | %(group)s,%(user)s | rpms/%(name)s/%(branch)s' % acl
+
+
+def _vcs_acls_json(acls):
+    '''Yield for each package a tuple of its name and of the JSON output
+    of its VCS ACLs.
+
+    :arg acls: an iterable of ACLs as returned by `pkgdb2.lib.vcs_acls`,
+        sorted by package name.
+
+    '''
+    for name, pkg_acls in itertools.groupby(acls, lambda acl: acl['name']):
+        yield name, dict(
+            (acl['branch'], {
+                'commit': {
+                    'groups': acl['group'].replace('@', '').split(','),
+                    'people': acl['user'].split(',') if acl['user'] else [],
                 }
-            else:
-                output.append(
-                    'avail | %(group)s,%(user)s | rpms/%(name)s/%(branch)s'
-                    % (packages[package][branch]))
+            })
+            for acl in pkg_acls
+        )
+
+
+@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
+def _critpath_cache(cache_key, branches):
+    '''Return the name of the critpath packages for each of the specified
+    Fedora branches.
+
+    :arg cache_key: the current cache key of the exports, see
+        ``pkgdb2.lib.get_cache_key``, only used to invalidate the cache.
+    :arg branches: a tuple of branchname, if empty all the active branches
+        are returned.
+
+    '''
+    output = {}
+
+    if not branches:
+        active_collections = pkgdblib.search_collection(
+            SESSION, '*', status='Under Development')
+        active_collections.extend(
+            pkgdblib.search_collection(SESSION, '*', status='Active'))
+    else:
+        active_collections = []
+        for branch in branches:
+            active_collections.extend(
+                pkgdblib.search_collection(SESSION, branch)
+            )
+
+    for collection in active_collections:
+        if collection.name != 'Fedora':
+            continue
+        pkgs = pkgdblib.get_critpath_packages(
+            SESSION, branch=collection.branchname)
+        if not pkgs:
+            continue
+        output[collection.branchname] = [pkg.package.name for pkg in pkgs]
+
     return output
 
 
+@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
+def _groups_cache(cache_key):
+    '''Return the list of FAS groups involved in maintaining packages.
+
+    :arg cache_key: the current cache key of the exports, see
+        ``pkgdb2.lib.get_cache_key``, only used to invalidate the cache.
+
+    '''
+    return pkgdblib.get_groups(SESSION)
+
+
 @API.route('/bugzilla/')
 @API.route('/bugzilla')
 def api_bugzilla():
@@ -227,7 +295,8 @@ Bugzilla information
 
 """
 
-    acls = _bz_acls_cached(name, out_format)
+    acls = _bz_acls_cached(
+        pkgdblib.get_cache_key(SESSION), name, out_format)
 
     if out_format == 'json':
         return flask.jsonify(acls)
@@ -238,6 +307,158 @@ Bugzilla information
         )
 
 
+@API.route('/bugzilla/job/<int:job_id>/')
+@API.route('/bugzilla/job/<int:job_id>')
+def api_bugzilla_job(job_id):
+    '''
+Bugzilla reassignment job
+-------------------------
+    Return the state of a job reassigning bugzilla bugs, as returned by
+    the API changing the point of contact of packages when
+    ``PKGDB2_BUGZILLA_JOBS`` is set.
+
+    ::
+
+        /api/bugzilla/job/<job_id>/
+
+    Accept GET queries only.
+
+    Sample response:
+
+    ::
+
+        {
+          "output": "ok",
+          "job": {
+            "id": 12,
+            "status": "Done",
+            "created": 1406213825.0,
+            "finished": 1406213831.0,
+            "bugs": 3,
+            "error": null,
+            "reassignments": [
+              {
+                "username": "pingou",
+                "prev_poc": "orphan",
+                "product": "Fedora",
+                "component": "guake",
+                "version": "rawhide",
+                "comment": "This package has changed ownership in ..."
+              }
+            ]
+          }
+        }
+
+    The ``status`` is one of ``Pending``, ``Done`` or ``Failed``, in
+    which case ``error`` explains why.
+
+    '''
+    httpcode = 200
+    output = {}
+
+    try:
+        job = model.BugzillaJob.by_id(SESSION, job_id)
+        output['output'] = 'ok'
+        output['job'] = job.to_json()
+    except NoResultFound:
+        output['output'] = 'notok'
+        output['error'] = 'No bugzilla job %s found' % job_id
+        httpcode = 404
+
+    jsonout = flask.jsonify(output)
+    jsonout.status_code = httpcode
+    return jsonout
+
+
+@API.route('/changes/')
+@API.route('/changes')
+def api_changes():
+    '''
+Changes
+-------
+    Return the changes made in pkgdb after the specified one, in the order
+    they were made, so the consumers can stay in sync by retrieving only
+    what changed since their last query.
+
+    ::
+
+        /api/changes/
+
+        /api/changes/?since=<seq>
+
+    Accept GET queries only.
+
+    :kwarg since: the sequence number of the last change already processed,
+        as returned in ``last_seq``. Defaults to ``0``, retrieving the
+        changes from the first one.
+    :kwarg limit: the maximum number of changes to return, at least 1,
+        defaults to 250 and is capped to 500.
+
+    Sample response:
+
+    ::
+
+        {
+          "output": "ok",
+          "changes": [
+            {
+              "seq": 1043,
+              "topic": "owner.update",
+              "change_time": 1406552306.0,
+              "agent": "pingou",
+              "package": "guake",
+              "branch": "master",
+              "acl": null,
+              "user": null,
+              "old": "orphan",
+              "new": "pingou"
+            }
+          ],
+          "last_seq": 1043,
+          "more": false
+        }
+
+    Query again with ``since`` set to ``last_seq`` to retrieve the next
+    changes, ``more`` is ``true`` when some were left out because of the
+    ``limit``.
+
+    '''
+    httpcode = 200
+    output = {}
+
+    since = flask.request.args.get('since', 0)
+    limit = get_limit()
+
+    try:
+        since = int(since)
+    except ValueError:
+        output['output'] = 'notok'
+        output['error'] = 'Invalid since: %s' % since
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 400
+        return jsonout
+
+    if limit < 1:
+        output['output'] = 'notok'
+        output['error'] = 'Invalid limit: %s' % limit
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 400
+        return jsonout
+
+    changes = model.Change.since(SESSION, seq=since, limit=limit + 1)
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    output['output'] = 'ok'
+    output['changes'] = [change.to_json() for change in changes]
+    output['last_seq'] = changes[-1].seq if changes else since
+    output['more'] = more
+
+    jsonout = flask.jsonify(output)
+    jsonout.status_code = httpcode
+    return jsonout
+
+
 @API.route('/notify/')
 @API.route('/notify')
 def api_notify():
@@ -272,8 +493,8 @@ Notification information
         out_format = 'json'
 
     output = _bz_notify_cache(
-        name, version, eol, out_format,
-        acls=['commit', 'approveacls', 'watchcommits'])
+        pkgdblib.get_cache_key(SESSION), name, version, eol is not False,
+        out_format, ['commit', 'approveacls', 'watchcommits'])
 
     if out_format == 'json':
         return flask.jsonify(output)
@@ -317,7 +538,9 @@ Notification information 2
     if request_wants_json():
         out_format = 'json'
 
-    output = _bz_notify_cache(name, version, eol, out_format, acls='all')
+    output = _bz_notify_cache(
+        pkgdblib.get_cache_key(SESSION), name, version, eol is not False,
+        out_format, 'all')
 
     if out_format == 'json':
         return flask.jsonify(output)
@@ -343,6 +566,9 @@ Version Control System ACLs
     :kwarg format: Specify if the output if text or json.
     :kwarg eol: A boolean specifying whether to include information about
         End Of Life collections or not. Defaults to ``False``.
+    :kwarg stream: A boolean to have the ACLs serialized while they are
+        loaded from the database instead of returned from the cache, the
+        output is otherwise identical. Defaults to ``False``.
 
     '''
     intro = """# VCS ACLs
@@ -359,7 +585,17 @@ Version Control System ACLs
     if request_wants_json():
         out_format = 'json'
 
-    acls = _vcs_acls_cache(out_format, eol=eol)
+    if is_stream():
+        acls = pkgdblib.vcs_acls(session=SESSION, eol=bool(eol), stream=True)
+        if out_format == 'json':
+            return stream_json(
+                {'title': 'Fedora Package Database -- VCS ACLs'},
+                'packageAcls', _vcs_acls_json(acls), mapping=True)
+        else:
+            return stream_text(intro, _vcs_acls_text(acls))
+
+    acls = _vcs_acls_cache(
+        pkgdblib.get_cache_key(SESSION), out_format, bool(eol))
 
     if out_format == 'json':
         return flask.jsonify(acls)
@@ -398,28 +634,8 @@ Critical path packages
     if request_wants_json():
         out_format = 'json'
 
-    output = {}
-
-    if not branches:
-        active_collections = pkgdblib.search_collection(
-            SESSION, '*', status='Under Development')
-        active_collections.extend(
-            pkgdblib.search_collection(SESSION, '*', status='Active'))
-    else:
-        active_collections = []
-        for branch in branches:
-            active_collections.extend(
-                pkgdblib.search_collection(SESSION, branch)
-            )
-
-    for collection in active_collections:
-        if collection.name != 'Fedora':
-            continue
-        pkgs = pkgdblib.get_critpath_packages(
-            SESSION, branch=collection.branchname)
-        if not pkgs:
-            continue
-        output[collection.branchname] = [pkg.package.name for pkg in pkgs]
+    output = _critpath_cache(
+        pkgdblib.get_cache_key(SESSION), tuple(branches))
 
     if out_format == 'json':
         output = {"pkgs": output}
@@ -514,7 +730,7 @@ List group maintainer
 
     output = {}
 
-    groups = pkgdblib.get_groups(SESSION)
+    groups = _groups_cache(pkgdblib.get_cache_key(SESSION))
 
     if out_format == 'json':
         output = {"groups": groups}
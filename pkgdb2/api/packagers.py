@@ -32,7 +32,9 @@ from math import ceil
 
 import pkgdb2.lib as pkgdblib
 from pkgdb2 import SESSION
-from pkgdb2.api import API, get_limit
+from pkgdb2.api import (
+    API, get_cursor, get_limit, is_stream, stream_json, want_total)
+from pkgdb2.lib import readmodel
 
 
 ## Some of the object we use here have inherited methods which apparently
@@ -84,9 +86,18 @@ User's ACL
         of contact of the package (thus every packages is returned).
     :kwarg page: The page number to return (useful in combination to limit).
     :kwarg limit: An integer to limit the number of results, defaults to
-        250, maximum is 500 (acls).
+        250, maximum is 500 (acls) unless the output is streamed.
     :kwarg count: A boolean to return the number of packages instead of the
         list. Defaults to False.
+    :kwarg stream: A boolean to have the ACLs serialized one at a time
+        while they are loaded from the database, the output is otherwise
+        identical. Defaults to False.
+    :kwarg next: Use the cursor-based pagination: leave empty to retrieve
+        the first page, then set it to the ``next`` value returned to
+        retrieve the following page, until it is ``null``. The ``page``
+        and ``page_total`` are then not returned and ``page`` is ignored.
+    :kwarg total: A boolean to include the ``total`` number of ACLs when
+        using the cursor-based pagination. Defaults to False.
 
     *Results are paginated*
 
@@ -190,7 +201,79 @@ User's ACL
     limit = get_limit()
     count = flask.request.args.get('count', False)
 
-    if packagername:
+    try:
+        cursor = get_cursor()
+    except pkgdblib.PkgdbException, err:
+        output = {'output': 'notok', 'error': str(err)}
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 500
+        return jsonout
+
+    if packagername and cursor is not False and not count:
+        packagers = pkgdblib.get_acl_packager(
+            SESSION,
+            packager=packagername,
+            acls=acls,
+            eol=eol,
+            poc=poc,
+            page=None,
+            limit=limit + 1,
+            after=cursor[0] if cursor else None,
+            load='rows')
+        output['output'] = 'ok'
+        output['next'] = None
+        if len(packagers) > limit:
+            packagers = packagers[:limit]
+            output['next'] = pkgdblib.encode_cursor([packagers[-1].id])
+        output['acls'] = [readmodel.acl_to_json(pkg) for pkg in packagers]
+        if not packagers:
+            output['output'] = 'notok'
+            output['error'] = 'No ACL found for this user'
+            httpcode = 404
+        if want_total():
+            output['total'] = pkgdblib.get_acl_packager(
+                SESSION,
+                packager=packagername,
+                acls=acls,
+                eol=eol,
+                poc=poc,
+                count=True)
+
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = httpcode
+        return jsonout
+    elif packagername and is_stream() and not count:
+        limit = get_limit(stream=True)
+        total_acl = pkgdblib.get_acl_packager(
+            SESSION,
+            packager=packagername,
+            acls=acls,
+            eol=eol,
+            poc=poc,
+            count=True)
+        if total_acl > (abs(int(page)) - 1) * limit:
+            packagers = pkgdblib.get_acl_packager(
+                SESSION,
+                packager=packagername,
+                acls=acls,
+                eol=eol,
+                poc=poc,
+                page=page,
+                limit=limit,
+                stream=True,
+                load='rows')
+            output = {
+                'output': 'ok',
+                'page': page,
+                'page_total': int(ceil(total_acl / float(limit))),
+            }
+            return stream_json(
+                output, 'acls',
+                (readmodel.acl_to_json(pkg) for pkg in packagers))
+        else:
+            output = {'output': 'notok', 'error': 'No ACL found for this user'}
+            httpcode = 404
+    elif packagername:
         packagers = pkgdblib.get_acl_packager(
             SESSION,
             packager=packagername,
@@ -199,13 +282,15 @@ User's ACL
             poc=poc,
             page=page,
             limit=limit,
-            count=count)
+            count=count,
+            load='rows')
         if packagers:
             output['output'] = 'ok'
             if count:
                 output['acls_count'] = packagers
             else:
-                output['acls'] = [pkg.to_json() for pkg in packagers]
+                output['acls'] = [
+                    readmodel.acl_to_json(pkg) for pkg in packagers]
 
             total_acl = pkgdblib.get_acl_packager(
                 SESSION,
@@ -456,32 +541,86 @@ User's stats
     eol = flask.request.args.get('eol', False)
 
     if packagername:
-        if not eol:
-            collections = pkgdblib.search_collection(
-                SESSION, '*', status='Active')
-            collections.extend(pkgdblib.search_collection(
-                SESSION, '*', status='Under Development'))
-        else:
-            collections = pkgdblib.search_collection(SESSION, '*')
+        output = pkgdblib.get_packager_stats(
+            SESSION, packagername, eol=eol)[packagername]
+        output['output'] = 'ok'
+    else:
+        output = {'output': 'notok', 'error': 'Invalid request'}
+        httpcode = 500
 
-        for collection in collections:
-            packages_co = pkgdblib.get_package_maintained(
-                SESSION,
-                packager=packagername,
-                poc=False,
-                branch=collection.branchname
-            )
+    jsonout = flask.jsonify(output)
+    jsonout.status_code = httpcode
+    return jsonout
 
-            packages = pkgdblib.get_package_maintained(
-                SESSION,
-                packager=packagername,
-                poc=True,
-                branch=collection.branchname
-            )
-            output[collection.branchname] = {
-                'point of contact': len(packages),
-                'co-maintainer': len(packages_co)
+
+@API.route('/packagers/stats/')
+@API.route('/packagers/stats')
+def api_packagers_stats():
+    '''
+Packagers' stats
+----------------
+    Give the stats of the ACLs of several users at once, the same as
+    ``/api/packager/stats/<username>/`` for each of them.
+
+    ::
+
+        /api/packagers/stats/?packagername=<username>&packagername=<username>
+
+    Accept GET queries only.
+
+    :arg packagername: the name of the packagers, either separated by
+        commas or as several arguments.
+    :kwarg eol: a boolean to specify whether to include results for
+        EOL collections or not. Defaults to False.
+        If ``True``, it will return results for all collections (including
+        EOL).
+        If ``False``, it will return results only for non-EOL collections.
+
+    Sample response:
+
+    ::
+
+        /api/packagers/stats/?packagername=pingou,ralph
+
+        {
+          "output": "ok",
+          "packagers": {
+            "pingou": {
+              "master": {
+                "co-maintainer": 12,
+                "point of contact": 60
+              },
+              "f20": {
+                "co-maintainer": 12,
+                "point of contact": 60
+              }
+            },
+            "ralph": {
+              "master": {
+                "co-maintainer": 3,
+                "point of contact": 15
+              },
+              "f20": {
+                "co-maintainer": 3,
+                "point of contact": 14
+              }
             }
+          }
+        }
+
+    '''
+    httpcode = 200
+    output = {}
+
+    packagernames = []
+    for value in flask.request.args.getlist('packagername'):
+        packagernames.extend(
+            name.strip() for name in value.split(',') if name.strip())
+    eol = flask.request.args.get('eol', False)
+
+    if packagernames:
+        output['packagers'] = pkgdblib.get_packager_stats(
+            SESSION, packagernames, eol=eol)
         output['output'] = 'ok'
     else:
         output = {'output': 'notok', 'error': 'Invalid request'}
@@ -516,6 +655,13 @@ List packagers
 
     :kwarg pattern: String of the pattern to use to list find packagers.
         If no pattern is provided, it returns the list of all packagers.
+    :kwarg next: Use the cursor-based pagination: leave empty to retrieve
+        the first page, then set it to the ``next`` value returned to
+        retrieve the following page, until it is ``null``.
+    :kwarg limit: An integer to limit the number of results when using the
+        cursor-based pagination, defaults to 250, maximum is 500.
+    :kwarg total: A boolean to include the ``total`` number of packagers
+        when using the cursor-based pagination. Defaults to False.
 
 
     Sample response:
@@ -545,7 +691,31 @@ List packagers
     output = {}
 
     pattern = flask.request.args.get('pattern', pattern) or '*'
-    if pattern:
+    try:
+        cursor = get_cursor()
+    except pkgdblib.PkgdbException, err:
+        output = {'output': 'notok', 'error': str(err)}
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 500
+        return jsonout
+
+    if pattern and cursor is not False:
+        limit = get_limit()
+        packagers = pkgdblib.search_packagers(
+            SESSION, pattern=pattern, eol=False, limit=limit + 1,
+            after=cursor[0] if cursor else None)
+        packagers = [pkg[0] for pkg in packagers]
+        output['output'] = 'ok'
+        output['next'] = None
+        if len(packagers) > limit:
+            packagers = packagers[:limit]
+            output['next'] = pkgdblib.encode_cursor([packagers[-1]])
+        output['packagers'] = packagers
+        if want_total():
+            output['total'] = pkgdblib.search_packagers(
+                SESSION, pattern=pattern, eol=False, count=True)
+        SESSION.commit()
+    elif pattern:
         packagers = pkgdblib.search_packagers(
             SESSION, pattern=pattern, eol=False)
         packagers = [pkg[0] for pkg in packagers]
@@ -559,3 +729,48 @@ List packagers
     jsonout = flask.jsonify(output)
     jsonout.status_code = httpcode
     return jsonout
+
+
+@API.route('/complete/packagers/')
+@API.route('/complete/packagers')
+def api_packager_complete():
+    '''
+Complete packager names
+-----------------------
+    Return the name of the packagers starting with the given prefix, case
+    insensitively. The names are kept in memory and the database is not
+    queried, which makes it suitable for completing the names as they are
+    typed.
+
+    ::
+
+        /api/complete/packagers/?q=<prefix>
+
+    Accept GET queries only.
+
+    :arg q: String of the beginning of the names.
+    :kwarg limit: An integer to limit the number of names returned,
+        defaults to 10, maximum is 50.
+
+    Sample response:
+
+    ::
+
+        /api/complete/packagers/?q=pi
+
+        {
+          "output": "ok",
+          "packagers": [
+            "pilcher",
+            "pingou"
+          ]
+        }
+
+    '''
+    prefix = flask.request.args.get('q', '')
+    limit = get_limit(default=10, maximum=50)
+
+    names = pkgdblib.complete_packager(SESSION, prefix, limit=limit)
+    SESSION.commit()
+
+    return flask.jsonify({'output': 'ok', 'packagers': names})
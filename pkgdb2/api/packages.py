@@ -33,8 +33,18 @@ from math import ceil
 from sqlalchemy.orm.exc import NoResultFound
 
 import pkgdb2.lib as pkgdblib
+import pkgdb2.lib.bugzilla_jobs as bugzilla_jobs
 from pkgdb2 import APP, SESSION, forms, is_admin, packager_login_required
-from pkgdb2.api import API, get_limit
+from pkgdb2.api import (
+    API, get_cursor, get_fields, get_limit, is_stream, select_fields,
+    stream_json, want_total)
+from pkgdb2.lib import model, readmodel
+
+
+# The fields which can be selected in the package information
+PACKAGE_INFO_FIELDS = [
+    'point_of_contact', 'critpath', 'status', 'status_change', 'package',
+    'collection', 'acls']
 
 
 ## Some of the object we use here have inherited methods which apparently
@@ -277,6 +287,10 @@ Orphan package
         which these packages will be orphaned.
 
 
+    When ``PKGDB2_BUGZILLA_JOBS`` is set, the bugs are reassigned in the
+    background and ``bugzilla_jobs`` lists the identifiers of the jobs
+    doing it, see ``/api/bugzilla/job/<job_id>/``.
+
     Sample response:
 
     ::
@@ -302,6 +316,7 @@ Orphan package
     if pkgnames and branches:
         messages = []
         errors = set()
+        jobs = []
         for pkg_name, pkg_branch in itertools.product(
                 pkgnames, branches):
             try:
@@ -314,7 +329,10 @@ Orphan package
                 )
 
                 messages.append(message)
+                job_id = bugzilla_jobs.get_current_job(SESSION)
                 SESSION.commit()
+                if job_id:
+                    jobs.append(job_id)
             except pkgdblib.PkgdbException, err:
                 SESSION.rollback()
                 errors.add(str(err))
@@ -322,6 +340,8 @@ Orphan package
         if messages:
             output['messages'] = messages
             output['output'] = 'ok'
+            if jobs:
+                output['bugzilla_jobs'] = jobs
         else:
             # If messages is empty that means that we failed all the orphans
             # so output is `notok`, otherwise it means that we succeeded at
@@ -373,6 +393,10 @@ Unorphan packages
     :arg poc: String of the name of the user taking ownership of
         this package. If you are not an admin, this name must be None.
 
+    When ``PKGDB2_BUGZILLA_JOBS`` is set, the bugs are reassigned in the
+    background and ``bugzilla_jobs`` lists the identifiers of the jobs
+    doing it, see ``/api/bugzilla/job/<job_id>/``.
+
     Sample response:
 
     ::
@@ -399,6 +423,7 @@ Unorphan packages
     if pkgnames and branches and poc:
         messages = []
         errors = set()
+        jobs = []
         for pkg_name, pkg_branch in itertools.product(
                 pkgnames, branches):
             try:
@@ -410,7 +435,10 @@ Unorphan packages
                     user=flask.g.fas_user
                 )
                 messages.append(message)
+                job_id = bugzilla_jobs.get_current_job(SESSION)
                 SESSION.commit()
+                if job_id:
+                    jobs.append(job_id)
             except pkgdblib.PkgdbBugzillaException, err:  # pragma: no cover
                 APP.logger.exception(err)
                 SESSION.rollback()
@@ -422,6 +450,8 @@ Unorphan packages
         if messages:
             output['messages'] = messages
             output['output'] = 'ok'
+            if jobs:
+                output['bugzilla_jobs'] = jobs
         else:
             # If messages is empty that means that we failed all the
             # unorphans so output is `notok`, otherwise it means that we
@@ -472,6 +502,10 @@ Retire packages
     :arg branches: Comma separated list of string of the branches name in
         which these packages will be retire.
 
+    When ``PKGDB2_BUGZILLA_JOBS`` is set, the bugs are reassigned in the
+    background and ``bugzilla_jobs`` lists the identifiers of the jobs
+    doing it, see ``/api/bugzilla/job/<job_id>/``.
+
     Sample response:
 
     ::
@@ -499,6 +533,7 @@ Retire packages
         try:
             messages = []
             errors = set()
+            jobs = []
             for pkg_name, pkg_branch in itertools.product(
                     pkgnames, branches):
                 message = pkgdblib.update_pkg_status(
@@ -509,7 +544,10 @@ Retire packages
                     user=flask.g.fas_user,
                 )
                 messages.append(message)
+            job_id = bugzilla_jobs.get_current_job(SESSION)
             SESSION.commit()
+            if job_id:
+                jobs.append(job_id)
         except pkgdblib.PkgdbException, err:
             SESSION.rollback()
             errors.add(str(err))
@@ -517,6 +555,8 @@ Retire packages
         if messages:
             output['messages'] = messages
             output['output'] = 'ok'
+            if jobs:
+                output['bugzilla_jobs'] = jobs
         else:
             # If messages is empty that means that we failed all the
             # retire so output is `notok`, otherwise it means that we
@@ -567,6 +607,10 @@ Unretire packages
         which these packages will be un-deprecated.
 
 
+    When ``PKGDB2_BUGZILLA_JOBS`` is set, the bugs are reassigned in the
+    background and ``bugzilla_jobs`` lists the identifiers of the jobs
+    doing it, see ``/api/bugzilla/job/<job_id>/``.
+
     Sample response:
 
     ::
@@ -603,9 +647,12 @@ Unretire packages
                     user=flask.g.fas_user,
                 )
                 messages.append(message)
+            job_id = bugzilla_jobs.get_current_job(SESSION)
             SESSION.commit()
             output['output'] = 'ok'
             output['messages'] = messages
+            if job_id:
+                output['bugzilla_jobs'] = [job_id]
         except pkgdblib.PkgdbException, err:
             SESSION.rollback()
             output['output'] = 'notok'
@@ -658,6 +705,12 @@ Package information
         If True, it will include the ACL of the package in the collection.
         If False, it will not include the ACL of the package in the
         collection.
+    :kwarg fields: the fields to return for each branch, separated by
+        commas, among ``point_of_contact``, ``critpath``, ``status``,
+        ``status_change``, ``package``, ``collection`` and ``acls``.
+        ``package.<field>`` and ``collection.<field>`` return only some
+        fields of the package and collection.
+        Defaults to returning all the fields.
 
     Sample response:
 
@@ -741,6 +794,21 @@ Package information
     acls = flask.request.args.get('acls', True)
     if str(acls).lower() in ['0', 'false']:
         acls = False
+    fields = get_fields()
+
+    package = True
+    if fields is not None:
+        selected = set(field.split('.', 1)[0] for field in fields)
+        invalid = selected - set(PACKAGE_INFO_FIELDS)
+        if invalid:
+            output['output'] = 'notok'
+            output['error'] = 'Invalid fields: %s' % ', '.join(
+                sorted(invalid))
+            jsonout = flask.jsonify(output)
+            jsonout.status_code = 400
+            return jsonout
+        acls = acls and 'acls' in selected
+        package = 'package' in selected
 
     try:
         packages = pkgdblib.get_acl_package(
@@ -748,6 +816,7 @@ Package information
             pkg_name=pkg_name,
             pkg_clt=branches,
             eol=eol,
+            load='listing_acls' if acls else None,
         )
         if not packages:
             output['output'] = 'notok'
@@ -757,8 +826,11 @@ Package information
         else:
             output['output'] = 'ok'
             output['packages'] = [
-                pkg.to_json(not_provenpackager=APP.config.get(
-                    'PKGS_NOT_PROVENPACKAGER'), acls=acls)
+                select_fields(
+                    pkg.to_json(not_provenpackager=APP.config.get(
+                        'PKGS_NOT_PROVENPACKAGER'), acls=acls,
+                        package=package),
+                    fields)
                 for pkg in packages]
     except NoResultFound:
         output['output'] = 'notok'
@@ -808,10 +880,19 @@ List packages
         If True, it will return results for all collections (including EOL).
         If False, it will return results only for non-EOL collections.
     :kwarg limit: An integer to limit the number of results, defaults to
-        250, maximum is 500.
+        250, maximum is 500 unless the output is streamed.
     :kwarg page: The page number to return (useful in combination to limit).
     :kwarg count: A boolean to return the number of packages instead of the
         list. Defaults to False.
+    :kwarg stream: A boolean to have the packages serialized one at a time
+        while they are loaded from the database, the output is otherwise
+        identical. Defaults to False.
+    :kwarg next: Use the cursor-based pagination: leave empty to retrieve
+        the first page, then set it to the ``next`` value returned to
+        retrieve the following page, until it is ``null``. The ``page``
+        and ``page_total`` are then not returned and ``page`` is ignored.
+    :kwarg total: A boolean to include the ``total`` number of packages
+        when using the cursor-based pagination. Defaults to False.
 
     *Results are paginated*
 
@@ -912,6 +993,7 @@ List packages
             branches = [None]
         if not statuses:
             statuses = [None]
+        cursor = get_cursor()
 
         if count:
             packages = 0
@@ -935,6 +1017,14 @@ List packages
             output['packages'] = packages
             output['page'] = 1
             output['page_total'] = 1
+        elif cursor is not False:
+            output, httpcode = _cursor_package_list(
+                pattern, branches, statuses, poc, orphaned, critpath, eol,
+                acls, cursor, limit)
+        elif is_stream():
+            return _stream_package_list(
+                pattern, branches, statuses, poc, orphaned, critpath, eol,
+                acls, page, get_limit(stream=True))
         else:
             packages = set()
             packages_count = 0
@@ -953,6 +1043,7 @@ List packages
                         page=page,
                         limit=limit,
                         count=count,
+                        load='rows',
                     )
                 )
                 packages_count += pkgdblib.search_package(
@@ -975,10 +1066,12 @@ List packages
                 output['error'] = 'No packages found for these parameters'
                 httpcode = 404
             else:
-                output['packages'] = [
-                    pkg.to_json(acls=acls, collection=branches, package=False)
-                    for pkg in packages
-                ]
+                output['packages'] = readmodel.packages_to_json(
+                    SESSION,
+                    sorted(packages, key=lambda pkg: pkg.name),
+                    acls=acls,
+                    branches=branches,
+                )
                 output['output'] = 'ok'
                 output['page'] = int(page)
                 output['page_total'] = int(ceil(packages_count / float(limit)))
@@ -989,7 +1082,7 @@ List packages
         output['error'] = str(err)
         httpcode = 500
 
-    if 'page_total' not in output:
+    if 'page_total' not in output and 'next' not in output:
         output['page'] = 1
         output['page_total'] = 1
 
@@ -998,6 +1091,141 @@ List packages
     return jsonout
 
 
+def _cursor_package_list(
+        pattern, branches, statuses, poc, orphaned, critpath, eol, acls,
+        cursor, limit):
+    """ Return the output and HTTP code of the `api_package_list` endpoint
+    using the cursor-based pagination.
+
+    Each search seeks directly after the last package returned, using the
+    index on the package name, and retrieves one more package than asked
+    to know whether there is a next page, so no COUNT query is needed.
+    """
+    after = cursor[0] if cursor else None
+    queries = []
+    packages = []
+    for status, branch in itertools.product(statuses, branches):
+        kwargs = dict(
+            pkg_name=pattern,
+            pkg_branch=branch,
+            pkg_poc=poc,
+            orphaned=orphaned,
+            critpath=critpath,
+            status=status,
+            eol=eol,
+        )
+        packages.extend(pkgdblib.search_package(
+            SESSION, limit=limit + 1, after=after,
+            load='package_acls' if acls else None, **kwargs))
+        queries.append(kwargs)
+
+    if len(queries) > 1 and packages:
+        # Merge the results of the searches in the database's order
+        packages = model.Package.by_ids(
+            SESSION, set(pkg.id for pkg in packages))
+
+    output = {'output': 'ok', 'next': None}
+    httpcode = 200
+    if len(packages) > limit:
+        packages = packages[:limit]
+        output['next'] = pkgdblib.encode_cursor([packages[-1].name])
+
+    if not packages:
+        output['output'] = 'notok'
+        output['error'] = 'No packages found for these parameters'
+        httpcode = 404
+
+    output['packages'] = [
+        pkg.to_json(acls=acls, collection=branches, package=False)
+        for pkg in packages
+    ]
+
+    if want_total():
+        output['total'] = sum(
+            pkgdblib.search_package(SESSION, count=True, **kwargs)
+            for kwargs in queries
+        )
+
+    return output, httpcode
+
+
+def _stream_package_list(
+        pattern, branches, statuses, poc, orphaned, critpath, eol, acls,
+        page, limit):
+    """ Return the streamed output of the `api_package_list` endpoint.
+
+    The number of packages is retrieved first, so that the pagination
+    information and the error returned when no packages are found are the
+    same as in the non-streamed output, then the packages are serialized
+    one at a time while they are loaded from the database.
+    """
+    try:
+        offset = (abs(int(page)) - 1) * limit
+    except ValueError:
+        raise pkgdblib.PkgdbException('Wrong page provided')
+
+    queries = []
+    packages_count = 0
+    found = False
+    for status, branch in itertools.product(statuses, branches):
+        kwargs = dict(
+            pkg_name=pattern,
+            pkg_branch=branch,
+            pkg_poc=poc,
+            orphaned=orphaned,
+            critpath=critpath,
+            status=status,
+            eol=eol,
+            page=page,
+            limit=limit,
+        )
+        cnt = pkgdblib.search_package(SESSION, count=True, **kwargs)
+        packages_count += cnt
+        found = found or cnt > offset
+        queries.append(kwargs)
+
+    if not found:
+        output = {
+            'output': 'notok',
+            'packages': [],
+            'error': 'No packages found for these parameters',
+            'page': 1,
+            'page_total': 1,
+        }
+        jsonout = flask.jsonify(output)
+        jsonout.status_code = 404
+        return jsonout
+
+    def _packages():
+        """ Yield the JSON representation of each package found, only once
+        if it is returned by several of the queries. The listings and ACLs
+        of the packages are loaded by batches. """
+        seen = set()
+
+        def _unseen(rows):
+            """ Skip the packages returned by a previous query. """
+            for row in rows:
+                if row.id not in seen:
+                    seen.add(row.id)
+                    yield row
+
+        for kwargs in queries:
+            rows = pkgdblib.search_package(
+                SESSION, stream=True, load='rows', **kwargs)
+            if len(queries) > 1:
+                rows = _unseen(rows)
+            for pkg in readmodel.iter_packages_to_json(
+                    SESSION, rows, acls=acls, branches=branches):
+                yield pkg
+
+    output = {
+        'output': 'ok',
+        'page': int(page),
+        'page_total': int(ceil(packages_count / float(limit))),
+    }
+    return stream_json(output, 'packages', _packages())
+
+
 @API.route('/package/critpath/', methods=['POST'])
 @is_admin
 def api_package_critpath():
@@ -1089,3 +1317,48 @@ Critpath status
     jsonout = flask.jsonify(output)
     jsonout.status_code = httpcode
     return jsonout
+
+
+@API.route('/complete/packages/')
+@API.route('/complete/packages')
+def api_package_complete():
+    '''
+Complete package names
+----------------------
+    Return the name of the packages starting with the given prefix, case
+    insensitively. The names are kept in memory and the database is not
+    queried, which makes it suitable for completing the names as they are
+    typed.
+
+    ::
+
+        /api/complete/packages/?q=<prefix>
+
+    Accept GET queries only.
+
+    :arg q: String of the beginning of the names.
+    :kwarg limit: An integer to limit the number of names returned,
+        defaults to 10, maximum is 50.
+
+    Sample response:
+
+    ::
+
+        /api/complete/packages/?q=gu
+
+        {
+          "output": "ok",
+          "packages": [
+            "guake",
+            "gummi"
+          ]
+        }
+
+    '''
+    prefix = flask.request.args.get('q', '')
+    limit = get_limit(default=10, maximum=50)
+
+    names = pkgdblib.complete_package(SESSION, prefix, limit=limit)
+    SESSION.commit()
+
+    return flask.jsonify({'output': 'ok', 'packages': names})
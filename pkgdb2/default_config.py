@@ -40,6 +40,29 @@ SITE_URL = SITE_ROOT
 # url to the database server:
 DB_URL = 'sqlite:////var/tmp/pkgdb2_dev.sqlite'
 
+# Connection pool of the database, ignored for SQLite.
+# Number of connections kept open by each process
+DB_POOL_SIZE = 5
+# Number of connections which can be opened beyond DB_POOL_SIZE when they
+# are all in use
+DB_MAX_OVERFLOW = 10
+# Number of seconds to wait for a connection before failing the request
+DB_POOL_TIMEOUT = 30
+# Number of seconds after which a connection is closed and replaced
+DB_POOL_RECYCLE = 3600
+# Check that a connection is alive before each use
+DB_POOL_PRE_PING = True
+# Maximum duration of a SQL statement in seconds (PostgreSQL only), None
+# for no limit
+DB_STATEMENT_TIMEOUT = None
+# URLs of the read-only replicas of the database
+DB_REPLICA_URLS = []
+# Blueprints whose GET requests read from the replicas
+DB_REPLICA_BLUEPRINTS = ['api_ns']
+# Number of seconds during which a user who changed something keeps
+# reading from the primary database
+DB_REPLICA_STICKINESS = 30
+
 # the number of items to display on the search pages
 ITEMS_PER_PAGE = 50
 
@@ -60,6 +83,9 @@ PKGDB2_CACHE_BACKEND = 'dogpile.cache.memcached'
 PKGDB2_CACHE_KWARGS = {
     'arguments': {
         'url': "127.0.0.1:11211",
+        # Compress the large exports (bugzilla, vcs...) so they fit in
+        # memcached's default 1MB item size
+        'min_compress_len': 102400,
     }
 }
 
@@ -73,6 +99,14 @@ PKGDB2_BUGZILLA_NOTIFICATION = False
 PKGDB2_BUGZILLA_URL = 'https://bugzilla.redhat.com'
 PKGDB2_BUGZILLA_USER = None
 PKGDB2_BUGZILLA_PASSWORD = None
+# Queue the reassignments of the bugs in the database, the
+# ``pkgdb2_bugzilla_jobs`` script then makes them, instead of making them
+# during the requests
+PKGDB2_BUGZILLA_JOBS = False
+# Number of jobs run together by the ``pkgdb2_bugzilla_jobs`` script
+PKGDB2_BUGZILLA_BATCH_SIZE = 50
+# Number of queries run at the same time on bugzilla
+PKGDB2_BUGZILLA_THREADS = 4
 
 # Settings specific to the ``pkgdb-sync-bugzilla`` script/cron
 PKGDB2_BUGZILLA_NOTIFY_EMAIL = [
@@ -82,12 +116,24 @@ BUGZILLA_COMPONENT_API = "component.get"
 PKGDB2_BUGZILLA_NOTIFY_USER = None
 PKGDB2_BUGZILLA_NOTIFY_PASSWORD = None
 PKGDB2_BUGZILLA_DRY_RUN = False
+# File storing the state of the components last pushed to bugzilla, only
+# the components which changed since are updated
+PKGDB2_BUGZILLA_SYNC_CACHE = '/var/cache/pkgdb2/bugzilla-components.json'
+# Number of threads calling bugzilla at the same time
+PKGDB2_BUGZILLA_SYNC_THREADS = 4
+# Maximum number of calls per second to bugzilla
+PKGDB2_BUGZILLA_SYNC_RATE = 10
+# Number of components retrieved per call
+PKGDB2_BUGZILLA_SYNC_SEGMENT = 1000
 
 # FAS information
 PKGDB2_FAS_URL = None
 PKGDB2_FAS_USER = None
 PKGDB2_FAS_PASSWORD = None
 PKGDB2_FAS_INSECURE = False
+# Seconds after which the packagers, emails and groups retrieved from FAS
+# are refreshed in the background
+PKGDB2_FAS_CACHE_EXPIRATION = 3600
 
 # pkgdb notifications
 PKGDB2_FEDMSG_NOTIFICATION = True
@@ -96,8 +142,39 @@ PKGDB2_EMAIL_TO = '{pkg_name}-owner@fedoraproject.org'
 PKGDB2_EMAIL_FROM = 'nobody@fedoraproject.org'
 PKGDB2_EMAIL_SMTP_SERVER = 'localhost'
 PKGDB2_EMAIL_CC = None
+# Queue the notifications in the Outbox table, sent by the
+# ``pkgdb2_dispatch_notifications`` script, instead of sending them during
+# the requests
+PKGDB2_NOTIFICATION_OUTBOX = False
+PKGDB2_OUTBOX_BATCH_SIZE = 100
+PKGDB2_OUTBOX_MAX_ATTEMPTS = 10
+# Seconds before retrying to send a notification, doubled at every attempt
+PKGDB2_OUTBOX_RETRY_DELAY = 60
 
 MAIL_ADMIN = 'pingou@pingoured.fr'
 
 # List the packages that are not accessible to the provenpackager group
 PKGS_NOT_PROVENPACKAGER = ['firefox', 'thunderbird', 'xulrunner']
+
+# Backend used to search the packages: 'like', 'trigram' (PostgreSQL
+# with pg_trgm), 'fts5' (SQLite) or 'auto' to use the best one the
+# database supports
+PKGDB2_SEARCH_BACKEND = 'auto'
+
+# Number of seconds between two checks of whether the package and
+# packager names used by /api/complete/ changed
+PKGDB2_COMPLETE_CHECK_INTERVAL = 30
+
+# Number of seconds between two checks of whether the collections and the
+# lists of statuses and ACLs kept in memory changed
+PKGDB2_REFERENCE_CHECK_INTERVAL = 30
+
+# SQL instrumentation: number of queries and time spent in the database
+# for each request, returned in the Server-Timing header and shown on the
+# /admin/queries/ page
+PKGDB2_QUERY_STATS = True
+# Requests taking longer than this (in seconds) are logged with their
+# slowest SQL statements
+PKGDB2_SLOW_REQUEST = 1.0
+# Number of slowest statements kept for each request
+PKGDB2_SLOW_QUERIES_KEPT = 5
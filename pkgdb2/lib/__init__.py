@@ -23,11 +23,13 @@
 PkgDB internal API to interact with the database.
 '''
 
+import base64
+import json
 import operator
 
 import sqlalchemy
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.exc import NoResultFound
@@ -37,6 +39,10 @@ from fedora.client.fas2 import FASError
 
 import pkgdb2
 from pkgdb2.lib import model
+import pkgdb2.lib.complete
+import pkgdb2.lib.engines
+import pkgdb2.lib.reference
+import pkgdb2.lib.search
 import pkgdb2.lib.utils
 from pkgdb2.lib.exceptions import PkgdbException, PkgdbBugzillaException
 
@@ -92,22 +98,57 @@ def _validate_poc(pkg_poc):
                 'User "%s" is not in the packager group' % pkg_poc)
 
 
-def create_session(db_url, debug=False, pool_recycle=3600):
+def encode_cursor(values):
+    """ Return the opaque token to give back to retrieve the next page of
+    results in cursor-based pagination.
+
+    :arg values: the list of the values identifying the last result
+        returned, as expected by the ``after`` argument of the search
+        functions.
+
+    """
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(token):
+    """ Return the list of values encoded in the provided cursor token.
+
+    :arg token: a token returned by :func:`encode_cursor`.
+    :raises pkgdb2.lib.PkgdbException: The token provided is invalid.
+
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise PkgdbException('Invalid cursor provided')
+    if not isinstance(values, list) or not values:
+        raise PkgdbException('Invalid cursor provided')
+    return values
+
+
+def create_session(db_url, debug=False, pool_recycle=3600, **kwargs):
     """ Create the Session object to use to query the database.
 
+    The engine connecting to the database is only created when the session
+    is first used, and once per process.
+
     :arg db_url: URL used to connect to the database. The URL contains
     information with regards to the database engine, the host to connect
     to, the user and password and the database name.
       ie: <engine>://<user>:<password>@<host>/<dbname>
     :kwarg debug: a boolean specifying wether we should have the verbose
         output of sqlalchemy or not.
+    :kwarg pool_recycle: the number of seconds after which a connection is
+        closed and replaced.
+    :kwarg kwargs: the configuration of the connection pool, see
+        ``pkgdb2.lib.engines.EngineFactory``.
     :return a Session that can be used to query the database.
 
     """
-    engine = sqlalchemy.create_engine(db_url,
-                                      echo=debug,
-                                      pool_recycle=pool_recycle)
-    scopedsession = scoped_session(sessionmaker(bind=engine))
+    engines = pkgdb2.lib.engines.EngineFactory(
+        db_url, debug=debug, pool_recycle=pool_recycle, **kwargs)
+    scopedsession = scoped_session(sessionmaker(
+        class_=pkgdb2.lib.engines.Session, engines=engines))
     return scopedsession
 
 
@@ -187,7 +228,7 @@ def add_package(session, pkg_name, pkg_summary, pkg_description, pkg_status,
             pkgdb2.lib.utils.log(session, package, 'package.new', dict(
                 agent=user.username,
                 package_name=package.name,
-                package_listing=pkglisting.to_json(),
+                package_listing=pkglisting,
             ))
 
     # Add all new ACLs to the owner
@@ -205,14 +246,14 @@ def add_package(session, pkg_name, pkg_summary, pkg_description, pkg_status,
                             status='Approved',
                             user=user)
     try:
-        session.flush()
+        model.PackageAclSnapshot.refresh(session, package_ids=[package.id])
         return 'Package created'
     except SQLAlchemyError, err:  # pragma: no cover
         pkgdb2.LOG.exception(err)
         raise PkgdbException('Could not add ACLs')
 
 
-def get_acl_package(session, pkg_name, pkg_clt=None, eol=False):
+def get_acl_package(session, pkg_name, pkg_clt=None, eol=False, load=None):
     """ Return the ACLs for the specified package.
 
     :arg session: session with which to connect to the database.
@@ -223,34 +264,118 @@ def get_acl_package(session, pkg_name, pkg_clt=None, eol=False):
         EOL collections or not. Defaults to False.
         If True, it will return results for all collections (including EOL).
         If False, it will return results only for non-EOL collections.
+    :kwarg load: the name of the loading profile eager-loading the
+        relations used afterward, see `pkgdb2.lib.model.load_options`.
     :returns: a list of ``PackageListing``.
     :rtype: list(PackageListing)
     :raises sqlalchemy.orm.exc.NoResultFound: when there is no package
         found in the database with the name ``pkg_name``.
 
     """
-    package = model.Package.by_name(session, pkg_name)
-    pkglisting = model.PackageListing.by_package_id(session, package.id)
-
-    if pkg_clt:
-        if isinstance(pkg_clt, basestring):
-            pkg_clt = [pkg_clt]
-        tmp = []
-        for pkglist in pkglisting:
-            if pkglist.collection.branchname in pkg_clt:
-                tmp.append(pkglist)
-        pkglisting = tmp
-
-    if not eol:
-        tmp = []
-        for pkglist in pkglisting:
-            if pkglist.collection.status != 'EOL':
-                tmp.append(pkglist)
-        pkglisting = tmp
+    pkglisting = model.PackageListing.by_package_name(
+        session, pkg_name, branches=pkg_clt, eol=eol, load=load)
+
+    if not pkglisting:
+        # Raises NoResultFound if the package does not exist
+        model.Package.by_name(session, pkg_name)
 
     return pkglisting
 
 
+def get_package_page(session, pkg_name):
+    """ Return the information displayed on the page of a package, loaded
+    with two queries and pivoted by user and branch.
+
+    :arg session: session with which to connect to the database.
+    :arg pkg_name: the name of the package.
+    :returns: a dictionnary with the keys:
+        - ``package``: the ``Package``,
+        - ``listings``: its non-EOL ``PackageListing``, reverse sorted by
+          collection,
+        - ``branches``: the set of the names of their collection,
+        - ``statuses``: the set of their status,
+        - ``pocs``: the branches of each point of contact,
+        - ``admins`` and ``pending_admins``: the branches of the users
+          with the ``approveacls`` ACL approved or awaiting review,
+        - ``commit_acls`` and ``watch_acls``: the status of the ACLs of
+          the committers and watchers, by user, branch and ACL,
+        - ``committers``: the users with an approved ``commit`` ACL.
+    :raises sqlalchemy.orm.exc.NoResultFound: when the package does not
+        exist or is only in EOL collections.
+
+    """
+    listings = model.PackageListing.by_package_name(
+        session, pkg_name, load='listing_acls')
+    if not listings:
+        raise NoResultFound()
+
+    planned_acls = get_status(session, 'pkg_acl')['pkg_acl']
+
+    branches = set()
+    statuses = set()
+    commit_acls = {}
+    watch_acls = {}
+    admins = {}
+    pending_admins = {}
+    pocs = {}
+    committers = []
+
+    for pkg in listings:
+        collection_name = '%s %s' % (
+            pkg.collection.name, pkg.collection.version)
+
+        branches.add(collection_name)
+        statuses.add(pkg.status)
+        pocs.setdefault(pkg.point_of_contact, set()).add(collection_name)
+
+        for acl in pkg.acls:
+            if acl.acl == 'approveacls':
+                if acl.status == 'Approved':
+                    admins.setdefault(
+                        acl.fas_name, set()).add(collection_name)
+                elif acl.status == 'Awaiting Review':
+                    pending_admins.setdefault(
+                        acl.fas_name, set()).add(collection_name)
+                continue
+
+            if acl.acl == 'commit':
+                dic = commit_acls
+                if acl.status == 'Approved':
+                    committers.append(acl.fas_name)
+            elif acl.acl.startswith('watch') and acl.status == 'Approved':
+                dic = watch_acls
+            else:
+                continue
+
+            dic.setdefault(acl.fas_name, {}).setdefault(
+                collection_name, {})[acl.acl] = acl.status
+
+    # Every ACL is listed for the users having some on a branch
+    for dic in (commit_acls, watch_acls):
+        for user_acls in dic.values():
+            for branch_acls in user_acls.values():
+                for aclname in planned_acls:
+                    branch_acls.setdefault(aclname, None)
+
+    listings = sorted(
+        listings,
+        key=lambda pkg: pkg.collection.name + pkg.collection.version,
+        reverse=True)
+
+    return dict(
+        package=listings[0].package,
+        listings=listings,
+        branches=branches,
+        statuses=statuses,
+        pocs=pocs,
+        admins=admins,
+        pending_admins=pending_admins,
+        commit_acls=commit_acls,
+        watch_acls=watch_acls,
+        committers=committers,
+    )
+
+
 def set_acl_package(session, pkg_name, pkg_branch, pkg_user, acl, status,
                     user):
     """ Set the specified ACLs for the specified package.
@@ -318,8 +443,8 @@ def set_acl_package(session, pkg_name, pkg_branch, pkg_user, acl, status,
         session.flush()
         pkgdb2.lib.utils.log(session, package, 'package.branch.new', dict(
             agent=user.username,
-            package=package.to_json(acls=False),
-            package_listing=pkglisting.to_json(),
+            package=pkgdb2.lib.utils.LazyJson(package, acls=False),
+            package_listing=pkglisting,
         ))
 
     create = False
@@ -343,6 +468,7 @@ def set_acl_package(session, pkg_name, pkg_branch, pkg_user, acl, status,
     else:
         personpkg.status = status
     session.flush()
+    model.PackageAclSnapshot.refresh(session, package_ids=[package.id])
     return pkgdb2.lib.utils.log(session, package, 'acl.update', dict(
         agent=user.username,
         username=pkg_user,
@@ -350,10 +476,218 @@ def set_acl_package(session, pkg_name, pkg_branch, pkg_user, acl, status,
         previous_status=prev_status,
         status=status,
         package_name=pkglisting.package.name,
-        package_listing=pkglisting.to_json(),
+        package_listing=pkglisting,
     ))
 
 
+def set_acl_packages(session, pkg_names, pkg_branches, pkg_user, acls,
+                     user):
+    """ Set the specified ACLs on several packages and branches at once.
+
+    This does the same as calling `set_acl_package` for every combination
+    of package, branch and ACL, but the packages, collections, listings and
+    ACLs are retrieved with a few queries, the changes are logged in a
+    single statement and a single ``acl.update.bulk`` message is published
+    on fedmsg (the usual ``acl.update`` one if a single ACL changed).
+
+    :arg session: session with which to connect to the database.
+    :arg pkg_names: the list of the names of the packages.
+    :arg pkg_branches: the list of the names of the collections.
+    :arg pkg_user: the FAS user for which the ACLs should be set/change.
+    :arg acls: a list of ``(acl, status)`` tuples, the ACLs to set and the
+        status to set them to.
+    :arg user: the user making the action.
+    :returns: the message logged for each combination of package, branch
+        and ACL, in the order of ``itertools.product(pkg_names,
+        pkg_branches, acls)``, ``None`` for the combinations for which
+        there was nothing to update.
+    :rtype: list
+    :raises pkgdb2.lib.PkgdbException: in the same conditions as
+        `set_acl_package`, before anything is changed.
+
+    """
+    for acl, status in acls:
+        if acl not in pkgdb2.APP.config['AUTO_APPROVE'] \
+                and status not in ('Removed', 'Obsolete'):
+            _validate_poc(pkg_user)
+            break
+
+    packages = {}
+    if pkg_names:
+        for package in session.query(model.Package).filter(
+                model.Package.name.in_(set(pkg_names))):
+            packages[package.name] = package
+    for pkg_name in pkg_names:
+        if pkg_name not in packages:
+            raise PkgdbException('No package found by this name')
+
+    collections = {}
+    if pkg_branches:
+        for collection in session.query(model.Collection).filter(
+                model.Collection.branchname.in_(set(pkg_branches))):
+            collections[collection.branchname] = collection
+    for pkg_branch in pkg_branches:
+        if pkg_branch not in collections:
+            raise PkgdbException('No collection found by the name of %s'
+                                 % pkg_branch)
+
+    combinations = [
+        (packages[pkg_name], collections[pkg_branch], acl, status)
+        for pkg_name in pkg_names
+        for pkg_branch in pkg_branches
+        for acl, status in acls
+    ]
+    if not combinations:
+        return []
+    package_ids = set(package.id for package in packages.values())
+    collection_ids = set(
+        collection.id for collection in collections.values())
+
+    # The listings on which the user can approve ACLs, see is_pkg_admin
+    admin = pkgdb2.is_pkgdb_admin(user)
+    approver = set()
+    if not admin:
+        approver = set(session.query(
+            model.PackageListing.package_id,
+            model.PackageListing.collection_id,
+        ).join(
+            model.PackageListingAcl,
+            model.PackageListingAcl.packagelisting_id
+            == model.PackageListing.id
+        ).filter(
+            model.PackageListingAcl.fas_name == user.username,
+            model.PackageListingAcl.acl == 'approveacls',
+            model.PackageListingAcl.status == 'Approved',
+            model.PackageListing.package_id.in_(package_ids),
+            model.PackageListing.collection_id.in_(collection_ids),
+        ).all())
+
+    for package, collection, acl, status in combinations:
+        if not admin and (package.id, collection.id) not in approver:
+            if user.username != pkg_user \
+                    and not pkg_user.startswith('group::'):
+                raise PkgdbException('You are not allowed to update ACLs of '
+                                     'someone else.')
+            elif user.username == pkg_user and status not in \
+                    ('Awaiting Review', 'Removed', 'Obsolete', '') \
+                    and acl not in pkgdb2.APP.config['AUTO_APPROVE']:
+                raise PkgdbException(
+                    'You are not allowed to approve or deny '
+                    'ACLs for yourself.')
+
+        if pkg_user.startswith('group::') and acl == 'approveacls':
+            raise PkgdbException(
+                'Groups cannot have "approveacls".')
+
+    listings = {}
+    for pkglisting in session.query(model.PackageListing).filter(
+            model.PackageListing.package_id.in_(package_ids),
+            model.PackageListing.collection_id.in_(collection_ids)):
+        listings[(pkglisting.package_id, pkglisting.collection_id)] = \
+            pkglisting
+
+    for package, collection, acl, status in combinations:
+        key = (package.id, collection.id)
+        if key not in listings:
+            pkglisting = package.create_listing(point_of_contact=pkg_user,
+                                                collection=collection,
+                                                statusname='Approved')
+            session.add(pkglisting)
+            session.flush()
+            pkgdb2.lib.utils.log(session, package, 'package.branch.new', dict(
+                agent=user.username,
+                package=pkgdb2.lib.utils.LazyJson(package, acls=False),
+                package_listing=pkglisting,
+            ))
+            listings[key] = pkglisting
+
+    existing = {}
+    for personpkg in session.query(model.PackageListingAcl).filter(
+            model.PackageListingAcl.fas_name == pkg_user,
+            model.PackageListingAcl.packagelisting_id.in_(
+                set(pkglisting.id for pkglisting in listings.values())),
+            model.PackageListingAcl.acl.in_(set(acl for acl, _ in acls))):
+        existing[(personpkg.packagelisting_id, personpkg.acl)] = personpkg
+
+    output = []
+    changes = []
+    for package, collection, acl, status in combinations:
+        pkglisting = listings[(package.id, collection.id)]
+        key = (pkglisting.id, acl)
+        personpkg = existing.get(key)
+        if personpkg is None:
+            if not status:
+                output.append(None)
+                continue
+            prev_status = ''
+            personpkg = model.PackageListingAcl(
+                fas_name=pkg_user,
+                packagelisting_id=pkglisting.id,
+                acl=acl,
+                status=status)
+            session.add(personpkg)
+            existing[key] = personpkg
+        elif personpkg.status == status:
+            output.append(None)
+            continue
+        else:
+            prev_status = personpkg.status
+            if not status:
+                session.delete(personpkg)
+                del existing[key]
+            else:
+                personpkg.status = status
+
+        output.append(len(changes))
+        changes.append((package, pkglisting, dict(
+            agent=user.username,
+            username=pkg_user,
+            acl=acl,
+            previous_status=prev_status,
+            status=status,
+            package_name=package.name,
+        )))
+
+    if not changes:
+        return output
+
+    session.flush()
+    model.PackageAclSnapshot.refresh(
+        session,
+        package_ids=list(set(package.id for package, _, _ in changes)))
+
+    if len(changes) == 1:
+        package, pkglisting, message = changes[0]
+        message['package_listing'] = pkglisting
+        messages = [pkgdb2.lib.utils.log(
+            session, package, 'acl.update', message)]
+    else:
+        entries = []
+        for package, pkglisting, message in changes:
+            message['package_listing'] = pkglisting
+            entries.append((package, message))
+        messages = pkgdb2.lib.utils.log_many(
+            session, 'acl.update.bulk', entries, dict(
+                agent=user.username,
+                username=pkg_user,
+                changes=[
+                    dict(
+                        package_name=message['package_name'],
+                        branch=pkglisting.collection.branchname,
+                        acl=message['acl'],
+                        previous_status=message['previous_status'],
+                        status=message['status'],
+                    )
+                    for _, pkglisting, message in changes
+                ],
+            ))
+
+    return [
+        messages[idx] if idx is not None else None
+        for idx in output
+    ]
+
+
 def update_pkg_poc(session, pkg_name, pkg_branch, pkg_poc, user):
     """ Change the point of contact of a package.
 
@@ -387,7 +721,8 @@ def update_pkg_poc(session, pkg_name, pkg_branch, pkg_poc, user):
         raise PkgdbException('No package found by this name')
 
     try:
-        collection = model.Collection.by_name(session, pkg_branch)
+        collection = pkgdb2.lib.reference.REGISTRY.get_collection(
+            session, pkg_branch, force=True)
     except NoResultFound:
         raise PkgdbException('No collection found by the name of %s'
                              % pkg_branch)
@@ -437,19 +772,20 @@ def update_pkg_poc(session, pkg_name, pkg_branch, pkg_poc, user):
 
     session.add(pkglisting)
     session.flush()
+    model.PackageAclSnapshot.refresh(session, package_ids=[package.id])
     output = pkgdb2.lib.utils.log(
         session, pkglisting.package, 'owner.update', dict(
             agent=user.username,
             username=pkg_poc,
             previous_owner=prev_poc,
             package_name=pkglisting.package.name,
-            package_listing=pkglisting.to_json(),
+            package_listing=pkglisting,
         )
     )
     # Update Bugzilla about new owner
     pkgdb2.lib.utils.set_bugzilla_owner(
         pkg_poc, prev_poc, package.name, collection.name,
-        collection.version)
+        collection.version, session=session)
 
     return output
 
@@ -488,7 +824,8 @@ def update_pkg_status(session, pkg_name, pkg_branch, status, user,
         raise PkgdbException('No package found by this name')
 
     try:
-        collection = model.Collection.by_name(session, pkg_branch)
+        collection = pkgdb2.lib.reference.REGISTRY.get_collection(
+            session, pkg_branch, force=True)
     except NoResultFound:
         raise PkgdbException('No collection found by this name')
 
@@ -530,7 +867,7 @@ def update_pkg_status(session, pkg_name, pkg_branch, status, user,
                 # Update Bugzilla about new owner
                 pkgdb2.lib.utils.set_bugzilla_owner(
                     poc, prev_poc, package.name, collection.name,
-                    collection.version)
+                    collection.version, session=session)
         else:
             raise PkgdbException(
                 'You are not allowed to retire the '
@@ -559,7 +896,7 @@ def update_pkg_status(session, pkg_name, pkg_branch, status, user,
         # Update Bugzilla about new owner
         pkgdb2.lib.utils.set_bugzilla_owner(
             poc, prev_poc, package.name, collection.name,
-            collection.version)
+            collection.version, session=session)
 
     else:
         raise PkgdbException(
@@ -568,6 +905,7 @@ def update_pkg_status(session, pkg_name, pkg_branch, status, user,
                 package.name, collection.branchname, status)
         )
 
+    model.PackageAclSnapshot.refresh(session, package_ids=[package.id])
     return pkgdb2.lib.utils.log(
         session,
         package,
@@ -577,14 +915,16 @@ def update_pkg_status(session, pkg_name, pkg_branch, status, user,
             status=status,
             prev_status=prev_status,
             package_name=package.name,
-            package_listing=pkglisting.to_json(),
+            package_listing=pkglisting,
         )
     )
 
 
 def search_package(session, pkg_name, pkg_branch=None, pkg_poc=None,
                    orphaned=None, critpath=None, status=None, eol=False,
-                   page=None, limit=None, count=False, case_sensitive=True):
+                   page=None, limit=None, count=False, case_sensitive=True,
+                   stream=False, after=None, load=None, mode='name',
+                   rank=False):
     """ Return the list of packages matching the given criteria.
 
     :arg session: session with which to connect to the database.
@@ -605,6 +945,17 @@ def search_package(session, pkg_name, pkg_branch=None, pkg_poc=None,
        if true, returns the data if false (default).
     :kwarg case_sensitive: a boolean to specify doing a case insensitive
         search. Defaults to True.
+    :kwarg stream: a boolean to return an iterable query loading the
+        packages by batches instead of a list. Defaults to False.
+    :kwarg after: the name of the package after which to return the
+        results, the ``page`` is then ignored.
+    :kwarg load: the name of the loading profile eager-loading the
+        relations used afterward, see `pkgdb2.lib.model.load_options`.
+    :kwarg mode: ``name`` to search the pattern in the name of the
+        packages (default), ``summary`` to search it in their name, summary
+        and description.
+    :kwarg rank: a boolean to order the packages by relevance instead of
+        alphabetically. Defaults to False.
     :returns: a list of ``Package`` entry corresponding to the given
         criterias.
     :rtype: list(Package)
@@ -612,8 +963,15 @@ def search_package(session, pkg_name, pkg_branch=None, pkg_poc=None,
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``mode`` is not supported.
+            - ``rank`` and ``after`` are both provided.
 
     """
+    if mode not in pkgdb2.lib.search.MODES:
+        raise PkgdbException('Wrong search mode provided')
+    if rank and after is not None:
+        raise PkgdbException('Ranked results cannot be paginated by cursor')
+
     if '*' in pkg_name:
         pkg_name = pkg_name.replace('*', '%')
     if orphaned:
@@ -635,6 +993,9 @@ def search_package(session, pkg_name, pkg_branch=None, pkg_poc=None,
     if page is not None and page > 0 and limit is not None and limit > 0:
         page = (page - 1) * limit
 
+    if after is not None:
+        page = None
+
     return model.Package.search(
         session,
         pkg_name=pkg_name,
@@ -648,6 +1009,12 @@ def search_package(session, pkg_name, pkg_branch=None, pkg_poc=None,
         limit=limit,
         count=count,
         case_sensitive=case_sensitive,
+        stream=stream,
+        after=after,
+        load=load,
+        backend=pkgdb2.lib.search.get_backend(session),
+        mode=mode,
+        rank=rank,
     )
 
 
@@ -698,7 +1065,7 @@ def search_collection(session, pattern, status=None, page=None,
 
 
 def search_packagers(session, pattern, eol=False, page=None, limit=None,
-                     count=False):
+                     count=False, after=None):
     """ Return the list of Packagers maching the given pattern.
 
     :arg session: session with which to connect to the database.
@@ -711,6 +1078,8 @@ def search_packagers(session, pattern, eol=False, page=None, limit=None,
     :kwarg limit: the number of results to return.
     :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+    :kwarg after: the name of the packager after which to return the
+        results, the ``page`` is then ignored.
     :returns: a list of ``PackageListing`` entry corresponding to the given
         criterias.
     :rtype: list(PackageListing)
@@ -738,20 +1107,24 @@ def search_packagers(session, pattern, eol=False, page=None, limit=None,
     if page is not None and page > 0 and limit is not None and limit > 0:
         page = (page - 1) * limit
 
+    if after is not None:
+        page = None
+
     packagers = model.PackageListing.search_packagers(
         session,
         pattern=pattern,
         eol=eol,
         offset=page,
         limit=limit,
-        count=count)
+        count=count,
+        after=after)
 
     return packagers
 
 
 def search_logs(session, package=None, packager=None,
                 from_date=None, page=None,
-                limit=None, count=False):
+                limit=None, count=False, after=None):
     """ Return the list of Collection matching the given criteria.
 
     :arg session: session with which to connect to the database.
@@ -762,12 +1135,16 @@ def search_logs(session, package=None, packager=None,
     :kwarg limit: the number of results to return.
     :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+    :kwarg after: the values returned by :func:`log_cursor` for the log
+        entry after which to return the results, the ``page`` is then
+        ignored.
     :returns: a list of ``Log`` entry corresponding to the given criterias.
     :rtype: list(Log)
     :raises pkgdb2.lib.PkgdbException: There are few conditions leading to
         this exception beeing raised:
             - The provided ``limit`` is not an integer.
             - The provided ``page`` is not an integer.
+            - The provided ``after`` is not a valid log position.
             - The ``package`` name specified does not correspond to any
                 package.
 
@@ -799,18 +1176,40 @@ def search_logs(session, package=None, packager=None,
         # Make sure we get all the events of the day asked
         from_date = from_date + timedelta(days=1)
 
+    if after is not None:
+        page = None
+        try:
+            change_time, log_id = after
+            after = (
+                datetime.strptime(change_time, '%Y-%m-%dT%H:%M:%S.%f'),
+                int(log_id))
+        except (TypeError, ValueError):
+            raise PkgdbException('Invalid cursor provided')
+
     return model.Log.search(session,
                             package_id=package_id,
                             packager=packager,
                             from_date=from_date,
                             offset=page,
                             limit=limit,
-                            count=count)
+                            count=count,
+                            after=after)
+
+
+def log_cursor(log):
+    """ Return the values identifying the position of the provided log
+    entry, to give to :func:`search_logs` to retrieve the entries after it.
+
+    :arg log: a ``Log`` entry.
+
+    """
+    return [log.change_time.strftime('%Y-%m-%dT%H:%M:%S.%f'), log.id]
 
 
 def get_acl_packager(
         session, packager, acls=None, eol=False, poc=None,
-        page=1, limit=100, count=False):
+        page=1, limit=100, count=False, stream=False, after=None,
+        load=None):
     """ Return the list of ACL associated with a packager.
 
     :arg session: session with which to connect to the database.
@@ -833,6 +1232,12 @@ def get_acl_packager(
     :kwarg limit: the number of results to return.
     :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+    :kwarg stream: a boolean to return an iterable query loading the ACLs
+        by batches instead of a list. Defaults to False.
+    :kwarg after: the identifier of the ACL after which to return the
+        results, the ``page`` is then ignored.
+    :kwarg load: the name of the loading profile eager-loading the
+        relations used afterward, see `pkgdb2.lib.model.load_options`.
     :returns: a list of ``PackageListingAcl`` associated to the specified
         user.
     :rtype: list(PackageListingAcl)
@@ -848,6 +1253,9 @@ def get_acl_packager(
     if page is not None and page > 0 and limit is not None and limit > 0:
         page = (page - 1) * limit
 
+    if after is not None:
+        page = None
+
     return model.PackageListingAcl.get_acl_packager(
         session,
         packager=packager,
@@ -856,7 +1264,10 @@ def get_acl_packager(
         poc=poc,
         offset=page,
         limit=limit,
-        count=count)
+        count=count,
+        stream=stream,
+        after=after,
+        load=load)
 
 
 def get_critpath_packages(session, branch=None):
@@ -915,6 +1326,51 @@ def get_package_maintained(
     return [output[key] for key in sorted(output)]
 
 
+def get_packager_stats(session, packagers, eol=False):
+    """ Return the number of packages each packager is the point of contact
+    of or co-maintains on each branch.
+
+    :arg session: session with which to connect to the database.
+    :arg packagers: the name of the packager or the list of the names of
+        the packagers to retrieve the stats of.
+    :kwarg eol: a boolean to specify wether the output should include
+        End Of Life releases or not. Nothing is maintained on them, so
+        their counts are always 0.
+    :returns: a dictionnary of the stats of each packager, the stats being
+        a dictionnary of the ``point of contact`` and ``co-maintainer``
+        counts by branchname, for every Active and Under Development
+        collection, or every collection if ``eol`` is True.
+    :rtype: dict(str(): dict(str(): dict(str(): int)))
+
+    """
+    if isinstance(packagers, basestring):
+        packagers = [packagers]
+
+    branches = [
+        collection.branchname
+        for collection in model.Collection.all(session)
+        if eol or collection.status in ('Active', 'Under Development')
+    ]
+
+    output = {}
+    for packager in packagers:
+        output[packager] = dict(
+            (branch, {'point of contact': 0, 'co-maintainer': 0})
+            for branch in branches)
+
+    if not packagers:
+        return output
+
+    for packager, branch, poc, count in model.Package.count_package_of_users(
+            session, packagers):
+        if branch not in output[packager]:
+            continue
+        key = 'point of contact' if poc else 'co-maintainer'
+        output[packager][branch][key] = count
+
+    return output
+
+
 def get_package_watch(
         session, packager, branch=None, pkg_status=None, eol=False):
     """ Return all the packages and branches that the given packager
@@ -985,9 +1441,10 @@ def add_collection(session, clt_name, clt_version, clt_status,
     try:
         session.add(collection)
         session.flush()
+        pkgdb2.lib.reference.invalidate(session)
         pkgdb2.lib.utils.log(session, None, 'collection.new', dict(
             agent=user.username,
-            collection=collection.to_json(),
+            collection=collection,
         ))
         return 'Collection "%s" created' % collection.branchname
     except SQLAlchemyError, err:  # pragma: no cover
@@ -1052,6 +1509,9 @@ def edit_collection(session, collection, clt_name=None, clt_version=None,
         try:
             session.add(collection)
             session.flush()
+            model.PackageAclSnapshot.refresh(
+                session, collection_ids=[collection.id])
+            pkgdb2.lib.reference.invalidate(session)
             pkgdb2.lib.utils.log(
                 session,
                 None,
@@ -1059,7 +1519,7 @@ def edit_collection(session, collection, clt_name=None, clt_version=None,
                 dict(
                     agent=user.username,
                     fields=edited,
-                    collection=collection.to_json(),
+                    collection=collection,
                 )
             )
             return 'Collection "%s" edited' % collection.branchname
@@ -1125,10 +1585,12 @@ def edit_package(session, package, pkg_name=None, pkg_summary=None,
         try:
             session.add(package)
             session.flush()
+            model.PackageAclSnapshot.refresh(
+                session, package_ids=[package.id])
             pkgdb2.lib.utils.log(session, None, 'package.update', dict(
                 agent=user.username,
                 fields=edited,
-                package=package.to_json(acls=False),
+                package=pkgdb2.lib.utils.LazyJson(package, acls=False),
             ))
             return 'Package "%s" edited' % package.name
         except SQLAlchemyError, err:  # pragma: no cover
@@ -1170,10 +1632,13 @@ def update_collection_status(session, clt_branchname, clt_status, user):
                 prev_status, clt_status)
             session.add(collection)
             session.flush()
+            model.PackageAclSnapshot.refresh(
+                session, collection_ids=[collection.id])
+            pkgdb2.lib.reference.invalidate(session)
             pkgdb2.lib.utils.log(session, None, 'collection.update', dict(
                 agent=user.username,
                 fields=['status'],
-                collection=collection.to_json(),
+                collection=collection,
             ))
         else:
             message = 'Collection "%s" already had this status' % \
@@ -1290,6 +1755,9 @@ def get_status(session, status='all'):
         keys are: clt_status, pkg_status, pkg_acl, acl_status.
     :rtype: dict(str():list())
 
+    The status are read from the reference data of the process, see
+    :mod:`pkgdb2.lib.reference`.
+
     """
     output = {}
 
@@ -1298,17 +1766,81 @@ def get_status(session, status='all'):
     elif isinstance(status, basestring):
         status = [status]
 
-    if 'clt_status' in status:
-        output['clt_status'] = model.CollecStatus.all_txt(session)
-    if 'pkg_status' in status:
-        output['pkg_status'] = model.PkgStatus.all_txt(session)
-    if 'pkg_acl' in status:
-        output['pkg_acl'] = model.PkgAcls.all_txt(session)
-    if 'acl_status' in status:
-        output['acl_status'] = model.AclStatus.all_txt(session)
+    for name in ['clt_status', 'pkg_status', 'pkg_acl', 'acl_status']:
+        if name in status:
+            output[name] = pkgdb2.lib.reference.REGISTRY.get_status(
+                session, name)
     return output
 
 
+def get_generation(session, name='acls'):
+    """ Return the current value of the specified generation counter.
+
+    The ``acls`` counter is bumped when a transaction in which changes
+    were logged via :func:`pkgdb2.lib.utils.log` is committed, it can be
+    used to know whether some information derived from the database is
+    still up to date.
+
+    :arg session: session with which to connnect to the database.
+    :kwarg name: the name of the counter, defaults to ``acls``.
+    :returns: the value of the counter.
+    :rtype: int
+
+    """
+    return model.Generation.get(session, name)
+
+
+def get_cache_key(session):
+    """ Return the key identifying the current version of the cached
+    exports.
+
+    It is made of the random token of the ``database`` counter, so the
+    databases sharing the same cache, or a database created again, do not
+    read each other's entries, and of the ``acls`` generation counter.
+
+    :arg session: session with which to connnect to the database.
+    :returns: the key.
+    :rtype: str
+
+    """
+    values = model.Generation.get_many(session, ['database', 'acls'])
+    return '%(database)s-%(acls)s' % values
+
+
+def complete_package(session, prefix, limit=10):
+    """ Return the name of the packages starting with the given prefix.
+
+    The names are kept in memory and only reloaded from the database when
+    they changed, see :mod:`pkgdb2.lib.complete`.
+
+    :arg session: session with which to connnect to the database.
+    :arg prefix: the beginning of the names, case insensitive.
+    :kwarg limit: the maximum number of names to return, defaults to 10.
+    :returns: the names found, in alphabetical order.
+    :rtype: list(str)
+
+    """
+    index = pkgdb2.lib.complete.INDEX.get(session, 'packages')
+    return index.complete(prefix, limit)
+
+
+def complete_packager(session, prefix, limit=10):
+    """ Return the name of the packagers starting with the given prefix.
+
+    The names are kept in memory and only reloaded from the database when
+    they changed, see :mod:`pkgdb2.lib.complete`.
+
+    :arg session: session with which to connnect to the database.
+    :arg prefix: the beginning of the names, case insensitive.
+    :kwarg limit: the maximum number of names to return, defaults to 10.
+    :returns: the names found, in alphabetical order.
+    :rtype: list(str)
+
+    """
+    index = pkgdb2.lib.complete.INDEX.get(session, 'packagers')
+    return index.complete(prefix, limit)
+
+
 def get_top_maintainers(session, top=10):
     """ Return the specified top maintainer having the most commit rights
 
@@ -1318,7 +1850,7 @@ def get_top_maintainers(session, top=10):
     :rtype: list(tuple())
 
     """
-    return model.PackageListingAcl.get_top_maintainers(session, top)
+    return model.PackagerStats.get_top(session, 'commit', top)
 
 
 def get_top_poc(session, top=10):
@@ -1330,7 +1862,7 @@ def get_top_poc(session, top=10):
     :rtype: list(tuple())
 
     """
-    return model.PackageListing.get_top_poc(session, top)
+    return model.PackagerStats.get_top(session, 'poc', top)
 
 
 def unorphan_package(session, pkg_name, pkg_branch, pkg_user, user):
@@ -1365,7 +1897,8 @@ def unorphan_package(session, pkg_name, pkg_branch, pkg_user, user):
         raise PkgdbException('No package found by this name')
 
     try:
-        collection = model.Collection.by_name(session, pkg_branch)
+        collection = pkgdb2.lib.reference.REGISTRY.get_collection(
+            session, pkg_branch, force=True)
     except NoResultFound:
         raise PkgdbException('No collection found by this name')
 
@@ -1399,11 +1932,11 @@ def unorphan_package(session, pkg_name, pkg_branch, pkg_user, user):
         previous_owner="orphan",
         status=status,
         package_name=pkg_listing.package.name,
-        package_listing=pkg_listing.to_json(),
+        package_listing=pkg_listing,
     ))
     pkgdb2.lib.utils.set_bugzilla_owner(
         pkg_user, None, package.name, collection.name,
-        collection.version)
+        collection.version, session=session)
 
     acls = ['commit', 'watchbugzilla', 'watchcommits', 'approveacls']
 
@@ -1425,16 +1958,17 @@ def unorphan_package(session, pkg_name, pkg_branch, pkg_user, user):
             previous_status=prev_status,
             status=status,
             package_name=pkg_listing.package.name,
-            package_listing=pkg_listing.to_json(),
+            package_listing=pkg_listing,
         ))
 
     session.flush()
+    model.PackageAclSnapshot.refresh(session, package_ids=[package.id])
     return 'Package %s has been unorphaned on %s by %s' % (
         pkg_name, pkg_branch, pkg_user
     )
 
 
-def add_branch(session, clt_from, clt_to, user):
+def add_branch(session, clt_from, clt_to, user, bulk=False):
     """ Clone a the permission from a branch to another.
 
     This method only flushes the new objects, the only thing committed is
@@ -1444,6 +1978,9 @@ def add_branch(session, clt_from, clt_to, user):
     :arg clt_from: the ``branchname`` of the collection to branch from.
     :arg clt_to: the ``branchname`` of the collection to branch to.
     :arg user: the user making the action.
+    :kwarg bulk: a boolean specifying whether to branch all the packages
+        at once using set-based queries in a single transaction instead of
+        branching and committing them one by one.
     :returns: a list of errors generated while branching, these errors
         might be the results of trying to create a PackageListing object
         already existing.
@@ -1471,17 +2008,69 @@ def add_branch(session, clt_from, clt_to, user):
 
     pkgdb2.lib.utils.log(session, None, 'branch.start', dict(
         agent=user.username,
-        collection_from=clt_from.to_json(),
-        collection_to=clt_to.to_json(),
+        collection_from=clt_from,
+        collection_to=clt_to,
     ))
     session.commit()
 
+    if bulk:
+        messages = _add_branch_bulk(
+            session, clt_from, clt_to, user.username)
+    else:
+        messages = _add_branch_loop(
+            session, clt_from, clt_to, user.username)
+        model.PackageAclSnapshot.refresh(
+            session, collection_ids=[clt_to.id])
+
+    pkgdb2.lib.utils.log(session, None, 'branch.complete', dict(
+        agent=user.username,
+        collection_from=clt_from,
+        collection_to=clt_to,
+    ))
+
+    return messages
+
+
+def _record_branches(session, clt_to, agent, listings):
+    """ Record the new branches of packages in the change feed, as
+    ``package.branch.new`` changes.
+
+    :arg session: session with which to connect to the database.
+    :arg clt_to: the Collection object branched to.
+    :arg agent: the username of the user branching.
+    :arg listings: a list of ``(package name, point of contact, status)``
+        tuples, one per package branched.
+
+    """
+    pkgdb2.lib.utils.record_changes(
+        session, 'package.branch.new', agent, [
+            dict(package=name, branch=clt_to.branchname,
+                 fas_name=poc, new_value=status)
+            for name, poc, status in listings
+        ])
+
+
+def _add_branch_loop(session, clt_from, clt_to, agent):
+    """ Branch the packages of a collection into another one, one package
+    at a time, committing after each of them.
+
+    :arg session: session with which to connect to the database.
+    :arg clt_from: the Collection object to branch from.
+    :arg clt_to: the Collection object to branch to.
+    :arg agent: the username of the user branching.
+    :returns: the report of the branching, one or two lines per package.
+    :rtype: list(str)
+
+    """
     messages = []
     for pkglist in model.PackageListing.by_collectionid(
             session, clt_from.id):
         if pkglist.status == 'Approved':
             try:
                 pkglist.branch(session, clt_to)
+                _record_branches(session, clt_to, agent, [(
+                    pkglist.package.name, pkglist.point_of_contact,
+                    pkglist.status)])
                 # Should not fail since the flush() passed
                 session.commit()
                 messages.append(
@@ -1497,11 +2086,69 @@ def add_branch(session, clt_from, clt_to, user):
                         clt_to.version))
                 messages.append(str(err))
 
-    pkgdb2.lib.utils.log(session, None, 'branch.complete', dict(
-        agent=user.username,
-        collection_from=clt_from.to_json(),
-        collection_to=clt_to.to_json(),
-    ))
+    return messages
+
+
+def _add_branch_bulk(session, clt_from, clt_to, agent):
+    """ Branch all the packages of a collection into another one at once
+    and commit them in a single transaction.
+
+    Packages already present in the collection branched to are reported as
+    failed, as they would be when branching them one by one.
+
+    The new branches are not logged one by one, but they are recorded in
+    the change feed as ``package.branch.new`` changes, with a single
+    insert.
+
+    :arg session: session with which to connect to the database.
+    :arg clt_from: the Collection object to branch from.
+    :arg clt_to: the Collection object to branch to.
+    :arg agent: the username of the user branching.
+    :returns: the report of the branching, one or two lines per package.
+    :rtype: list(str)
+    :raises pkgdb2.lib.PkgdbException: if the branching failed, in which
+        case nothing has been branched.
+
+    """
+    try:
+        branched, conflicts = model.PackageListing.bulk_branch(
+            session, clt_from.id, clt_to.id)
+        names = set(branched)
+        listings = session.query(
+            model.Package.name,
+            model.PackageListing.point_of_contact,
+            model.PackageListing.status,
+        ).filter(
+            model.PackageListing.package_id == model.Package.id
+        ).filter(
+            model.PackageListing.collection_id == clt_to.id
+        ).order_by(
+            model.Package.name
+        )
+        _record_branches(session, clt_to, agent, [
+            row for row in listings if row.name in names])
+        model.PackageAclSnapshot.refresh(
+            session, collection_ids=[clt_to.id])
+        session.commit()
+    except SQLAlchemyError, err:  # pragma: no cover
+        session.rollback()
+        pkgdb2.LOG.exception(err)
+        raise PkgdbException(
+            'Could not branch %s to %s %s' % (
+                clt_from.name, clt_to.name, clt_to.version))
+
+    messages = []
+    for pkgname in branched:
+        messages.append(
+            '%s branched successfully from %s to %s %s' % (
+                pkgname, clt_from.name, clt_to.name, clt_to.version))
+    for pkgname in conflicts:
+        messages.append(
+            'FAILED: %s failed to branch from %s to %s %s' % (
+                pkgname, clt_from.name, clt_to.name, clt_to.version))
+        messages.append(
+            'Package %s already exists in %s %s' % (
+                pkgname, clt_to.name, clt_to.version))
 
     return messages
 
@@ -1512,7 +2159,7 @@ def count_collection(session):
     :arg session: the session to connect to the database with.
 
     """
-    return model.Package.count_collection(session)
+    return model.CollectionStats.count_collection(session)
 
 
 def count_fedora_collection(session):
@@ -1521,7 +2168,8 @@ def count_fedora_collection(session):
     :arg session: the session to connect to the database with.
 
     """
-    collections_fedora = model.Package.count_fedora_collection(session)
+    collections_fedora = model.CollectionStats.count_fedora_collection(
+        session)
 
     if collections_fedora:
         # We need to get devel out to sort the releases correctly
@@ -1535,6 +2183,27 @@ def count_fedora_collection(session):
     return collections_fedora
 
 
+def rebuild_stats(session, snapshot=False):
+    """ Recompute from scratch the statistics rollups: the number of
+    packages per collection and per packager.
+
+    This method only flushes, committing is up to the caller.
+
+    :arg session: the session to connect to the database with.
+    :kwarg snapshot: a boolean specifying whether to rebuild the
+        denormalized snapshot of the ACLs the statistics are computed from
+        as well. Defaults to ``False``.
+
+    """
+    if snapshot:
+        # This refreshes all the statistics as well
+        model.PackageAclSnapshot.refresh(session)
+    else:
+        model.CollectionStats.refresh(session)
+        model.PackagerStats.refresh(session)
+    session.flush()
+
+
 def get_groups(session):
     """ Return the list of FAS groups involved in maintaining packages in
     the database
@@ -1648,56 +2317,40 @@ def bugzilla(session, name=None):
     return output
 
 
-def vcs_acls(session, eol=False):
+def vcs_acls(session, eol=False, stream=False):
     """ Return the information to sync ACLs with gitolite.
 
+    This is a generator returning, sorted by package name and branch name,
+    one dictionary per package and branch with the keys ``name``,
+    ``branch``, ``group`` (the comma separated list of groups having commit
+    access, prefixed by ``@``, starting with ``@provenpackager``) and
+    ``user`` (the comma separated list of users having commit access).
+
     :arg session: the session to connect to the database with.
     :kwarg eol: A boolean specifying whether to include information about
         End Of Life collections or not. Defaults to ``False``.
+    :kwarg stream: A boolean specifying whether to load the rows by batches
+        from a server-side cursor rather than all at once. Defaults to
+        ``False``.
 
     """
-    output = {}
-    pkgs = model.vcs_acls(session=session, eol=eol)
-    for pkg in pkgs:
-        user = None
-        group = None
-        if pkg[1] and pkg[1].startswith('group::'):
-            group = pkg[1].replace('group::', '@')
-        else:
-            user = pkg[1]
-
-        if pkg[0] in output:
-            if pkg[2] in output[pkg[0]]:
-                if user:
-                    if output[pkg[0]][pkg[2]]['user']:
-                        output[pkg[0]][pkg[2]]['user'] += ','
-                    output[pkg[0]][pkg[2]]['user'] += user
-                elif group:  # pragma: no cover
-                    if output[pkg[0]][pkg[2]]['group']:
-                        output[pkg[0]][pkg[2]]['group'] += ','
-                    output[pkg[0]][pkg[2]]['group'] += group
-            else:
-                if group:  # pragma: no cover
-                    group = ',' + group
-                output[pkg[0]][pkg[2]] = {
-                    'name': pkg[0],
-                    'user': user or '',
-                    'group': '@provenpackager' + (group or ''),
-                    'branch': pkg[2],
-                }
-        else:
-            if group:
-                group = ',' + group
-            output[pkg[0]] = {
-                pkg[2]: {
-                    'name': pkg[0],
-                    'user': user or '',
-                    'group': '@provenpackager' + (group or ''),
-                    'branch': pkg[2],
-                }
-            }
-
-    return output
+    query = model.vcs_acls(session=session, eol=eol)
+    if stream:
+        query = query.yield_per(model.STREAM_BATCH).execution_options(
+            stream_results=True)
+
+    for name, branch, groups, users in query:
+        group = '@provenpackager'
+        if groups:
+            group += ''.join(
+                ',' + grp.replace('group::', '@')
+                for grp in sorted(groups.split(',')))
+        yield {
+            'name': name,
+            'user': ','.join(sorted(users.split(','))) if users else '',
+            'group': group,
+            'branch': branch,
+        }
 
 
 def set_critpath_packages(
@@ -1735,7 +2388,8 @@ def set_critpath_packages(
         raise PkgdbException('No package found by this name')
 
     try:
-        collection = model.Collection.by_name(session, pkg_branch)
+        collection = pkgdb2.lib.reference.REGISTRY.get_collection(
+            session, pkg_branch, force=True)
     except NoResultFound:
         raise PkgdbException('No collection found by the name of %s'
                              % pkg_branch)
@@ -1764,7 +2418,7 @@ def set_critpath_packages(
             agent=user.username,
             critpath=critpath,
             branches=branches,
-            package=package.to_json(),
+            package=package,
         ))
     except SQLAlchemyError, err:  # pragma: no cover
         pkgdb2.LOG.exception(err)
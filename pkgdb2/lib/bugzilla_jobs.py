@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Reassignment of the bugzilla bugs of the packages changing owner.
+
+When ``PKGDB2_BUGZILLA_JOBS`` is set, the reassignments made in a
+transaction are queued as a single `BugzillaJob`, in that transaction, and
+made afterward by the ``pkgdb2_bugzilla_jobs`` script.
+
+The reassignments of a batch of jobs are made together: the open bugs of
+the components changed are retrieved with one query per product, run in a
+pool of ``PKGDB2_BUGZILLA_THREADS`` threads each with its own client, and
+the bugs going to the same assignee are updated with a single
+``update_bugs`` call.
+'''
+
+import datetime
+import itertools
+import threading
+from multiprocessing.pool import ThreadPool
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from fedora.client import Bunch
+
+import pkgdb2
+import pkgdb2.lib.exceptions
+from pkgdb2.lib import model
+
+
+## We use global variable for a reason
+# pylint: disable=W0603
+## We catch Exception to record why the job failed
+# pylint: disable=W0703
+
+
+# The status of the bugs which are reassigned
+OPEN_STATUS = [
+    'NEW', 'ASSIGNED', 'ON_DEV', 'ON_QA', 'MODIFIED', 'POST',
+    'FAILS_QA', 'PASSES_QA', 'RELEASE_PENDING']
+
+DEFAULT_COMMENT = 'This package has changed ownership in the Fedora'\
+    ' Package Database.  Reassigning to the new owner'\
+    ' of this component.'
+
+# The key of the job of the current transaction in the ``info`` of the
+# session
+_SESSION_KEY = 'pkgdb2.bugzilla_job'
+
+# The client used instead of the one configured, see `set_client`
+_CLIENT = None
+
+
+def set_client(client):
+    """ Use the specified client to query bugzilla, for example a
+    `FakeBugzilla`, instead of the one configured. ``None`` restores the
+    configured one.
+
+    :arg client: an object with the ``query``, ``build_update`` and
+        ``update_bugs`` methods of ``bugzilla.Bugzilla``.
+
+    """
+    global _CLIENT
+    _CLIENT = client
+
+
+def get_client():
+    """ Return the client used to query bugzilla. """
+    if _CLIENT is not None:
+        return _CLIENT
+    # To avoid a circular import.
+    import pkgdb2.lib.utils
+    return pkgdb2.lib.utils.get_bz()
+
+
+def new_client():
+    """ Return a new client to query bugzilla, or the one set with
+    `set_client`. The configured clients are not thread-safe, each thread
+    needs its own. """
+    if _CLIENT is not None:
+        return _CLIENT
+    # To avoid a circular import.
+    import pkgdb2.lib.utils
+    return pkgdb2.lib.utils.new_bz()
+
+
+def build_reassignment(
+        username, prev_poc, pkg_name, collectn, collectn_version,
+        bz_comment=None):
+    """ Return the dictionnary describing a reassignment.
+
+    :arg username: Username of the new point of contact.
+    :arg prev_poc: Username of the previous point of contact, if set only
+        the bugs assigned to them are reassigned.
+    :arg pkg_name: Name of the package, the bugzilla component.
+    :arg collectn: Collection name of the package, the bugzilla product.
+    :arg collectn_version: Collection version.
+    :kwarg bz_comment: the comment of changes, if left to None, rely on a
+        default comment.
+
+    """
+    version = collectn_version
+    if version == 'devel':
+        version = 'rawhide'
+    return dict(
+        username=username,
+        prev_poc=prev_poc,
+        product=collectn,
+        component=pkg_name,
+        version=version,
+        comment=bz_comment or DEFAULT_COMMENT,
+    )
+
+
+def queue_reassignment(session, reassignment):
+    """ Add a reassignment to the job of the current transaction, creating
+    the job if needed.
+
+    :arg session: the session to connect to the database with.
+    :arg reassignment: a dictionnary describing the reassignment, see
+        `build_reassignment`.
+    :returns: the `BugzillaJob` of the transaction.
+
+    """
+    job = session.info.get(_SESSION_KEY)
+    if job is None or job not in session:
+        job = model.BugzillaJob()
+        session.add(job)
+        session.info[_SESSION_KEY] = job
+    job.add_reassignment(reassignment)
+    return job
+
+
+def get_current_job(session):
+    """ Return the identifier of the job of the current transaction, or
+    ``None`` if no reassignment was queued in it.
+
+    This has to be called before the transaction is committed.
+
+    :arg session: the session to connect to the database with.
+
+    """
+    job = session.info.get(_SESSION_KEY)
+    if job is None:
+        return None
+    session.flush()
+    return job.id
+
+
+def _forget_job(session, *args):
+    """ Forget the job of the transaction once it ended. """
+    session.info.pop(_SESSION_KEY, None)
+
+
+event.listen(Session, 'after_commit', _forget_job)
+event.listen(Session, 'after_soft_rollback', _forget_job)
+
+
+def _as_list(value):
+    """ Return the value as a list, bugzilla returns some fields as a
+    string or a list depending on its configuration. """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class _ThreadClients(object):
+    """ The clients of the threads of the pool of a `reassign` run, one
+    per thread, created on its first query. """
+
+    def __init__(self):
+        """ Constructor. """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.clients = []
+
+    def query(self, query):
+        """ Run the query with the client of the current thread. """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = new_client()
+            with self._lock:
+                self.clients.append(client)
+        return client.query(query)
+
+    def close(self):
+        """ Disconnect the clients created, once the pool is closed. """
+        for client in self.clients:
+            if client is not _CLIENT:
+                client.disconnect()
+        self.clients = []
+
+
+def _get_email(username):
+    """ Return the email of the user or group in bugzilla. """
+    if username.startswith('group::'):
+        return pkgdb2.lib.utils.get_fas_group(
+            username.replace('group::', '')).mailing_list
+    return pkgdb2.lib.utils.get_bz_email_user(username).bugzilla_email
+
+
+def reassign(reassignments, client=None):
+    """ Make the specified reassignments.
+
+    The reassignments are applied in order, so a package given to a user
+    and then to another ends up assigned to the second one.
+
+    If ``PKGDB2_BUGZILLA_NOTIFICATION`` is not set, the reassignments are
+    only printed.
+
+    :arg reassignments: a list of dictionnaries describing the
+        reassignments, see `build_reassignment`.
+    :kwarg client: the bugzilla client to use, defaults to a client per
+        thread of the pool, see `new_client`, and to `get_client` for the
+        updates.
+    :returns: the number of bugs reassigned by each reassignment.
+    :rtype: list(int)
+    :raises pkgdb2.lib.exceptions.PkgdbBugzillaException: if an error
+        occured while calling FAS or bugzilla.
+
+    """
+    # To avoid a circular import.
+    import pkgdb2.lib.utils
+
+    counts = [0] * len(reassignments)
+    if not reassignments:
+        return counts
+
+    # The reassignments by (component, version) and the queries by product
+    by_key = {}
+    queries = {}
+    try:
+        emails = {}
+        for idx, item in enumerate(reassignments):
+            for username in (item['username'], item['prev_poc']):
+                if username and username not in emails:
+                    email = _get_email(username)
+                    emails[username] = '%s' % email if email else None
+            by_key.setdefault(
+                (item['component'], item['version']), []).append(idx)
+            query = queries.setdefault(item['product'], {
+                'product': item['product'],
+                'component': set(),
+                'version': set(),
+                'bug_status': OPEN_STATUS,
+            })
+            query['component'].add(item['component'])
+            query['version'].add(item['version'])
+    except Exception, err:
+        raise pkgdb2.lib.exceptions.PkgdbBugzillaException(
+            'An error occured while calling FAS: %s' % str(err))
+
+    queries = [
+        dict(query, component=sorted(query['component']),
+             version=sorted(query['version']))
+        for _, query in sorted(queries.items())
+    ]
+    thread_clients = None
+    if client is None:
+        thread_clients = _ThreadClients()
+        run_query = thread_clients.query
+    else:
+        run_query = client.query
+    pool = ThreadPool(min(
+        len(queries), pkgdb2.APP.config.get('PKGDB2_BUGZILLA_THREADS', 4)))
+    try:
+        results = pool.map(run_query, queries)
+    except Exception, err:
+        raise pkgdb2.lib.exceptions.PkgdbBugzillaException(
+            'An error occured while calling bugzilla: %s' % str(err))
+    finally:
+        pool.close()
+        pool.join()
+        if thread_clients is not None:
+            thread_clients.close()
+
+    if client is None:
+        client = get_client()
+    # The bugs to update, by new assignee and comment
+    updates = {}
+    for bug in itertools.chain(*results):
+        assigned_to = bug.assigned_to
+        applied = None
+        indexes = sorted(set(itertools.chain(*[
+            by_key.get((component, version), [])
+            for component in _as_list(bug.component)
+            for version in _as_list(bug.version)
+        ])))
+        for idx in indexes:
+            item = reassignments[idx]
+            new_email = emails[item['username']]
+            prev_email = emails.get(item['prev_poc'])
+            if (not prev_email or assigned_to == prev_email) \
+                    and assigned_to != new_email:
+                assigned_to = new_email
+                applied = idx
+        if applied is not None:
+            counts[applied] += 1
+            updates.setdefault(
+                (assigned_to, reassignments[applied]['comment']), []
+            ).append(bug)
+
+    for (email, comment), bugs in sorted(updates.items()):
+        if pkgdb2.APP.config['PKGDB2_BUGZILLA_NOTIFICATION']:
+            try:
+                client.update_bugs(
+                    sorted(bug.bug_id for bug in bugs),
+                    client.build_update(assigned_to=email, comment=comment))
+            except Exception, err:
+                raise pkgdb2.lib.exceptions.PkgdbBugzillaException(
+                    'An error occured while calling bugzilla: %s'
+                    % str(err)
+                )
+        else:
+            for bug in bugs:
+                pkgdb2.LOG.info(
+                    'Would have reassigned bug #%s from %s to %s',
+                    bug.bug_id, bug.assigned_to, email)
+
+    return counts
+
+
+def run_jobs(session, jobs, client=None):
+    """ Make the reassignments of the specified jobs, together.
+
+    If they fail, the jobs are run again one by one so a job failing does
+    not prevent the others from succeeding. The reassignments already made
+    are then skipped since the bugs are already assigned to their new
+    owner.
+
+    This method only flushes, committing is up to the caller.
+
+    :arg session: the session to connect to the database with.
+    :arg jobs: the list of `BugzillaJob` to run.
+    :kwarg client: the bugzilla client to use, defaults to `get_client`.
+
+    """
+    reassignments = []
+    owners = []
+    for job in jobs:
+        for reassignment in job.reassignments:
+            reassignments.append(reassignment)
+            owners.append(job)
+
+    try:
+        counts = reassign(reassignments, client=client)
+    except pkgdb2.lib.exceptions.PkgdbBugzillaException, err:
+        if len(jobs) > 1:
+            for job in jobs:
+                run_jobs(session, [job], client=client)
+            return
+        for job in jobs:
+            job.status = 'Failed'
+            job.error = str(err)
+            job.finished = datetime.datetime.utcnow()
+    else:
+        for job in jobs:
+            job.status = 'Done'
+            job.error = None
+            job.bugs = 0
+            job.finished = datetime.datetime.utcnow()
+        for job, count in zip(owners, counts):
+            job.bugs += count
+
+    session.flush()
+
+
+def run_pending(session, limit=None, client=None):
+    """ Run a batch of the jobs waiting to be run.
+
+    This method only flushes, committing is up to the caller.
+
+    :arg session: the session to connect to the database with.
+    :kwarg limit: the maximum number of jobs to run, defaults to
+        ``PKGDB2_BUGZILLA_BATCH_SIZE``.
+    :kwarg client: the bugzilla client to use, defaults to `get_client`.
+    :returns: the list of the jobs run.
+
+    """
+    if limit is None:
+        limit = pkgdb2.APP.config.get('PKGDB2_BUGZILLA_BATCH_SIZE', 50)
+    jobs = model.BugzillaJob.get_pending(session, limit=limit)
+    if jobs:
+        run_jobs(session, jobs, client=client)
+    return jobs
+
+
+class FakeBugzilla(object):
+    """ A bugzilla client serving the bugs it is given, used to run pkgdb
+    without a bugzilla instance, for example in the tests. """
+
+    def __init__(self, bugs=None):
+        """ Constructor.
+
+        :kwarg bugs: a list of dictionnaries describing the bugs, with the
+            ``bug_id``, ``product``, ``component``, ``version``,
+            ``bug_status`` and ``assigned_to`` keys.
+
+        """
+        self.bugs = [Bunch(bug) for bug in bugs or []]
+        # The queries and updates received
+        self.queries = []
+        self.updates = []
+        self.disconnected = False
+
+    def query(self, query):
+        """ Return the bugs matching the query. """
+        self.queries.append(query)
+
+        def matches(bug, key):
+            """ Return whether the bug matches the query on this key. """
+            if key not in query:
+                return True
+            return bool(set(_as_list(bug[key])) & set(_as_list(query[key])))
+
+        return [
+            bug for bug in self.bugs
+            if all(matches(bug, key) for key in (
+                'product', 'component', 'version', 'bug_status'))
+        ]
+
+    def build_update(self, **kwargs):
+        """ Return the changes to make, as a dictionnary. """
+        return kwargs
+
+    def disconnect(self):
+        """ Close the connection, recorded in ``disconnected``. """
+        self.disconnected = True
+
+    def update_bugs(self, ids, updates):
+        """ Apply the changes to the specified bugs. """
+        self.updates.append((list(ids), updates))
+        for bug in self.bugs:
+            if bug.bug_id in ids and 'assigned_to' in updates:
+                bug.assigned_to = updates['assigned_to']
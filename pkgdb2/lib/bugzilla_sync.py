@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Synchronization of the bugzilla components with the packages, used by the
+``pkgdb-sync-bugzilla`` script.
+
+The state of the components (owner, description, QA contact and CC list)
+is built from the database, with `pkgdb2.lib.bugzilla`, and compared with
+the state last pushed to bugzilla, kept in a local JSON file. Only the
+components which changed since are retrieved from bugzilla and updated.
+
+The components are retrieved and updated by a pool of
+``PKGDB2_BUGZILLA_SYNC_THREADS`` threads, making at most
+``PKGDB2_BUGZILLA_SYNC_RATE`` calls per second to bugzilla.
+'''
+
+import json
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import pkgdb2
+import pkgdb2.lib
+
+
+## We catch Exception to report the errors of each component
+# pylint: disable=W0703
+
+
+# The products synchronized
+PRODUCTS = ['Fedora', 'Fedora EPEL']
+
+DEFAULT_QA_CONTACT = 'extras-qa@fedoraproject.org'
+
+# The attributes of the components synchronized
+FIELDS = ['initialowner', 'description', 'initialqacontact', 'initialcclist']
+
+
+class RateLimiter(object):
+    """ Space the calls made by several threads so there are at most
+    ``rate`` calls per second. """
+
+    def __init__(self, rate=None):
+        """ Constructor.
+
+        :kwarg rate: the maximum number of calls per second, no limit if
+            ``None`` or 0.
+
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """ Wait until the next call can be made. """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ComponentCache(object):
+    """ The state of the components last pushed to bugzilla, stored in a
+    JSON file. """
+
+    def __init__(self, path=None):
+        """ Constructor.
+
+        :kwarg path: the path of the JSON file, nothing is stored if
+            ``None``.
+
+        """
+        self.path = path
+        self.data = {}
+        if path and os.path.exists(path):
+            with open(path) as stream:
+                self.data = json.load(stream)
+
+    def get(self, product, component):
+        """ Return the state of the component last pushed, or ``None``. """
+        return self.data.get(product, {}).get(component.lower())
+
+    def set(self, product, component, state):
+        """ Record the state of the component pushed. """
+        self.data.setdefault(product, {})[component.lower()] = state
+
+    def save(self):
+        """ Write the cache to its file, replacing it atomically. """
+        if not self.path:
+            return
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w') as stream:
+            json.dump(self.data, stream, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+def normalize(state):
+    """ Return the state of a component with the emails lowercased and the
+    CC list sorted, so the states can be compared.
+
+    :arg state: a dictionnary with the `FIELDS` of a component.
+
+    """
+    return dict(
+        initialowner=(state['initialowner'] or '').lower(),
+        description=state['description'] or '',
+        initialqacontact=(state['initialqacontact'] or '').lower(),
+        initialcclist=sorted(set(
+            email.lower() for email in state['initialcclist'] or [])),
+    )
+
+
+class BugzillaComponents(object):
+    """ Retrieve and change the components through python-bugzilla. """
+
+    def __init__(self, server):
+        """ Constructor.
+
+        :arg server: a ``bugzilla.Bugzilla`` instance.
+
+        """
+        self.server = server
+
+    def get_components(self, product, names):
+        """ Return the state of the specified components of the product,
+        by lowercased name. """
+        query = [dict(product=product, component=name) for name in names]
+        raw_data = self.server._proxy.Component.get(dict(names=query))
+        return dict(
+            (component['name'].lower(), dict(
+                initialowner=component['default_assignee'],
+                description=component['description'],
+                initialqacontact=component['default_qa_contact'],
+                initialcclist=component['default_cc'],
+            ))
+            for component in raw_data['components']
+        )
+
+    def add_component(self, data):
+        """ Create a component. """
+        self.server.addcomponent(data)
+
+    def edit_component(self, data):
+        """ Change a component. """
+        self.server.editcomponent(data)
+
+
+class FakeComponents(object):
+    """ A store of components used to run the synchronization without a
+    bugzilla instance, for example in the tests. """
+
+    def __init__(self, components=None):
+        """ Constructor.
+
+        :kwarg components: a dictionnary of the state of the components by
+            product and component name.
+
+        """
+        self.components = {}
+        for (product, name), state in (components or {}).items():
+            self.components[(product, name.lower())] = dict(state)
+        # The calls received
+        self.gets = []
+        self.added = []
+        self.edited = []
+
+    def get_components(self, product, names):
+        """ Return the state of the specified components of the product,
+        by lowercased name. """
+        self.gets.append((product, sorted(names)))
+        return dict(
+            (name.lower(), dict(self.components[(product, name.lower())]))
+            for name in names
+            if (product, name.lower()) in self.components
+        )
+
+    def _store(self, data):
+        """ Store the state sent for a component. """
+        key = (data['product'], data['component'].lower())
+        state = self.components.setdefault(
+            key, dict((field, None) for field in FIELDS))
+        for field in FIELDS:
+            if field in data:
+                state[field] = data[field]
+
+    def add_component(self, data):
+        """ Create a component. """
+        self.added.append(data)
+        self._store(data)
+
+    def edit_component(self, data):
+        """ Change a component. """
+        self.edited.append(data)
+        self._store(data)
+
+
+def describe_change(change):
+    """ Return the lines describing a change, as printed in dry-run.
+
+    :arg change: a dictionnary describing the change, see
+        `BugzillaSync.diff`.
+
+    """
+    if change['action'] == 'add':
+        output = ['[ADDCOMP] %(product)s/%(component)s' % change]
+    else:
+        output = ['[EDITCOMP] %(product)s/%(component)s' % change]
+    former = change['former'] or {}
+    for field in FIELDS:
+        if field not in change['changed']:
+            continue
+        output.append('    %s: %r -> %r' % (
+            field, former.get(field), change['data'][field]))
+    return output
+
+
+class BugzillaSync(object):
+    """ Push the state of the components to bugzilla. """
+
+    def __init__(self, client, cache, dry_run=False, threads=None,
+                 rate=None, segment=None):
+        """ Constructor.
+
+        :arg client: the client to retrieve and change the components
+            with, a `BugzillaComponents` or a `FakeComponents`.
+        :arg cache: the `ComponentCache` of the state last pushed.
+        :kwarg dry_run: a boolean to only compute the changes, without
+            making them nor updating the cache.
+        :kwarg threads: the number of threads calling bugzilla, defaults to
+            ``PKGDB2_BUGZILLA_SYNC_THREADS``.
+        :kwarg rate: the maximum number of calls per second to bugzilla,
+            defaults to ``PKGDB2_BUGZILLA_SYNC_RATE``.
+        :kwarg segment: the number of components retrieved per call,
+            defaults to ``PKGDB2_BUGZILLA_SYNC_SEGMENT``.
+
+        """
+        config = pkgdb2.APP.config
+        self.client = client
+        self.cache = cache
+        self.dry_run = dry_run
+        self.threads = threads or config.get(
+            'PKGDB2_BUGZILLA_SYNC_THREADS', 4)
+        self.limiter = RateLimiter(
+            rate if rate is not None
+            else config.get('PKGDB2_BUGZILLA_SYNC_RATE', 10))
+        self.segment = segment or config.get(
+            'PKGDB2_BUGZILLA_SYNC_SEGMENT', 1000)
+        self.errors = []
+        self._emails = {}
+
+    def _get_email(self, username):
+        """ Return the bugzilla email of a user or group, retrieved once per
+        synchronization. """
+        if username not in self._emails:
+            if username.startswith('group::'):
+                email = pkgdb2.lib.utils.get_fas_group(
+                    username.replace('group::', '')).mailing_list
+            else:
+                email = pkgdb2.lib.utils.get_bz_email_user(
+                    username).bugzilla_email
+            if not email:
+                raise ValueError('No bugzilla email for %s' % username)
+            self._emails[username] = email.lower()
+        return self._emails[username]
+
+    def get_states(self, session, products=None):
+        """ Return the state the components should have, by product and
+        component name.
+
+        The packages whose owner or CC have no bugzilla email are skipped
+        and reported in `errors`.
+
+        :arg session: the session to connect to the database with.
+        :kwarg products: the list of the products to synchronize, defaults
+            to `PRODUCTS`.
+
+        """
+        products = products or PRODUCTS
+        states = {}
+        packages = pkgdb2.lib.bugzilla(session)
+        for product in sorted(packages):
+            if product not in products:
+                continue
+            for name, info in sorted(packages[product].items()):
+                try:
+                    owner = self._get_email(info['poc'])
+                    cclist = [
+                        self._get_email(username)
+                        for username in info['cc'].split(',') if username
+                    ]
+                    qacontact = DEFAULT_QA_CONTACT
+                    if info['qa']:  # pragma: no cover
+                        qacontact = self._get_email(info['qa'])
+                except Exception, err:
+                    self.errors.append(
+                        '%s/%s: %s' % (product, name, err))
+                    continue
+                # The owner is in the CC list so the comaintainers taking
+                # over a bug don't have to add them manually
+                if owner not in cclist:
+                    cclist.append(owner)
+                states[(product, name)] = normalize(dict(
+                    initialowner=owner,
+                    description=info['summary'],
+                    initialqacontact=qacontact,
+                    initialcclist=cclist,
+                ))
+        return states
+
+    def _map(self, function, items):
+        """ Call the function on each item, from the pool of threads,
+        respecting the rate limit, and return the results. """
+        def call(item):
+            """ Call the function once the rate limit allows it. """
+            self.limiter.wait()
+            try:
+                return function(item), None
+            except Exception, err:
+                return None, err
+
+        if not items:
+            return []
+        pool = ThreadPool(min(self.threads, len(items)))
+        try:
+            return pool.map(call, items)
+        finally:
+            pool.close()
+
+    def fetch(self, keys):
+        """ Return the current state of the specified components in
+        bugzilla, by product and component name.
+
+        :arg keys: a list of (product, component name) tuples.
+        :returns: the state of the components found and the set of the
+            products whose components could not be retrieved.
+
+        """
+        by_product = {}
+        for product, name in keys:
+            by_product.setdefault(product, []).append(name)
+        segments = []
+        for product, names in sorted(by_product.items()):
+            for idx in range(0, len(names), self.segment):
+                segments.append((product, names[idx:idx + self.segment]))
+
+        output = {}
+        failed = set()
+        results = self._map(
+            lambda args: self.client.get_components(*args), segments)
+        for (product, names), (components, err) in zip(segments, results):
+            if err is not None:
+                self.errors.append(
+                    'Could not retrieve the components of %s: %s'
+                    % (product, err))
+                failed.add(product)
+                continue
+            for name in names:
+                if name.lower() in components:
+                    output[(product, name)] = normalize(
+                        components[name.lower()])
+        return output, failed
+
+    def diff(self, states):
+        """ Return the changes to make for the components to have the
+        specified states.
+
+        Each change is a dictionnary with the ``action`` (``add`` or
+        ``edit``), the ``product``, the ``component``, the ``data`` sent to
+        bugzilla, the ``former`` state of the component and the list of the
+        fields ``changed``.
+
+        The components whose state did not change since the last push are
+        not retrieved from bugzilla.
+
+        :arg states: the state the components should have, see
+            `get_states`.
+
+        """
+        changed = sorted(
+            key for key, state in states.items()
+            if self.cache.get(*key) != state)
+        current, failed = self.fetch(changed)
+
+        changes = []
+        for key in changed:
+            product, name = key
+            if product in failed:
+                continue
+            state = states[key]
+            former = current.get(key)
+            if former == state:
+                # Already up to date, only the cache was
+                if not self.dry_run:
+                    self.cache.set(product, name, state)
+                continue
+            if former is None:
+                fields = [field for field in FIELDS if state[field]]
+                action = 'add'
+            else:
+                fields = [
+                    field for field in FIELDS
+                    if former[field] != state[field]]
+                action = 'edit'
+            data = dict(state, product=product, component=name)
+            if action == 'edit':
+                data = dict(
+                    (field, value) for field, value in data.items()
+                    if field in fields
+                    or field in ('product', 'component', 'initialowner'))
+            changes.append(dict(
+                action=action, product=product, component=name,
+                data=data, former=former, changed=fields))
+        return changes
+
+    def push(self, changes, states):
+        """ Make the changes in bugzilla and record the new state of the
+        components changed successfully in the cache.
+
+        :arg changes: the changes to make, see `diff`.
+        :arg states: the state the components should have, see
+            `get_states`.
+        :returns: the number of components changed.
+
+        """
+        def apply(change):
+            """ Make a change in bugzilla. """
+            if change['action'] == 'add':
+                self.client.add_component(change['data'])
+            else:
+                self.client.edit_component(change['data'])
+
+        count = 0
+        for change, (_, err) in zip(changes, self._map(apply, changes)):
+            key = (change['product'], change['component'])
+            if err is not None:
+                self.errors.append('%s/%s: %s' % (key + (err,)))
+                continue
+            self.cache.set(change['product'], change['component'],
+                           states[key])
+            count += 1
+        return count
+
+    def run(self, session, products=None):
+        """ Synchronize the components of bugzilla with the database.
+
+        In dry-run, the changes are only computed and the cache is left
+        untouched.
+
+        :arg session: the session to connect to the database with.
+        :kwarg products: the list of the products to synchronize, defaults
+            to `PRODUCTS`.
+        :returns: the list of the changes, see `diff`.
+
+        """
+        states = self.get_states(session, products=products)
+        changes = self.diff(states)
+        if not self.dry_run:
+            self.push(changes, states)
+            self.cache.save()
+        return changes
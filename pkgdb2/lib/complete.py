@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+In-memory indexes of the package and packager names used to complete the
+names typed in the search boxes.
+
+The names are loaded once per process and kept in sorted arrays searched by
+bisection. The database is only queried again, to check whether the
+``acls`` generation changed, once every ``PKGDB2_COMPLETE_CHECK_INTERVAL``
+seconds.
+'''
+
+import bisect
+import threading
+import time
+
+import sqlalchemy as sa
+
+import pkgdb2
+from pkgdb2.lib import model
+
+
+class NameIndex(object):
+    """ A sorted array of names, completed case insensitively. """
+
+    def __init__(self, names=()):
+        """ Constructor.
+
+        :kwarg names: the names to index.
+
+        """
+        entries = sorted((name.lower(), name) for name in set(names))
+        self._keys = [entry[0] for entry in entries]
+        self._names = [entry[1] for entry in entries]
+
+    def __len__(self):
+        return len(self._names)
+
+    def complete(self, prefix, limit=10):
+        """ Return the names starting with the given prefix, in alphabetical
+        order.
+
+        :arg prefix: the beginning of the names.
+        :kwarg limit: the maximum number of names to return.
+
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        output = []
+        for idx in xrange(start, min(start + limit, len(self._keys))):
+            if not self._keys[idx].startswith(prefix):
+                break
+            output.append(self._names[idx])
+        return output
+
+
+class CompletionIndex(object):
+    """ The package and packager names, reloaded when the ``acls``
+    generation changes. """
+
+    def __init__(self):
+        """ Constructor, the names are only loaded when first needed. """
+        self.generation = None
+        self.checked = 0
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """ Forget the names loaded, they will be loaded again when next
+        needed. """
+        with self._lock:
+            self.generation = None
+
+    def _load(self, session):
+        """ Load the names from the database.
+
+        :arg session: the session to connect to the database with.
+
+        """
+        packages = session.query(model.Package.name).all()
+        packagers = session.query(
+            sa.func.distinct(model.PackageListingAcl.fas_name)).all()
+        return {
+            'packages': NameIndex(row[0] for row in packages),
+            'packagers': NameIndex(row[0] for row in packagers),
+        }
+
+    def get(self, session, kind):
+        """ Return the index of the specified kind of names, reloading the
+        names if they changed.
+
+        :arg session: the session to connect to the database with.
+        :arg kind: ``packages`` or ``packagers``.
+
+        """
+        interval = pkgdb2.APP.config.get('PKGDB2_COMPLETE_CHECK_INTERVAL', 30)
+        if self.generation is None or time.time() - self.checked >= interval:
+            with self._lock:
+                if self.generation is None \
+                        or time.time() - self.checked >= interval:
+                    generation = model.Generation.get(session, 'acls')
+                    if generation != self.generation:
+                        self.indexes = self._load(session)
+                        self.generation = generation
+                    self.checked = time.time()
+        return self.indexes[kind]
+
+
+# The index of the current process
+INDEX = CompletionIndex()
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Creation of the SQLAlchemy engines used to connect to the database.
+
+The engines are created lazily, the first time a session needs one, and
+once per process: a WSGI worker forked from a parent which already
+connected to the database opens its own connections instead of sharing the
+parent's sockets.
+'''
+
+import os
+import random
+import threading
+import time
+import weakref
+
+import sqlalchemy as sa
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DisconnectionError, TimeoutError
+from sqlalchemy.orm import Session as _Session
+from sqlalchemy.pool import QueuePool
+
+
+# All the factories created, to report the metrics of their pools
+_FACTORIES = weakref.WeakValueDictionary()
+
+
+class PoolMetrics(object):
+    """ Time spent waiting for a connection to be available in a pool. """
+
+    def __init__(self):
+        """ Constructor. """
+        self.checkouts = 0
+        self.wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def add(self, wait, timeout=False):
+        """ Record a checkout from the pool.
+
+        :arg wait: the time spent waiting for the connection, in seconds.
+        :kwarg timeout: a boolean specifying whether no connection could be
+            obtained before the pool timeout.
+
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if timeout:
+                self.timeouts += 1
+
+
+class TimedQueuePool(QueuePool):
+    """ A QueuePool recording the time spent waiting for a connection in
+    its ``metrics``. """
+
+    def __init__(self, *args, **kwargs):
+        """ Constructor, see ``sqlalchemy.pool.QueuePool``. """
+        QueuePool.__init__(self, *args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        """ Return a new pool with the same arguments and metrics. """
+        pool = QueuePool.recreate(self)
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        """ Return a connection from the pool, recording the time spent
+        waiting for it. """
+        start = time.time()
+        try:
+            conn = QueuePool._do_get(self)
+        except TimeoutError:
+            self.metrics.add(time.time() - start, timeout=True)
+            raise
+        self.metrics.add(time.time() - start)
+        return conn
+
+
+def _ping_connection(dbapi_connection, connection_record, connection_proxy):
+    """ Check that the connection checked out from the pool is still alive,
+    and make the pool replace it otherwise. """
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+    except Exception:
+        raise DisconnectionError('The database connection is not alive')
+
+
+def _statement_timeout(timeout):
+    """ Return a listener setting the statement timeout of the new
+    PostgreSQL connections.
+
+    :arg timeout: the maximum duration of a statement, in seconds.
+
+    """
+    def set_timeout(dbapi_connection, connection_record):
+        """ Set the statement timeout of the connection. """
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET statement_timeout = %d' % int(timeout * 1000))
+        cursor.close()
+        dbapi_connection.commit()
+    return set_timeout
+
+
+class ReplicaRouter(object):
+    """ Decide when a session may read from a replica of the database.
+
+    This default router always uses the primary database.
+    """
+
+    def use_replica(self):
+        """ Return whether the current reads can be sent to a replica. """
+        return False
+
+    def written(self):
+        """ Called after a transaction writing to the primary database was
+        committed. """
+        pass
+
+
+class EngineFactory(object):
+    """ Create and hold the engines connecting to the primary database and
+    to its read replicas, one set of engines per process. """
+
+    def __init__(self, db_url, replica_urls=None, debug=False,
+                 pool_size=None, max_overflow=None, pool_timeout=None,
+                 pool_recycle=3600, pre_ping=False, statement_timeout=None,
+                 router=None):
+        """ Constructor, no connection is made to the database until an
+        engine is requested.
+
+        :arg db_url: URL used to connect to the primary database.
+        :kwarg replica_urls: a list of URLs of read-only replicas of the
+            primary database.
+        :kwarg debug: a boolean specifying wether we should have the
+            verbose output of sqlalchemy or not.
+        :kwarg pool_size: the number of connections kept open in the pool.
+        :kwarg max_overflow: the number of connections which can be opened
+            beyond ``pool_size`` when they are all in use.
+        :kwarg pool_timeout: the number of seconds to wait for a connection
+            to be available before giving up.
+        :kwarg pool_recycle: the number of seconds after which a
+            connection is closed and replaced.
+        :kwarg pre_ping: a boolean specifying whether the connections are
+            checked to be alive every time they are checked out.
+        :kwarg statement_timeout: the maximum duration of a SQL statement,
+            in seconds (PostgreSQL only).
+        :kwarg router: the ``ReplicaRouter`` deciding when the replicas are
+            used, by default they never are.
+
+        """
+        self.db_url = db_url
+        self.replica_urls = list(replica_urls or [])
+        self.debug = debug
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.pre_ping = pre_ping
+        self.statement_timeout = statement_timeout
+        self.router = router or ReplicaRouter()
+        self._pid = None
+        self._engines = {}
+        self._lock = threading.Lock()
+        _FACTORIES[id(self)] = self
+
+    def _create_engine(self, db_url):
+        """ Create the engine connecting to the specified database.
+
+        :arg db_url: the URL of the database to connect to.
+
+        """
+        url = make_url(db_url)
+        kwargs = {'echo': self.debug, 'pool_recycle': self.pool_recycle}
+        # SQLite uses its own pools, which do not have a size
+        if not url.drivername.startswith('sqlite'):
+            kwargs['poolclass'] = TimedQueuePool
+            for key, value in [
+                    ('pool_size', self.pool_size),
+                    ('max_overflow', self.max_overflow),
+                    ('pool_timeout', self.pool_timeout)]:
+                if value is not None:
+                    kwargs[key] = value
+
+        engine = sa.create_engine(url, **kwargs)
+
+        if self.pre_ping:
+            sa.event.listen(engine, 'checkout', _ping_connection)
+        if self.statement_timeout and engine.dialect.name == 'postgresql':
+            sa.event.listen(
+                engine, 'connect', _statement_timeout(self.statement_timeout))
+        return engine
+
+    def get_engine(self, replica=None):
+        """ Return the engine of the current process connecting to the
+        specified database, creating it if needed.
+
+        :kwarg replica: the index in ``replica_urls`` of the replica to
+            connect to, ``None`` for the primary database.
+
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # First use, or we were forked: forget the engines of
+                    # the parent process without closing their
+                    # connections, they belong to it.
+                    self._engines = {}
+                    self._pid = pid
+
+        engine = self._engines.get(replica)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(replica)
+                if engine is None:
+                    if replica is None:
+                        db_url = self.db_url
+                    else:
+                        db_url = self.replica_urls[replica]
+                    engine = self._create_engine(db_url)
+                    self._engines[replica] = engine
+        return engine
+
+    def pool_stats(self):
+        """ Return the state of the pools of the engines created in the
+        current process as a list of dictionnaries. """
+        if self._pid != os.getpid():
+            return []
+
+        stats = []
+        for replica, engine in sorted(
+                self._engines.items(), key=lambda item: item[0]):
+            pool = engine.pool
+            info = {
+                'url': repr(engine.url),
+                'replica': replica,
+                'status': pool.status(),
+            }
+            metrics = getattr(pool, 'metrics', None)
+            if metrics is not None:
+                info.update({
+                    'checkouts': metrics.checkouts,
+                    'wait': metrics.wait,
+                    'max_wait': metrics.max_wait,
+                    'timeouts': metrics.timeouts,
+                })
+            stats.append(info)
+        return stats
+
+
+def get_pool_stats():
+    """ Return the state of the connection pools of all the engine
+    factories in the current process. """
+    stats = []
+    for factory in list(_FACTORIES.values()):
+        stats.extend(factory.pool_stats())
+    return stats
+
+
+class Session(_Session):
+    """ A session connecting to the database using the engine of the
+    current process provided by an ``EngineFactory``.
+
+    When the factory has replicas and its router allows it, the session
+    reads from one of them, picked at random the first time, until it
+    writes something: from then on, it uses the primary database.
+    """
+
+    def __init__(self, engines, **kwargs):
+        """ Constructor.
+
+        :arg engines: the ``EngineFactory`` providing the engines.
+
+        """
+        self.engines = engines
+        _Session.__init__(self, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None):
+        """ Return the engine to use for the next statement. """
+        engines = self.engines
+        if engines.replica_urls and not self._flushing \
+                and not self.info.get('wrote') \
+                and engines.router.use_replica():
+            if 'replica' not in self.info:
+                self.info['replica'] = random.randrange(
+                    len(engines.replica_urls))
+            return engines.get_engine(replica=self.info['replica'])
+        return engines.get_engine()
+
+
+@sa.event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    """ Keep reading from the primary database once we wrote to it. """
+    session.info['wrote'] = True
+
+
+@sa.event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    """ Let the router know about the writes committed. """
+    if session.info.pop('wrote', False) and session.engines.replica_urls:
+        session.engines.router.written()
+
+
+@sa.event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    """ Forget about the writes rolled back. """
+    session.info.pop('wrote', None)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Cache of the information pkgdb retrieves from the Fedora Account System.
+
+The members of the packager group and their bugzilla email are retrieved
+together, with two requests to FAS, and cached as a single directory. The
+users who are not in the directory and the groups are retrieved one by one
+and cached separately.
+
+Once they are older than ``PKGDB2_FAS_CACHE_EXPIRATION`` seconds, the
+cached values keep being served while they are refreshed in a background
+thread, so the requests never wait for FAS once the cache is warm.
+'''
+
+import threading
+
+import dogpile.cache
+from fedora.client import Bunch
+from fedora.client.fas2 import FASError
+
+import pkgdb2
+
+
+# The client used instead of the one configured, see `set_client`
+_CLIENT = None
+
+
+def _refresh_in_background(cache, key, creator, mutex):
+    """ Create the new value of an expired key of the cache in a
+    background thread, the previous value is returned meanwhile.
+
+    This is the ``async_creation_runner`` of the dogpile region. If the
+    new value cannot be created, the error is logged and the previous
+    value is kept, it is refreshed again the next time it is requested.
+
+    """
+    def refresh():
+        """ Store the new value and release the dogpile lock. """
+        try:
+            cache.set(key, creator())
+        except Exception:  # pylint: disable=W0703
+            pkgdb2.LOG.exception('Could not refresh %s from FAS', key)
+        finally:
+            mutex.release()
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
+
+
+def _get_expiration():
+    """ Return the number of seconds after which the cached information
+    is refreshed. """
+    return pkgdb2.APP.config.get('PKGDB2_FAS_CACHE_EXPIRATION', 3600)
+
+
+REGION = dogpile.cache.make_region(
+    key_mangler=pkgdb2._mangle_key,
+    async_creation_runner=_refresh_in_background,
+).configure(
+    pkgdb2.APP.config.get('PKGDB2_CACHE_BACKEND', 'dogpile.cache.memory'),
+    **pkgdb2.APP.config.get('PKGDB2_CACHE_KWARGS', {})
+)
+
+
+def set_client(client):
+    """ Use the specified client to query FAS, for example a `StubFas`,
+    instead of the one configured. ``None`` restores the configured one.
+
+    :arg client: an object with the methods of
+        ``fedora.client.fas2.AccountSystem`` used by this module.
+
+    """
+    global _CLIENT
+    _CLIENT = client
+
+
+def get_client():
+    """ Return the client used to query FAS. """
+    if _CLIENT is not None:
+        return _CLIENT
+    # To avoid a circular import.
+    import pkgdb2.lib.utils
+    return pkgdb2.lib.utils.get_fas()
+
+
+@REGION.cache_on_arguments(expiration_time=_get_expiration)
+def get_directory():
+    """ Return the packagers and their bugzilla email, as a dictionnary
+    with the keys:
+        - ``packagers``: the set of the username of the packagers,
+        - ``emails``: a dictionnary of their bugzilla email by username.
+
+    FAS cannot list the members of a group with their email, so the second
+    request lists all the accounts, but only with their username and
+    emails, which bounds its size to a few dozens of bytes per account.
+    Their memberships, which would make most of the response, are not
+    requested: the groups are retrieved one by one, see `get_group`.
+    """
+    fas = get_client()
+
+    packagers = frozenset(
+        user.username
+        for user in fas.group_members('packager')
+        if user.role_type in ('user', 'sponsor', 'administrator')
+    )
+
+    emails = {}
+    people = fas.people_by_key(
+        key='username', fields=['username', 'bugzilla_email'])
+    for username, person in people.items():
+        if username in packagers:
+            emails[username] = person['bugzilla_email']
+
+    return {'packagers': packagers, 'emails': emails}
+
+
+@REGION.cache_on_arguments(expiration_time=_get_expiration)
+def _get_person(username):
+    """ Return the information of a user who is not a packager. """
+    return get_client().person_by_username(username)
+
+
+def get_packagers():
+    """ Return the set of the username of the members of the packager
+    group. """
+    return get_directory()['packagers']
+
+
+def get_person(username):
+    """ Return the username and bugzilla email of the specified user.
+
+    :arg username: the FAS username of the user.
+
+    """
+    email = get_directory()['emails'].get(username)
+    if email is None:
+        return _get_person(username)
+    return Bunch(username=username, bugzilla_email=email)
+
+
+@REGION.cache_on_arguments(expiration_time=_get_expiration)
+def get_group(group):
+    """ Return the information of the specified group.
+
+    :arg group: the name of the group.
+
+    """
+    return get_client().group_by_name(group)
+
+
+class StubFas(object):
+    """ A FAS client serving the users and groups it is given, used to run
+    pkgdb without a FAS instance, for example in the tests. """
+
+    def __init__(self, people=None, groups=None, packagers=None):
+        """ Constructor.
+
+        :kwarg people: a dictionnary of the bugzilla email of the users
+            by username.
+        :kwarg groups: a list of dictionnaries describing the groups,
+            with at least the ``name``, ``group_type`` and ``mailing_list``
+            keys, and optionally the ``members`` of the group.
+        :kwarg packagers: the list of the members of the packager group.
+
+        """
+        self.people = dict(people or {})
+        self.groups = dict(
+            (group['name'], dict(group)) for group in groups or [])
+        self.packagers = list(packagers or [])
+        # The number of requests received and the fields of the users
+        # last requested
+        self.requests = 0
+        self.fields = None
+
+    def _group(self, group):
+        """ Return a group without its members. """
+        return Bunch(
+            (key, value) for key, value in self.groups[group].items()
+            if key != 'members')
+
+    def group_members(self, groupname):
+        """ Return the members of the packager group. """
+        self.requests += 1
+        if groupname != 'packager':
+            return []
+        return [
+            Bunch(username=username, role_type='user')
+            for username in self.packagers
+        ]
+
+    def people_by_key(self, key=u'username', search=u'*', fields=None):
+        """ Return all the users, with the specified fields among their
+        username, bugzilla email and memberships, all of them by default.
+        """
+        self.requests += 1
+        self.fields = fields
+        people = Bunch()
+        for username, email in self.people.items():
+            person = Bunch(
+                username=username,
+                bugzilla_email=email,
+                memberships=[
+                    self._group(group)
+                    for group in sorted(self.groups)
+                    if username in self.groups[group].get('members', [])
+                ],
+            )
+            if fields:
+                person = Bunch(
+                    (field, person[field]) for field in fields
+                    if field in person)
+            people[username] = person
+        return people
+
+    def person_by_username(self, username):
+        """ Return the specified user, an empty Bunch if they do not
+        exist. """
+        self.requests += 1
+        if username not in self.people:
+            return Bunch()
+        return Bunch(
+            username=username, bugzilla_email=self.people[username])
+
+    def group_by_name(self, groupname):
+        """ Return the specified group. """
+        self.requests += 1
+        if groupname not in self.groups:
+            raise FASError(
+                'FAS server unable to retrieve group %s' % groupname)
+        return self._group(groupname)
@@ -27,18 +27,25 @@ __requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
 import pkg_resources
 
 import datetime
+import json
 import logging
+import random
 import time
 
 import sqlalchemy as sa
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import relation
 from sqlalchemy.orm import backref
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm import subqueryload
 from sqlalchemy.sql import or_
 
 BASE = declarative_base()
@@ -47,6 +54,51 @@ ERROR_LOG = logging.getLogger('pkgdb2.lib.model.packages')
 
 DEFAULT_GROUPS = {'provenpackager': {'commit': True}}
 
+# Number of rows fetched at once from the database when streaming results
+STREAM_BATCH = 100
+
+
+def load_options(profile):
+    """ Return the loader options eager-loading the relations needed by
+    the ``to_json`` method for the given loading profile.
+
+    :arg profile: the name of the loading profile, either:
+        - ``None`` to lazy load everything,
+        - ``package_acls`` for ``Package`` with its listings, their
+          collection and ACLs,
+        - ``listing_acls`` for ``PackageListing`` with its package,
+          collection and ACLs,
+        - ``acl_listing`` for ``PackageListingAcl`` with its package
+          listing, its package and its collection,
+        - ``rows`` for the queries returning the read-only records of
+          `pkgdb2.lib.readmodel` instead of objects, which need no option.
+    :raises ValueError: The loading profile is unknown.
+
+    """
+    if profile is None or profile == 'rows':
+        return []
+    elif profile == 'package_acls':
+        return [
+            subqueryload(Package.listings).joinedload(
+                PackageListing.collection),
+            subqueryload(Package.listings).subqueryload(
+                PackageListing.acls),
+        ]
+    elif profile == 'listing_acls':
+        return [
+            joinedload(PackageListing.package),
+            joinedload(PackageListing.collection),
+            subqueryload(PackageListing.acls),
+        ]
+    elif profile == 'acl_listing':
+        return [
+            joinedload(PackageListingAcl.packagelist).joinedload(
+                PackageListing.package),
+            joinedload(PackageListingAcl.packagelist).joinedload(
+                PackageListing.collection),
+        ]
+    raise ValueError('Unknown loading profile: %s' % profile)
+
 
 ## Apparently some of our methods have too few public methods
 # pylint: disable=R0903
@@ -153,6 +205,23 @@ def create_status(session):
         except SQLAlchemyError:  # pragma: no cover
             session.rollback()
 
+    for name in ['acls', 'changes', 'collections']:
+        obj = Generation(name)
+        session.add(obj)
+        try:
+            session.commit()
+        except SQLAlchemyError:  # pragma: no cover
+            session.rollback()
+
+    # Random token telling this database apart from the others sharing
+    # the same cache
+    obj = Generation('database', random.randint(1, 2 ** 31 - 1))
+    session.add(obj)
+    try:
+        session.commit()
+    except SQLAlchemyError:  # pragma: no cover
+        session.rollback()
+
 
 class PkgAcls(BASE):
     ''' Table storing the ACLs a package can have. '''
@@ -316,7 +385,8 @@ class PackageListingAcl(BASE):
     @classmethod
     def get_acl_packager(
             cls, session, packager, acls=None, eol=False, poc=None,
-            offset=None, limit=None, count=False):
+            offset=None, limit=None, count=False, stream=False,
+            after=None, load=None):
         """ Retrieve the ACLs associated with a packager.
 
         :arg session: the database session used to connect to the
@@ -343,6 +413,14 @@ class PackageListingAcl(BASE):
         :kwarg limit: the number of results to return
         :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+        :kwarg stream: a boolean to return a query loading the ACLs by
+            batches from a server-side cursor instead of the list of ACLs.
+            Defaults to False.
+        :kwarg after: the identifier of the ACL after which to return the
+            results, used to seek to the next page instead of using an
+            offset.
+        :kwarg load: the loading profile to use, see `load_options`. The
+            ``rows`` profile returns ``pkgdb2.lib.readmodel.AclRow``.
 
         """
 
@@ -386,13 +464,31 @@ class PackageListingAcl(BASE):
         if count:
             return query.count()
 
-        query = query.order_by(PackageListingAcl.id)
+        query = query.order_by(PackageListingAcl.id).options(
+            *load_options(load))
+
+        if after is not None:
+            query = query.filter(PackageListingAcl.id > after)
+
+        if load == 'rows':
+            # To avoid a circular import.
+            from pkgdb2.lib import readmodel
+            query = readmodel.select_acls(query)
 
         if offset:
             query = query.offset(offset)
         if limit:
             query = query.limit(limit)
 
+        if stream:
+            query = query.yield_per(STREAM_BATCH).execution_options(
+                stream_results=True)
+
+        if load == 'rows':
+            return readmodel.acl_rows(query, lazy=stream)
+        if stream:
+            return query
+
         return query.all()
 
     @classmethod
@@ -773,7 +869,7 @@ class PackageListing(BASE):
         if self.collection:
             result['collection'] = self.collection.to_json(_seen)
 
-        if acls and self.acls and not type(self.acls[0]) in _seen:
+        if acls and PackageListingAcl not in _seen and self.acls:
             tmp = []
             for acl in self.acls:
                 tmp.append(acl.to_json(_seen + [type(self)]))
@@ -819,11 +915,132 @@ class PackageListing(BASE):
         session.flush()
 
     @classmethod
-    def by_package_id(cls, session, pkgid):
+    def bulk_branch(cls, session, clt_from_id, clt_to_id):
+        """ Clone all the Approved PackageListing of a collection, together
+        with their ACLs, into another collection using set-based
+        ``INSERT ... SELECT`` queries.
+
+        Packages already present in the collection branched to are left
+        untouched and returned as conflicts.
+
+        This method only flushes, committing is up to the caller.
+
+        :arg session: the database session used to query the information.
+        :arg clt_from_id: the identifier of the Collection to branch from.
+        :arg clt_to_id: the identifier of the Collection to branch to.
+        :returns: a tuple of two lists of package names, the packages
+            branched and the packages which could not be branched because
+            they already exist in the collection branched to.
+
+        """
+        now = datetime.datetime.utcnow()
+
+        existing = session.query(
+            PackageListing.package_id
+        ).filter(
+            PackageListing.collection_id == clt_to_id
+        )
+
+        approved = session.query(
+            Package.name, PackageListing.package_id
+        ).filter(
+            PackageListing.package_id == Package.id
+        ).filter(
+            PackageListing.collection_id == clt_from_id
+        ).filter(
+            PackageListing.status == 'Approved'
+        ).order_by(
+            Package.name
+        ).all()
+
+        conflict_ids = set(
+            row.package_id for row in existing.filter(
+                PackageListing.package_id.in_(
+                    session.query(PackageListing.package_id).filter(
+                        PackageListing.collection_id == clt_from_id
+                    ).filter(
+                        PackageListing.status == 'Approved'
+                    ).subquery()
+                )
+            ).all()
+        )
+
+        branched = []
+        branched_ids = []
+        conflicts = []
+        for row in approved:
+            if row.package_id in conflict_ids:
+                conflicts.append(row.name)
+            else:
+                branched.append(row.name)
+                branched_ids.append(row.package_id)
+
+        if not branched:
+            return (branched, conflicts)
+
+        # Copy the PackageListing
+        source = session.query(
+            PackageListing.package_id,
+            PackageListing.point_of_contact,
+            sa.literal(clt_to_id, sa.Integer),
+            PackageListing.status,
+            PackageListing.critpath,
+            sa.literal(now, sa.DateTime),
+        ).filter(
+            PackageListing.collection_id == clt_from_id
+        ).filter(
+            PackageListing.status == 'Approved'
+        ).filter(
+            ~PackageListing.package_id.in_(existing.subquery())
+        )
+        session.execute(
+            PackageListing.__table__.insert().from_select(
+                ['package_id', 'point_of_contact', 'collection_id',
+                 'status', 'critpath', 'status_change'],
+                source.subquery().select()
+            )
+        )
+
+        # Copy the ACLs of the listings just inserted, by batches of
+        # packages to keep the number of parameters of the queries low
+        old_pkglist = sa.orm.aliased(PackageListing)
+        new_pkglist = sa.orm.aliased(PackageListing)
+        for cnt in range(0, len(branched_ids), 500):
+            source = session.query(
+                PackageListingAcl.fas_name,
+                new_pkglist.id,
+                PackageListingAcl.acl,
+                PackageListingAcl.status,
+                sa.literal(now, sa.DateTime),
+            ).filter(
+                PackageListingAcl.packagelisting_id == old_pkglist.id
+            ).filter(
+                old_pkglist.collection_id == clt_from_id
+            ).filter(
+                old_pkglist.package_id == new_pkglist.package_id
+            ).filter(
+                new_pkglist.collection_id == clt_to_id
+            ).filter(
+                new_pkglist.package_id.in_(branched_ids[cnt:cnt + 500])
+            )
+            session.execute(
+                PackageListingAcl.__table__.insert().from_select(
+                    ['fas_name', 'packagelisting_id', 'acl', 'status',
+                     'date_created'],
+                    source.subquery().select()
+                )
+            )
+        session.flush()
+
+        return (branched, conflicts)
+
+    @classmethod
+    def by_package_id(cls, session, pkgid, load=None):
         """ Return the PackageListing object based on the Package ID.
 
         :arg pkgid: Integer, identifier of the package in the Package
             table
+        :kwarg load: the loading profile to use, see `load_options`.
 
         """
 
@@ -831,8 +1048,51 @@ class PackageListing(BASE):
             PackageListing.package_id == pkgid
         ).order_by(
             PackageListing.collection_id
+        ).options(
+            *load_options(load)
         ).all()
 
+    @classmethod
+    def by_package_name(cls, session, pkgname, branches=None, eol=False,
+                        load=None):
+        """ Return the PackageListing of the package, the package and the
+        collection of each are loaded by the same query.
+
+        :arg pkgname: the name of the package.
+        :kwarg branches: the branchname of the collection or collections
+            to restrict the listings to.
+        :kwarg eol: a boolean to specify whether to include the listings
+            of the EOL collections or not. Defaults to False.
+        :kwarg load: the loading profile to use, see `load_options`.
+
+        """
+        query = session.query(
+            cls
+        ).join(
+            cls.package
+        ).join(
+            cls.collection
+        ).filter(
+            Package.name == pkgname
+        ).order_by(
+            PackageListing.collection_id
+        ).options(
+            *load_options(load)
+        ).options(
+            contains_eager(cls.package),
+            contains_eager(cls.collection),
+        )
+
+        if branches:
+            if isinstance(branches, basestring):
+                branches = [branches]
+            query = query.filter(Collection.branchname.in_(branches))
+
+        if not eol:
+            query = query.filter(Collection.status != 'EOL')
+
+        return query.all()
+
     @classmethod
     def by_pkgid_collectionid(cls, session, pkgid, collectionid):
         """Return the PackageListing for the provided package in the
@@ -918,7 +1178,7 @@ class PackageListing(BASE):
 
     @classmethod
     def search_packagers(cls, session, pattern, eol=False, offset=None,
-                         limit=None, count=False):
+                         limit=None, count=False, after=None):
         """ Return all the packagers whose name match the pattern.
         Are packagers user having at least one commit ACL on one package.
 
@@ -934,6 +1194,9 @@ class PackageListing(BASE):
         :kwarg limit: the number of results to return
         :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+        :kwarg after: the name of the packager after which to return the
+            results, used to seek to the next page instead of using an
+            offset.
 
         """
         query = session.query(
@@ -958,6 +1221,9 @@ class PackageListing(BASE):
         if count:
             return query.count()
 
+        if after is not None:
+            query = query.filter(PackageListingAcl.fas_name > after)
+
         if offset:
             query = query.offset(offset)
         if limit:
@@ -1054,16 +1320,23 @@ class Package(BASE):
     def sorted_listings(self):
         """ Return associated listings reverse sorted by collection name.
 
+        The collections are compared using the reference data of the
+        process, without loading them.
+
         """
-        def comparator(a, b):
-            """ Compare two collections and return the result of the
-            comparison relying on collection name and version.
+        # To avoid a circular import.
+        from pkgdb2.lib import reference
+        session = object_session(self)
 
-            """
-            b, a = a.collection, b.collection
-            return cmp(a.name + a.version, b.name + b.version)
+        def sort_key(listing):
+            """ Return the key sorting the listings by the name and version
+            of their collection. """
+            if session is None or listing.collection_id is None:
+                return listing.collection.name + listing.collection.version
+            return reference.REGISTRY.sort_key(
+                session, listing.collection_id)
 
-        return sorted(self.listings, cmp=comparator)
+        return sorted(self.listings, key=sort_key, reverse=True)
 
     @classmethod
     def by_name(cls, session, pkgname):
@@ -1074,6 +1347,19 @@ class Package(BASE):
         """
         return session.query(cls).filter(Package.name == pkgname).one()
 
+    @classmethod
+    def by_ids(cls, session, pkg_ids):
+        """ Return the packages associated to the given identifiers, sorted
+        by name.
+        """
+        return session.query(
+            cls
+        ).filter(
+            Package.id.in_(pkg_ids)
+        ).order_by(
+            Package.name
+        ).all()
+
     def __init__(self, name, summary, description, status,
                  review_url=None, upstream_url=None):
         self.name = name
@@ -1153,7 +1439,8 @@ class Package(BASE):
     def search(cls, session, pkg_name, pkg_poc=None, pkg_status=None,
                pkg_branch=None, orphaned=None, critpath=None, eol=False,
                offset=None, limit=None, count=False,
-               case_sensitive=True):
+               case_sensitive=True, stream=False, after=None, load=None,
+               backend=None, mode='name', rank=False):
         """ Search the Packages for the one fitting the given pattern.
 
         :arg session: session with which to connect to the database
@@ -1175,13 +1462,35 @@ class Package(BASE):
             if true, returns the data if false (default).
         :kwarg case_sensitive: a boolean to specify doing a case insensitive
             search. Defaults to True.
+        :kwarg stream: a boolean to return a query loading the packages
+            by batches from a server-side cursor instead of the list of
+            packages. Defaults to False.
+        :kwarg after: the name of the package after which to return the
+            results, used to seek to the next page instead of using an
+            offset.
+        :kwarg load: the loading profile to use, see `load_options`. It
+            is ignored when streaming since the collections cannot be
+            eager-loaded by batches. The ``rows`` profile returns
+            ``pkgdb2.lib.readmodel.PackageRow``, as an iterator when
+            streaming.
+        :kwarg backend: the search backend matching the pattern, see
+            `pkgdb2.lib.search`. Defaults to a LIKE on the name.
+        :kwarg mode: ``name`` to match the pattern on the name of the
+            packages, ``summary`` to match it on their name, summary and
+            description as well.
+        :kwarg rank: a boolean to order the packages by relevance instead of
+            by name.
 
         """
 
         query = session.query(
             sa.func.distinct(Package.id)
         )
-        if case_sensitive:
+        if backend is not None:
+            query = query.filter(
+                backend.match(pkg_name, case_sensitive, mode)
+            )
+        elif case_sensitive:
             query = query.filter(
                 Package.name.like(pkg_name)
             )
@@ -1249,23 +1558,45 @@ class Package(BASE):
                 Collection.status != 'EOL'
             )
 
+        if backend is not None and backend.indexed:
+            # Select the packages matching from the index first, instead of
+            # scanning them by name and checking each one
+            query = query.correlate(None)
         final_query = session.query(
             Package
         ).filter(
             Package.id.in_(query.subquery())
-        ).order_by(
+        )
+        if rank and backend is not None:
+            final_query = final_query.order_by(
+                *backend.rank(pkg_name, mode))
+        final_query = final_query.order_by(
             Package.name
         )
 
         if count:
             return final_query.count()
 
+        if after is not None:
+            final_query = final_query.filter(Package.name > after)
+
         if offset:
             final_query = final_query.offset(offset)
         if limit:
             final_query = final_query.limit(limit)
 
-        return final_query.all()
+        if stream:
+            final_query = final_query.yield_per(
+                STREAM_BATCH).execution_options(stream_results=True)
+            if load != 'rows':
+                return final_query
+
+        if load == 'rows':
+            # To avoid a circular import.
+            from pkgdb2.lib import readmodel
+            return readmodel.package_rows(final_query, lazy=stream)
+
+        return final_query.options(*load_options(load)).all()
 
     @classmethod
     def count_collection(cls, session):
@@ -1373,6 +1704,49 @@ class Package(BASE):
 
         return query.all()
 
+    @classmethod
+    def count_package_of_users(cls, session, users, eol=False):
+        """ Return the number of packages on which the given users have
+        commit rights, per branch and whether they are the point of
+        contact or not, using a single grouped query.
+
+        :arg session: session with which to connect to the database.
+        :arg users: the list of the FAS username of the users of interest.
+        :kwarg eol: a boolean to specify wether the output should include
+            End Of Life releases or not.
+        :returns: a list of ``(user, branchname, poc, count)`` tuples.
+
+        """
+        is_poc = PackageListing.point_of_contact == PackageListingAcl.fas_name
+        query = session.query(
+            PackageListingAcl.fas_name,
+            Collection.branchname,
+            is_poc,
+            sa.func.count(sa.distinct(PackageListing.package_id)),
+        ).filter(
+            PackageListing.id == PackageListingAcl.packagelisting_id
+        ).filter(
+            PackageListing.collection_id == Collection.id
+        ).filter(
+            PackageListing.status == 'Approved'
+        ).filter(
+            PackageListingAcl.fas_name.in_(users)
+        ).filter(
+            PackageListingAcl.acl == 'commit'
+        ).filter(
+            PackageListingAcl.status == 'Approved'
+        ).group_by(
+            PackageListingAcl.fas_name, Collection.branchname, is_poc
+        )
+
+        if eol is False:
+            query = query.filter(Collection.status != 'EOL')
+
+        return [
+            (user, branchname, bool(poc), count)
+            for user, branchname, poc, count in query.all()
+        ]
+
     @classmethod
     def get_package_watch_by_user(
             cls, session, user, pkg_status=None, eol=False):
@@ -1452,6 +1826,66 @@ class Package(BASE):
         return result
 
 
+# Indexes used by the search backends of `pkgdb2.lib.search`: trigram
+# indexes on PostgreSQL (when the pg_trgm extension is installed) and a FTS5
+# table, kept in sync with the Package table by triggers, on SQLite.
+SEARCH_DDL = {
+    'postgresql': [
+        'CREATE INDEX "Package_name_trgm_idx" ON "Package" '
+        'USING gin (name gin_trgm_ops)',
+        'CREATE INDEX "Package_summary_trgm_idx" ON "Package" '
+        'USING gin (summary gin_trgm_ops)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE "PackageSearch" USING fts5('
+        'name, summary, description, content="Package", content_rowid="id", '
+        'tokenize="trigram")',
+        'CREATE TRIGGER "Package_search_insert" AFTER INSERT ON "Package" '
+        'BEGIN INSERT INTO "PackageSearch" (rowid, name, summary, '
+        'description) VALUES (new.id, new.name, new.summary, '
+        'new.description); END',
+        'CREATE TRIGGER "Package_search_delete" AFTER DELETE ON "Package" '
+        'BEGIN INSERT INTO "PackageSearch" ("PackageSearch", rowid, name, '
+        'summary, description) VALUES (\'delete\', old.id, old.name, '
+        'old.summary, old.description); END',
+        'CREATE TRIGGER "Package_search_update" AFTER UPDATE ON "Package" '
+        'BEGIN INSERT INTO "PackageSearch" ("PackageSearch", rowid, name, '
+        'summary, description) VALUES (\'delete\', old.id, old.name, '
+        'old.summary, old.description); INSERT INTO "PackageSearch" '
+        '(rowid, name, summary, description) VALUES (new.id, new.name, '
+        'new.summary, new.description); END',
+    ],
+}
+
+
+def _has_search_support(ddl, target, bind, **kw):
+    """ Return whether the database supports the search indexes. """
+    if bind.dialect.name == 'postgresql':
+        return bool(bind.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        ).scalar())
+    elif bind.dialect.name == 'sqlite':
+        # The trigram tokenizer appeared in SQLite 3.34
+        return bind.dialect.dbapi.sqlite_version_info >= (3, 34, 0) \
+            and bool(bind.execute(
+                "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+            ).scalar())
+    return False
+
+
+for _dialect, _statements in SEARCH_DDL.items():
+    for _statement in _statements:
+        sa.event.listen(
+            Package.__table__, 'after_create',
+            sa.DDL(_statement).execute_if(
+                dialect=_dialect, callable_=_has_search_support))
+# The triggers and indexes are dropped with the Package table
+sa.event.listen(
+    Package.__table__, 'before_drop',
+    sa.DDL('DROP TABLE IF EXISTS "PackageSearch"').execute_if(
+        dialect='sqlite'))
+
+
 class Log(BASE):
     """Base Log record.
 
@@ -1489,7 +1923,7 @@ class Log(BASE):
     @classmethod
     def search(cls, session, package_id=None, packager=None,
                from_date=None, limit=None,
-               offset=None, count=False):
+               offset=None, count=False, after=None):
         """ Return the list of the last Log entries present in the database.
 
         :arg cls: the class object
@@ -1501,6 +1935,9 @@ class Log(BASE):
         :kwarg offset: start the result at row X
         :kwarg count: a boolean to return the result of a COUNT query
             if true, returns the data if false (default).
+        :kwarg after: a tuple of the change time and identifier of the log
+            entry after which to return the results, used to seek to the
+            next page instead of using an offset.
 
         """
         query = session.query(
@@ -1516,11 +1953,23 @@ class Log(BASE):
         if from_date:
             query = query.filter(cls.change_time <= from_date)
 
-        query = query.order_by(cls.change_time.desc())
+        query = query.order_by(cls.change_time.desc(), cls.id.desc())
 
         if count:
             return query.count()
 
+        if after is not None:
+            change_time, log_id = after
+            query = query.filter(
+                or_(
+                    cls.change_time < change_time,
+                    sa.and_(
+                        cls.change_time == change_time,
+                        cls.id < log_id,
+                    )
+                )
+            )
+
         if offset:
             query = query.offset(offset)
         if limit:
@@ -1547,6 +1996,885 @@ class Log(BASE):
         session.flush()
 
 
+class Change(BASE):
+    """Structured record of a change, sequenced so the consumers of the
+    ``/api/changes/`` feed can retrieve the changes made since the last one
+    they processed.
+
+    The changes are recorded by `pkgdb2.lib.utils.log` for the topics
+    registered with the fields of their change, when the transaction is
+    committed. Their sequence number comes from the ``changes`` generation,
+    see `insert_many`, so they are numbered in the order the transactions
+    commit and a consumer never misses a change committed after it
+    retrieved a later one.
+
+    Table -- Change
+    """
+
+    __tablename__ = 'Change'
+    seq = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    topic = sa.Column(sa.String(50), nullable=False)
+    change_time = sa.Column(sa.DateTime, nullable=False,
+                            default=datetime.datetime.utcnow)
+    agent = sa.Column(sa.String(32), nullable=False)
+    package = sa.Column(sa.Text, nullable=True, index=True)
+    branch = sa.Column(sa.String(32), nullable=True)
+    acl = sa.Column(sa.String(50), nullable=True)
+    fas_name = sa.Column(sa.Text, nullable=True)
+    old_value = sa.Column(sa.Text, nullable=True)
+    new_value = sa.Column(sa.Text, nullable=True)
+
+    # The fields describing what changed, see `pkgdb2.lib.utils.Topic`
+    FIELDS = ['package', 'branch', 'acl', 'fas_name', 'old_value',
+              'new_value']
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'Change(%r, %r, package=%r, branch=%r)' % (
+            self.seq, self.topic, self.package, self.branch)
+
+    def to_json(self):
+        """ Return a representation of the change as a dictionnary. """
+        return dict(
+            seq=self.seq,
+            topic=self.topic,
+            change_time=time.mktime(self.change_time.timetuple()),
+            agent=self.agent,
+            package=self.package,
+            branch=self.branch,
+            acl=self.acl,
+            user=self.fas_name,
+            old=self.old_value,
+            new=self.new_value,
+        )
+
+    @classmethod
+    def insert_many(cls, session, rows):
+        """ Insert the given changes into the database, with a single
+        statement.
+
+        Their sequence numbers are reserved on the ``changes`` generation,
+        which stays locked until the end of the transaction, so this has to
+        be called just before committing.
+
+        :arg session: the session to connect to the database with.
+        :arg rows: a list of dictionnaries with the ``topic``, ``agent``,
+            ``change_time`` and `FIELDS` of each change.
+
+        """
+        if rows:
+            last = Generation.reserve(session, 'changes', len(rows))
+            first = last - len(rows) + 1
+            session.execute(cls.__table__.insert(), [
+                dict(row, seq=seq)
+                for seq, row in enumerate(rows, first)
+            ])
+
+    @classmethod
+    def since(cls, session, seq=0, limit=None):
+        """ Return the changes recorded after the specified one, in the
+        order they were recorded.
+
+        :arg session: the session to connect to the database with.
+        :kwarg seq: the sequence number of the last change already known.
+        :kwarg limit: the maximum number of changes to return.
+
+        """
+        query = session.query(
+            cls
+        ).filter(
+            cls.seq > seq
+        ).order_by(
+            cls.seq
+        )
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @classmethod
+    def last_seq(cls, session):
+        """ Return the sequence number of the last change recorded, 0 if
+        there is none.
+
+        :arg session: the session to connect to the database with.
+
+        """
+        return session.query(sa.func.max(cls.seq)).scalar() or 0
+
+
+class Generation(BASE):
+    """Counters bumped every time the data they cover changes, used to
+    know whether cached information is still up to date.
+
+    Table -- Generation
+    """
+
+    __tablename__ = 'Generation'
+    name = sa.Column(sa.String(50), primary_key=True)
+    value = sa.Column(sa.Integer, nullable=False, default=0)
+
+    def __init__(self, name, value=0):
+        """ Constructor. """
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'Generation(%r, %r)' % (self.name, self.value)
+
+    @classmethod
+    def get(cls, session, name):
+        """ Return the current value of the specified counter, 0 if it does
+        not exist.
+
+        :arg session: the database session used to query the information.
+        :arg name: the name of the counter.
+
+        """
+        value = session.query(cls.value).filter(cls.name == name).scalar()
+        return value or 0
+
+    @classmethod
+    def get_many(cls, session, names):
+        """ Return the current value of the specified counters, 0 for
+        those which do not exist.
+
+        :arg session: the database session used to query the information.
+        :arg names: the names of the counters.
+        :returns: a dictionary of the value of the counters by name.
+
+        """
+        values = dict((name, 0) for name in names)
+        values.update(session.query(
+            cls.name, cls.value
+        ).filter(
+            cls.name.in_(names)
+        ).all())
+        return values
+
+    @classmethod
+    def bump(cls, session, name):
+        """ Increment the specified counter, creating it if needed.
+
+        The increment is done by the database so concurrent transactions
+        do not lose any.
+
+        This method only flushes, committing is up to the caller.
+
+        :arg session: the database session used to query the information.
+        :arg name: the name of the counter.
+
+        """
+        updated = session.query(cls).filter(
+            cls.name == name
+        ).update(
+            {cls.value: cls.value + 1}, synchronize_session=False)
+        if not updated:
+            session.add(cls(name, 1))
+            session.flush()
+
+    @classmethod
+    def reserve(cls, session, name, count):
+        """ Increment the specified counter by ``count``, creating it if
+        needed, and return its new value.
+
+        The row of the counter stays locked until the end of the
+        transaction, so concurrent transactions reserve consecutive ranges
+        of values in the order they commit.
+
+        This method only flushes, committing is up to the caller.
+
+        :arg session: the database session used to query the information.
+        :arg name: the name of the counter.
+        :arg count: the number of values to reserve.
+        :returns: the last value reserved.
+
+        """
+        updated = session.query(cls).filter(
+            cls.name == name
+        ).update(
+            {cls.value: cls.value + count}, synchronize_session=False)
+        if not updated:
+            session.add(cls(name, count))
+            session.flush()
+        return session.query(cls.value).filter(cls.name == name).scalar()
+
+
+class PackageAclSnapshot(BASE):
+    """Denormalized copy of the PackageListing and their ACLs together with
+    the information about their Package and Collection.
+
+    There is one row per ACL and one row without ACL information for the
+    PackageListing having no ACLs at all.
+
+    This table is what the bugzilla, notify and vcs exports read, it is
+    refreshed by the methods of pkgdb2.lib changing the data it holds.
+
+    Table -- PackageAclSnapshot
+    """
+
+    __tablename__ = 'PackageAclSnapshot'
+    id = sa.Column(sa.Integer, nullable=False, primary_key=True)
+    packagelisting_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'PackageListing.id', ondelete='CASCADE', onupdate='CASCADE'),
+        nullable=False,
+        index=True)
+    package_id = sa.Column(sa.Integer, nullable=False, index=True)
+    package_name = sa.Column(sa.Text, nullable=False, index=True)
+    package_summary = sa.Column(sa.Text, nullable=False)
+    package_status = sa.Column(sa.String(50), nullable=False)
+    point_of_contact = sa.Column(sa.Text, nullable=False)
+    pkglist_status = sa.Column(sa.String(50), nullable=False)
+    collection_id = sa.Column(sa.Integer, nullable=False, index=True)
+    collection_name = sa.Column(sa.Text, nullable=False)
+    collection_version = sa.Column(sa.Text, nullable=False)
+    collection_status = sa.Column(sa.String(50), nullable=False)
+    branchname = sa.Column(sa.String(32), nullable=False)
+    fas_name = sa.Column(sa.String(32), nullable=True)
+    acl = sa.Column(sa.String(50), nullable=True)
+    acl_status = sa.Column(sa.String(50), nullable=True)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'PackageAclSnapshot(%r, %r, %r, %r)' % (
+            self.package_name, self.branchname, self.fas_name, self.acl)
+
+    @classmethod
+    def refresh(cls, session, package_ids=None, collection_ids=None):
+        """ Rebuild the snapshot rows of the specified packages and/or
+        collections, the entire table if none are specified.
+
+        The CollectionStats and PackagerStats rollups are updated with the
+        difference between the old and the new rows of the packages and
+        collections refreshed, they are only recomputed entirely when the
+        entire table is rebuilt.
+
+        This method only flushes, committing is up to the caller.
+
+        :arg session: the database session used to query the information.
+        :kwarg package_ids: a list of identifiers of the packages to refresh.
+        :kwarg collection_ids: a list of identifiers of the collections to
+            refresh.
+
+        """
+        if package_ids is not None:
+            package_ids = list(set(package_ids))
+        if collection_ids is not None:
+            collection_ids = list(set(collection_ids))
+        if package_ids == [] or collection_ids == []:
+            session.flush()
+            return
+
+        def scope(query, package_column, collection_column):
+            """ Restrict the query to the packages and collections
+            refreshed. """
+            if package_ids is not None:
+                query = query.filter(package_column.in_(package_ids))
+            if collection_ids is not None:
+                query = query.filter(collection_column.in_(collection_ids))
+            return query
+
+        delete = scope(session.query(cls), cls.package_id, cls.collection_id)
+        scoped = package_ids is not None or collection_ids is not None
+        if scoped:
+            # Read before flushing, the rows of the listings deleted are
+            # removed with them by the database
+            with session.no_autoflush:
+                old = cls._contributions(delete)
+
+        session.flush()
+
+        source = session.query(
+            PackageListing.id,
+            Package.id,
+            Package.name,
+            Package.summary,
+            Package.status,
+            PackageListing.point_of_contact,
+            PackageListing.status,
+            Collection.id,
+            Collection.name,
+            Collection.version,
+            Collection.status,
+            Collection.branchname,
+            PackageListingAcl.fas_name,
+            PackageListingAcl.acl,
+            PackageListingAcl.status,
+        ).select_from(
+            PackageListing
+        ).join(
+            Package, Package.id == PackageListing.package_id
+        ).join(
+            Collection, Collection.id == PackageListing.collection_id
+        ).outerjoin(
+            PackageListingAcl,
+            PackageListingAcl.packagelisting_id == PackageListing.id
+        )
+        source = scope(
+            source, PackageListing.package_id, PackageListing.collection_id)
+
+        delete.delete(synchronize_session=False)
+        session.execute(
+            cls.__table__.insert().from_select(
+                ['packagelisting_id', 'package_id', 'package_name',
+                 'package_summary', 'package_status', 'point_of_contact',
+                 'pkglist_status', 'collection_id', 'collection_name',
+                 'collection_version', 'collection_status', 'branchname',
+                 'fas_name', 'acl', 'acl_status'],
+                source.subquery(with_labels=True).select()
+            )
+        )
+
+        if not scoped:
+            CollectionStats.refresh(session)
+            PackagerStats.refresh(session)
+            return
+
+        new = cls._contributions(delete)
+
+        deltas = {}
+        for item in old[0] ^ new[0]:
+            deltas[item[0]] = deltas.get(item[0], 0) + (
+                1 if item in new[0] else -1)
+        CollectionStats.add(session, deltas)
+
+        # A user counts a package once whatever the number of collections
+        # it is in, the rows of the other collections tell whether a user
+        # still counts the packages changed
+        others = (set(), set(), set())
+        if collection_ids is not None:
+            changed = sorted(set(
+                item[1] for item in (old[1] ^ new[1]) | (old[2] ^ new[2])))
+            for cnt in range(0, len(changed), 500):
+                rows = cls._contributions(session.query(cls).filter(
+                    cls.package_id.in_(changed[cnt:cnt + 500])
+                ).filter(
+                    ~cls.collection_id.in_(collection_ids)
+                ))
+                others[1].update(rows[1])
+                others[2].update(rows[2])
+
+        deltas = {}
+        for idx, kind in ((1, 'commit'), (2, 'poc')):
+            for item in (old[idx] ^ new[idx]) - others[idx]:
+                key = (item[0], kind)
+                deltas[key] = deltas.get(key, 0) + (
+                    1 if item in new[idx] else -1)
+        PackagerStats.add(session, deltas)
+
+    @classmethod
+    def _contributions(cls, query):
+        """ Return what the snapshot rows selected by the query count in
+        the rollups.
+
+        :arg query: a query on the PackageAclSnapshot.
+        :returns: a tuple of three sets: the ``(collection_id, package_id)``
+            of the Approved listings, and the ``(fas_name, package_id)`` of
+            the commit rights and the ``(point_of_contact, package_id)`` on
+            the Approved listings of the collections not EOL.
+
+        """
+        listings = set()
+        commits = set()
+        pocs = set()
+        for row in query.with_entities(
+                cls.collection_id,
+                cls.package_id,
+                cls.collection_status,
+                cls.point_of_contact,
+                cls.fas_name,
+                cls.acl,
+                cls.acl_status,
+        ).filter(
+            cls.package_status == 'Approved'
+        ).filter(
+            cls.pkglist_status == 'Approved'
+        ).distinct():
+            listings.add((row.collection_id, row.package_id))
+            if row.collection_status == 'EOL':
+                continue
+            pocs.add((row.point_of_contact, row.package_id))
+            if row.acl == 'commit' and row.acl_status == 'Approved':
+                commits.add((row.fas_name, row.package_id))
+        return (listings, commits, pocs)
+
+
+def _add_to_counts(session, cls, deltas):
+    """ Add to the ``packages`` column of the rows of a rollup, creating
+    them if needed and dropping those reaching zero, as the rollups only
+    have rows for what counts at least one package.
+
+    :arg session: the database session used to query the information.
+    :arg cls: the class of the rollup, CollectionStats or PackagerStats.
+    :arg deltas: a list of ``(key, delta)`` tuples, the key being a
+        dictionnary of the values of the primary key of the row.
+
+    """
+    for key, delta in deltas:
+        if not delta:
+            continue
+        query = session.query(cls).filter_by(**key)
+        updated = query.update(
+            {cls.packages: cls.packages + delta}, synchronize_session=False)
+        if not updated and delta > 0:
+            session.execute(
+                cls.__table__.insert(), [dict(key, packages=delta)])
+        elif delta < 0:
+            query.filter(
+                cls.packages <= 0
+            ).delete(synchronize_session=False)
+
+
+class CollectionStats(BASE):
+    """Number of Approved packages in each collection.
+
+    This rollup is computed from the PackageAclSnapshot and updated with
+    the changes of its rows every time some of them are refreshed.
+
+    Table -- CollectionStats
+    """
+
+    __tablename__ = 'CollectionStats'
+    collection_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'Collection.id', ondelete='CASCADE', onupdate='CASCADE'),
+        primary_key=True)
+    packages = sa.Column(sa.Integer, nullable=False, default=0)
+
+    @classmethod
+    def refresh(cls, session, collection_ids=None):
+        """ Recompute the number of packages of the specified collections,
+        of all the collections if none are specified.
+
+        :arg session: the database session used to query the information.
+        :kwarg collection_ids: a list of identifiers of the collections to
+            refresh.
+
+        """
+        snapshot = PackageAclSnapshot
+        source = session.query(
+            snapshot.collection_id,
+            sa.func.count(sa.func.distinct(snapshot.package_id)),
+        ).filter(
+            snapshot.package_status == 'Approved'
+        ).filter(
+            snapshot.pkglist_status == 'Approved'
+        ).group_by(
+            snapshot.collection_id
+        )
+        delete = session.query(cls)
+
+        if collection_ids is not None:
+            collection_ids = list(set(collection_ids))
+            if not collection_ids:
+                return
+            source = source.filter(snapshot.collection_id.in_(collection_ids))
+            delete = delete.filter(cls.collection_id.in_(collection_ids))
+
+        delete.delete(synchronize_session=False)
+        session.execute(
+            cls.__table__.insert().from_select(
+                ['collection_id', 'packages'],
+                source.subquery().select()
+            )
+        )
+
+    @classmethod
+    def add(cls, session, deltas):
+        """ Add to the number of packages of the collections.
+
+        :arg session: the database session used to query the information.
+        :arg deltas: a dictionnary of the number of packages to add, or
+            remove if negative, by collection identifier.
+
+        """
+        _add_to_counts(
+            session, cls, [
+                ({'collection_id': key}, delta)
+                for key, delta in deltas.items()
+            ])
+
+    @classmethod
+    def count_collection(cls, session):
+        """ Return the number of packages present in each active
+        collection.
+
+        :arg session: the database session used to query the information.
+
+        """
+        return session.query(
+            Collection.branchname,
+            cls.packages,
+        ).filter(
+            cls.collection_id == Collection.id
+        ).filter(
+            Collection.status != 'EOL'
+        ).order_by(
+            Collection.branchname
+        ).all()
+
+    @classmethod
+    def count_fedora_collection(cls, session):
+        """ Return the number of packages present in each Fedora collection.
+
+        :arg session: the database session used to query the information.
+
+        """
+        return session.query(
+            Collection.version,
+            cls.packages,
+        ).filter(
+            cls.collection_id == Collection.id
+        ).filter(
+            Collection.name == 'Fedora'
+        ).order_by(
+            Collection.version
+        ).all()
+
+
+class PackagerStats(BASE):
+    """Number of packages on which each user has commit rights (``commit``)
+    or is the point of contact (``poc``), in the active collections.
+
+    This rollup is computed from the PackageAclSnapshot and updated with
+    the changes of its rows every time some of them are refreshed.
+
+    Table -- PackagerStats
+    """
+
+    __tablename__ = 'PackagerStats'
+    fas_name = sa.Column(sa.String(255), primary_key=True)
+    kind = sa.Column(sa.String(10), primary_key=True)
+    packages = sa.Column(sa.Integer, nullable=False, default=0)
+
+    @classmethod
+    def refresh(cls, session, users=None):
+        """ Recompute the number of packages of the specified users, of all
+        the users if none are specified.
+
+        :arg session: the database session used to query the information.
+        :kwarg users: a list of the FAS usernames (or groups) to refresh.
+
+        """
+        snapshot = PackageAclSnapshot
+        sources = [
+            session.query(
+                snapshot.fas_name,
+                sa.literal('commit'),
+                sa.func.count(sa.func.distinct(snapshot.package_id)),
+            ).filter(
+                snapshot.acl == 'commit'
+            ).filter(
+                snapshot.acl_status == 'Approved'
+            ),
+            session.query(
+                snapshot.point_of_contact,
+                sa.literal('poc'),
+                sa.func.count(sa.func.distinct(snapshot.package_id)),
+            ),
+        ]
+        delete = session.query(cls)
+
+        if users is not None:
+            users = list(set(users))
+            if not users:
+                return
+            sources[0] = sources[0].filter(snapshot.fas_name.in_(users))
+            sources[1] = sources[1].filter(
+                snapshot.point_of_contact.in_(users))
+            delete = delete.filter(cls.fas_name.in_(users))
+
+        delete.delete(synchronize_session=False)
+        for source, column in zip(
+                sources, [snapshot.fas_name, snapshot.point_of_contact]):
+            source = source.filter(
+                snapshot.package_status == 'Approved'
+            ).filter(
+                snapshot.pkglist_status == 'Approved'
+            ).filter(
+                snapshot.collection_status != 'EOL'
+            ).group_by(
+                column
+            )
+            session.execute(
+                cls.__table__.insert().from_select(
+                    ['fas_name', 'kind', 'packages'],
+                    source.subquery().select()
+                )
+            )
+
+    @classmethod
+    def add(cls, session, deltas):
+        """ Add to the number of packages of the users.
+
+        :arg session: the database session used to query the information.
+        :arg deltas: a dictionnary of the number of packages to add, or
+            remove if negative, by ``(fas_name, kind)``.
+
+        """
+        _add_to_counts(
+            session, cls, [
+                ({'fas_name': key[0], 'kind': key[1]}, delta)
+                for key, delta in deltas.items()
+            ])
+
+    @classmethod
+    def get_top(cls, session, kind, limit=10):
+        """ Return the users with the most packages, and their number of
+        packages.
+
+        :arg session: the database session used to query the information.
+        :arg kind: ``commit`` to rank the users on the packages they have
+            commit rights on, ``poc`` on the packages they are the point of
+            contact of.
+        :kwarg limit: the number of users to return, defaults to 10.
+
+        """
+        return session.query(
+            cls.fas_name,
+            cls.packages,
+        ).filter(
+            cls.kind == kind
+        ).order_by(
+            cls.packages.desc(),
+            cls.fas_name,
+        ).limit(limit).all()
+
+
+class Outbox(BASE):
+    """Notifications (fedmsg messages and emails) waiting to be sent.
+
+    The notifications are added in the same transaction as the changes they
+    are about and sent afterward by the ``pkgdb2_dispatch_notifications``
+    script, see `pkgdb2.lib.notifications.dispatch`.
+
+    Table -- Outbox
+    """
+
+    __tablename__ = 'Outbox'
+    id = sa.Column(sa.Integer, primary_key=True)
+    kind = sa.Column(sa.String(10), nullable=False)
+    payload = sa.Column(sa.Text, nullable=False)
+    created = sa.Column(sa.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    next_attempt = sa.Column(sa.DateTime, nullable=False,
+                             default=datetime.datetime.utcnow, index=True)
+    last_error = sa.Column(sa.Text, nullable=True)
+
+    def __init__(self, kind, payload):
+        """ Constructor.
+
+        :arg kind: ``fedmsg`` or ``email``.
+        :arg payload: a dictionnary with the arguments of the function
+            sending the notification.
+
+        """
+        self.kind = kind
+        self.payload = json.dumps(payload)
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'Outbox(%r, %r, attempts=%r)' % (
+            self.id, self.kind, self.attempts)
+
+    @property
+    def data(self):
+        """ The payload of the notification, as a dictionnary. """
+        return json.loads(self.payload)
+
+    @classmethod
+    def add(cls, session, kind, payload):
+        """ Queue a notification.
+
+        This method only adds the notification to the session, it is sent
+        once the transaction is committed and the dispatcher runs.
+
+        :arg session: the database session used to query the information.
+        :arg kind: ``fedmsg`` or ``email``.
+        :arg payload: a dictionnary with the arguments of the function
+            sending the notification.
+
+        """
+        notification = cls(kind, payload)
+        session.add(notification)
+        return notification
+
+    @classmethod
+    def get_pending(cls, session, max_attempts, limit=None):
+        """ Return the notifications due to be sent, oldest first.
+
+        :arg session: the database session used to query the information.
+        :arg max_attempts: the number of attempts after which the
+            notifications are no longer sent.
+        :kwarg limit: the maximum number of notifications to return.
+
+        """
+        query = session.query(
+            cls
+        ).filter(
+            cls.next_attempt <= datetime.datetime.utcnow()
+        ).filter(
+            cls.attempts < max_attempts
+        ).order_by(
+            cls.id
+        )
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @classmethod
+    def get_stats(cls, session, max_attempts):
+        """ Return the state of the queue as a dictionnary: the number of
+        notifications ``pending``, the number of ``failed`` ones which will
+        not be retried and the creation time of the ``oldest`` pending
+        notification.
+
+        :arg session: the database session used to query the information.
+        :arg max_attempts: the number of attempts after which the
+            notifications are no longer sent.
+
+        """
+        pending, oldest = session.query(
+            sa.func.count(cls.id),
+            sa.func.min(cls.created),
+        ).filter(
+            cls.attempts < max_attempts
+        ).one()
+        failed = session.query(
+            sa.func.count(cls.id)
+        ).filter(
+            cls.attempts >= max_attempts
+        ).scalar()
+        return {'pending': pending, 'failed': failed, 'oldest': oldest}
+
+
+
+class BugzillaJob(BASE):
+    """Reassignments of bugzilla bugs waiting to be made.
+
+    The reassignments made in a transaction are grouped in a single job,
+    added in that transaction, and made afterward by the
+    ``pkgdb2_bugzilla_jobs`` script, see `pkgdb2.lib.bugzilla_jobs`.
+
+    Table -- BugzillaJob
+    """
+
+    __tablename__ = 'BugzillaJob'
+    id = sa.Column(sa.Integer, primary_key=True)
+    # Pending, Done or Failed
+    status = sa.Column(sa.String(10), nullable=False, default='Pending',
+                       index=True)
+    payload = sa.Column(sa.Text, nullable=False)
+    created = sa.Column(sa.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+    finished = sa.Column(sa.DateTime, nullable=True)
+    bugs = sa.Column(sa.Integer, nullable=False, default=0)
+    error = sa.Column(sa.Text, nullable=True)
+
+    def __init__(self, reassignments=None):
+        """ Constructor.
+
+        :kwarg reassignments: a list of dictionnaries describing the
+            reassignments to make, see
+            `pkgdb2.lib.bugzilla_jobs.build_reassignment`.
+
+        """
+        self.status = 'Pending'
+        self.payload = json.dumps(reassignments or [])
+
+    def __repr__(self):
+        """ The string representation of this object.
+
+        """
+        return 'BugzillaJob(%r, %r, bugs=%r)' % (
+            self.id, self.status, self.bugs)
+
+    @property
+    def reassignments(self):
+        """ The reassignments to make, as a list of dictionnaries. """
+        return json.loads(self.payload)
+
+    def add_reassignment(self, reassignment):
+        """ Add a reassignment to the job.
+
+        :arg reassignment: a dictionnary describing the reassignment.
+
+        """
+        reassignments = self.reassignments
+        reassignments.append(reassignment)
+        self.payload = json.dumps(reassignments)
+
+    def to_json(self):
+        """ Return a representation of the job as a dictionnary. """
+        return dict(
+            id=self.id,
+            status=self.status,
+            created=time.mktime(self.created.timetuple()),
+            finished=time.mktime(self.finished.timetuple())
+            if self.finished else None,
+            bugs=self.bugs,
+            error=self.error,
+            reassignments=self.reassignments,
+        )
+
+    @classmethod
+    def by_id(cls, session, job_id):
+        """ Return the job with the specified id.
+
+        :arg session: the database session used to query the information.
+        :arg job_id: the identifier of the job.
+        :raises sqlalchemy.orm.exc.NoResultFound: when there is no job
+            with this identifier.
+
+        """
+        return session.query(cls).filter(cls.id == job_id).one()
+
+    @classmethod
+    def get_pending(cls, session, limit=None):
+        """ Return the jobs waiting to be run, oldest first.
+
+        :arg session: the database session used to query the information.
+        :kwarg limit: the maximum number of jobs to return.
+
+        """
+        query = session.query(
+            cls
+        ).filter(
+            cls.status == 'Pending'
+        ).order_by(
+            cls.id
+        )
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @classmethod
+    def get_stats(cls, session):
+        """ Return the number of jobs in each status, as a dictionnary.
+
+        :arg session: the database session used to query the information.
+
+        """
+        stats = dict((status, 0) for status in ('Pending', 'Done', 'Failed'))
+        stats.update(session.query(
+            cls.status, sa.func.count(cls.id)
+        ).group_by(
+            cls.status
+        ).all())
+        return stats
+
 def notify(session, eol=False, name=None, version=None, acls=None):
     """ Return the user that should be notify for each package.
 
@@ -1571,40 +2899,32 @@ def notify(session, eol=False, name=None, version=None, acls=None):
     elif isinstance(acls, basestring):
         acls = [acls]
 
+    snapshot = PackageAclSnapshot
     query = session.query(
-        Package.name,
-        PackageListingAcl.fas_name
-    ).join(
-        PackageListing,
-        PackageListingAcl
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListingAcl.packagelisting_id == PackageListing.id
-    ).filter(
-        PackageListing.collection_id == Collection.id
+        snapshot.package_name,
+        snapshot.fas_name
     ).filter(
-        Package.status == 'Approved'
+        snapshot.package_status == 'Approved'
     ).filter(
-        PackageListing.point_of_contact != 'orphan'
+        snapshot.point_of_contact != 'orphan'
     ).filter(
-        PackageListingAcl.acl.in_(acls)
+        snapshot.acl.in_(acls)
     ).filter(
-        PackageListingAcl.status == 'Approved'
+        snapshot.acl_status == 'Approved'
     ).group_by(
-        Package.name, PackageListingAcl.fas_name
+        snapshot.package_name, snapshot.fas_name
     ).order_by(
-        Package.name
+        snapshot.package_name
     )
 
     if eol is False:
-        query = query.filter(Collection.status != 'EOL')
+        query = query.filter(snapshot.collection_status != 'EOL')
 
     if name:
-        query = query.filter(Collection.name == name)
+        query = query.filter(snapshot.collection_name == name)
 
     if version:
-        query = query.filter(Collection.version == version)
+        query = query.filter(snapshot.collection_version == version)
 
     return query.all()
 
@@ -1616,109 +2936,137 @@ def bugzilla(session, name=None):
     :kwarg name: restricts the output to a specific collection name.
 
     """
+    snapshot = PackageAclSnapshot
     query = session.query(
-        Collection.name,  # 0
-        Collection.version,  # 1
-        Package.name,  # 2
-        Package.summary,  # 3
-        PackageListing.point_of_contact,  # 4
-        PackageListingAcl.fas_name,  # 5
-        Collection.branchname,  # 6
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListingAcl.packagelisting_id == PackageListing.id
-    ).filter(
-        PackageListing.collection_id == Collection.id
+        snapshot.collection_name,  # 0
+        snapshot.collection_version,  # 1
+        snapshot.package_name,  # 2
+        snapshot.package_summary,  # 3
+        snapshot.point_of_contact,  # 4
+        snapshot.fas_name,  # 5
+        snapshot.branchname,  # 6
     ).filter(
-        Package.status == 'Approved'
+        snapshot.package_status == 'Approved'
     ).filter(
-        Collection.status != 'EOL'
+        snapshot.collection_status != 'EOL'
     ).filter(
-        PackageListingAcl.acl.in_(
+        snapshot.acl.in_(
             ['watchbugzilla'])
     ).filter(
-        PackageListingAcl.status == 'Approved'
+        snapshot.acl_status == 'Approved'
     ).group_by(
-        Collection.name, Package.name, PackageListing.point_of_contact,
-        PackageListingAcl.fas_name, Package.summary, Collection.branchname,
-        Collection.version
+        snapshot.collection_name, snapshot.package_name,
+        snapshot.point_of_contact, snapshot.fas_name,
+        snapshot.package_summary, snapshot.branchname,
+        snapshot.collection_version
     ).order_by(
-        Package.name
+        snapshot.package_name
     )
 
     if name:
-        query = query.filter(Collection.name == name)
+        query = query.filter(snapshot.collection_name == name)
 
     return query.all()
 
 
+class StringAgg(sa.sql.expression.FunctionElement):
+    """ Aggregate function concatenating the non-NULL values of a column
+    using a comma as separator.
+    """
+    type = sa.Text()
+    name = 'string_agg'
+
+
+@compiles(StringAgg)
+def _compile_string_agg(element, compiler, **kw):
+    """ sqlite's group_concat defaults to a comma as separator. """
+    return 'group_concat(%s)' % compiler.process(element.clauses)
+
+
+@compiles(StringAgg, 'postgresql')
+def _compile_string_agg_pg(element, compiler, **kw):
+    """ string_agg on postgresql. """
+    return "string_agg(%s, ',')" % compiler.process(element.clauses)
+
+
+@compiles(StringAgg, 'mysql')
+def _compile_string_agg_mysql(element, compiler, **kw):
+    """ group_concat with an explicit separator on mysql. """
+    return "group_concat(%s SEPARATOR ',')" % compiler.process(
+        element.clauses)
+
+
+class ByteOrder(sa.sql.expression.ColumnElement):
+    """ Sort the given column byte-wise, regardless of the collation of the
+    database, so the results come in the same order as with python's
+    ``sorted``.
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self.type = column.type
+
+
+@compiles(ByteOrder)
+def _compile_byte_order(element, compiler, **kw):
+    """ sqlite compares strings byte-wise by default. """
+    return compiler.process(element.column)
+
+
+@compiles(ByteOrder, 'postgresql')
+def _compile_byte_order_pg(element, compiler, **kw):
+    """ Use the C collation on postgresql. """
+    return '%s COLLATE "C"' % compiler.process(element.column)
+
+
+@compiles(ByteOrder, 'mysql')
+def _compile_byte_order_mysql(element, compiler, **kw):
+    """ Use a binary comparison on mysql. """
+    return 'BINARY %s' % compiler.process(element.column)
+
+
 def vcs_acls(session, eol=False):
     """ Return information for each package to sync with git.
 
+    Each row returned contains the name of the package, the name of the
+    branch and two comma separated lists: the groups and the users having
+    approved commit ACLs on this package and branch (either might be
+    ``None``). The rows are sorted by package name and branch name.
+
     :arg session: the session to connect to the database with.
     :kwarg eol: A boolean specifying whether to include information about
         End Of Life collections or not. Defaults to ``False``.
 
     """
+    snapshot = PackageAclSnapshot
+    is_commit = sa.and_(
+        snapshot.acl == 'commit',
+        snapshot.acl_status == 'Approved',
+    )
+    is_group = snapshot.fas_name.like('group::%')
+
     query = session.query(
-        Package.name,  # 0
-        PackageListingAcl.fas_name,  # 1
-        Collection.branchname,  # 2
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListingAcl.packagelisting_id == PackageListing.id
-    ).filter(
-        PackageListing.collection_id == Collection.id
+        snapshot.package_name,  # 0
+        snapshot.branchname,  # 1
+        StringAgg(sa.case(
+            [(sa.and_(is_commit, is_group), snapshot.fas_name)])),  # 2
+        StringAgg(sa.case(
+            [(sa.and_(is_commit, ~is_group), snapshot.fas_name)])),  # 3
     ).filter(
-        PackageListing.status.in_(['Approved', 'Orphaned'])
+        snapshot.pkglist_status.in_(['Approved', 'Orphaned'])
     )
 
     if not eol:
         query = query.filter(
-            Collection.status != 'EOL')
+            snapshot.collection_status != 'EOL')
 
-    query = query.filter(
-        PackageListingAcl.acl == 'commit'
-    ).filter(
-        PackageListingAcl.status == 'Approved'
-    ).group_by(
-        Package.name, PackageListingAcl.fas_name,
-        Collection.branchname,
+    query = query.group_by(
+        snapshot.package_name, snapshot.branchname,
     ).order_by(
-        Package.name
+        ByteOrder(snapshot.package_name), ByteOrder(snapshot.branchname)
     )
 
-    data = query.all()
-    sub = set([(it[0], it[2]) for it in data])
-
-    query2 = session.query(
-        Package.name,  # 0
-        Collection.branchname,  # 1
-    ).filter(
-        Package.id == PackageListing.package_id
-    ).filter(
-        PackageListing.collection_id == Collection.id
-    ).filter(
-        PackageListing.status.in_(['Approved', 'Orphaned'])
-    ).group_by(
-        Package.name,
-        Collection.branchname,
-    ).order_by(
-        Package.name
-    )
-
-    if not eol:
-        query2 = query2.filter(
-            Collection.status != 'EOL')
-
-    sub2 = set(query2.all())
-
-    for entry in sub2 - sub:
-        data.append([entry[0], None, entry[1]])
-
-    return data
+    return query
 
 
 def get_groups(session):
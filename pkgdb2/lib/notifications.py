@@ -23,10 +23,15 @@
 pkgdb.  If fedmsg is installed, these function calls will try to actually send
 messages.  If it is not installed, it will return silently.
 
+When ``PKGDB2_NOTIFICATION_OUTBOX`` is set, the notifications are not sent
+during the requests but queued in the Outbox table, in the same transaction
+as the changes they are about, and sent by `dispatch`.
+
   :Author: Ralph Bean <rbean@redhat.com>
 
 """
 
+import datetime
 import smtplib
 import warnings
 
@@ -35,6 +40,14 @@ from email.mime.text import MIMEText
 import pkgdb2
 
 
+def _fedmsg_send(topic, msg):  # pragma: no cover
+    ''' Publish a message on the fedmsg bus, raising the errors. '''
+    ## Ignore message about fedmsg import
+    # pylint: disable=F0401
+    import fedmsg
+    fedmsg.publish(topic=topic, msg=msg, modname='pkgdb')
+
+
 def fedmsg_publish(*args, **kwargs):  # pragma: no cover
     ''' Try to publish a message on the fedmsg bus. '''
     ## We catch Exception if we want :-p
@@ -49,12 +62,23 @@ def fedmsg_publish(*args, **kwargs):  # pragma: no cover
         warnings.warn(str(err))
 
 
-def email_publish(
-        user, package, message, subject=None,
-        to_email=None):  # pragma: no cover
-    ''' Send notification by email. '''
+def send_email(
+        user, package_name, message, subject=None, to_email=None,
+        smtp=None):  # pragma: no cover
+    ''' Send a notification by email.
+
+    :arg user: the username of the user who made the change.
+    :arg package_name: the name of the package changed, used to find the
+        recipient if ``to_email`` is not specified.
+    :arg message: the body of the email.
+    :kwarg subject: the subject of the email.
+    :kwarg to_email: the recipient(s) of the email.
+    :kwarg smtp: an opened ``smtplib.SMTP`` connection to send the email
+        with, a new connection is opened (and closed) if not specified.
 
-    if not package and not to_email:
+    '''
+
+    if not package_name and not to_email:
         # If we have no package and no to_email, we have no way to know
         # where to send the email
         return
@@ -63,9 +87,9 @@ def email_publish(
 
     if subject:
         msg['Subject'] = '[PkgDB] %s' % subject
-    elif package:
+    elif package_name:
         msg['Subject'] = '[PkgDB] {0} updated {1}'.format(
-            user, package.name)
+            user, package_name)
     else:
         msg['Subject'] = '[PkgDB] updated by {0}'.format(user)
 
@@ -75,7 +99,7 @@ def email_publish(
     if not to_email:
         email_to_template = pkgdb2.APP.config.get(
             'PKGDB2_EMAIL_TO', '{pkg_name}-owner@fedoraproject.org')
-        to_email = email_to_template.format(pkg_name=package.name)
+        to_email = email_to_template.format(pkg_name=package_name)
 
     msg['From'] = from_email
     msg['To'] = to_email
@@ -87,11 +111,163 @@ def email_publish(
         cc_email = [cc_email]
     if isinstance(to_email, basestring):
         to_email = [to_email]
-    to_email.extend(cc_email)
+    to_email = list(to_email)
+    if cc_email:
+        to_email.extend(cc_email)
 
     # Send the message via our own SMTP server, but don't include the
     # envelope header.
-    smtp = smtplib.SMTP(pkgdb2.APP.config.get(
-        'PKGDB2_EMAIL_SMTP_SERVER', 'localhost'))
-    smtp.sendmail(from_email, to_email, msg.as_string())
-    smtp.quit()
+    if smtp is None:
+        smtp = smtplib.SMTP(pkgdb2.APP.config.get(
+            'PKGDB2_EMAIL_SMTP_SERVER', 'localhost'))
+        smtp.sendmail(from_email, to_email, msg.as_string())
+        smtp.quit()
+    else:
+        smtp.sendmail(from_email, to_email, msg.as_string())
+
+
+def email_publish(
+        user, package, message, subject=None,
+        to_email=None):  # pragma: no cover
+    ''' Send notification by email. '''
+    send_email(
+        user, package.name if package else None, message,
+        subject=subject, to_email=to_email)
+
+
+def notify_fedmsg(session, topic, message):
+    ''' Publish a message on the fedmsg bus, or queue it in the outbox.
+
+    :arg session: the session to connect to the database with.
+    :arg topic: the partial fedmsg topic of the message.
+    :arg message: the message to publish.
+
+    '''
+    if pkgdb2.APP.config.get('PKGDB2_NOTIFICATION_OUTBOX', False):
+        # To avoid a circular import.
+        import pkgdb2.lib.model as model
+        model.Outbox.add(
+            session, 'fedmsg', {'topic': topic, 'msg': message})
+    else:
+        fedmsg_publish(topic, message)
+
+
+def notify_email(
+        session, user, package, message, subject=None, to_email=None):
+    ''' Send a notification by email, or queue it in the outbox.
+
+    :arg session: the session to connect to the database with.
+    :arg user: the username of the user who made the change.
+    :arg package: the `Package` changed.
+    :arg message: the body of the email.
+    :kwarg subject: the subject of the email.
+    :kwarg to_email: the recipient(s) of the email.
+
+    '''
+    if pkgdb2.APP.config.get('PKGDB2_NOTIFICATION_OUTBOX', False):
+        # To avoid a circular import.
+        import pkgdb2.lib.model as model
+        model.Outbox.add(session, 'email', {
+            'user': user,
+            'package_name': package.name if package else None,
+            'message': message,
+            'subject': subject,
+            'to_email': to_email,
+        })
+    else:  # pragma: no cover
+        email_publish(
+            user, package, message, subject=subject, to_email=to_email)
+
+
+def get_outbox_stats(session):
+    ''' Return the number of notifications pending and failed in the
+    outbox and the creation time of the oldest pending one, see
+    `pkgdb2.lib.model.Outbox.get_stats`.
+
+    :arg session: the session to connect to the database with.
+
+    '''
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+    return model.Outbox.get_stats(
+        session, pkgdb2.APP.config.get('PKGDB2_OUTBOX_MAX_ATTEMPTS', 10))
+
+
+def dispatch(session, limit=None):
+    ''' Send a batch of the notifications queued in the outbox.
+
+    The notifications sent are deleted from the outbox, the others are
+    retried later, after a delay doubling at every attempt, until they
+    failed ``PKGDB2_OUTBOX_MAX_ATTEMPTS`` times. All the emails of the
+    batch are sent using the same SMTP connection.
+
+    This method only flushes, committing is up to the caller. A
+    notification may thus be sent twice if the commit fails.
+
+    :arg session: the session to connect to the database with.
+    :kwarg limit: the maximum number of notifications to send, defaults
+        to ``PKGDB2_OUTBOX_BATCH_SIZE``.
+    :returns: the number of notifications sent and the number of
+        notifications which could not be sent.
+    :rtype: tuple(int, int)
+
+    '''
+    ## We catch Exception to retry sending the notification later
+    # pylint: disable=W0703
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+
+    config = pkgdb2.APP.config
+    if limit is None:
+        limit = config.get('PKGDB2_OUTBOX_BATCH_SIZE', 100)
+    delay = config.get('PKGDB2_OUTBOX_RETRY_DELAY', 60)
+
+    notifications = model.Outbox.get_pending(
+        session, config.get('PKGDB2_OUTBOX_MAX_ATTEMPTS', 10), limit=limit)
+
+    sent = failed = 0
+    smtp = None
+    try:
+        for notification in notifications:
+            data = notification.data
+            try:
+                if notification.kind == 'fedmsg':
+                    _fedmsg_send(data['topic'], data['msg'])
+                else:
+                    if smtp is None:
+                        smtp = smtplib.SMTP(config.get(
+                            'PKGDB2_EMAIL_SMTP_SERVER', 'localhost'))
+                    send_email(
+                        data['user'], data['package_name'], data['message'],
+                        subject=data['subject'], to_email=data['to_email'],
+                        smtp=smtp)
+            except Exception, err:
+                if notification.kind == 'email' and smtp is not None:
+                    # The connection may be broken, use a new one
+                    _close_smtp(smtp)
+                    smtp = None
+                notification.attempts += 1
+                notification.last_error = str(err)
+                notification.next_attempt = datetime.datetime.utcnow() \
+                    + datetime.timedelta(
+                        seconds=delay * 2 ** (notification.attempts - 1))
+                failed += 1
+            else:
+                session.delete(notification)
+                sent += 1
+    finally:
+        if smtp is not None:
+            _close_smtp(smtp)
+
+    session.flush()
+    return sent, failed
+
+
+def _close_smtp(smtp):
+    ''' Close the SMTP connection, ignoring the errors. '''
+    ## We catch Exception if we want :-p
+    # pylint: disable=W0703
+    try:
+        smtp.quit()
+    except Exception:
+        pass
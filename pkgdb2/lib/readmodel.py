@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Read-only records of the packages, their listings and ACLs, used by the
+API listings instead of the objects of the model.
+
+The queries of the model return these records when given the ``rows``
+loading profile (see ``pkgdb2.lib.model.load_options``): only the columns
+serialized are selected and each row is mapped into a namedtuple, without
+the identity map and the instrumentation of the objects of the model.
+The ``*_to_json`` functions return the same dictionaries as the
+``to_json`` methods of the model.
+'''
+
+import collections
+import itertools
+import time
+
+from pkgdb2.lib import model
+
+
+PackageRow = collections.namedtuple('PackageRow', [
+    'id', 'name', 'summary', 'description', 'status', 'review_url',
+    'upstream_url', 'date_created'])
+
+CollectionRow = collections.namedtuple('CollectionRow', [
+    'id', 'name', 'version', 'branchname', 'status', 'koji_name',
+    'dist_tag'])
+
+ListingRow = collections.namedtuple('ListingRow', [
+    'id', 'package_id', 'point_of_contact', 'critpath', 'status',
+    'status_change', 'collection'])
+
+AclRow = collections.namedtuple('AclRow', [
+    'id', 'fas_name', 'acl', 'status', 'listing', 'package'])
+
+
+PACKAGE_COLUMNS = [
+    model.Package.id,
+    model.Package.name,
+    model.Package.summary,
+    model.Package.description,
+    model.Package.status,
+    model.Package.review_url,
+    model.Package.upstream_url,
+    model.Package.date_created,
+]
+
+COLLECTION_COLUMNS = [
+    model.Collection.id,
+    model.Collection.name,
+    model.Collection.version,
+    model.Collection.branchname,
+    model.Collection.status,
+    model.Collection.koji_name,
+    model.Collection.dist_tag,
+]
+
+# The columns of a listing, but its collection
+LISTING_COLUMNS = [
+    model.PackageListing.id,
+    model.PackageListing.package_id,
+    model.PackageListing.point_of_contact,
+    model.PackageListing.critpath,
+    model.PackageListing.status,
+    model.PackageListing.status_change,
+]
+
+# The columns of an ACL, but its listing and package
+ACL_COLUMNS = [
+    model.PackageListingAcl.id,
+    model.PackageListingAcl.fas_name,
+    model.PackageListingAcl.acl,
+    model.PackageListingAcl.status,
+]
+
+
+class _Collections(dict):
+    """ The collections already mapped, by identifier, so the listings of
+    the same collection share its record. """
+
+    def get_row(self, values):
+        """ Return the record of the collection with the given values. """
+        row = self.get(values[0])
+        if row is None:
+            row = self[values[0]] = CollectionRow._make(values)
+        return row
+
+
+def package_rows(query, lazy=False):
+    """ Return the records of the packages selected by a query of
+    ``Package``.
+
+    :arg query: the query of ``Package``, with its filters, order, offset
+        and limit.
+    :kwarg lazy: a boolean to return an iterator mapping the rows while
+        they are loaded instead of the list of all the records, for the
+        queries loading the rows by batches. Defaults to False.
+    :returns: the list or iterator of ``PackageRow``.
+
+    """
+    rows = (
+        PackageRow._make(row)
+        for row in query.with_entities(*PACKAGE_COLUMNS)
+    )
+    if lazy:
+        return rows
+    return list(rows)
+
+
+def select_acls(query):
+    """ Return the query selecting the columns of the ``AclRow`` records
+    from a query of ``PackageListingAcl``, see `acl_rows`.
+
+    :arg query: the query of ``PackageListingAcl``, with its filters and
+        order but no offset nor limit yet.
+
+    """
+    return query.with_entities(
+        *(ACL_COLUMNS + LISTING_COLUMNS + PACKAGE_COLUMNS
+          + COLLECTION_COLUMNS)
+    ).filter(
+        model.PackageListingAcl.packagelisting_id == model.PackageListing.id
+    ).filter(
+        model.PackageListing.package_id == model.Package.id
+    ).filter(
+        model.PackageListing.collection_id == model.Collection.id
+    )
+
+
+def acl_rows(query, lazy=False):
+    """ Return the records of the ACLs, with their listing, package and
+    collection, selected by a query returned by `select_acls`.
+
+    :arg query: the query returned by `select_acls`, with its offset and
+        limit.
+    :kwarg lazy: a boolean to return an iterator mapping the rows while
+        they are loaded instead of the list of all the records, for the
+        queries loading the rows by batches. Defaults to False.
+    :returns: the list or iterator of ``AclRow``.
+
+    """
+    nb_acl = len(ACL_COLUMNS)
+    nb_listing = nb_acl + len(LISTING_COLUMNS)
+    nb_package = nb_listing + len(PACKAGE_COLUMNS)
+
+    def _rows():
+        """ Map the rows of the query into records. """
+        clts = _Collections()
+        for row in query:
+            yield AclRow(
+                row[0], row[1], row[2], row[3],
+                ListingRow._make(
+                    row[nb_acl:nb_listing]
+                    + (clts.get_row(row[nb_package:]),)),
+                PackageRow._make(row[nb_listing:nb_package]),
+            )
+
+    if lazy:
+        return _rows()
+    return list(_rows())
+
+
+def get_listings(session, package_ids, branches=None, acls=True):
+    """ Return the records of the listings of the specified packages, with
+    their collection and ACLs.
+
+    :arg session: session with which to connect to the database.
+    :arg package_ids: the identifiers of the packages.
+    :kwarg branches: the branchname of the collections to restrict the
+        listings to.
+    :kwarg acls: a boolean to specify whether to load the ACLs of the
+        listings too. Defaults to True.
+    :returns: a tuple of a dictionary of the list of ``ListingRow`` by
+        package identifier and a dictionary of the list of the ACLs of the
+        listings, as ``AclRow`` without listing nor package, by listing
+        identifier.
+
+    """
+    listings = collections.defaultdict(list)
+    listing_acls = collections.defaultdict(list)
+    if not package_ids:
+        return listings, listing_acls
+
+    query = session.query(
+        *(LISTING_COLUMNS + COLLECTION_COLUMNS)
+    ).filter(
+        model.PackageListing.collection_id == model.Collection.id
+    ).filter(
+        model.PackageListing.package_id.in_(package_ids)
+    ).order_by(
+        model.PackageListing.id
+    )
+    if branches:
+        query = query.filter(model.Collection.branchname.in_(branches))
+
+    clts = _Collections()
+    nb_listing = len(LISTING_COLUMNS)
+    for row in query:
+        listing = ListingRow._make(
+            row[:nb_listing] + (clts.get_row(row[nb_listing:]),))
+        listings[listing.package_id].append(listing)
+
+    if acls and listings:
+        # Select the ACLs of the same listings, by package rather than by
+        # listing to keep the number of parameters of the query low
+        query = session.query(
+            model.PackageListingAcl.packagelisting_id, *ACL_COLUMNS
+        ).filter(
+            model.PackageListingAcl.packagelisting_id ==
+            model.PackageListing.id
+        ).filter(
+            model.PackageListing.package_id.in_(package_ids)
+        ).order_by(
+            model.PackageListingAcl.id
+        )
+        if branches:
+            query = query.filter(
+                model.PackageListing.collection_id == model.Collection.id
+            ).filter(
+                model.Collection.branchname.in_(branches)
+            )
+        for row in query:
+            listing_acls[row[0]].append(AclRow._make(row[1:] + (None, None)))
+
+    return listings, listing_acls
+
+
+def collection_to_json(row):
+    """ Return the representation of a collection, see
+    ``Collection.to_json``. """
+    return dict(
+        name=row.name,
+        version=row.version,
+        branchname=row.branchname,
+        status=row.status,
+        koji_name=row.koji_name,
+        dist_tag=row.dist_tag,
+    )
+
+
+def package_to_json(row, listings=None):
+    """ Return the representation of a package, see ``Package.to_json``.
+
+    :arg row: the ``PackageRow`` of the package.
+    :kwarg listings: the representation of its listings.
+
+    """
+    return {
+        'name': row.name,
+        'summary': row.summary,
+        'description': row.description,
+        'status': row.status,
+        'review_url': row.review_url,
+        'upstream_url': row.upstream_url,
+        'creation_date': time.mktime(row.date_created.timetuple()),
+        'acls': listings or [],
+    }
+
+
+def listing_to_json(row, package=None, acls=None):
+    """ Return the representation of a listing, see
+    ``PackageListing.to_json``.
+
+    :arg row: the ``ListingRow`` of the listing.
+    :kwarg package: the ``PackageRow`` of its package, to include it.
+    :kwarg acls: the ``AclRow`` of its ACLs, to include them.
+
+    """
+    result = dict(
+        point_of_contact=row.point_of_contact,
+        critpath=row.critpath,
+        status=row.status,
+        status_change=time.mktime(row.status_change.timetuple()),
+        collection=collection_to_json(row.collection),
+    )
+    if package is not None:
+        result['package'] = package_to_json(package)
+    if acls:
+        result['acls'] = [
+            dict(fas_name=acl.fas_name, acl=acl.acl, status=acl.status)
+            for acl in acls
+        ]
+    return result
+
+
+def acl_to_json(row):
+    """ Return the representation of an ACL with its listing, package and
+    collection, see ``PackageListingAcl.to_json``. """
+    return dict(
+        fas_name=row.fas_name,
+        acl=row.acl,
+        status=row.status,
+        packagelist=listing_to_json(row.listing, package=row.package),
+    )
+
+
+def iter_packages_to_json(session, rows, acls=False, branches=None,
+                          batch=model.STREAM_BATCH):
+    """ Yield the representation of the packages of an iterator of
+    ``PackageRow``, see `packages_to_json`, loading the listings and ACLs
+    of the packages by batches.
+
+    :arg session: session with which to connect to the database.
+    :arg rows: the iterator of the ``PackageRow`` of the packages.
+    :kwarg acls: a boolean to specify whether to include the listings of
+        the packages and their ACLs. Defaults to False.
+    :kwarg branches: the branchname of the collections to restrict the
+        listings to.
+    :kwarg batch: the number of packages whose listings are loaded
+        together.
+
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, batch))
+        if not chunk:
+            break
+        for output in packages_to_json(
+                session, chunk, acls=acls, branches=branches):
+            yield output
+
+
+def packages_to_json(session, rows, acls=False, branches=None):
+    """ Return the representation of several packages with, optionally,
+    their listings and the ACLs of these, loaded with two queries.
+
+    This is the same as calling ``to_json(acls=acls, collection=branches,
+    package=False)`` on each ``Package``.
+
+    :arg session: session with which to connect to the database.
+    :arg rows: the ``PackageRow`` of the packages.
+    :kwarg acls: a boolean to specify whether to include the listings of
+        the packages and their ACLs. Defaults to False.
+    :kwarg branches: the branchname of the collections to restrict the
+        listings to.
+
+    """
+    if isinstance(branches, basestring):
+        branches = [branches]
+
+    if not acls:
+        return [package_to_json(row) for row in rows]
+
+    listings, listing_acls = get_listings(
+        session, [row.id for row in rows], branches=branches)
+    return [
+        package_to_json(row, [
+            listing_to_json(listing, acls=listing_acls[listing.id])
+            for listing in listings[row.id]
+        ])
+        for row in rows
+    ]
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+In-memory copy of the reference data: the collections and the lists of
+statuses and ACLs.
+
+The reference data is loaded once per process, the collections as
+``pkgdb2.lib.readmodel.CollectionRow`` records. The functions changing it
+bump the ``collections`` generation (see `invalidate`), the database is
+only queried again, to check whether this generation changed, once every
+``PKGDB2_REFERENCE_CHECK_INTERVAL`` seconds or when a collection is not
+found.
+
+A session with changes to the reference data not yet committed reads it
+from the database, so the copy never holds uncommitted data; the copy of
+the process is dropped once these changes are committed.
+'''
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import NoResultFound
+
+import pkgdb2
+from pkgdb2.lib import model, readmodel
+
+
+_SESSION_KEY = 'pkgdb2.reference_changed'
+
+# The classes of the model holding reference data
+_REFERENCE_CLASSES = (
+    model.Collection,
+    model.CollecStatus,
+    model.PkgStatus,
+    model.PkgAcls,
+    model.AclStatus,
+)
+
+
+class _Data(object):
+    """ The reference data loaded from the database. """
+
+    def __init__(self, session):
+        """ Constructor, load the reference data.
+
+        :arg session: the session to connect to the database with.
+
+        """
+        self.by_id = {}
+        self.by_branchname = {}
+        for row in session.query(*readmodel.COLLECTION_COLUMNS):
+            collection = readmodel.CollectionRow._make(row)
+            self.by_id[collection.id] = collection
+            self.by_branchname[collection.branchname] = collection
+        self.sort_keys = dict(
+            (collection.id, collection.name + collection.version)
+            for collection in self.by_id.values()
+        )
+        self.statuses = {
+            'clt_status': model.CollecStatus.all_txt(session),
+            'pkg_status': model.PkgStatus.all_txt(session),
+            'pkg_acl': model.PkgAcls.all_txt(session),
+            'acl_status': model.AclStatus.all_txt(session),
+        }
+
+
+class ReferenceData(object):
+    """ The reference data, reloaded when the ``collections`` generation
+    changes. """
+
+    def __init__(self):
+        """ Constructor, the data is only loaded when first needed. """
+        self.generation = None
+        self.checked = 0
+        self.data = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """ Forget the data loaded, it will be loaded again when next
+        needed. """
+        with self._lock:
+            self.generation = None
+
+    def _check(self, session):
+        """ Reload the data if the ``collections`` generation changed, to be
+        called with the lock held.
+
+        :arg session: the session to connect to the database with.
+
+        """
+        generation = model.Generation.get(session, 'collections')
+        if generation != self.generation:
+            self.data = _Data(session)
+            self.generation = generation
+        self.checked = time.time()
+
+    def _get(self, session, force=False):
+        """ Return the data, reloading it if it changed.
+
+        :arg session: the session to connect to the database with.
+        :kwarg force: a boolean to check whether the data changed even if
+            it was checked less than ``PKGDB2_REFERENCE_CHECK_INTERVAL``
+            seconds ago. Defaults to False.
+
+        """
+        if session.info.get(_SESSION_KEY):
+            return _Data(session)
+
+        interval = pkgdb2.APP.config.get(
+            'PKGDB2_REFERENCE_CHECK_INTERVAL', 30)
+        if force or self.generation is None \
+                or time.time() - self.checked >= interval:
+            with self._lock:
+                if force or self.generation is None \
+                        or time.time() - self.checked >= interval:
+                    self._check(session)
+        return self.data
+
+    def get_collection(self, session, branchname, force=False):
+        """ Return the collection with the specified branchname.
+
+        :arg session: the session to connect to the database with.
+        :arg branchname: the branchname of the collection.
+        :kwarg force: a boolean to check whether the data changed first,
+            for the callers deciding what a user is allowed to do, which
+            cannot rely on data up to ``PKGDB2_REFERENCE_CHECK_INTERVAL``
+            seconds old. Defaults to False.
+        :returns: the ``CollectionRow`` of the collection.
+        :raises sqlalchemy.orm.exc.NoResultFound: no collection has this
+            branchname.
+
+        """
+        collection = self._get(
+            session, force=force).by_branchname.get(branchname)
+        if collection is None and not force:
+            # It may have been created by another process since the last
+            # check
+            collection = self._get(
+                session, force=True).by_branchname.get(branchname)
+        if collection is None:
+            raise NoResultFound('No collection %s' % branchname)
+        return collection
+
+    def get_collection_by_id(self, session, collection_id):
+        """ Return the collection with the specified identifier.
+
+        :arg session: the session to connect to the database with.
+        :arg collection_id: the identifier of the collection.
+        :returns: the ``CollectionRow`` of the collection.
+        :raises sqlalchemy.orm.exc.NoResultFound: no collection has this
+            identifier.
+
+        """
+        collection = self._get(session).by_id.get(collection_id)
+        if collection is None:
+            collection = self._get(
+                session, force=True).by_id.get(collection_id)
+        if collection is None:
+            raise NoResultFound('No collection %s' % collection_id)
+        return collection
+
+    def sort_key(self, session, collection_id):
+        """ Return the key sorting the collections by name and version.
+
+        :arg session: the session to connect to the database with.
+        :arg collection_id: the identifier of the collection.
+
+        """
+        key = self._get(session).sort_keys.get(collection_id)
+        if key is None:
+            collection = self.get_collection_by_id(session, collection_id)
+            key = collection.name + collection.version
+        return key
+
+    def get_status(self, session, name):
+        """ Return the list of the statuses or ACLs of the specified kind.
+
+        :arg session: the session to connect to the database with.
+        :arg name: ``clt_status``, ``pkg_status``, ``pkg_acl`` or
+            ``acl_status``.
+
+        """
+        return list(self._get(session).statuses[name])
+
+
+# The reference data of the current process
+REGISTRY = ReferenceData()
+
+
+def invalidate(session):
+    """ Record that the reference data changed, so every process reloads
+    it.
+
+    This method only flushes, committing is up to the caller.
+
+    :arg session: the session to connect to the database with.
+
+    """
+    model.Generation.bump(session, 'collections')
+    session.info[_SESSION_KEY] = True
+
+
+def _flag_changes(session, *args):
+    """ Flag the session when reference data is added, changed or deleted.
+    """
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, _REFERENCE_CLASSES):
+            session.info[_SESSION_KEY] = True
+            return
+
+
+def _reset(session, *args):
+    """ Drop the reference data of the process once changes to it were
+    committed. """
+    if session.info.pop(_SESSION_KEY, None):
+        REGISTRY.reset()
+
+
+def _forget_changes(session, *args):
+    """ Forget the changes to the reference data rolled back. """
+    session.info.pop(_SESSION_KEY, None)
+
+
+event.listen(Session, 'before_flush', _flag_changes)
+event.listen(Session, 'after_commit', _reset)
+event.listen(Session, 'after_soft_rollback', _forget_changes)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Backends matching the patterns given to `pkgdb2.lib.search_package`.
+
+The patterns use ``%`` as wildcard, as in SQL. The backends differ in the
+indexes they rely on:
+    - ``like`` uses a plain LIKE and works everywhere, but infix and case
+      insensitive patterns scan the whole Package table,
+    - ``trigram`` uses the pg_trgm GIN indexes of PostgreSQL,
+    - ``fts5`` uses the FTS5 table of SQLite, with the trigram tokenizer.
+
+See `pkgdb2.lib.model.SEARCH_DDL` for the indexes themselves.
+'''
+
+import weakref
+
+import sqlalchemy as sa
+
+import pkgdb2
+from pkgdb2.lib import model
+
+
+MODES = ['name', 'summary']
+
+# Backend detected for each engine
+_DETECTED = weakref.WeakKeyDictionary()
+
+
+def _get_term(pattern):
+    """ Return the pattern without its wildcards. """
+    return pattern.replace('%', '').replace('_', '')
+
+
+class LikeBackend(object):
+    """ Match the patterns using LIKE, or ILIKE for the case insensitive
+    searches. """
+
+    name = 'like'
+    # Whether the patterns are matched using an index
+    indexed = False
+
+    def columns(self, mode):
+        """ Return the columns of the Package table searched in the
+        specified mode. """
+        if mode == 'summary':
+            return [
+                model.Package.name,
+                model.Package.summary,
+                model.Package.description,
+            ]
+        return [model.Package.name]
+
+    def match(self, pattern, case_sensitive=True, mode='name'):
+        """ Return the clause selecting the packages matching the pattern.
+
+        :arg pattern: the pattern to match.
+        :kwarg case_sensitive: a boolean to specify doing a case insensitive
+            search. Defaults to True.
+        :kwarg mode: the mode of the search, see `MODES`.
+
+        """
+        if case_sensitive:
+            clauses = [col.like(pattern) for col in self.columns(mode)]
+        else:
+            clauses = [col.ilike(pattern) for col in self.columns(mode)]
+        return sa.or_(*clauses)
+
+    def rank(self, pattern, mode='name'):
+        """ Return the clauses ordering the packages found by relevance:
+        exact name first, then the names starting with the term searched,
+        then the shortest names.
+
+        :arg pattern: the pattern matched.
+        :kwarg mode: the mode of the search, see `MODES`.
+
+        """
+        term = _get_term(pattern).lower()
+        name = sa.func.lower(model.Package.name)
+        return [
+            sa.case([(name == term, 0), (name.like(term + '%'), 1)], else_=2),
+            sa.func.length(model.Package.name),
+        ]
+
+
+class TrigramBackend(LikeBackend):
+    """ Match the patterns using LIKE and ILIKE, which PostgreSQL serves
+    from the pg_trgm GIN indexes, and rank them by similarity. """
+
+    name = 'trigram'
+    # Whether the patterns are matched using an index
+    indexed = True
+
+    def rank(self, pattern, mode='name'):
+        """ Return the clauses ordering the packages found by similarity
+        with the term searched.
+
+        :arg pattern: the pattern matched.
+        :kwarg mode: the mode of the search, see `MODES`.
+
+        """
+        term = _get_term(pattern)
+        similarity = sa.func.similarity(model.Package.name, term)
+        if mode == 'summary':
+            similarity = sa.func.greatest(
+                similarity, sa.func.similarity(model.Package.summary, term))
+        return [similarity.desc()]
+
+
+class Fts5Backend(LikeBackend):
+    """ Match the patterns on the SQLite FTS5 table: LIKE is used for the
+    case insensitive searches and GLOB for the case sensitive ones. """
+
+    name = 'fts5'
+    # Whether the patterns are matched using an index
+    indexed = True
+
+    table = sa.sql.table(
+        'PackageSearch',
+        sa.sql.column('rowid'),
+        sa.sql.column('name'),
+        sa.sql.column('summary'),
+        sa.sql.column('description'),
+    )
+
+    def match(self, pattern, case_sensitive=True, mode='name'):
+        """ Return the clause selecting the packages matching the pattern.
+
+        :arg pattern: the pattern to match.
+        :kwarg case_sensitive: a boolean to specify doing a case insensitive
+            search. Defaults to True.
+        :kwarg mode: the mode of the search, see `MODES`.
+
+        """
+        columns = [self.table.c.name]
+        if mode == 'summary':
+            columns.extend([self.table.c.summary, self.table.c.description])
+
+        if case_sensitive:
+            glob = pattern.replace('%', '*').replace('_', '?')
+            clauses = [col.op('GLOB')(glob) for col in columns]
+        else:
+            clauses = [col.like(pattern) for col in columns]
+
+        # FTS5 only uses its index for one constraint, OR-ing the columns
+        # would scan the whole table
+        selects = [
+            sa.select([self.table.c.rowid]).where(clause)
+            for clause in clauses
+        ]
+        if len(selects) == 1:
+            return model.Package.id.in_(selects[0])
+        return model.Package.id.in_(sa.union(*selects))
+
+
+BACKENDS = dict(
+    (backend.name, backend)
+    for backend in [LikeBackend(), TrigramBackend(), Fts5Backend()]
+)
+
+
+def detect_backend(engine):
+    """ Return the best backend supported by the database.
+
+    :arg engine: the engine connecting to the database.
+
+    """
+    if engine not in _DETECTED:
+        name = 'like'
+        if engine.dialect.name == 'postgresql':
+            if engine.execute(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            ).scalar():
+                name = 'trigram'
+        elif engine.dialect.name == 'sqlite':
+            if engine.dialect.has_table(engine, 'PackageSearch'):
+                name = 'fts5'
+        _DETECTED[engine] = name
+    return BACKENDS[_DETECTED[engine]]
+
+
+def get_backend(session):
+    """ Return the backend to use with the given session, as set in the
+    ``PKGDB2_SEARCH_BACKEND`` configuration key or detected from the
+    database if it is ``auto``.
+
+    :arg session: the session to connect to the database with.
+
+    """
+    name = pkgdb2.APP.config.get('PKGDB2_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        return detect_backend(session.get_bind())
+    return BACKENDS[name]
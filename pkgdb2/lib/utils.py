@@ -23,13 +23,19 @@
 Utilities for all classes to use
 '''
 
+import datetime
 import hashlib
+import re
 import urllib
 
 import pkgdb2
+import pkgdb2.lib.bugzilla_jobs
 import pkgdb2.lib.exceptions
+import pkgdb2.lib.fas
 
 from bugzilla import Bugzilla
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 # The Fedora Account System Module
 from fedora.client.fas2 import AccountSystem
@@ -47,6 +53,10 @@ _BUGZILLA = None
 # Have a global connection to FAS open.
 _FAS = None
 
+# Key of the session info holding the changes logged in a transaction,
+# recorded in the change feed when it is committed
+_SESSION_KEY = 'pkgdb2.changes'
+
 
 def get_fas():  # pragma: no cover
     ''' Retrieve a connection to the Fedora Account System.
@@ -78,40 +88,22 @@ def get_fas():  # pragma: no cover
     return _FAS
 
 
-@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
-def __get_fas_grp_member(group='packager'):  # pragma: no cover
-    ''' Retrieve from FAS the list of users in the packager group.
-    '''
-    fas = get_fas()
-
-    return fas.group_members(group)
-
-
-def get_packagers():  # pragma: no cover
-    """ Return a list containing the name of all the packagers. """
-    output = []
-    for user in __get_fas_grp_member('packager'):
-        if user.role_type in ('user', 'sponsor', 'administrator'):
-            output.append(user.username)
-    return output
+def get_packagers():
+    """ Return the set of the name of all the packagers, see
+    `pkgdb2.lib.fas`. """
+    return pkgdb2.lib.fas.get_packagers()
 
 
-@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
-def get_fas_group(group):  # pragma: no cover
+def get_fas_group(group):
     """ Return group information from FAS based on the specified group name.
     """
-    fas = get_fas()
-
-    return fas.group_by_name(group)
+    return pkgdb2.lib.fas.get_group(group)
 
 
-@pkgdb2.CACHE.cache_on_arguments(expiration_time=3600)
-def get_bz_email_user(username):  # pragma: no cover
+def get_bz_email_user(username):
     ''' Retrieve the bugzilla email associated to the provided username.
     '''
-    fas = get_fas()
-
-    return fas.person_by_username(username)
+    return pkgdb2.lib.fas.get_person(username)
 
 
 def get_bz():  # pragma: no cover
@@ -123,6 +115,16 @@ def get_bz():  # pragma: no cover
     if _BUGZILLA:  # pragma: no cover
         return _BUGZILLA
 
+    _BUGZILLA = new_bz()
+    return _BUGZILLA
+
+
+def new_bz():  # pragma: no cover
+    '''Open a new connection to bugzilla, for the threads which cannot
+    share the one of `get_bz`.
+
+    :raises xmlrpclib.ProtocolError: If we're unable to contact bugzilla
+    '''
     # Get a connection to bugzilla
     bz_server = pkgdb2.APP.config['PKGDB2_BUGZILLA_URL']
     if not bz_server:
@@ -131,16 +133,19 @@ def get_bz():  # pragma: no cover
     bz_user = pkgdb2.APP.config['PKGDB2_BUGZILLA_USER']
     bz_pass = pkgdb2.APP.config['PKGDB2_BUGZILLA_PASSWORD']
 
-    _BUGZILLA = Bugzilla(url=bz_url, user=bz_user, password=bz_pass,
-                         cookiefile=None, tokenfile=None)
-    return _BUGZILLA
+    return Bugzilla(url=bz_url, user=bz_user, password=bz_pass,
+                    cookiefile=None, tokenfile=None)
 
 
 def set_bugzilla_owner(
         username, prev_poc, pkg_name, collectn, collectn_version,
-        bz_comment=None):  # pragma: no cover
+        bz_comment=None, session=None):
     '''Change the package owner
 
+    If ``PKGDB2_BUGZILLA_JOBS`` is set and a session is given, the change
+    is queued in the job of the current transaction, see
+    `pkgdb2.lib.bugzilla_jobs`, otherwise it is made right away.
+
      :arg username: Username of the new point of contact.
      :arg prev_poc: Username of the previous point of contact
      :arg pkg_name: Name of the package to change the owner.
@@ -148,152 +153,390 @@ def set_bugzilla_owner(
      :arg collectn_version: Collection version.
      :kwarg bz_comment: the comment of changes, if left to None, rely on a
         default comment.
+     :kwarg session: the session to connect to the database with, used to
+        queue the change.
+     :returns: the `BugzillaJob` the change was queued in, if it was.
     '''
-    if not bz_comment:
-        bz_comment = 'This package has changed ownership in the Fedora'\
-                     ' Package Database.  Reassigning to the new owner'\
-                     ' of this component.'
-
-    if username.startswith('group::'):
-        user_email = get_fas_group(
-            username.replace('group::', '')).mailing_list
-    else:
-        user_email = get_bz_email_user(username).bugzilla_email
-
-    prev_poc_email = ''
-    if prev_poc:
-        prev_poc_email = get_bz_email_user(prev_poc).bugzilla_email
-
-    bz_mail = '%s' % user_email
-    prev_mail = '%s' % prev_poc_email
-    bz_query = {}
-    bz_query['product'] = collectn
-    bz_query['component'] = pkg_name
-    bz_query['bug_status'] = [
-        'NEW', 'ASSIGNED', 'ON_DEV', 'ON_QA', 'MODIFIED', 'POST',
-        'FAILS_QA', 'PASSES_QA', 'RELEASE_PENDING']
-    bz_query['version'] = collectn_version
-    if bz_query['version'] == 'devel':
-        bz_query['version'] = 'rawhide'
-    bugz = get_bz()
-    query_results = bugz.query(bz_query)
-
-    for bug in query_results:
-        if (not prev_poc_email or bug.assigned_to == prev_mail) \
-                and bug.assigned_to != bz_mail:
-            if pkgdb2.APP.config[
-                    'PKGDB2_BUGZILLA_NOTIFICATION']:  # pragma: no cover
-                try:
-                    bug.setassignee(assigned_to=bz_mail, comment=bz_comment)
-                except Exception, err:
-                    raise pkgdb2.lib.exceptions.PkgdbBugzillaException(
-                        'An error occured while calling bugzilla: %s'
-                        % str(err)
-                    )
-            else:
-                print(
-                    'Would have reassigned bug #%(bug_num)s '
-                    'from %(former)s to %(current)s' % {
-                        'bug_num': bug.bug_id, 'former': bug.assigned_to,
-                        'current': bz_mail})
-
-
-def _construct_substitutions(msg):
-    """ Convert a fedmsg message into a dict of substitutions. """
-    subs = {}
-    for key1 in msg:
-        if isinstance(msg[key1], dict):
-            subs.update(dict([
-                ('.'.join([key1, key2]), val2)
-                for key2, val2 in _construct_substitutions(msg[key1]).items()
-            ]))
-
-        subs[key1] = msg[key1]
-
-    return subs
+    reassignment = pkgdb2.lib.bugzilla_jobs.build_reassignment(
+        username, prev_poc, pkg_name, collectn, collectn_version,
+        bz_comment=bz_comment)
+
+    if session is not None \
+            and pkgdb2.APP.config.get('PKGDB2_BUGZILLA_JOBS', False):
+        return pkgdb2.lib.bugzilla_jobs.queue_reassignment(
+            session, reassignment)
+
+    pkgdb2.lib.bugzilla_jobs.reassign([reassignment])  # pragma: no cover
+
+
+class LogTemplate(object):
+    """ A template of log message, parsed once to know the fields of the
+    message it uses. """
+
+    _field = re.compile(r'%\(([^)]+)\)s')
+
+    def __init__(self, template):
+        """ Constructor.
+
+        :arg template: the template, using ``%(name)s`` placeholders where
+            ``name`` is the path to the value in the message, its
+            components separated by dots.
+
+        """
+        self.template = template
+        self.fields = [
+            (field, field.split('.'))
+            for field in sorted(set(self._field.findall(template)))
+        ]
+
+    def format(self, message):
+        """ Return the template filled with the fields of the message.
+
+        Only the fields used by the template are looked up in the message,
+        in the nested dictionnaries or in the attributes of the objects it
+        contains.
+
+        :arg message: the partial fedmsg message.
+
+        """
+        values = {}
+        for field, path in self.fields:
+            values[field] = _get_path(message, path)
+        return self.template % values
+
+
+class ChangeTemplate(object):
+    """ The paths, in the message of a topic, to the fields of the change
+    recorded for the change feed, see `pkgdb2.lib.model.Change`. """
+
+    def __init__(self, **fields):
+        """ Constructor.
+
+        :kwarg fields: the path to the value in the message of each of the
+            ``FIELDS`` of `pkgdb2.lib.model.Change` set for this topic, its
+            components separated by dots.
+
+        """
+        self.fields = [
+            (field, path.split('.')) for field, path in sorted(fields.items())
+        ]
+
+    def values(self, message):
+        """ Return the fields of the change described by the message, as a
+        dictionnary.
+
+        :arg message: the partial fedmsg message.
+
+        """
+        values = {}
+        for field, path in self.fields:
+            value = _get_path(message, path)
+            if value is not None and not isinstance(value, basestring):
+                value = unicode(value)
+            values[field] = value
+        return values
+
+
+def _get_path(message, path):
+    """ Return the value at the given path of the message, looking in the
+    nested dictionnaries or in the attributes of the objects it contains.
+    """
+    value = message
+    for key in path:
+        if isinstance(value, dict):
+            value = value[key]
+        else:
+            value = getattr(value, key)
+    return value
+
+
+class Topic(object):
+    """ The templates of the log message and of the email subject of the
+    changes published on a fedmsg topic. """
+
+    def __init__(self, log, subject=None, change=None):
+        """ Constructor.
+
+        :arg log: the template of the log message.
+        :kwarg subject: the template of the subject of the emails, emails
+            have a generic subject if not specified.
+        :kwarg change: the paths to the fields of the change recorded in
+            the change feed, by field, see `ChangeTemplate`. The changes of
+            all the topics are recorded, with only their topic and agent if
+            not specified.
+
+        """
+        self.log = LogTemplate(log)
+        self.subject = LogTemplate(subject) if subject else None
+        self.change = ChangeTemplate(**(change or {}))
+
+
+# The fedmsg topics published, by partial topic name
+TOPICS = {}
+
+
+def register_topic(topic, log, subject=None, change=None):
+    """ Register the templates of a fedmsg topic, see `Topic`.
+
+    :arg topic: the partial fedmsg topic.
+    :arg log: the template of the log message.
+    :kwarg subject: the template of the subject of the emails.
+    :kwarg change: the paths to the fields of the change recorded in the
+        change feed.
+
+    """
+    TOPICS[topic] = Topic(log, subject=subject, change=change)
+
+
+register_topic(
+    'acl.update',
+    log='user: %(agent)s set for %(username)s acl: %(acl)s of'
+        ' package: %(package_name)s from: '
+        '%(previous_status)s to: '
+        '%(status)s on branch: '
+        '%(package_listing.collection.branchname)s',
+    subject='%(agent)s:%(package_name)s %(acl)s  set to %(status)s',
+    change=dict(
+        package='package_name',
+        branch='package_listing.collection.branchname',
+        acl='acl',
+        fas_name='username',
+        old_value='previous_status',
+        new_value='status',
+    ),
+)
+register_topic(
+    'acl.delete',
+    log='user: %(agent)s deleted acl: %(acl.acl)s of '
+        'package: %(acl.packagelist.package.name)s of user: '
+        '%(acl.fas_name)s on: '
+        '%(acl.packagelist.collection.branchname)s',
+    change=dict(
+        package='acl.packagelist.package.name',
+        branch='acl.packagelist.collection.branchname',
+        acl='acl.acl',
+        fas_name='acl.fas_name',
+        old_value='acl.status',
+    ),
+)
+register_topic(
+    'owner.update',
+    log='user: %(agent)s changed point of contact of package: '
+        '%(package_name)s from: '
+        '%(previous_owner)s to: '
+        '%(username)s on branch: '
+        '%(package_listing.collection.branchname)s',
+    subject='%(agent)s:%(package_name)s set point of contact to: '
+            '%(username)s',
+    change=dict(
+        package='package_name',
+        branch='package_listing.collection.branchname',
+        fas_name='username',
+        old_value='previous_owner',
+        new_value='username',
+    ),
+)
+register_topic(
+    'branch.start',
+    log='user: %(agent)s started branching from '
+        '%(collection_from.branchname)s to '
+        '%(collection_to.branchname)s',
+    change=dict(
+        branch='collection_to.branchname',
+        old_value='collection_from.branchname',
+    ),
+)
+register_topic(
+    'branch.complete',
+    log='user: %(agent)s finished branching from '
+        '%(collection_from.branchname)s to '
+        '%(collection_to.branchname)s',
+    change=dict(
+        branch='collection_to.branchname',
+        old_value='collection_from.branchname',
+    ),
+)
+register_topic(
+    'package.branch.delete',
+    log='user: %(agent)s deleted branch: '
+        '%(package_listing.collection.'
+        'branchname)s '
+        'for package %(package_listing.'
+        'package.name)s ',
+    change=dict(
+        package='package_listing.package.name',
+        branch='package_listing.collection.branchname',
+        old_value='package_listing.status',
+    ),
+)
+register_topic(
+    'package.branch.new',
+    log='user: %(agent)s created branch '
+        '%(package_listing.collection.'
+        'branchname)s on package %(package.name)s',
+    change=dict(
+        package='package.name',
+        branch='package_listing.collection.branchname',
+        fas_name='package_listing.point_of_contact',
+        new_value='package_listing.status',
+    ),
+)
+register_topic(
+    'package.delete',
+    log='user: %(agent)s deleted package %(package.name)s',
+    change=dict(
+        package='package.name',
+        old_value='package.status',
+    ),
+)
+register_topic(
+    'package.new',
+    log='user: %(agent)s created package: '
+        '%(package_name)s on branch: '
+        '%(package_listing.collection.branchname)s for point'
+        ' of contact: %(package_listing.point_of_contact)s',
+    change=dict(
+        package='package_name',
+        branch='package_listing.collection.branchname',
+        fas_name='package_listing.point_of_contact',
+        new_value='package_listing.status',
+    ),
+)
+register_topic(
+    'package.critpath.update',
+    log='user: %(agent)s updated critpath status'
+        'for package: %(package.name)s on '
+        'branches %(branches)s',
+    change=dict(
+        package='package.name',
+        new_value='critpath',
+    ),
+)
+register_topic(
+    'package.update',
+    log='user: %(agent)s updated %(fields)s package: '
+        '%(package.name)s',
+    subject='%(agent)s updated package: '
+            '%(package.name)s',
+    change=dict(
+        package='package.name',
+    ),
+)
+register_topic(
+    'package.update.status',
+    log='user: %(agent)s updated package: '
+        '%(package_name)s status from: '
+        '%(prev_status)s to '
+        '%(status)s on branch: '
+        '%(package_listing.collection.branchname)s',
+    subject='%(agent)s updated package: '
+            '%(package_name)s status to '
+            '%(status)s ['
+            '%(package_listing.collection.branchname)s]',
+    change=dict(
+        package='package_name',
+        branch='package_listing.collection.branchname',
+        old_value='prev_status',
+        new_value='status',
+    ),
+)
+register_topic(
+    'collection.new',
+    log='user: %(agent)s created collection: '
+        '%(collection.name)s',
+    change=dict(
+        branch='collection.branchname',
+        new_value='collection.status',
+    ),
+)
+register_topic(
+    'collection.update',
+    log='user: %(agent)s edited collection: '
+        '%(collection.name)s',
+    change=dict(
+        branch='collection.branchname',
+        new_value='collection.status',
+    ),
+)
+
+
+class LazyJson(object):
+    """ An object in a message given to `log`, serialized with its
+    ``to_json`` method called with the specified arguments, and only if
+    the message is published. """
+
+    def __init__(self, obj, **kwargs):
+        """ Constructor.
+
+        :arg obj: the object to serialize.
+        :kwarg kwargs: the arguments of its ``to_json`` method.
+
+        """
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __getattr__(self, name):
+        return getattr(self.obj, name)
+
+    def to_json(self):
+        """ Return the serialized object. """
+        return self.obj.to_json(**self.kwargs)
+
+
+def _serialize(value):
+    """ Return the value with the objects it contains replaced by the
+    output of their ``to_json`` method. """
+    if hasattr(value, 'to_json'):
+        return value.to_json()
+    elif isinstance(value, dict):
+        return dict(
+            (key, _serialize(val)) for key, val in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [_serialize(val) for val in value]
+    return value
+
+
+def _change_row(topic, templates, message, change_time):
+    """ Return the row of the Change table recording the change described
+    by the message. """
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+
+    row = dict((field, None) for field in model.Change.FIELDS)
+    row.update(templates.change.values(message))
+    row.update(
+        topic=topic, agent=message['agent'], change_time=change_time)
+    return row
 
 
 def log(session, package, topic, message):
     """ Take a partial fedmsg topic and message.
 
-    Publish the message and log it in the db.
+    Publish the message, log it in the db and record the change in the
+    change feed when the transaction is committed, see
+    `pkgdb2.lib.model.Change`.
+
+    The values of the message which have a ``to_json`` method, such as the
+    objects of the model, are only serialized if the message is published,
+    use `LazyJson` to give arguments to their ``to_json`` method.
     """
 
     # To avoid a circular import.
     import pkgdb2.lib.model as model
-    from pkgdb2.lib.notifications import fedmsg_publish, email_publish
+    from pkgdb2.lib.notifications import notify_fedmsg, notify_email
 
     if pkgdb2.APP.config.get('PKGDB2_FEDMSG_NOTIFICATION', True):
-        fedmsg_publish(topic, message)
-
-    # A big lookup of fedmsg topics to model.Log template strings.
-    templates = {
-        'acl.update': 'user: %(agent)s set for %(username)s acl: %(acl)s of'
-                      ' package: %(package_name)s from: '
-                      '%(previous_status)s to: '
-                      '%(status)s on branch: '
-                      '%(package_listing.collection.branchname)s',
-        'acl.delete': 'user: %(agent)s deleted acl: %(acl.acl)s of '
-                      'package: %(acl.packagelist.package.name)s of user: '
-                      '%(acl.fas_name)s on: '
-                      '%(acl.packagelist.collection.branchname)s',
-        'owner.update': 'user: %(agent)s changed point of contact of package: '
-                        '%(package_name)s from: '
-                        '%(previous_owner)s to: '
-                        '%(username)s on branch: '
-                        '%(package_listing.collection.branchname)s',
-        'branch.start': 'user: %(agent)s started branching from '
-                        '%(collection_from.branchname)s to '
-                        '%(collection_to.branchname)s',
-        'branch.complete': 'user: %(agent)s finished branching from '
-                           '%(collection_from.branchname)s to '
-                           '%(collection_to.branchname)s',
-        'package.branch.delete': 'user: %(agent)s deleted branch: '
-                                 '%(package_listing.collection.'
-                                 'branchname)s '
-                                 'for package %(package_listing.'
-                                 'package.name)s ',
-        'package.branch.new': 'user: %(agent)s created branch '
-                              '%(package_listing.collection.'
-                              'branchname)s on package %(package.name)s',
-        'package.delete': 'user: %(agent)s deleted package %(package.name)s',
-        'package.new': 'user: %(agent)s created package: '
-                       '%(package_name)s on branch: '
-                       '%(package_listing.collection.branchname)s for point'
-                       ' of contact: %(package_listing.point_of_contact)s',
-        'package.critpath.update': 'user: %(agent)s updated critpath status'
-                                   'for package: %(package.name)s on '
-                                   'branches %(branches)s',
-        'package.update': 'user: %(agent)s updated %(fields)s package: '
-                          '%(package.name)s',
-        'package.update.status': 'user: %(agent)s updated package: '
-                          '%(package_name)s status from: '
-                          '%(prev_status)s to '
-                          '%(status)s on branch: '
-                          '%(package_listing.collection.branchname)s',
-        'collection.new': 'user: %(agent)s created collection: '
-                          '%(collection.name)s',
-        'collection.update': 'user: %(agent)s edited collection: '
-                             '%(collection.name)s',
-    }
-    subject_templates = {
-        'acl.update': '%(agent)s:%(package_name)s %(acl)s  set to %(status)s',
-        'owner.update': '%(agent)s:%(package_name)s set point of contact to: '
-                        '%(username)s',
-        'package.update': '%(agent)s updated package: '
-                          '%(package.name)s',
-        'package.update.status': '%(agent)s updated package: '
-                          '%(package_name)s status to '
-                          '%(status)s ['
-                          '%(package_listing.collection.branchname)s]',
-    }
-    substitutions = _construct_substitutions(message)
-    final_msg = templates[topic] % substitutions
+        notify_fedmsg(session, topic, _serialize(message))
+
+    templates = TOPICS[topic]
+    final_msg = templates.log.format(message)
     subject = None
-    if topic in subject_templates:
-        subject = subject_templates[topic] % substitutions
+    if templates.subject:
+        subject = templates.subject.format(message)
 
     model.Log.insert(session, message['agent'], package, final_msg)
+    session.info.setdefault(_SESSION_KEY, []).append(
+        _change_row(topic, templates, message, datetime.datetime.utcnow()))
 
     if pkgdb2.APP.config.get(
             'PKGDB2_EMAIL_NOTIFICATION', False):  # pragma: no cover
@@ -303,12 +546,133 @@ def log(session, package, topic, message):
                 '{1}/package/{2}'.format(
                     final_msg, pkgdb2.APP.config.get('SITE_URL'),
                     package.name)
-        email_publish(
-            message['agent'], package, body_email, subject=subject)
+        notify_email(
+            session, message['agent'], package, body_email, subject=subject)
 
     return final_msg
 
 
+def log_many(session, topic, entries, message):
+    """ Log several changes made at once in the db and publish a single
+    message summarizing them.
+
+    :arg session: the session to connect to the database with.
+    :arg topic: the partial fedmsg topic of the message published.
+    :arg entries: a list of ``(package, message)`` tuples, the `Package`
+        object changed and the partial fedmsg message of each change,
+        formatted with the template of the ``<topic>`` minus its last
+        component (``acl.update`` for ``acl.update.bulk``).
+    :arg message: the message published on fedmsg.
+    :returns: the log messages, in the order of the entries.
+    :rtype: list(str)
+
+    """
+
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+    from pkgdb2.lib.notifications import notify_fedmsg, notify_email
+
+    if not entries:
+        return []
+
+    if pkgdb2.APP.config.get('PKGDB2_FEDMSG_NOTIFICATION', True):
+        notify_fedmsg(session, topic, _serialize(message))
+
+    entry_topic = topic.rsplit('.', 1)[0]
+    templates = TOPICS[entry_topic]
+    now = datetime.datetime.utcnow()
+    messages = []
+    rows = []
+    change_rows = []
+    for package, entry in entries:
+        final_msg = templates.log.format(entry)
+        messages.append(final_msg)
+        rows.append({
+            'user': entry['agent'],
+            'package_id': package.id if package else None,
+            'description': final_msg,
+            'change_time': now,
+        })
+        change_rows.append(_change_row(entry_topic, templates, entry, now))
+
+    session.execute(model.Log.__table__.insert(), rows)
+    session.info.setdefault(_SESSION_KEY, []).extend(change_rows)
+
+    if pkgdb2.APP.config.get(
+            'PKGDB2_EMAIL_NOTIFICATION', False):  # pragma: no cover
+        # One email per package, listing all its changes
+        changes = {}
+        order = []
+        for (package, entry), final_msg in zip(entries, messages):
+            if package is None:
+                continue
+            if package.name not in changes:
+                order.append(package)
+                changes[package.name] = []
+            changes[package.name].append(final_msg)
+        for package in order:
+            body_email = '{0}\n\nTo make changes to this package see:\n' \
+                '{1}/package/{2}'.format(
+                    '\n'.join(changes[package.name]),
+                    pkgdb2.APP.config.get('SITE_URL'), package.name)
+            notify_email(session, message['agent'], package, body_email)
+
+    return messages
+
+
+def record_changes(session, topic, agent, changes):
+    """ Record changes in the change feed when the transaction is
+    committed, without logging nor publishing them, for the changes made
+    in bulk which are only summarized in the log.
+
+    :arg session: the session to connect to the database with.
+    :arg topic: the partial fedmsg topic of the changes.
+    :arg agent: the username of the user making the changes.
+    :arg changes: a list of dictionnaries with some of the
+        `pkgdb2.lib.model.Change.FIELDS` of each change.
+
+    """
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+
+    now = datetime.datetime.utcnow()
+    change_rows = []
+    for change in changes:
+        row = dict((field, None) for field in model.Change.FIELDS)
+        row.update(change)
+        row.update(topic=topic, agent=agent, change_time=now)
+        change_rows.append(row)
+    session.info.setdefault(_SESSION_KEY, []).extend(change_rows)
+
+
+def _record_changes(session):
+    """ Record the changes logged in the transaction being committed in
+    the change feed and bump the ``acls`` generation, invalidating the
+    cached exports.
+
+    This is done just before the commit, so the concurrent transactions
+    only wait for the lock on the counters while the others commit, and
+    the changes are numbered in the order the transactions commit.
+    """
+    # To avoid a circular import.
+    import pkgdb2.lib.model as model
+
+    change_rows = session.info.pop(_SESSION_KEY, None)
+    if change_rows:
+        session.flush()
+        model.Generation.bump(session, 'acls')
+        model.Change.insert_many(session, change_rows)
+
+
+def _forget_changes(session, *args):
+    """ Forget the changes logged in the transaction rolled back. """
+    session.info.pop(_SESSION_KEY, None)
+
+
+event.listen(Session, 'before_commit', _record_changes)
+event.listen(Session, 'after_soft_rollback', _forget_changes)
+
+
 def avatar_url(username, size=64, default='retro'):
     openid = "http://%s.id.fedoraproject.org/" % username
     return avatar_url_from_openid(openid, size, default)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Per-request SQL instrumentation.
+
+Records, for each request, the number of SQL statements executed, the time
+spent in the database and the slowest statements. These are returned in
+the ``Server-Timing`` header of the response, logged when the request is
+slow and aggregated per endpoint for the admin interface.
+'''
+
+import collections
+import heapq
+import json
+import logging
+import threading
+import time
+
+import flask
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+
+LOG = logging.getLogger('pkgdb2.query_stats')
+
+# Statistics aggregated per endpoint since the application started
+ENDPOINTS = {}
+# The last slow requests
+SLOW_REQUESTS = collections.deque(maxlen=50)
+_LOCK = threading.Lock()
+
+
+class RequestStats(object):
+    """ The SQL statistics of a request. """
+
+    def __init__(self, kept=5):
+        """ Constructor.
+
+        :kwarg kept: the number of slowest statements to keep.
+
+        """
+        self.start = time.time()
+        self.queries = 0
+        self.db_time = 0.0
+        self.kept = kept
+        self._slowest = []
+
+    def add(self, statement, duration):
+        """ Record a statement executed.
+
+        :arg statement: the SQL statement executed.
+        :arg duration: the time the statement took, in seconds.
+
+        """
+        self.queries += 1
+        self.db_time += duration
+        if len(self._slowest) < self.kept:
+            heapq.heappush(self._slowest, (duration, statement))
+        elif self._slowest and duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (duration, statement))
+
+    @property
+    def slowest(self):
+        """ Return the slowest statements recorded as a list of
+        ``(duration, statement)`` tuples, the slowest first. """
+        return sorted(self._slowest, reverse=True)
+
+
+class EndpointStats(object):
+    """ The SQL statistics of all the requests to an endpoint. """
+
+    def __init__(self, endpoint):
+        """ Constructor.
+
+        :arg endpoint: the name of the endpoint.
+
+        """
+        self.endpoint = endpoint
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.duration = 0.0
+        self.max_duration = 0.0
+
+    def add(self, stats, duration):
+        """ Record a request to the endpoint.
+
+        :arg stats: the ``RequestStats`` of the request.
+        :arg duration: the time the request took, in seconds.
+
+        """
+        self.requests += 1
+        self.queries += stats.queries
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.db_time += stats.db_time
+        self.duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
+
+def get_stats():
+    """ Return the ``RequestStats`` of the current request, or ``None`` if
+    called outside of a request. """
+    if not flask.has_request_context():
+        return None
+    stats = getattr(flask.g, 'query_stats', None)
+    if stats is None:
+        stats = RequestStats(
+            kept=flask.current_app.config.get('PKGDB2_SLOW_QUERIES_KEPT', 5))
+        flask.g.query_stats = stats
+    return stats
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    """ Record when the statement started. """
+    conn.info['query_start'] = time.time()
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    """ Record the statement in the statistics of the current request. """
+    duration = time.time() - conn.info.pop('query_start', time.time())
+    stats = get_stats()
+    if stats is not None:
+        stats.add(statement, duration)
+
+
+def _start_request():
+    """ Start recording the statistics of the request. """
+    get_stats()
+
+
+def _add_server_timing(response):
+    """ Add the statistics recorded so far to the response in the
+    ``Server-Timing`` header. """
+    stats = get_stats()
+    response.headers.add(
+        'Server-Timing',
+        'db;dur=%.2f;desc="%s queries"' % (
+            stats.db_time * 1000, stats.queries))
+    response.headers.add(
+        'Server-Timing',
+        'app;dur=%.2f' % ((time.time() - stats.start) * 1000))
+    return response
+
+
+def _end_request(exception=None):
+    """ Aggregate the statistics of the request per endpoint and log the
+    request if it was slow. """
+    stats = get_stats()
+    duration = time.time() - stats.start
+    endpoint = flask.request.endpoint or '<unknown>'
+
+    with _LOCK:
+        if endpoint not in ENDPOINTS:
+            ENDPOINTS[endpoint] = EndpointStats(endpoint)
+        ENDPOINTS[endpoint].add(stats, duration)
+
+    if duration >= flask.current_app.config.get('PKGDB2_SLOW_REQUEST', 1.0):
+        info = {
+            'endpoint': endpoint,
+            'method': flask.request.method,
+            'path': flask.request.full_path,
+            'duration': round(duration, 4),
+            'queries': stats.queries,
+            'db_time': round(stats.db_time, 4),
+            'slowest': [
+                {'duration': round(query_time, 4), 'statement': statement}
+                for query_time, statement in stats.slowest
+            ],
+        }
+        SLOW_REQUESTS.appendleft(info)
+        LOG.warning('Slow request: %s', json.dumps(info, sort_keys=True))
+
+
+def get_endpoints():
+    """ Return the statistics of each endpoint, sorted by total time spent
+    in the database. """
+    with _LOCK:
+        endpoints = list(ENDPOINTS.values())
+    return sorted(endpoints, key=lambda stat: stat.db_time, reverse=True)
+
+
+def reset():
+    """ Forget the statistics recorded so far. """
+    with _LOCK:
+        ENDPOINTS.clear()
+        SLOW_REQUESTS.clear()
+
+
+def setup(app):
+    """ Instrument the SQL statements executed by the requests of the
+    given application.
+
+    :arg app: the flask application to instrument.
+
+    """
+    sa.event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    sa.event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_add_server_timing)
+    app.teardown_request(_end_request)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Routing of the read-only requests to the replicas of the database.
+
+The GET requests of the configured blueprints read from a replica, all the
+others use the primary database. A user who just changed something keeps
+reading from the primary database for a while so they see their changes
+even if the replicas lag behind.
+'''
+
+import time
+
+import flask
+from dogpile.cache.api import NO_VALUE
+
+from pkgdb2.lib.engines import ReplicaRouter
+
+
+class RequestRouter(ReplicaRouter):
+    """ Send the read-only requests of a flask application to the
+    replicas. """
+
+    def __init__(self, app, cache):
+        """ Constructor.
+
+        :arg app: the flask application whose requests are routed.
+        :arg cache: the dogpile cache region in which to remember which
+            users wrote to the database recently, it must be shared by all
+            the processes of the application.
+
+        """
+        self.app = app
+        self.cache = cache
+
+    def _get_key(self):
+        """ Return the cache key recording the last write of the current
+        user, or ``None`` if the user is not logged in. """
+        user = getattr(flask.g, 'fas_user', None)
+        if user is None:
+            return None
+        return 'replicas.written:%s' % user.username
+
+    def _use_replica(self, key):
+        """ Return whether the current request can read from a replica.
+
+        :arg key: the cache key recording the last write of the current
+            user, see `_get_key`.
+
+        """
+        if flask.request.method not in ('GET', 'HEAD'):
+            return False
+        if flask.request.blueprint not in self.app.config.get(
+                'DB_REPLICA_BLUEPRINTS', ['api_ns']):
+            return False
+
+        if key is not None:
+            written = self.cache.get(key)
+            if written is not NO_VALUE and time.time() - written \
+                    < self.app.config.get('DB_REPLICA_STICKINESS', 30):
+                return False
+        return True
+
+    def use_replica(self):
+        """ Return whether the current request can read from a replica.
+
+        The decision is only made once per request and user, it is kept in
+        ``flask.g`` for the following statements.
+        """
+        if not flask.has_request_context():
+            return False
+
+        key = self._get_key()
+        decision = getattr(flask.g, 'use_replica', None)
+        if decision is None or decision[0] != key:
+            decision = (key, self._use_replica(key))
+            flask.g.use_replica = decision
+        return decision[1]
+
+    def written(self):
+        """ Remember that the current user just wrote to the database. """
+        if not flask.has_request_context():
+            return
+        key = self._get_key()
+        if key is not None:
+            self.cache.set(key, time.time())
+        # The rest of the request reads what was just written
+        flask.g.use_replica = (key, False)
@@ -29,6 +29,8 @@ from dateutil import parser
 from math import ceil
 
 import pkgdb2.lib as pkgdblib
+import pkgdb2.lib.notifications
+import pkgdb2.query_stats
 from pkgdb2 import SESSION, APP, is_admin
 from pkgdb2.ui import UI
 
@@ -40,6 +42,23 @@ def admin():
     return flask.render_template('admin.html')
 
 
+@UI.route('/admin/queries/')
+@is_admin
+def admin_queries():
+    """ Return the number of SQL queries and the time spent in the
+    database by each endpoint, the last slow requests, the state of the
+    connection pools of this process and of the notification outbox. """
+    outbox = pkgdb2.lib.notifications.get_outbox_stats(SESSION)
+    return flask.render_template(
+        'list_queries.html',
+        endpoints=pkgdb2.query_stats.get_endpoints(),
+        slow_requests=list(pkgdb2.query_stats.SLOW_REQUESTS),
+        pools=pkgdb2.lib.engines.get_pool_stats(),
+        outbox=outbox,
+        enabled=APP.config.get('PKGDB2_QUERY_STATS', True),
+    )
+
+
 @UI.route('/admin/log/')
 @is_admin
 def admin_log():
@@ -77,22 +96,43 @@ def admin_log():
 
     logs = []
     cnt_logs = 0
+    cursor = 'next' in flask.request.args
+    next_cursor = None
     try:
-        logs = pkgdblib.search_logs(
-            SESSION,
-            package=package or None,
-            packager=packager or None,
-            from_date=from_date,
-            page=page,
-            limit=limit,
-        )
-        cnt_logs = pkgdblib.search_logs(
-            SESSION,
-            package=package or None,
-            packager=packager or None,
-            from_date=from_date,
-            count=True
-        )
+        if cursor:
+            # Seek after the last log entry seen rather than counting
+            # and skipping all the entries of the previous pages
+            after = flask.request.args.get('next')
+            if after:
+                after = pkgdblib.decode_cursor(after)
+            logs = pkgdblib.search_logs(
+                SESSION,
+                package=package or None,
+                packager=packager or None,
+                from_date=from_date,
+                limit=limit + 1,
+                after=after or None,
+            )
+            if len(logs) > limit:
+                logs = logs[:limit]
+                next_cursor = pkgdblib.encode_cursor(
+                    pkgdblib.log_cursor(logs[-1]))
+        else:
+            logs = pkgdblib.search_logs(
+                SESSION,
+                package=package or None,
+                packager=packager or None,
+                from_date=from_date,
+                page=page,
+                limit=limit,
+            )
+            cnt_logs = pkgdblib.search_logs(
+                SESSION,
+                package=package or None,
+                packager=packager or None,
+                from_date=from_date,
+                count=True
+            )
     except pkgdblib.PkgdbException, err:
         flask.flash(err, 'errors')
 
@@ -105,6 +145,9 @@ def admin_log():
         cnt_logs=cnt_logs,
         total_page=total_page,
         page=page,
+        cursor=cursor,
+        next_cursor=next_cursor,
+        limit=limit,
         package=package or '',
         from_date=from_date or '',
         packager=packager or '',
@@ -30,6 +30,7 @@ from sqlalchemy.orm.exc import NoResultFound
 
 import pkgdb2.forms
 import pkgdb2.lib as pkgdblib
+import pkgdb2.lib.bugzilla_jobs as bugzilla_jobs
 from pkgdb2 import SESSION, APP, is_admin, is_pkgdb_admin, \
     packager_login_required
 from pkgdb2.ui import UI
@@ -40,6 +41,17 @@ from pkgdb2.ui import UI
 # pylint: disable=E1101
 
 
+def flash_bugzilla_job():
+    ''' Tell the user the bugs are reassigned in the background if a job
+    was queued in the current transaction, see `pkgdb2.lib.bugzilla_jobs`.
+    '''
+    job_id = bugzilla_jobs.get_current_job(SESSION)
+    if job_id:
+        flask.flash(
+            'The bugs will be reassigned in bugzilla shortly (job #%s)'
+            % job_id)
+
+
 @UI.route('/packages/')
 @UI.route('/packages/<motif>/')
 def list_packages(motif=None, orphaned=None, status=None,
@@ -140,99 +152,17 @@ def list_retired(motif=None):
 def package_info(package):
     ''' Display the information about the specified package. '''
 
-    packagename = package
-    package = None
     try:
-        package_acl = pkgdblib.get_acl_package(SESSION, packagename)
-        package = pkgdblib.search_package(SESSION, packagename, limit=1)[0]
-    except (NoResultFound, IndexError):
+        page = pkgdblib.get_package_page(SESSION, package)
+    except NoResultFound:
         SESSION.rollback()
         flask.flash('No package of this name found.', 'errors')
         return flask.render_template('msg.html')
 
-    planned_acls = set(
-        pkgdblib.get_status(SESSION, 'pkg_acl')['pkg_acl'])
-
-    branches = set()
-    commit_acls = {}
-    watch_acls = {}
-    admins = {}
-    pending_admins = {}
-    pocs = {}
-    committers = []
-
-    for pkg in package_acl:
-        if pkg.collection.status == 'EOL':  # pragma: no cover
-            continue
-
-        collection_name = '%s %s' % (
-            pkg.collection.name, pkg.collection.version)
-
-        branches.add(collection_name)
-
-        if pkg.point_of_contact not in pocs:
-            pocs[pkg.point_of_contact] = set()
-        pocs[pkg.point_of_contact].add(collection_name)
-
-        for acl in pkg.acls:
-
-            if acl.acl == 'approveacls' and acl.status == 'Approved':
-                if acl.fas_name not in admins:
-                    admins[acl.fas_name] = set()
-                admins[acl.fas_name].add(collection_name)
-            elif acl.acl == 'approveacls' and acl.status == 'Awaiting Review':
-                if acl.fas_name not in pending_admins:
-                    pending_admins[acl.fas_name] = set()
-                pending_admins[acl.fas_name].add(collection_name)
-
-            if acl.acl == 'commit':
-                dic = commit_acls
-                if acl.status == 'Approved':
-                    committers.append(acl.fas_name)
-            elif acl.acl.startswith('watch') and acl.status == 'Approved':
-                dic = watch_acls
-            else:  # pragma: no cover  -- pass isn't `covered` by coverage
-                # We managed approveacls earlier
-                continue
-
-            if acl.fas_name not in dic:
-                dic[acl.fas_name] = {}
-            if collection_name not in dic[acl.fas_name]:
-                dic[acl.fas_name][collection_name] = {}
-
-            dic[acl.fas_name][collection_name][acl.acl] = \
-                acl.status
-
-        for aclname in planned_acls:
-            for user in commit_acls:
-                if collection_name in commit_acls[user] and \
-                        aclname not in commit_acls[user][collection_name]:
-                    commit_acls[user][collection_name][aclname] = None
-
-        for aclname in planned_acls:
-            for user in watch_acls:
-                if collection_name in watch_acls[user] and \
-                        aclname not in watch_acls[user][collection_name]:
-                    watch_acls[user][collection_name][aclname] = None
-
-    statuses = set([
-        listing.status
-        for listing in package.sorted_listings
-        if listing.collection.status != 'EOL'
-    ])
-
     return flask.render_template(
         'package.html',
-        package=package,
-        commit_acls=commit_acls,
-        watch_acls=watch_acls,
-        pocs=pocs,
-        admins=admins,
-        statuses=statuses,
-        pending_admins=pending_admins,
-        branches=branches,
-        committers=committers,
         form=pkgdb2.forms.ConfirmationForm(),
+        **page
     )
 
 
@@ -356,6 +286,7 @@ def package_give(package, full=True):
                         user=flask.g.fas_user
                     )
 
+                flash_bugzilla_job()
                 SESSION.commit()
         except pkgdblib.PkgdbBugzillaException, err:  # pragma: no cover
             APP.logger.exception(err)
@@ -430,6 +361,7 @@ def package_orphan(package, full=True):
                 SESSION.rollback()
 
         try:
+            flash_bugzilla_job()
             SESSION.commit()
         # Keep it in, but normally we shouldn't hit this
         except pkgdblib.PkgdbException, err:  # pragma: no cover
@@ -507,6 +439,7 @@ def package_retire(package, full=True):
                         'branch: %s' % acl.collection.branchname)
 
         try:
+            flash_bugzilla_job()
             SESSION.commit()
         # Keep it in, but normally we shouldn't hit this
         except pkgdblib.PkgdbException, err:  # pragma: no cover
@@ -568,6 +501,7 @@ def package_take(package, full=True):
                     pkg_user=flask.g.fas_user.username,
                     user=flask.g.fas_user
                 )
+                flash_bugzilla_job()
                 SESSION.commit()
                 flask.flash('You have taken the package %s on branch %s' % (
                     package.name, branch))
@@ -780,22 +714,28 @@ def delete_package(package):
         for acl in pkglist.acls:
             pkgdb2.lib.utils.log(SESSION, None, 'acl.delete', dict(
                 agent=flask.g.fas_user.username,
-                acl=acl.to_json(),
+                acl=acl,
             ))
             SESSION.delete(acl)
         pkgdb2.lib.utils.log(SESSION, None, 'package.branch.delete', dict(
             agent=flask.g.fas_user.username,
-            package_listing=pkglist.to_json(),
+            package_listing=pkglist,
         ))
-        SESSION.delete(pkglist)
 
     pkgdb2.lib.utils.log(SESSION, None, 'package.delete', dict(
         agent=flask.g.fas_user.username,
-        package=package.to_json(),
+        package=package,
     ))
+
+    # Deleted once logged since logging flushes, the statistics are updated
+    # from the snapshot rows of the listings, deleted with them
+    for pkglist in package.listings:
+        SESSION.delete(pkglist)
     SESSION.delete(package)
 
     try:
+        pkgdblib.model.PackageAclSnapshot.refresh(
+            SESSION, package_ids=[package.id])
         SESSION.commit()
         flask.flash('Package %s deleted' % packagename)
     except SQLAlchemyError, err:  # pragma: no cover
@@ -47,6 +47,8 @@ setup(
     scripts=[
         'utility/pkgdb2_branch.py',
         'utility/pkgdb-sync-bugzilla',
+        'utility/pkgdb2_dispatch_notifications.py',
+        'utility/pkgdb2_bugzilla_jobs.py',
         'utility/update_package_info.py',
     ],
 )
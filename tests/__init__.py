@@ -37,6 +37,8 @@ from contextlib import contextmanager
 from flask import appcontext_pushed, g
 
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 
@@ -45,6 +47,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(
 
 from pkgdb2 import APP, FAS
 from pkgdb2.lib import model
+from pkgdb2.lib import reference
 
 #DB_PATH = 'sqlite:///:memory:'
 ## A file database is required to check the integrity, don't ask
@@ -109,6 +112,22 @@ def user_set(APP, user):
         yield
 
 
+@contextmanager
+def count_queries():
+    """ Record the SQL statements executed within the block, in the list
+    returned. """
+    queries = []
+
+    def handler(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', handler)
+    try:
+        yield queries
+    finally:
+        event.remove(Engine, 'before_cursor_execute', handler)
+
+
 class Modeltests(unittest.TestCase):
     """ Model tests. """
 
@@ -125,6 +144,8 @@ class Modeltests(unittest.TestCase):
             if os.path.exists(dbfile):
                 os.unlink(dbfile)
         self.session = model.create_tables(DB_PATH, debug=False)
+        # The database is new, so is its reference data
+        reference.REGISTRY.reset()
         APP.before_request(FAS._check_session)
 
     # pylint: disable=C0103
@@ -340,6 +361,7 @@ def create_package_listing(session):
     )
     session.add(pkgltg)
 
+    model.PackageAclSnapshot.refresh(session)
     session.commit()
 
 
@@ -378,6 +400,7 @@ def create_package_critpath(session):
     )
     session.add(pkgltg)
 
+    model.PackageAclSnapshot.refresh(session)
     session.commit()
 
 
@@ -518,6 +541,7 @@ def create_package_acl(session):
     )
     session.add(packager)
 
+    model.PackageAclSnapshot.refresh(session)
     session.commit()
 
 
@@ -684,6 +708,7 @@ def create_package_acl2(session):
     )
     session.add(packager)
 
+    model.PackageAclSnapshot.refresh(session)
     session.commit()
 
 
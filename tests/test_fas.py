@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+pkgdb tests for the cache of the information retrieved from FAS.
+'''
+
+__requires__ = ['SQLAlchemy >= 0.7']
+import pkg_resources
+
+import time
+import unittest
+import sys
+import os
+
+from dogpile.cache.backends.memory import MemoryBackend
+from mock import Mock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pkgdb2
+import pkgdb2.lib as pkgdblib
+from pkgdb2.lib import fas
+
+
+class Fastests(unittest.TestCase):
+    """ FAS cache tests. """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        self.backend = fas.REGION.backend
+        fas.REGION.backend = MemoryBackend({})
+        self.client = fas.StubFas(
+            people={
+                'pingou': 'pingou@fp.o',
+                'toshio': 'toshio@bz.o',
+                'ralph': 'ralph@fp.o',
+            },
+            groups=[
+                {
+                    'name': 'gtk-sig',
+                    'group_type': 'pkgdb',
+                    'mailing_list': 'gtk@fp.o',
+                    'members': ['pingou'],
+                },
+                {
+                    'name': 'perl-sig',
+                    'group_type': 'pkgdb',
+                    'mailing_list': 'perl@fp.o',
+                    'members': [],
+                },
+                {
+                    'name': 'sysadmin',
+                    'group_type': 'tracking',
+                    'mailing_list': 'sysadmin@fp.o',
+                    'members': ['pingou'],
+                },
+            ],
+            packagers=['pingou', 'toshio'],
+        )
+        fas.set_client(self.client)
+
+    def tearDown(self):
+        """ Remove the stub client and the values cached. """
+        fas.set_client(None)
+        fas.REGION.backend = self.backend
+        pkgdb2.APP.config['PKGDB2_FAS_CACHE_EXPIRATION'] = 3600
+
+    def test_directory(self):
+        """ Test that the packagers and their emails are retrieved at once
+        and cached. """
+        self.assertEqual(
+            pkgdblib.utils.get_packagers(), frozenset(['pingou', 'toshio']))
+        self.assertEqual(self.client.requests, 2)
+        # Only the fields needed are retrieved for all the accounts
+        self.assertEqual(self.client.fields, ['username', 'bugzilla_email'])
+
+        self.assertEqual(
+            pkgdblib.utils.get_bz_email_user('toshio').bugzilla_email,
+            'toshio@bz.o')
+        self.assertEqual(
+            sorted(fas.get_directory()), ['emails', 'packagers'])
+        self.assertEqual(self.client.requests, 2)
+
+        # Users out of the directory and groups are retrieved one by one
+        self.assertEqual(
+            pkgdblib.utils.get_bz_email_user('ralph').bugzilla_email,
+            'ralph@fp.o')
+        group = pkgdblib.utils.get_fas_group('gtk-sig')
+        self.assertEqual(group.mailing_list, 'gtk@fp.o')
+        self.assertEqual(group.group_type, 'pkgdb')
+        self.assertEqual(
+            pkgdblib.utils.get_fas_group('perl-sig').mailing_list,
+            'perl@fp.o')
+        self.assertEqual(self.client.requests, 5)
+        pkgdblib.utils.get_bz_email_user('ralph')
+        pkgdblib.utils.get_fas_group('gtk-sig')
+        pkgdblib.utils.get_fas_group('perl-sig')
+        self.assertEqual(self.client.requests, 5)
+
+    @patch('pkgdb2.LOG')
+    def test_validate_poc(self, log):
+        """ Test that _validate_poc relies on the cached information. """
+        pkgdblib._validate_poc('pingou')
+        pkgdblib._validate_poc('group::gtk-sig')
+        self.assertRaises(
+            pkgdblib.PkgdbException, pkgdblib._validate_poc, 'ralph')
+        self.assertRaises(
+            pkgdblib.PkgdbException, pkgdblib._validate_poc,
+            'group::foo-sig')
+        # The directory, then each group
+        self.assertEqual(self.client.requests, 4)
+        pkgdblib._validate_poc('group::gtk-sig')
+        self.assertEqual(self.client.requests, 4)
+
+    def test_background_refresh(self):
+        """ Test that the expired values are served while they are
+        refreshed in the background. """
+        self.assertEqual(
+            fas.get_packagers(), frozenset(['pingou', 'toshio']))
+
+        pkgdb2.APP.config['PKGDB2_FAS_CACHE_EXPIRATION'] = 0.01
+        self.client.packagers.append('ralph')
+        time.sleep(0.02)
+
+        # The previous value is returned while the new one is created
+        self.assertEqual(
+            fas.get_packagers(), frozenset(['pingou', 'toshio']))
+        # Do not start other refreshes while waiting for this one
+        pkgdb2.APP.config['PKGDB2_FAS_CACHE_EXPIRATION'] = 3600
+
+        for _ in range(200):
+            if 'ralph' in fas.get_packagers():
+                break
+            time.sleep(0.01)
+        self.assertEqual(
+            fas.get_packagers(), frozenset(['pingou', 'ralph', 'toshio']))
+
+    @patch('pkgdb2.LOG')
+    def test_background_refresh_error(self, log):
+        """ Test that the previous value is kept when it cannot be
+        refreshed. """
+        cache = Mock()
+        mutex = Mock()
+
+        def creator():
+            """ Fail as FAS would when it is not configured. """
+            raise pkgdblib.PkgdbException('No PKGDB2_FAS_URL configured')
+
+        fas._refresh_in_background(cache, 'packagers', creator, mutex)
+        for _ in range(200):
+            if mutex.release.called:
+                break
+            time.sleep(0.01)
+        self.assertTrue(mutex.release.called)
+        self.assertFalse(cache.set.called)
+        self.assertTrue(log.exception.called)
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Fastests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
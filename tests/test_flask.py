@@ -31,6 +31,8 @@ import unittest
 import sys
 import os
 
+from mock import patch
+
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
@@ -302,6 +304,57 @@ engineers need to create packages and spin them into a distribution."""
 """
         self.assertTrue(expected in output.data)
 
+    @patch('pkgdb2.query_stats.LOG')
+    def test_query_stats(self, mock_log):
+        """ Test the SQL instrumentation of the requests. """
+        create_package_acl(self.session)
+        # The first search detects the search backend of the database
+        self.app.get('/packages/g*/')
+        pkgdb2.query_stats.reset()
+
+        output = self.app.get('/packages/g*/')
+        self.assertEqual(output.status_code, 200)
+        timings = output.headers.getlist('Server-Timing')
+        self.assertEqual(len(timings), 2)
+        self.assertTrue(timings[0].startswith('db;dur='))
+        self.assertTrue(timings[1].startswith('app;dur='))
+        queries = int(timings[0].split('desc="')[1].split(' ')[0])
+        self.assertTrue(queries > 0)
+
+        endpoints = pkgdb2.query_stats.get_endpoints()
+        self.assertEqual(
+            [stat.endpoint for stat in endpoints], ['ui_ns.list_packages'])
+        self.assertEqual(endpoints[0].requests, 1)
+        self.assertEqual(endpoints[0].queries, queries)
+        self.assertFalse(mock_log.warning.called)
+        self.assertEqual(len(pkgdb2.query_stats.SLOW_REQUESTS), 0)
+
+        # Every request is slow now
+        slow = pkgdb2.APP.config['PKGDB2_SLOW_REQUEST']
+        pkgdb2.APP.config['PKGDB2_SLOW_REQUEST'] = 0
+        try:
+            output = self.app.get('/packages/g*/')
+        finally:
+            pkgdb2.APP.config['PKGDB2_SLOW_REQUEST'] = slow
+
+        self.assertTrue(mock_log.warning.called)
+        info = json.loads(mock_log.warning.call_args[0][1])
+        self.assertEqual(info['endpoint'], 'ui_ns.list_packages')
+        self.assertEqual(info['path'], '/packages/g*/?')
+        self.assertEqual(info['queries'], queries)
+        self.assertEqual(
+            len(info['slowest']),
+            min(queries, pkgdb2.APP.config['PKGDB2_SLOW_QUERIES_KEPT']))
+        self.assertEqual(
+            info['slowest'],
+            sorted(info['slowest'], key=lambda query: query['duration'],
+                   reverse=True))
+        self.assertEqual(
+            list(pkgdb2.query_stats.SLOW_REQUESTS), [info])
+
+        self.assertEqual(pkgdb2.query_stats.get_endpoints()[0].requests, 2)
+        pkgdb2.query_stats.reset()
+
     def test_is_pkg_admin(self):
         """ Test the is_pkg_admin function. """
         self.assertFalse(pkgdb2.is_pkg_admin(None, None, None, None))
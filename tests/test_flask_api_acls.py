@@ -221,6 +221,91 @@ class FlaskApiAclsTest(Modeltests):
             self.assertEqual(output.status_code, 200)
             self.assertEqual(json_out, exp)
 
+    @patch('pkgdb2.lib.utils.get_packagers')
+    @patch('pkgdb2.packager_login_required')
+    def test_acl_update_bulk(self, login_func, mock_func):
+        """ Test the api_acl_update function on several packages.  """
+        login_func.return_value = None
+        mock_func.return_value = ['pingou', 'ralph', 'toshio']
+
+        create_package_acl(self.session)
+
+        data = {
+            'pkgname': ['guake', 'geany', 'fedocal'],
+            'branches': ['f18', 'master'],
+            'acl': ['commit', 'watchcommits'],
+            'acl_status': 'Approved',
+            'user': 'toshio',
+        }
+
+        # Nothing is changed if one of the packages does not exist
+        user = FakeFasUserAdmin()
+        with user_set(APP, user):
+            output = self.app.post('/api/package/acl/', data=dict(
+                data, pkgname=['guake', 'foobar']))
+            self.assertEqual(output.status_code, 500)
+            json_out = json.loads(output.data)
+            self.assertEqual(
+                json_out,
+                {
+                    "error": "No package found by this name",
+                    "output": "notok",
+                }
+            )
+
+        # Nor if the user is not allowed to change one of them
+        user = FakeFasUser()
+        with user_set(APP, user):
+            output = self.app.post('/api/package/acl/', data=data)
+            self.assertEqual(output.status_code, 500)
+            json_out = json.loads(output.data)
+            self.assertEqual(
+                json_out['error'],
+                'You are not allowed to update ACLs of someone else.')
+
+        user = FakeFasUserAdmin()
+        with user_set(APP, user):
+            logs = self.session.query(model.Log).count()
+
+            output = self.app.post('/api/package/acl/', data=data)
+            self.assertEqual(output.status_code, 200)
+            json_out = json.loads(output.data)
+            self.assertEqual(json_out['output'], 'ok')
+            self.assertEqual(len(json_out['messages']), 12)
+            self.assertEqual(
+                json_out['messages'][0],
+                "user: admin set for toshio acl: commit of package: "
+                "guake from:  to: Approved on branch: f18")
+            self.assertEqual(
+                json_out['messages'][2],
+                "user: admin set for toshio acl: commit of package: "
+                "guake from: Awaiting Review to: Approved on branch: "
+                "master")
+            self.assertEqual(
+                json_out['messages'][11],
+                "user: admin set for toshio acl: watchcommits of "
+                "package: fedocal from:  to: Approved on branch: master")
+            self.assertEqual(
+                self.session.query(model.Log).count(), logs + 12)
+
+            acls = model.PackageListingAcl.get_acl_packager(
+                self.session, 'toshio')
+            self.assertEqual(len(acls), 12)
+            self.assertEqual(
+                set(acl.status for acl in acls), set(['Approved']))
+
+            # A second time, there is nothing to update
+            output = self.app.post('/api/package/acl/', data=data)
+            self.assertEqual(output.status_code, 200)
+            json_out = json.loads(output.data)
+            self.assertEqual(len(json_out['messages']), 12)
+            self.assertEqual(
+                json_out['messages'][0],
+                "Nothing to update on branch: f18 for acl: commit of "
+                "package: guake")
+            self.assertEqual(
+                self.session.query(model.Log).count(), logs + 12)
+
     @patch('pkgdb2.lib.utils')
     @patch('pkgdb2.packager_login_required')
     def test_acl_reassign(self, login_func, mock_func):
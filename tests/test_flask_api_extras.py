@@ -26,21 +26,120 @@ pkgdb tests for the Flask API regarding collections.
 __requires__ = ['SQLAlchemy >= 0.7']
 import pkg_resources
 
+import datetime
 import json
 import unittest
 import sys
 import os
 
+from dogpile.cache.backends.memory import MemoryBackend
+from mock import patch
+
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
 import pkgdb2
 from pkgdb2.lib import model
-from tests import (Modeltests, FakeFasUser,
+from tests import (Modeltests, FakeFasUser, FakeFasUserAdmin,
                    create_package_acl, create_package_acl2,
                    create_package_critpath)
 
 
+def _legacy_vcs_acls(session, eol=False, out_format='text'):
+    """ The /api/vcs/ output as it was built before the aggregation was
+    moved to the database, used to check the new implementation against.
+    """
+    query = session.query(
+        model.Package.name,
+        model.PackageListingAcl.fas_name,
+        model.Collection.branchname,
+    ).filter(
+        model.Package.id == model.PackageListing.package_id
+    ).filter(
+        model.PackageListingAcl.packagelisting_id == model.PackageListing.id
+    ).filter(
+        model.PackageListing.collection_id == model.Collection.id
+    ).filter(
+        model.PackageListing.status.in_(['Approved', 'Orphaned'])
+    )
+    if not eol:
+        query = query.filter(model.Collection.status != 'EOL')
+    query = query.filter(
+        model.PackageListingAcl.acl == 'commit'
+    ).filter(
+        model.PackageListingAcl.status == 'Approved'
+    ).group_by(
+        model.Package.name, model.PackageListingAcl.fas_name,
+        model.Collection.branchname,
+    ).order_by(
+        model.Package.name
+    )
+    data = query.all()
+    sub = set([(it[0], it[2]) for it in data])
+
+    query2 = session.query(
+        model.Package.name,
+        model.Collection.branchname,
+    ).filter(
+        model.Package.id == model.PackageListing.package_id
+    ).filter(
+        model.PackageListing.collection_id == model.Collection.id
+    ).filter(
+        model.PackageListing.status.in_(['Approved', 'Orphaned'])
+    ).group_by(
+        model.Package.name,
+        model.Collection.branchname,
+    )
+    if not eol:
+        query2 = query2.filter(model.Collection.status != 'EOL')
+    for entry in set(query2.all()) - sub:
+        data.append([entry[0], None, entry[1]])
+
+    packages = {}
+    for pkg in data:
+        user = None
+        group = None
+        if pkg[1] and pkg[1].startswith('group::'):
+            group = pkg[1].replace('group::', '@')
+        else:
+            user = pkg[1]
+        entry = packages.setdefault(pkg[0], {}).get(pkg[2])
+        if entry is None:
+            packages[pkg[0]][pkg[2]] = {
+                'name': pkg[0],
+                'user': user or '',
+                'group': '@provenpackager' + (',' + group if group else ''),
+                'branch': pkg[2],
+            }
+        elif user:
+            if entry['user']:
+                entry['user'] += ','
+            entry['user'] += user
+        elif group:
+            entry['group'] += ',' + group
+
+    output = []
+    if out_format == 'json':
+        output = {'packageAcls': {},
+                  'title': 'Fedora Package Database -- VCS ACLs'}
+    for package in sorted(packages):
+        for branch in sorted(packages[package]):
+            acl = packages[package][branch]
+            if out_format == 'json':
+                output['packageAcls'].setdefault(package, {})[branch] = {
+                    'commit': {
+                        'groups': acl['group'].replace('@', '').split(','),
+                        'people': acl['user'].split(',')
+                        if acl['user'] else [],
+                    }
+                }
+            else:
+                output.append(
+                    'avail | %(group)s,%(user)s | rpms/%(name)s/%(branch)s'
+                    % acl)
+    return output
+
+
 class FlaskApiExtrasTest(Modeltests):
     """ Flask API extras tests. """
 
@@ -504,6 +603,166 @@ avail | @provenpackager, | rpms/offlineimap/master"""
 
         self.assertEqual(data, expected)
 
+    def test_api_vcs_legacy(self):
+        """ Test that the api_vcs function returns exactly what the former
+        implementation did. """
+        create_package_acl2(self.session)
+
+        # Give geany/master and fedocal/f18 a mix of users and groups, added
+        # in no particular order
+        listings = [
+            model.PackageListing.by_pkgid_collectionid(
+                self.session,
+                model.Package.by_name(self.session, pkg).id,
+                model.Collection.by_name(self.session, branch).id)
+            for pkg, branch in [('geany', 'master'), ('fedocal', 'f18')]
+        ]
+        for listing in listings:
+            for fas_name, status in [
+                    ('toshio', 'Approved'),
+                    ('group::python-sig', 'Approved'),
+                    ('ralph', 'Approved'),
+                    ('group::infra-sig', 'Approved'),
+                    ('kevin', 'Awaiting Review'),
+                    ('group::kde-sig', 'Obsolete')]:
+                self.session.add(model.PackageListingAcl(
+                    fas_name=fas_name,
+                    packagelisting_id=listing.id,
+                    acl='commit',
+                    status=status,
+                ))
+                self.session.add(model.PackageListingAcl(
+                    fas_name=fas_name,
+                    packagelisting_id=listing.id,
+                    acl='watchcommits',
+                    status='Approved',
+                ))
+        model.PackageAclSnapshot.refresh(self.session)
+        self.session.commit()
+
+        intro = """# VCS ACLs
+# avail|@groups,users|rpms/Package/branch
+
+"""
+        for eol in ['', 'True']:
+            output = self.app.get('/api/vcs/?eol=%s' % eol)
+            self.assertEqual(output.status_code, 200)
+            expected = intro + '\n'.join(
+                _legacy_vcs_acls(self.session, eol=bool(eol)))
+            self.assertEqual(output.data, expected)
+
+            output = self.app.get('/api/vcs/?format=json&eol=%s' % eol)
+            self.assertEqual(output.status_code, 200)
+            self.assertEqual(
+                json.loads(output.data),
+                _legacy_vcs_acls(
+                    self.session, eol=bool(eol), out_format='json'))
+
+            # The streamed output is the same
+            output = self.app.get('/api/vcs/?stream=1&eol=%s' % eol)
+            self.assertEqual(output.status_code, 200)
+            self.assertEqual(output.data, expected)
+
+            output = self.app.get(
+                '/api/vcs/?stream=1&format=json&eol=%s' % eol)
+            self.assertEqual(output.status_code, 200)
+            self.assertEqual(
+                json.loads(output.data),
+                _legacy_vcs_acls(
+                    self.session, eol=bool(eol), out_format='json'))
+
+        output = self.app.get('/api/vcs/')
+        self.assertTrue(
+            'avail | @provenpackager,@gtk-sig,@infra-sig,@python-sig,'
+            'pingou,ralph,toshio | rpms/geany/master' in output.data)
+
+    @patch('pkgdb2.lib.utils.get_packagers')
+    def test_api_vcs_cached(self, mock_func):
+        """ Test that the api_vcs output is cached until the ACLs change.
+        """
+        mock_func.return_value = ['pingou', 'toshio']
+        create_package_acl2(self.session)
+
+        # Use an in-memory cache rather than the memcached configured
+        backend = pkgdb2.CACHE.backend
+        pkgdb2.CACHE.backend = MemoryBackend({})
+        try:
+            output = self.app.get('/api/vcs/')
+            self.assertEqual(output.status_code, 200)
+            expected = output.data
+            self.assertTrue(
+                'avail | @provenpackager,pingou,spot | rpms/guake/master'
+                in expected)
+
+            # Changes not going through pkgdb2.lib are not seen
+            listing = model.PackageListing.by_pkgid_collectionid(
+                self.session,
+                model.Package.by_name(self.session, 'guake').id,
+                model.Collection.by_name(self.session, 'master').id)
+            self.session.add(model.PackageListingAcl(
+                fas_name='ralph',
+                packagelisting_id=listing.id,
+                acl='commit',
+                status='Approved',
+            ))
+            model.PackageAclSnapshot.refresh(self.session)
+            self.session.commit()
+
+            output = self.app.get('/api/vcs/')
+            self.assertEqual(output.data, expected)
+
+            # Changes going through pkgdb2.lib invalidate the cache
+            generation = pkgdb2.lib.get_generation(self.session)
+            pkgdb2.lib.set_acl_package(
+                self.session,
+                pkg_name='guake',
+                pkg_branch='master',
+                pkg_user='toshio',
+                acl='commit',
+                status='Approved',
+                user=FakeFasUserAdmin(),
+            )
+            # The counter is only bumped when committing
+            self.assertEqual(
+                pkgdb2.lib.get_generation(self.session), generation)
+            self.session.commit()
+            self.assertEqual(
+                pkgdb2.lib.get_generation(self.session), generation + 1)
+
+            output = self.app.get('/api/vcs/')
+            self.assertNotEqual(output.data, expected)
+            self.assertTrue(
+                'avail | @provenpackager,pingou,ralph,spot,toshio | '
+                'rpms/guake/master' in output.data)
+            expected = output.data
+
+            # The changes rolled back do not invalidate the cache
+            pkgdb2.lib.set_acl_package(
+                self.session,
+                pkg_name='guake',
+                pkg_branch='master',
+                pkg_user='toshio',
+                acl='watchcommits',
+                status='Approved',
+                user=FakeFasUserAdmin(),
+            )
+            self.session.rollback()
+            self.session.commit()
+            self.assertEqual(
+                pkgdb2.lib.get_generation(self.session), generation + 1)
+
+            # Another database sharing the cache has its own entries
+            entries = len(pkgdb2.CACHE.backend._cache)
+            self.session.query(model.Generation).filter(
+                model.Generation.name == 'database'
+            ).update({model.Generation.value: model.Generation.value + 1})
+            self.session.commit()
+            output = self.app.get('/api/vcs/')
+            self.assertEqual(output.data, expected)
+            self.assertEqual(len(pkgdb2.CACHE.backend._cache), entries + 1)
+        finally:
+            pkgdb2.CACHE.backend = backend
+
     def test_api_critpath_empty(self):
         """ Test the api_critpath function with an empty database. """
 
@@ -733,6 +992,84 @@ kernel-maint"""
 
         self.assertEqual(data, expected)
 
+    def test_api_bugzilla_job(self):
+        """ Test the api_bugzilla_job function. """
+        output = self.app.get('/api/bugzilla/job/1/')
+        self.assertEqual(output.status_code, 404)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {'output': 'notok', 'error': 'No bugzilla job 1 found'})
+
+        job = model.BugzillaJob([{
+            'username': 'pingou', 'prev_poc': 'orphan',
+            'product': 'Fedora', 'component': 'guake',
+            'version': 'rawhide', 'comment': 'Reassigning'}])
+        self.session.add(job)
+        self.session.commit()
+
+        output = self.app.get('/api/bugzilla/job/%s' % job.id)
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['output'], 'ok')
+        self.assertEqual(data['job']['status'], 'Pending')
+        self.assertEqual(data['job']['finished'], None)
+        self.assertEqual(data['job']['bugs'], 0)
+        self.assertEqual(
+            data['job']['reassignments'][0]['component'], 'guake')
+
+    def test_api_changes(self):
+        """ Test the api_changes function. """
+        output = self.app.get('/api/changes/')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {'output': 'ok', 'changes': [], 'last_seq': 0, 'more': False})
+
+        output = self.app.get('/api/changes/?since=foo')
+        self.assertEqual(output.status_code, 400)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {'output': 'notok', 'error': 'Invalid since: foo'})
+
+        output = self.app.get('/api/changes/?limit=0')
+        self.assertEqual(output.status_code, 400)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {'output': 'notok', 'error': 'Invalid limit: 0'})
+
+        now = datetime.datetime.utcnow()
+        model.Change.insert_many(self.session, [
+            dict(topic='package.new', agent='pingou', change_time=now,
+                 package=name, branch='master', fas_name='pingou',
+                 new_value='Approved')
+            for name in ('guake', 'geany', 'fedocal')
+        ])
+        self.session.commit()
+        total = model.Change.last_seq(self.session)
+        self.assertEqual(total, 3)
+
+        output = self.app.get('/api/changes/?limit=2')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['output'], 'ok')
+        self.assertEqual(
+            [change['seq'] for change in data['changes']], [1, 2])
+        self.assertEqual(data['last_seq'], 2)
+        self.assertTrue(data['more'])
+        self.assertEqual(data['changes'][0]['topic'], 'package.new')
+
+        output = self.app.get('/api/changes?since=2&limit=500')
+        data = json.loads(output.data)
+        self.assertEqual(len(data['changes']), total - 2)
+        self.assertEqual(data['last_seq'], total)
+        self.assertFalse(data['more'])
+
+        output = self.app.get('/api/changes?since=%s' % total)
+        data = json.loads(output.data)
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['last_seq'], total)
+        self.assertFalse(data['more'])
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(FlaskApiExtrasTest)
@@ -36,8 +36,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(
 
 import pkgdb2
 from pkgdb2.lib import model
-from tests import (Modeltests, FakeFasUser, create_package_acl,
-                   create_package_acl2, user_set)
+from tests import (Modeltests, FakeFasUser, count_queries,
+                   create_package_acl, create_package_acl2, user_set)
 
 
 class FlaskApiPackagersTest(Modeltests):
@@ -239,6 +239,80 @@ class FlaskApiPackagersTest(Modeltests):
             output['acls'][1]['packagelist']['collection']['branchname'],
             'master')
 
+    def test_packager_acl_stream(self):
+        """ Test that the api_packager_acl function returns the same output
+        when streamed. """
+        create_package_acl(self.session)
+
+        for args in [
+                'pingou/', 'random/', 'pingou/?acls=commit',
+                'pingou/?acls=commit&poc=1', 'pingou/?limit=2&page=2',
+                'pingou/?page=30', 'pingou/?acls=commit&count=True']:
+            url = '/api/packager/acl/' + args
+            output = self.app.get(url)
+            stream = self.app.get(
+                url + ('&' if '?' in url else '?') + 'stream=1')
+            self.assertEqual(stream.status_code, output.status_code)
+            self.assertEqual(json.loads(stream.data), json.loads(output.data))
+
+    def test_packager_acl_cursor(self):
+        """ Test the api_packager_acl and api_packager_list functions with
+        the cursor-based pagination. """
+        create_package_acl(self.session)
+
+        output = self.app.get('/api/packager/acl/pingou/?limit=500')
+        expected = [
+            (acl['packagelist']['package']['name'], acl['acl'])
+            for acl in json.loads(output.data)['acls']]
+
+        acls = []
+        token = ''
+        while token is not None:
+            output = self.app.get(
+                '/api/packager/acl/pingou/?limit=3&total=1&next=%s' % token)
+            self.assertEqual(output.status_code, 200)
+            data = json.loads(output.data)
+            self.assertEqual(
+                sorted(data.keys()), ['acls', 'next', 'output', 'total'])
+            self.assertEqual(data['total'], len(expected))
+            acls.extend(
+                (acl['packagelist']['package']['name'], acl['acl'])
+                for acl in data['acls'])
+            token = data['next']
+        self.assertEqual(acls, expected)
+
+        output = self.app.get('/api/packager/acl/random/?next=')
+        self.assertEqual(output.status_code, 404)
+
+        output = self.app.get('/api/packager/acl/pingou/?next=foo')
+        self.assertEqual(output.status_code, 500)
+
+        packagers = []
+        token = ''
+        while token is not None:
+            output = self.app.get('/api/packagers/?limit=1&next=%s' % token)
+            self.assertEqual(output.status_code, 200)
+            data = json.loads(output.data)
+            packagers.extend(data['packagers'])
+            token = data['next']
+        output = self.app.get('/api/packagers/')
+        self.assertEqual(packagers, json.loads(output.data)['packagers'])
+
+    def test_packager_acl_queries(self):
+        """ Test that the number of SQL queries run by the api_packager_acl
+        function does not depend on the number of ACLs returned. """
+        create_package_acl(self.session)
+        self.app.get('/api/packager/acl/pingou/')
+
+        counts = []
+        for limit in [1, 2, 500]:
+            with count_queries() as queries:
+                output = self.app.get(
+                    '/api/packager/acl/pingou/?limit=%s' % limit)
+            self.assertEqual(output.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1)
+
     def test_packager_list(self):
         """ Test the api_packager_list function.  """
 
@@ -369,6 +443,59 @@ class FlaskApiPackagersTest(Modeltests):
         self.assertEqual(output['master']['point of contact'], 0)
         self.assertEqual(output['master']['co-maintainer'], 0)
 
+    def test_packagers_stats(self):
+        """ Test the api_packagers_stats function.  """
+
+        output = self.app.get('/api/packagers/stats/')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                "output": "notok",
+                "error": "Invalid request",
+            }
+        )
+
+        create_package_acl(self.session)
+
+        with count_queries() as queries:
+            output = self.app.get(
+                '/api/packagers/stats/?packagername=pingou,toshio'
+                '&packagername=random')
+        # The collections and the counts
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['output'], 'ok')
+        self.assertEqual(
+            sorted(data['packagers']), ['pingou', 'random', 'toshio'])
+        self.assertEqual(
+            data['packagers']['pingou'],
+            {
+                'el6': {'point of contact': 0, 'co-maintainer': 0},
+                'f17': {'point of contact': 0, 'co-maintainer': 0},
+                'f18': {'point of contact': 1, 'co-maintainer': 0},
+                'master': {'point of contact': 1, 'co-maintainer': 0},
+            }
+        )
+        self.assertEqual(
+            data['packagers']['random'],
+            {
+                'el6': {'point of contact': 0, 'co-maintainer': 0},
+                'f17': {'point of contact': 0, 'co-maintainer': 0},
+                'f18': {'point of contact': 0, 'co-maintainer': 0},
+                'master': {'point of contact': 0, 'co-maintainer': 0},
+            }
+        )
+
+        output = self.app.get(
+            '/api/packagers/stats/?packagername=pingou&eol=True')
+        data = json.loads(output.data)
+        self.assertEqual(
+            sorted(data['packagers']['pingou']),
+            ['el4', 'el6', 'f17', 'f18', 'master'])
+
     def test_packager_package(self):
         """ Test the api_packager_package function.  """
 
@@ -458,6 +585,30 @@ class FlaskApiPackagersTest(Modeltests):
 
         self.assertEqual(output['co-maintained'][0]['name'], 'guake')
 
+    def test_packager_complete(self):
+        """ Test the api_packager_complete function.  """
+        pkgdb2.lib.complete.INDEX.reset()
+
+        output = self.app.get('/api/complete/packagers/?q=p')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data, {'output': 'ok', 'packagers': []})
+
+        create_package_acl(self.session)
+        pkgdb2.lib.complete.INDEX.reset()
+
+        output = self.app.get('/api/complete/packagers?q=P')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data, {'output': 'ok', 'packagers': ['pingou']})
+
+        output = self.app.get('/api/complete/packagers/?limit=2')
+        data = json.loads(output.data)
+        self.assertEqual(data['packagers'], ['dodji', 'group::gtk-sig'])
+
+        output = self.app.get('/api/complete/packagers/?q=group::')
+        data = json.loads(output.data)
+        self.assertEqual(data['packagers'], ['group::gtk-sig'])
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(FlaskApiPackagersTest)
@@ -40,8 +40,8 @@ import pkgdb2
 from pkgdb2 import lib as pkgdblib
 from pkgdb2.lib import model
 from tests import (Modeltests, FakeFasUser, FakeFasUserAdmin,
-                   create_collection, create_package, create_package_acl,
-                   create_package_critpath, user_set)
+                   count_queries, create_collection, create_package,
+                   create_package_acl, create_package_critpath, user_set)
 
 
 class FlaskApiPackagesTest(Modeltests):
@@ -909,6 +909,40 @@ class FlaskApiPackagesTest(Modeltests):
             }
         )
 
+        output = self.app.get(
+            '/api/package/guake/?branches=master'
+            '&fields=point_of_contact,package.name&fields=collection')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(len(data['packages']), 1)
+        self.assertEqual(
+            set(data['packages'][0].keys()),
+            set(['point_of_contact', 'package', 'collection']))
+        self.assertEqual(data['packages'][0]['package'], {'name': 'guake'})
+        self.assertEqual(data['packages'][0]['collection']['branchname'],
+                         'master')
+
+        # The ACLs are not loaded if they are not requested
+        with count_queries() as queries:
+            output = self.app.get(
+                '/api/package/guake/?fields=status,collection.branchname')
+        self.assertEqual(len(queries), 1)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['packages'],
+            [
+                {'status': 'Approved', 'collection': {'branchname': 'f18'}},
+                {'status': 'Approved',
+                 'collection': {'branchname': 'master'}},
+            ]
+        )
+
+        output = self.app.get('/api/package/guake/?fields=acls,foo')
+        self.assertEqual(output.status_code, 400)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {'output': 'notok', 'error': 'Invalid fields: foo'})
+
     def test_api_package_list(self):
         """ Test the api_package_list function.  """
 
@@ -1055,6 +1089,184 @@ class FlaskApiPackagesTest(Modeltests):
         self.assertEqual(data['output'], 'notok')
         self.assertEqual(data['packages'], [])
 
+    def test_api_package_complete(self):
+        """ Test the api_package_complete function.  """
+        pkgdb2.lib.complete.INDEX.reset()
+        create_package_acl(self.session)
+
+        output = self.app.get('/api/complete/packages/?q=G')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data, {'output': 'ok', 'packages': ['geany', 'guake']})
+
+        output = self.app.get('/api/complete/packages?q=g&limit=1')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], ['geany'])
+
+        output = self.app.get('/api/complete/packages/')
+        data = json.loads(output.data)
+        self.assertEqual(
+            data['packages'], ['fedocal', 'geany', 'guake', 'offlineimap'])
+
+        output = self.app.get('/api/complete/packages/?q=foo')
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], [])
+
+        # The names are served from memory
+        with count_queries() as queries:
+            output = self.app.get('/api/complete/packages/?q=gu')
+        self.assertEqual(queries, [])
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], ['guake'])
+
+        # New packages are seen once the generation changed
+        package = pkgdblib.model.Package(
+            name='gummi', summary='LaTeX editor', description='LaTeX',
+            status='Approved', review_url=None, upstream_url=None)
+        self.session.add(package)
+        pkgdblib.model.Generation.bump(self.session, 'acls')
+        self.session.commit()
+
+        output = self.app.get('/api/complete/packages/?q=gu')
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], ['guake'])
+
+        interval = pkgdb2.APP.config.get('PKGDB2_COMPLETE_CHECK_INTERVAL')
+        pkgdb2.APP.config['PKGDB2_COMPLETE_CHECK_INTERVAL'] = 0
+        try:
+            output = self.app.get('/api/complete/packages/?q=gu')
+        finally:
+            pkgdb2.APP.config['PKGDB2_COMPLETE_CHECK_INTERVAL'] = interval
+        data = json.loads(output.data)
+        self.assertEqual(data['packages'], ['guake', 'gummi'])
+
+    def test_api_package_list_stream(self):
+        """ Test that the api_package_list function returns the same output
+        when streamed. """
+        create_package_acl(self.session)
+        create_package_critpath(self.session)
+
+        for args in [
+                'guake/', 'g*/', 'g*/?acls=1', 'g*/?branches=master',
+                'g*/?branches=master&branches=f18&status=Approved',
+                'g*/?limit=1&page=2', 'g*/?page=3', 'g*/?orphaned=True',
+                'g*/?page=abc', 'g*/?count=True']:
+            url = '/api/packages/' + args
+            output = self.app.get(url)
+            stream = self.app.get(
+                url + ('&' if '?' in url else '?') + 'stream=1')
+            self.assertEqual(stream.status_code, output.status_code)
+            data = json.loads(output.data)
+            stream_data = json.loads(stream.data)
+            if 'packages' in data and isinstance(data['packages'], list):
+                for out in [data, stream_data]:
+                    out['packages'].sort(key=lambda pkg: pkg['name'])
+            self.assertEqual(stream_data, data)
+
+        # The limit is not capped when streaming
+        output = self.app.get('/api/packages/*/?limit=1000&stream=1')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(len(data['packages']), 5)
+        self.assertEqual(data['page_total'], 1)
+
+        # The limit is only left uncapped for the outputs streamed
+        with pkgdb2.APP.test_request_context('/?limit=1000&stream=1'):
+            self.assertEqual(pkgdb2.api.get_limit(), 500)
+            self.assertEqual(pkgdb2.api.get_limit(stream=True), 1000)
+
+        # The listings and ACLs of the packages are loaded by batches
+        url = '/api/packages/*/?branches=master&stream=1'
+        with count_queries() as queries:
+            output = self.app.get(url)
+            nb_packages = len(json.loads(output.data)['packages'])
+        nb_queries = len(queries)
+        with count_queries() as queries:
+            output = self.app.get(url + '&acls=1')
+            data = json.loads(output.data)
+        self.assertEqual(len(data['packages']), nb_packages)
+        self.assertTrue(all(pkg['acls'] for pkg in data['packages']))
+        self.assertEqual(len(queries), nb_queries + 2)
+
+    def test_api_package_list_cursor(self):
+        """ Test the api_package_list function with the cursor-based
+        pagination. """
+        create_package_acl(self.session)
+        create_package_critpath(self.session)
+
+        for args in ['', '&branches=master&branches=f18']:
+            output = self.app.get('/api/packages/*/?limit=500' + args)
+            expected = sorted(
+                pkg['name'] for pkg in json.loads(output.data)['packages'])
+            self.assertEqual(len(expected), 5)
+
+            names = []
+            url = '/api/packages/*/?limit=2&next=%s' + args
+            token = ''
+            while token is not None:
+                output = self.app.get(url % token)
+                self.assertEqual(output.status_code, 200)
+                data = json.loads(output.data)
+                self.assertEqual(
+                    sorted(data.keys()), ['next', 'output', 'packages'])
+                self.assertTrue(len(data['packages']) <= 2)
+                names.extend(pkg['name'] for pkg in data['packages'])
+                token = data['next']
+            self.assertEqual(names, expected)
+
+        output = self.app.get('/api/packages/g*/?next=&total=1&limit=1')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.data)
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(len(data['packages']), 1)
+        self.assertNotEqual(data['next'], None)
+
+        output = self.app.get('/api/packages/foo*/?next=')
+        self.assertEqual(output.status_code, 404)
+        data = json.loads(output.data)
+        self.assertEqual(
+            data,
+            {
+                "error": "No packages found for these parameters",
+                "next": None,
+                "packages": [],
+                "output": "notok",
+            }
+        )
+
+        output = self.app.get('/api/packages/g*/?next=foobar')
+        self.assertEqual(output.status_code, 500)
+        data = json.loads(output.data)
+        self.assertEqual(data['error'], 'Invalid cursor provided')
+
+    def test_api_package_queries(self):
+        """ Test that the number of SQL queries run by the api_package_list
+        and api_package_info functions does not depend on the number of
+        packages, branches or ACLs returned. """
+        create_package_acl(self.session)
+        create_package_critpath(self.session)
+        self.app.get('/api/packages/*/')
+
+        counts = []
+        for limit in [1, 2, 500]:
+            with count_queries() as queries:
+                output = self.app.get(
+                    '/api/packages/*/?acls=1&limit=%s' % limit)
+            self.assertEqual(output.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1)
+        self.assertTrue(counts[0] <= 5)
+
+        counts = []
+        for pkg in ['offlineimap', 'guake', 'geany']:
+            with count_queries() as queries:
+                output = self.app.get('/api/package/%s/' % pkg)
+            self.assertEqual(output.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1)
+
     @patch('pkgdb2.lib.utils')
     @patch('pkgdb2.is_admin')
     def test_api_package_edit(self, login_func, mock_func):
@@ -27,6 +27,7 @@ __requires__ = ['SQLAlchemy >= 0.7']
 import pkg_resources
 
 import json
+import re
 import unittest
 import sys
 import os
@@ -70,6 +71,30 @@ class FlaskUiAdminTest(Modeltests):
             self.assertEqual(output.status_code, 200)
             self.assertTrue('<h1>Admin interface</h1>' in output.data)
 
+    @patch('pkgdb2.is_admin')
+    def test_admin_queries(self, login_func):
+        """ Test the admin_queries function. """
+        login_func.return_value = None
+        pkgdb2.query_stats.reset()
+
+        user = FakeFasUserAdmin()
+        with user_set(pkgdb2.APP, user):
+            output = self.app.get('/admin/queries/')
+            self.assertEqual(output.status_code, 200)
+            self.assertTrue('<h1>SQL queries</h1>' in output.data)
+            self.assertTrue('<p>No requests recorded.</p>' in output.data)
+
+            self.app.get('/admin/log/')
+            output = self.app.get('/admin/queries/')
+            self.assertEqual(output.status_code, 200)
+            self.assertTrue('<td>ui_ns.admin_log</td>' in output.data)
+            self.assertTrue('<td>ui_ns.admin_queries</td>' in output.data)
+            self.assertTrue(
+                '<p>No slow requests recorded.</p>' in output.data)
+            self.assertTrue('<h2>Connection pools</h2>' in output.data)
+            self.assertTrue('<h2>Notification outbox</h2>' in output.data)
+        pkgdb2.query_stats.reset()
+
     @patch('pkgdb2.is_admin')
     def test_admin_log(self, login_func):
         """ Test the admin_log function. """
@@ -110,6 +135,40 @@ class FlaskUiAdminTest(Modeltests):
                 '<p class=\'error\'>No logs found in the database.</p>'
                 in output.data)
 
+    @patch('pkgdb2.is_admin')
+    def test_admin_log_cursor(self, login_func):
+        """ Test the admin_log function with the cursor-based pagination.
+        """
+        login_func.return_value = None
+        create_package_acl(self.session)
+        for cnt in range(5):
+            model.Log.insert(
+                self.session, 'pingou', None, 'log entry %s' % cnt)
+        self.session.commit()
+
+        user = FakeFasUserAdmin()
+        with user_set(pkgdb2.APP, user):
+            output = self.app.get('/admin/log/?limit=3&next=')
+            self.assertEqual(output.status_code, 200)
+            self.assertTrue('log entry 4' in output.data)
+            self.assertTrue('log entry 2' in output.data)
+            self.assertFalse('log entry 1' in output.data)
+            self.assertFalse('1 / ' in output.data)
+
+            # The token encodes a JSON list starting with a string: ["
+            token = re.search(r'next=(WyI[^"&]+)', output.data).group(1)
+            output = self.app.get('/admin/log/?limit=3&next=%s' % token)
+            self.assertEqual(output.status_code, 200)
+            self.assertFalse('log entry 2' in output.data)
+            self.assertTrue('log entry 1' in output.data)
+            self.assertTrue('log entry 0' in output.data)
+
+            output = self.app.get('/admin/log/?next=foo')
+            self.assertEqual(output.status_code, 200)
+            self.assertTrue(
+                '<li class="errors">Invalid cursor provided</li>'
+                in output.data)
+
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(FlaskUiAdminTest)
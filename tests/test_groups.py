@@ -113,6 +113,7 @@ class PkgdbGrouptests(Modeltests):
         )
         self.session.add(packager)
 
+        model.PackageAclSnapshot.refresh(self.session)
         self.session.commit()
 
     def test_api_bugzilla_group(self):
@@ -27,6 +27,7 @@ __requires__ = ['SQLAlchemy >= 0.7']
 import pkg_resources
 
 import mock
+import threading
 import unittest
 import sys
 import os
@@ -45,7 +46,8 @@ from tests import (FakeFasUser, FakeFasUserAdmin, Modeltests,
                    FakeFasGroupValid, FakeFasGroupInvalid,
                    create_collection, create_package,
                    create_package_listing, create_package_acl,
-                   create_package_acl2, create_package_critpath)
+                   create_package_acl2, create_package_critpath,
+                   count_queries, DB_PATH)
 
 
 class PkgdbLibtests(Modeltests):
@@ -242,6 +244,70 @@ class PkgdbLibtests(Modeltests):
         pkg_acl = pkgdblib.get_acl_package(self.session, 'guake', 'unknown')
         self.assertEqual(pkg_acl, [])
 
+        # The branches are filtered by the query loading the listings
+        with count_queries() as queries:
+            pkg_acl = pkgdblib.get_acl_package(
+                self.session, 'guake', ['master', 'unknown'],
+                load='listing_acls')
+            self.assertEqual(
+                [(pkg.collection.branchname, pkg.package.name, len(pkg.acls))
+                 for pkg in pkg_acl],
+                [('master', 'guake', 5)])
+        self.assertEqual(len(queries), 2)
+
+        # The listings of the EOL collections are filtered out
+        collection = pkgdblib.model.Collection.by_name(self.session, 'f18')
+        collection.status = 'EOL'
+        self.session.add(collection)
+        self.session.commit()
+        pkg_acl = pkgdblib.get_acl_package(self.session, 'guake')
+        self.assertEqual(
+            [pkg.collection.branchname for pkg in pkg_acl], ['master'])
+        pkg_acl = pkgdblib.get_acl_package(self.session, 'guake', eol=True)
+        self.assertEqual(
+            [pkg.collection.branchname for pkg in pkg_acl], ['f18', 'master'])
+
+    def test_get_package_page(self):
+        """ Test the get_package_page function. """
+        create_package_acl(self.session)
+        # Load the reference data
+        pkgdblib.get_status(self.session)
+
+        with count_queries() as queries:
+            page = pkgdblib.get_package_page(self.session, 'guake')
+            self.assertEqual(page['package'].name, 'guake')
+            self.assertEqual(
+                [(pkg.collection.branchname, len(pkg.acls))
+                 for pkg in page['listings']],
+                [('master', 5), ('f18', 2)])
+        # The listings with their package and collection and their ACLs,
+        # the ACLs available are kept in memory
+        self.assertEqual(len(queries), 2)
+
+        self.assertEqual(page['branches'], set(['Fedora devel', 'Fedora 18']))
+        self.assertEqual(page['statuses'], set(['Approved']))
+        self.assertEqual(
+            page['pocs'], {'pingou': set(['Fedora devel', 'Fedora 18'])})
+        self.assertEqual(page['admins'], {'pingou': set(['Fedora devel'])})
+        self.assertEqual(
+            page['pending_admins'], {'ralph': set(['Fedora devel'])})
+        self.assertEqual(page['committers'], ['pingou', 'pingou'])
+        self.assertEqual(
+            page['commit_acls']['toshio'],
+            {'Fedora devel': {
+                'commit': 'Awaiting Review', 'watchcommits': None,
+                'watchbugzilla': None, 'approveacls': None}})
+        self.assertEqual(
+            page['watch_acls']['pingou']['Fedora 18'],
+            {'commit': None, 'watchcommits': 'Approved',
+             'watchbugzilla': None, 'approveacls': None})
+
+        # Package does not exist
+        self.assertRaises(NoResultFound,
+                          pkgdblib.get_package_page,
+                          self.session,
+                          'test')
+
     def test_set_acl_package(self):
         """ Test the set_acl_package function. """
         self.test_add_package()
@@ -742,6 +808,71 @@ class PkgdbLibtests(Modeltests):
                           page='a'
                           )
 
+    def test_search_package_backends(self):
+        """ Test the search_package function with each search backend. """
+        create_package_listing(self.session)
+        model = pkgdblib.model
+
+        detected = pkgdblib.search.detect_backend(self.session.get_bind())
+        if model._has_search_support(None, None, self.session.get_bind()):
+            self.assertEqual(detected.name, 'fts5')
+        else:
+            self.assertEqual(detected.name, 'like')
+
+        def search(pattern, **kwargs):
+            """ Return the name of the packages found. """
+            return [
+                pkg.name for pkg in pkgdblib.search_package(
+                    self.session, pattern, eol=True, **kwargs)
+            ]
+
+        backend = pkgdb2.APP.config.get('PKGDB2_SEARCH_BACKEND', 'auto')
+        try:
+            for name in set(['like', detected.name]):
+                pkgdb2.APP.config['PKGDB2_SEARCH_BACKEND'] = name
+
+                # Prefix, infix and case insensitive searches
+                self.assertEqual(search('g*'), ['geany', 'guake'])
+                self.assertEqual(
+                    search('*a*'),
+                    ['fedocal', 'geany', 'guake', 'offlineimap'])
+                self.assertEqual(
+                    search('*OCAL', case_sensitive=False), ['fedocal'])
+
+                # Searching the summary
+                self.assertEqual(search('*calendar*'), [])
+                self.assertEqual(
+                    search('*calendar*', mode='summary'), ['fedocal'])
+
+                # Ranking: prefix first, then shortest names
+                self.assertEqual(
+                    search('*e*', rank=True),
+                    ['geany', 'guake', 'fedocal', 'offlineimap'])
+                self.assertEqual(
+                    search('*g*', rank=True), ['geany', 'guake'])
+                self.assertEqual(
+                    pkgdblib.search_package(
+                        self.session, '*ca*', eol=True, rank=True,
+                        count=True),
+                    1)
+
+                self.assertRaises(
+                    pkgdblib.PkgdbException, search, '*', mode='foo')
+                self.assertRaises(
+                    pkgdblib.PkgdbException, search, '*', rank=True,
+                    after='guake')
+
+            # The search index follows the changes to the packages
+            pkgdb2.APP.config['PKGDB2_SEARCH_BACKEND'] = 'auto'
+            package = model.Package.by_name(self.session, 'guake')
+            package.name = 'guake-terminal'
+            self.session.add(package)
+            self.session.commit()
+            self.assertEqual(search('*terminal'), ['guake-terminal'])
+            self.assertEqual(search('guake'), [])
+        finally:
+            pkgdb2.APP.config['PKGDB2_SEARCH_BACKEND'] = backend
+
     def test_update_pkg_status(self):
         """ Test the update_pkg_status function. """
         create_package_acl(self.session)
@@ -1003,6 +1134,66 @@ class PkgdbLibtests(Modeltests):
         collection = pkgdblib.model.Collection.by_name(self.session, 'f18')
         self.assertEqual(collection.status, 'EOL')
 
+    @mock.patch('pkgdb2.lib.utils.set_bugzilla_owner')
+    @mock.patch('pkgdb2.lib.utils.get_packagers')
+    def test_package_acl_snapshot(self, mock_func, mock_bz):
+        """ Test that the mutations of pkgdblib keep the PackageAclSnapshot
+        table in sync with the data it is built from. """
+        mock_func.return_value = ['pingou', 'toshio']
+        create_package_acl(self.session)
+
+        def get_snapshot():
+            """ Return the content of the snapshot table. """
+            snapshot = pkgdblib.model.PackageAclSnapshot
+            return sorted(
+                (row.package_name, row.branchname, row.collection_status,
+                 row.point_of_contact, row.pkglist_status, row.fas_name,
+                 row.acl, row.acl_status)
+                for row in self.session.query(snapshot).all()
+            )
+
+        snapshot = get_snapshot()
+        # geany on f18 has no ACLs but is in the snapshot
+        self.assertTrue(
+            ('geany', 'f18', 'Active', 'pingou', 'Approved', None, None,
+             None) in snapshot)
+        self.assertTrue(
+            ('guake', 'master', 'Under Development', 'pingou', 'Approved',
+             'toshio', 'commit', 'Awaiting Review') in snapshot)
+
+        pkgdblib.set_acl_package(
+            self.session,
+            pkg_name='guake',
+            pkg_branch='master',
+            pkg_user='toshio',
+            acl='commit',
+            status='Approved',
+            user=FakeFasUserAdmin(),
+        )
+        pkgdblib.update_pkg_poc(
+            self.session,
+            pkg_name='geany',
+            pkg_branch='f18',
+            pkg_poc='toshio',
+            user=FakeFasUserAdmin(),
+        )
+        pkgdblib.update_collection_status(
+            self.session, 'f18', 'EOL', user=FakeFasUserAdmin())
+        self.session.commit()
+
+        snapshot = get_snapshot()
+        self.assertTrue(
+            ('guake', 'master', 'Under Development', 'pingou', 'Approved',
+             'toshio', 'commit', 'Approved') in snapshot)
+        self.assertTrue(
+            ('geany', 'f18', 'EOL', 'toshio', 'Approved', None, None,
+             None) in snapshot)
+
+        # The incremental refreshes match a full rebuild
+        pkgdblib.model.PackageAclSnapshot.refresh(self.session)
+        self.session.commit()
+        self.assertEqual(get_snapshot(), snapshot)
+
     def test_search_packagers(self):
         """ Test the search_packagers function. """
         pkg = pkgdblib.search_packagers(self.session, 'pin*')
@@ -1183,6 +1374,211 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(obs['pkg_acl'], pkg_acl)
         self.assertEqual(obs['acl_status'], acl_status)
 
+    def test_reference_data(self):
+        """ Test the reference data kept in memory. """
+        create_package_acl(self.session)
+        registry = pkgdblib.reference.REGISTRY
+        interval = pkgdb2.APP.config.get('PKGDB2_REFERENCE_CHECK_INTERVAL')
+        pkgdb2.APP.config['PKGDB2_REFERENCE_CHECK_INTERVAL'] = 3600
+        try:
+            pkgdblib.get_status(self.session)
+            with count_queries() as queries:
+                status = pkgdblib.get_status(self.session)
+                collection = registry.get_collection(self.session, 'f18')
+            self.assertEqual(queries, [])
+            self.assertEqual(
+                status['clt_status'], ['Active', 'EOL', 'Under Development'])
+            self.assertEqual(collection.version, '18')
+            self.assertEqual(
+                registry.get_collection_by_id(self.session, collection.id),
+                collection)
+
+            # The lists returned are copies
+            status['clt_status'].append('Foo')
+            self.assertEqual(
+                pkgdblib.get_status(self.session, 'clt_status'),
+                {'clt_status': ['Active', 'EOL', 'Under Development']})
+
+            self.assertRaises(
+                NoResultFound, registry.get_collection, self.session, 'f42')
+
+            # The listings are sorted without loading their collection
+            package = pkgdblib.model.Package.by_name(self.session, 'guake')
+            with count_queries() as queries:
+                self.assertEqual(
+                    [lst.collection_id for lst in package.sorted_listings],
+                    [registry.get_collection(self.session, branch).id
+                     for branch in ['master', 'f18']])
+            self.assertEqual(len(queries), 1)
+
+            # The changes made through the library are seen at once
+            pkgdblib.add_collection(
+                self.session,
+                clt_name='Fedora',
+                clt_version='19',
+                clt_status='Active',
+                clt_branchname='f19',
+                clt_disttag='.fc19',
+                clt_koji_name='f19',
+                user=FakeFasUserAdmin(),
+            )
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19').status,
+                'Active')
+            self.session.commit()
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19').status,
+                'Active')
+
+            pkgdblib.update_collection_status(
+                self.session, 'f19', 'Under Development',
+                user=FakeFasUserAdmin())
+            self.session.commit()
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19').status,
+                'Under Development')
+
+            collection = pkgdblib.model.Collection.by_name(
+                self.session, 'f19')
+            pkgdblib.edit_collection(
+                self.session, collection, clt_branchname='f19_b',
+                user=FakeFasUserAdmin())
+            self.session.rollback()
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19').branchname,
+                'f19')
+            pkgdblib.edit_collection(
+                self.session, collection, clt_branchname='f19_b',
+                user=FakeFasUserAdmin())
+            self.session.commit()
+            self.assertRaises(
+                NoResultFound, registry.get_collection, self.session, 'f19')
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19_b').version, '19')
+
+            # The changes made by another process are seen once the interval
+            # is over
+            table = pkgdblib.model.Collection.__table__
+            self.session.execute(table.update().where(
+                table.c.branchname == 'f19_b').values(status='EOL'))
+            pkgdblib.model.Generation.bump(self.session, 'collections')
+            self.session.commit()
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19_b').status,
+                'Under Development')
+
+            # or at once when checking what a user is allowed to do, with a
+            # single query if nothing changed
+            self.assertEqual(
+                registry.get_collection(
+                    self.session, 'f19_b', force=True).status, 'EOL')
+            with count_queries() as queries:
+                registry.get_collection(self.session, 'f19_b', force=True)
+            self.assertEqual(len(queries), 1)
+
+            self.session.execute(table.update().where(
+                table.c.branchname == 'f18').values(
+                    status='Under Development'))
+            pkgdblib.model.Generation.bump(self.session, 'collections')
+            self.session.commit()
+            with mock.patch('pkgdb2.lib.utils.set_bugzilla_owner'):
+                pkgdblib.update_pkg_status(
+                    self.session,
+                    pkg_name='guake',
+                    pkg_branch='f18',
+                    status='Retired',
+                    user=FakeFasUser(),
+                )
+            self.session.rollback()
+
+            self.session.execute(table.update().where(
+                table.c.branchname == 'f19_b').values(status='Active'))
+            pkgdblib.model.Generation.bump(self.session, 'collections')
+            self.session.commit()
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19_b').status, 'EOL')
+            pkgdb2.APP.config['PKGDB2_REFERENCE_CHECK_INTERVAL'] = 0
+            self.assertEqual(
+                registry.get_collection(self.session, 'f19_b').status,
+                'Active')
+        finally:
+            pkgdb2.APP.config['PKGDB2_REFERENCE_CHECK_INTERVAL'] = interval
+
+    def test_get_packager_stats(self):
+        """ Test the get_packager_stats function. """
+        create_package_acl2(self.session)
+        packagers = ['pingou', 'toshio', 'spot', 'group::gtk-sig', 'random']
+
+        stats = pkgdblib.get_packager_stats(self.session, packagers)
+        self.assertEqual(sorted(stats), sorted(packagers))
+        for packager in packagers:
+            self.assertEqual(
+                sorted(stats[packager]), ['el6', 'f17', 'f18', 'master'])
+            for branch in stats[packager]:
+                for poc, key in [
+                        (True, 'point of contact'),
+                        (False, 'co-maintainer')]:
+                    self.assertEqual(
+                        stats[packager][branch][key],
+                        len(pkgdblib.get_package_maintained(
+                            self.session, packager, poc=poc,
+                            branch=branch)))
+        self.assertEqual(
+            stats['pingou']['master'],
+            {'point of contact': 1, 'co-maintainer': 1})
+
+        self.assertEqual(
+            pkgdblib.get_packager_stats(self.session, 'pingou')['pingou'],
+            stats['pingou'])
+        self.assertEqual(pkgdblib.get_packager_stats(self.session, []), {})
+
+    def test_readmodel(self):
+        """ Test that the read-only records are serialized as the objects
+        of the model. """
+        readmodel = pkgdblib.readmodel
+        create_package_acl2(self.session)
+
+        acls = pkgdblib.get_acl_packager(
+            self.session, 'pingou', load='acl_listing')
+        rows = pkgdblib.get_acl_packager(self.session, 'pingou', load='rows')
+        self.assertTrue(len(acls) > 1)
+        self.assertEqual(
+            [readmodel.acl_to_json(row) for row in rows],
+            [acl.to_json() for acl in acls])
+        self.assertEqual(rows[0].listing.collection.branchname, 'f18')
+
+        rows = pkgdblib.get_acl_packager(
+            self.session, 'pingou', page=2, limit=1, load='rows')
+        self.assertEqual(
+            [readmodel.acl_to_json(row) for row in rows],
+            [acls[1].to_json()])
+        rows = pkgdblib.get_acl_packager(
+            self.session, 'pingou', stream=True, load='rows')
+        self.assertEqual(
+            [readmodel.acl_to_json(row) for row in rows],
+            [acl.to_json() for acl in acls])
+
+        def sort_listings(output):
+            """ The order of the listings of a package is not defined. """
+            for pkg in output:
+                pkg['acls'].sort(
+                    key=lambda listing: listing['collection']['branchname'])
+            return output
+
+        packages = pkgdblib.search_package(self.session, '*')
+        rows = pkgdblib.search_package(self.session, '*', load='rows')
+        self.assertEqual([row.name for row in rows],
+                         [pkg.name for pkg in packages])
+        for branches in [None, ['master'], ['master', 'el4']]:
+            for acls in [False, True]:
+                self.assertEqual(
+                    sort_listings(readmodel.packages_to_json(
+                        self.session, rows, acls=acls, branches=branches)),
+                    sort_listings([
+                        pkg.to_json(acls=acls, collection=branches,
+                                    package=False)
+                        for pkg in packages]))
+
     def test_get_package_maintained(self):
         """ Test the get_package_maintained function. """
         create_package_acl(self.session)
@@ -1320,6 +1716,106 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(
             top, [(u'pingou', 3), (u'group::gtk-sig', 1), (u'josef', 1)])
 
+    @mock.patch('pkgdb2.lib.utils.set_bugzilla_owner')
+    @mock.patch('pkgdb2.lib.utils.get_packagers')
+    def test_stats_rollups(self, mock_func, mock_bz):
+        """ Test that the statistics rollups follow the changes made to
+        the packages and collections. """
+        mock_func.return_value = ['pingou', 'toshio']
+        create_package_acl(self.session)
+        model = pkgdblib.model
+
+        def check():
+            """ Compare the rollups to the aggregates computed live. """
+            self.assertEqual(
+                sorted(pkgdblib.get_top_maintainers(self.session, 100)),
+                sorted(model.PackageListingAcl.get_top_maintainers(
+                    self.session, 100)))
+            self.assertEqual(
+                sorted(pkgdblib.get_top_poc(self.session, 100)),
+                sorted(model.PackageListing.get_top_poc(self.session, 100)))
+            self.assertEqual(
+                pkgdblib.count_collection(self.session),
+                model.Package.count_collection(self.session))
+
+        check()
+        self.assertEqual(
+            pkgdblib.get_top_poc(self.session),
+            [(u'pingou', 3), (u'group::gtk-sig', 1), (u'josef', 1)])
+
+        pkgdblib.update_pkg_poc(
+            self.session, 'guake', 'f18', 'toshio',
+            user=FakeFasUserAdmin())
+        check()
+        self.assertEqual(
+            pkgdblib.get_top_poc(self.session),
+            [(u'pingou', 3), (u'group::gtk-sig', 1), (u'josef', 1),
+             (u'toshio', 1)])
+
+        pkgdblib.update_pkg_status(
+            self.session, 'fedocal', 'master', 'Orphaned',
+            user=FakeFasUserAdmin())
+        check()
+
+        # The rollups are updated with the rows changed, not recomputed
+        with count_queries() as queries:
+            pkgdblib.set_acl_package(
+                self.session, 'guake', 'master', 'toshio', 'commit',
+                'Approved', user=FakeFasUserAdmin())
+        self.assertFalse([
+            query for query in queries
+            if 'count(' in query.lower() and 'Stats' in query])
+        check()
+
+        collection = pkgdblib.search_collection(self.session, 'f18')[0]
+        pkgdblib.edit_collection(
+            self.session, collection, clt_status='EOL',
+            user=FakeFasUserAdmin())
+        check()
+
+        for version, bulk in (('19', False), ('20', True)):
+            self.session.add(model.Collection(
+                name='Fedora',
+                version=version,
+                status='Active',
+                owner='toshio',
+                branchname='f%s' % version,
+                dist_tag='.fc%s' % version,
+            ))
+            self.session.commit()
+            pkgdblib.add_branch(
+                self.session, 'master', 'f%s' % version,
+                user=FakeFasUserAdmin(), bulk=bulk)
+            self.session.commit()
+            check()
+
+        pkgdblib.update_pkg_poc(
+            self.session, 'guake', 'f19', 'toshio',
+            user=FakeFasUserAdmin())
+        check()
+        collection = pkgdblib.search_collection(self.session, 'master')[0]
+        pkgdblib.edit_collection(
+            self.session, collection, clt_status='EOL',
+            user=FakeFasUserAdmin())
+        check()
+
+        # Rebuilding from scratch gives the same result
+        before = (
+            pkgdblib.get_top_maintainers(self.session),
+            pkgdblib.get_top_poc(self.session),
+            pkgdblib.count_collection(self.session),
+            pkgdblib.count_fedora_collection(self.session),
+        )
+        pkgdblib.rebuild_stats(self.session, snapshot=True)
+        self.assertEqual(
+            before,
+            (
+                pkgdblib.get_top_maintainers(self.session),
+                pkgdblib.get_top_poc(self.session),
+                pkgdblib.count_collection(self.session),
+                pkgdblib.count_fedora_collection(self.session),
+            ))
+
     def test_search_logs(self):
         """ Test the search_logs function. """
         self.test_add_package()
@@ -1386,6 +1882,42 @@ class PkgdbLibtests(Modeltests):
         logs = pkgdblib.search_logs(self.session, packager='pingou')
         self.assertEqual(len(logs), 0)
 
+    def test_search_logs_cursor(self):
+        """ Test the search_logs function with the cursor-based pagination.
+        """
+        self.test_add_package()
+
+        # Invalid cursors
+        self.assertRaises(pkgdblib.PkgdbException,
+                          pkgdblib.decode_cursor,
+                          'foobar')
+        self.assertRaises(pkgdblib.PkgdbException,
+                          pkgdblib.search_logs,
+                          self.session,
+                          after=['foo', 1]
+                          )
+
+        expected = [log.id for log in pkgdblib.search_logs(self.session)]
+        self.assertEqual(len(expected), 23)
+
+        logs = []
+        after = None
+        while True:
+            page = pkgdblib.search_logs(self.session, limit=5, after=after)
+            logs.extend(log.id for log in page)
+            if len(page) < 5:
+                break
+            after = pkgdblib.decode_cursor(
+                pkgdblib.encode_cursor(pkgdblib.log_cursor(page[-1])))
+        self.assertEqual(logs, expected)
+
+        # The page is ignored when seeking
+        page = pkgdblib.search_logs(
+            self.session, limit=5, page=3,
+            after=pkgdblib.log_cursor(
+                pkgdblib.search_logs(self.session, limit=1)[0]))
+        self.assertEqual([log.id for log in page], expected[1:6])
+
     def test_unorphan_package(self):
         """ Test the unorphan_package function. """
         create_package_acl(self.session)
@@ -1563,6 +2095,136 @@ class PkgdbLibtests(Modeltests):
         self.assertEqual(pkg_acl[2].collection.branchname, 'f19')
         self.assertEqual(len(pkg_acl[2].acls), 5)
 
+    def test_add_branch_bulk(self):
+        """ Test the add_branch function in bulk mode. """
+        create_package_acl(self.session)
+
+        # Create a new collection
+        new_collection = pkgdblib.model.Collection(
+            name='Fedora',
+            version='19',
+            status='Active',
+            owner='toshio',
+            branchname='f19',
+            dist_tag='.fc19',
+        )
+        self.session.add(new_collection)
+        self.session.commit()
+
+        # Have offlineimap already in f19 to trigger a conflict
+        pkg = pkgdblib.model.Package.by_name(self.session, 'offlineimap')
+        self.session.add(pkgdblib.model.PackageListing(
+            point_of_contact='toshio',
+            status='Approved',
+            package_id=pkg.id,
+            collection_id=new_collection.id,
+        ))
+        self.session.commit()
+
+        msgs = pkgdblib.add_branch(
+            session=self.session,
+            clt_from='master',
+            clt_to='f19',
+            user=FakeFasUserAdmin(),
+            bulk=True,
+        )
+        self.assertEqual(
+            msgs,
+            [
+                'geany branched successfully from Fedora to Fedora 19',
+                'guake branched successfully from Fedora to Fedora 19',
+                'FAILED: offlineimap failed to branch from Fedora to '
+                'Fedora 19',
+                'Package offlineimap already exists in Fedora 19',
+            ]
+        )
+
+        pkg_acl = pkgdblib.get_acl_package(self.session, 'guake')
+        self.assertEqual(len(pkg_acl), 3)
+        self.assertEqual(pkg_acl[1].collection.branchname, 'master')
+        self.assertEqual(len(pkg_acl[1].acls), 5)
+        self.assertEqual(pkg_acl[2].collection.branchname, 'f19')
+        self.assertEqual(pkg_acl[2].point_of_contact, 'pingou')
+        self.assertEqual(pkg_acl[2].status, 'Approved')
+        self.assertEqual(
+            sorted((acl.fas_name, acl.acl, acl.status)
+                   for acl in pkg_acl[1].acls),
+            sorted((acl.fas_name, acl.acl, acl.status)
+                   for acl in pkg_acl[2].acls),
+        )
+
+        # The conflicting package was left untouched
+        pkg_acl = pkgdblib.get_acl_package(
+            self.session, 'offlineimap', pkg_clt='f19')
+        self.assertEqual(pkg_acl[0].point_of_contact, 'toshio')
+        self.assertEqual(pkg_acl[0].acls, [])
+
+        # Each new branch is recorded in the change feed
+        changes = [
+            (change.topic, change.package, change.branch, change.fas_name)
+            for change in pkgdblib.model.Change.since(self.session)
+        ]
+        self.assertEqual(changes, [
+            ('branch.start', None, 'f19', None),
+            ('package.branch.new', 'geany', 'f19', 'group::gtk-sig'),
+            ('package.branch.new', 'guake', 'f19', 'pingou'),
+        ])
+
+        # Branching again only reports conflicts
+        msgs = pkgdblib.add_branch(
+            session=self.session,
+            clt_from='master',
+            clt_to='f19',
+            user=FakeFasUserAdmin(),
+            bulk=True,
+        )
+        self.assertEqual(len(msgs), 6)
+        self.assertTrue(all(
+            msg.startswith(('FAILED', 'Package')) for msg in msgs))
+
+    def test_add_branch_changes(self):
+        """ Test that add_branch records the same changes in the change
+        feed whether it branches the packages one by one or in bulk. """
+        create_package_acl(self.session)
+        model = pkgdblib.model
+
+        for version in ('19', '20'):
+            self.session.add(model.Collection(
+                name='Fedora',
+                version=version,
+                status='Active',
+                owner='toshio',
+                branchname='f%s' % version,
+                dist_tag='.fc%s' % version,
+            ))
+        self.session.commit()
+
+        changes = {}
+        for branch, bulk in (('f19', False), ('f20', True)):
+            last_seq = model.Change.last_seq(self.session)
+            pkgdblib.add_branch(
+                session=self.session,
+                clt_from='master',
+                clt_to=branch,
+                user=FakeFasUserAdmin(),
+                bulk=bulk,
+            )
+            self.session.commit()
+            changes[bulk] = sorted(
+                (change.topic, change.package, change.fas_name,
+                 change.new_value)
+                for change in model.Change.since(self.session, last_seq)
+                if change.branch == branch
+            )
+
+        self.assertEqual(changes[False], changes[True])
+        self.assertEqual(
+            [change[:2] for change in changes[True]],
+            [('branch.complete', None), ('branch.start', None),
+             ('package.branch.new', 'geany'),
+             ('package.branch.new', 'guake'),
+             ('package.branch.new', 'offlineimap')])
+
     def test_get_critpath_packages(self):
         """ Test the get_critpath_packages method of pkgdblib. """
         create_package_acl(self.session)
@@ -1643,6 +2305,517 @@ class PkgdbLibtests(Modeltests):
             data,
             {u'guake': u'pingou', u'geany': u'group::gtk-sig,josef'})
 
+    @mock.patch('pkgdb2.lib.notifications.smtplib.SMTP')
+    @mock.patch('pkgdb2.lib.notifications._fedmsg_send')
+    def test_notification_outbox(self, mock_fedmsg, mock_smtp):
+        """ Test that the notifications are queued in the outbox and sent
+        by the dispatch function. """
+        import pkgdb2.lib.notifications as notify
+        model = pkgdblib.model
+        create_package_acl(self.session)
+
+        config = pkgdb2.APP.config
+        previous = config['PKGDB2_NOTIFICATION_OUTBOX']
+        config['PKGDB2_NOTIFICATION_OUTBOX'] = True
+        try:
+            user = FakeFasUser()
+            user.username = 'blahblah'
+            pkgdblib.set_acl_package(
+                self.session,
+                pkg_name='guake',
+                pkg_branch='f18',
+                pkg_user='blahblah',
+                acl='watchcommits',
+                status='Approved',
+                user=user,
+            )
+            self.session.commit()
+        finally:
+            config['PKGDB2_NOTIFICATION_OUTBOX'] = previous
+
+        # The message is queued, not published
+        self.assertFalse(mock_fedmsg.called)
+        stats = notify.get_outbox_stats(self.session)
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual(stats['failed'], 0)
+        notification = self.session.query(model.Outbox).one()
+        self.assertEqual(notification.kind, 'fedmsg')
+        self.assertEqual(notification.data['topic'], 'acl.update')
+        self.assertEqual(notification.data['msg']['acl'], 'watchcommits')
+
+        # Failures are retried later
+        mock_fedmsg.side_effect = IOError('fedmsg is down')
+        self.assertEqual(notify.dispatch(self.session), (0, 1))
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.last_error, 'fedmsg is down')
+        self.assertEqual(notify.dispatch(self.session), (0, 0))
+
+        notification.next_attempt = notification.created
+        mock_fedmsg.side_effect = None
+        self.assertEqual(notify.dispatch(self.session), (1, 0))
+        mock_fedmsg.assert_called_with(
+            'acl.update', notification.data['msg'])
+        self.assertEqual(notify.get_outbox_stats(self.session)['pending'], 0)
+
+        # The emails of a batch share the same SMTP connection
+        config['PKGDB2_NOTIFICATION_OUTBOX'] = True
+        try:
+            for package in ['guake', 'geany']:
+                notify.notify_email(
+                    self.session, 'pingou', model.Package.by_name(
+                        self.session, package), 'Changed', subject='Update')
+        finally:
+            config['PKGDB2_NOTIFICATION_OUTBOX'] = previous
+        self.session.commit()
+
+        self.assertEqual(notify.dispatch(self.session), (2, 0))
+        self.assertEqual(mock_smtp.call_count, 1)
+        smtp = mock_smtp.return_value
+        self.assertEqual(smtp.sendmail.call_count, 2)
+        self.assertEqual(
+            smtp.sendmail.call_args[0][1], ['geany-owner@fedoraproject.org'])
+        self.assertEqual(smtp.quit.call_count, 1)
+
+        # The notifications failing too often are given up
+        config['PKGDB2_OUTBOX_MAX_ATTEMPTS'] = 1
+        try:
+            model.Outbox.add(self.session, 'fedmsg', {
+                'topic': 'acl.update', 'msg': {}})
+            self.session.commit()
+            mock_fedmsg.side_effect = IOError('fedmsg is down')
+            self.assertEqual(notify.dispatch(self.session), (0, 1))
+            self.assertEqual(
+                notify.get_outbox_stats(self.session),
+                {'pending': 0, 'failed': 1, 'oldest': None})
+        finally:
+            config['PKGDB2_OUTBOX_MAX_ATTEMPTS'] = 10
+
+    @mock.patch('pkgdb2.lib.notifications.fedmsg_publish')
+    def test_log_topics(self, mock_fedmsg):
+        """ Test that the log messages only use the fields they need and
+        that the objects of the messages are serialized when published. """
+        utils = pkgdblib.utils
+        self.assertEqual(
+            [field for field, _ in utils.TOPICS['acl.update'].log.fields],
+            ['acl', 'agent', 'package_listing.collection.branchname',
+             'package_name', 'previous_status', 'status', 'username'])
+        self.assertEqual(
+            utils.TOPICS['acl.update'].subject.format({
+                'agent': 'pingou', 'package_name': 'guake',
+                'acl': 'commit', 'status': 'Approved'}),
+            'pingou:guake commit  set to Approved')
+        self.assertEqual(utils.TOPICS['package.delete'].subject, None)
+
+        create_package_acl(self.session)
+        user = FakeFasUser()
+        user.username = 'blahblah'
+        msg = pkgdblib.set_acl_package(
+            self.session,
+            pkg_name='guake',
+            pkg_branch='f18',
+            pkg_user='blahblah',
+            acl='watchcommits',
+            status='Approved',
+            user=user,
+        )
+        self.assertEqual(
+            msg,
+            'user: blahblah set for blahblah acl: watchcommits of package: '
+            'guake from:  to: Approved on branch: f18')
+        topic, message = mock_fedmsg.call_args[0]
+        self.assertEqual(topic, 'acl.update')
+        pkglisting = pkgdblib.model.PackageListing.by_pkgid_collectionid(
+            self.session,
+            pkgdblib.model.Package.by_name(self.session, 'guake').id,
+            pkgdblib.model.Collection.by_name(self.session, 'f18').id)
+        self.assertEqual(message['package_listing'], pkglisting.to_json())
+
+        # The objects are not serialized if the message is not published
+        pkgdb2.APP.config['PKGDB2_FEDMSG_NOTIFICATION'] = False
+        try:
+            with mock.patch.object(
+                    pkgdblib.model.PackageListing, 'to_json') as mock_json:
+                msg = pkgdblib.set_acl_package(
+                    self.session,
+                    pkg_name='guake',
+                    pkg_branch='f18',
+                    pkg_user='blahblah',
+                    acl='watchcommits',
+                    status='Obsolete',
+                    user=user,
+                )
+                self.assertFalse(mock_json.called)
+        finally:
+            pkgdb2.APP.config['PKGDB2_FEDMSG_NOTIFICATION'] = True
+        self.assertEqual(
+            msg,
+            'user: blahblah set for blahblah acl: watchcommits of package: '
+            'guake from: Approved to: Obsolete on branch: f18')
+        self.assertEqual(mock_fedmsg.call_count, 1)
+
+    def test_changes(self):
+        """ Test that the changes logged are recorded in the change feed.
+        """
+        self.assertEqual(pkgdblib.model.Change.last_seq(self.session), 0)
+        create_package_acl(self.session)
+
+        user = FakeFasUser()
+        user.username = 'blahblah'
+        for status in ('Awaiting Review', 'Approved'):
+            pkgdblib.set_acl_package(
+                self.session,
+                pkg_name='guake',
+                pkg_branch='f18',
+                pkg_user='blahblah',
+                acl='watchcommits',
+                status=status,
+                user=user,
+            )
+        self.session.commit()
+        last_seq = 1
+
+        changes = pkgdblib.model.Change.since(self.session, last_seq)
+        self.assertEqual(len(changes), 1)
+        change = changes[0].to_json()
+        self.assertEqual(change['seq'], last_seq + 1)
+        self.assertEqual(change['topic'], 'acl.update')
+        self.assertEqual(change['agent'], 'blahblah')
+        self.assertEqual(change['package'], 'guake')
+        self.assertEqual(change['branch'], 'f18')
+        self.assertEqual(change['acl'], 'watchcommits')
+        self.assertEqual(change['user'], 'blahblah')
+        self.assertEqual(change['old'], 'Awaiting Review')
+        self.assertEqual(change['new'], 'Approved')
+
+        self.assertEqual(
+            pkgdblib.model.Change.last_seq(self.session), last_seq + 1)
+        self.assertEqual(
+            len(pkgdblib.model.Change.since(self.session, limit=2)), 2)
+        self.assertEqual(
+            pkgdblib.model.Change.since(self.session, last_seq + 1), [])
+
+        # The changes are only recorded when the transaction is committed
+        pkgdblib.set_acl_package(
+            self.session,
+            pkg_name='guake',
+            pkg_branch='f18',
+            pkg_user='blahblah',
+            acl='watchcommits',
+            status='Obsolete',
+            user=user,
+        )
+        self.session.flush()
+        self.assertEqual(
+            pkgdblib.model.Change.last_seq(self.session), last_seq + 1)
+        self.session.rollback()
+        self.session.commit()
+        self.assertEqual(
+            pkgdblib.model.Change.last_seq(self.session), last_seq + 1)
+
+    def test_changes_overlapping(self):
+        """ Test that the changes of overlapping transactions are numbered
+        in the order the transactions commit, so a consumer does not miss
+        the changes of the transaction committed last. """
+        create_package_acl(self.session)
+        model = pkgdblib.model
+        other = pkgdblib.create_session(DB_PATH)
+        try:
+            self.assertEqual(model.Change.last_seq(other), 0)
+
+            # The first transaction starts, the second one commits first
+            self.assertEqual(model.Change.last_seq(self.session), 0)
+            pkgdblib.utils.record_changes(
+                self.session, 'package.update', 'pingou',
+                [dict(package='guake', new_value='first')])
+            pkgdblib.utils.record_changes(
+                other, 'package.update', 'toshio',
+                [dict(package='geany', new_value='second'),
+                 dict(package='fedocal', new_value='second')])
+            other.commit()
+
+            # A consumer retrieves the changes committed so far
+            changes = model.Change.since(other)
+            self.assertEqual(
+                [(change.seq, change.package) for change in changes],
+                [(1, 'geany'), (2, 'fedocal')])
+            other.commit()
+
+            self.session.commit()
+
+            # and then the changes committed since
+            changes = model.Change.since(other, 2)
+            self.assertEqual(
+                [(change.seq, change.package, change.agent)
+                 for change in changes],
+                [(3, 'guake', 'pingou')])
+        finally:
+            other.close()
+
+    def test_bugzilla_jobs(self):
+        """ Test that the bugzilla reassignments are queued in jobs and
+        made together, in batch. """
+        from dogpile.cache.backends.memory import MemoryBackend
+        import pkgdb2.lib.bugzilla_jobs as bugzilla_jobs
+        from pkgdb2.lib import fas
+        model = pkgdblib.model
+        create_package_acl(self.session)
+
+        config = pkgdb2.APP.config
+        backend = fas.REGION.backend
+        fas.REGION.backend = MemoryBackend({})
+        fas.set_client(fas.StubFas(
+            people={'pingou': 'pingou@bz.o', 'toshio': 'toshio@bz.o',
+                    'ralph': None},
+            groups=[{'name': 'gtk-sig', 'group_type': 'pkgdb',
+                     'mailing_list': 'gtk@fp.o', 'members': ['pingou']}],
+            packagers=['pingou', 'toshio'],
+        ))
+        client = bugzilla_jobs.FakeBugzilla([
+            dict(bug_id=1, product='Fedora', component='guake',
+                 version='rawhide', bug_status='NEW',
+                 assigned_to='pingou@bz.o'),
+            dict(bug_id=2, product='Fedora', component='guake',
+                 version='18', bug_status='ASSIGNED',
+                 assigned_to='pingou@bz.o'),
+            dict(bug_id=3, product='Fedora', component='guake',
+                 version='18', bug_status='NEW',
+                 assigned_to='someone@else.o'),
+            dict(bug_id=4, product='Fedora', component='guake',
+                 version='rawhide', bug_status='CLOSED',
+                 assigned_to='pingou@bz.o'),
+            dict(bug_id=5, product='Fedora', component='geany',
+                 version='rawhide', bug_status='NEW',
+                 assigned_to='pingou@bz.o'),
+        ])
+        # Other tests replace these functions of utils
+        patcher = mock.patch.multiple(
+            'pkgdb2.lib.utils',
+            get_packagers=fas.get_packagers,
+            get_fas_group=fas.get_group,
+            get_bz_email_user=fas.get_person,
+        )
+        patcher.start()
+        config['PKGDB2_BUGZILLA_JOBS'] = True
+        config['PKGDB2_BUGZILLA_NOTIFICATION'] = True
+        try:
+            # The changes of a transaction are queued in a single job
+            for branch in ('master', 'f18'):
+                pkgdblib.update_pkg_poc(
+                    self.session,
+                    pkg_name='guake',
+                    pkg_branch=branch,
+                    pkg_poc='toshio',
+                    user=FakeFasUser(),
+                )
+            job_id = bugzilla_jobs.get_current_job(self.session)
+            self.session.commit()
+            self.assertEqual(bugzilla_jobs.get_current_job(self.session), None)
+
+            job = model.BugzillaJob.by_id(self.session, job_id)
+            self.assertEqual(job.status, 'Pending')
+            self.assertEqual(
+                [(item['component'], item['version'], item['username'])
+                 for item in job.reassignments],
+                [('guake', 'rawhide', 'toshio'), ('guake', '18', 'toshio')])
+            self.assertEqual(client.queries, [])
+
+            # The reassignments rolled back are not queued
+            pkgdblib.update_pkg_poc(
+                self.session,
+                pkg_name='fedocal',
+                pkg_branch='f17',
+                pkg_poc='toshio',
+                user=FakeFasUser(),
+            )
+            self.session.rollback()
+            self.assertEqual(bugzilla_jobs.get_current_job(self.session), None)
+
+            # One query per product and one update per assignee
+            jobs = bugzilla_jobs.run_pending(self.session, client=client)
+            self.session.commit()
+            self.assertEqual(jobs, [job])
+            self.assertEqual(job.status, 'Done')
+            self.assertEqual(job.bugs, 2)
+            self.assertEqual(len(client.queries), 1)
+            self.assertEqual(client.queries[0]['version'], ['18', 'rawhide'])
+            self.assertEqual(client.updates, [(
+                [1, 2], {'assigned_to': 'toshio@bz.o',
+                         'comment': bugzilla_jobs.DEFAULT_COMMENT})])
+            self.assertEqual(
+                model.BugzillaJob.get_stats(self.session),
+                {'Pending': 0, 'Done': 1, 'Failed': 0})
+
+            # A job failing does not prevent the others from running
+            for username in ('group::foo-sig', 'group::gtk-sig'):
+                bugzilla_jobs.queue_reassignment(
+                    self.session, bugzilla_jobs.build_reassignment(
+                        username, 'pingou', 'geany', 'Fedora', 'devel'))
+                self.session.commit()
+            failed, done = bugzilla_jobs.run_pending(
+                self.session, client=client)
+            self.session.commit()
+            self.assertEqual(failed.status, 'Failed')
+            self.assertTrue('foo-sig' in failed.error)
+            self.assertEqual(done.status, 'Done')
+            self.assertEqual(done.bugs, 1)
+            self.assertEqual(client.updates[-1][0], [5])
+            self.assertEqual(client.updates[-1][1]['assigned_to'], 'gtk@fp.o')
+
+            # A previous owner without bugzilla email gives all the bugs
+            counts = bugzilla_jobs.reassign([
+                bugzilla_jobs.build_reassignment(
+                    'pingou', 'ralph', 'guake', 'Fedora', '18')
+            ], client=client)
+            self.assertEqual(counts, [2])
+            self.assertEqual(client.updates[-1][0], [2, 3])
+
+            # Each thread queries bugzilla with its own client
+            clients = []
+
+            class ThreadBugzilla(bugzilla_jobs.FakeBugzilla):
+                """ Record the threads using the client. """
+                def __init__(self):
+                    super(ThreadBugzilla, self).__init__()
+                    self.threads = set()
+                    clients.append(self)
+
+                def query(self, query):
+                    self.threads.add(threading.current_thread())
+                    return super(ThreadBugzilla, self).query(query)
+
+            with mock.patch('pkgdb2.lib.utils.new_bz', ThreadBugzilla), \
+                    mock.patch('pkgdb2.lib.utils.get_bz',
+                               return_value=client):
+                bugzilla_jobs.reassign([
+                    bugzilla_jobs.build_reassignment(
+                        'pingou', None, 'guake', product, 'devel')
+                    for product in ('Fedora', 'Fedora EPEL', 'Fedora Docs')
+                ])
+            self.assertEqual(
+                sum(len(item.queries) for item in clients), 3)
+            threads = [item.threads for item in clients]
+            self.assertTrue(all(len(item) == 1 for item in threads))
+            self.assertEqual(len(set.union(*threads)), len(clients))
+            self.assertFalse(threading.current_thread() in set.union(*threads))
+            # and they are disconnected once the pool is closed
+            self.assertTrue(all(item.disconnected for item in clients))
+            self.assertFalse(client.disconnected)
+        finally:
+            config['PKGDB2_BUGZILLA_JOBS'] = False
+            config['PKGDB2_BUGZILLA_NOTIFICATION'] = False
+            fas.set_client(None)
+            patcher.stop()
+            fas.REGION.backend = backend
+
+    def test_bugzilla_sync(self):
+        """ Test that the synchronization with bugzilla only retrieves and
+        updates the components which changed. """
+        import shutil
+        import tempfile
+        from dogpile.cache.backends.memory import MemoryBackend
+        from pkgdb2.lib import bugzilla_sync, fas
+        model = pkgdblib.model
+        create_package_acl2(self.session)
+
+        backend = fas.REGION.backend
+        fas.REGION.backend = MemoryBackend({})
+        fas.set_client(fas.StubFas(
+            people={'pingou': 'pingou@bz.o', 'spot': 'Spot@bz.o'},
+            groups=[{'name': 'gtk-sig', 'group_type': 'pkgdb',
+                     'mailing_list': 'gtk@fp.o', 'members': ['pingou']}],
+            packagers=['pingou', 'spot'],
+        ))
+        patcher = mock.patch.multiple(
+            'pkgdb2.lib.utils',
+            get_fas_group=fas.get_group,
+            get_bz_email_user=fas.get_person,
+        )
+        patcher.start()
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'components.json')
+        client = bugzilla_sync.FakeComponents({
+            ('Fedora', 'fedocal'): {
+                'initialowner': 'pingou@bz.o',
+                'description': 'A web-based calendar for Fedora',
+                'initialqacontact': bugzilla_sync.DEFAULT_QA_CONTACT,
+                'initialcclist': ['pingou@bz.o'],
+            },
+            ('Fedora', 'guake'): {
+                'initialowner': 'pingou@bz.o',
+                'description': 'Top down terminal for GNOME',
+                'initialqacontact': bugzilla_sync.DEFAULT_QA_CONTACT,
+                'initialcclist': ['pingou@bz.o'],
+            },
+        })
+
+        def run(dry_run=False):
+            """ Run the synchronization and return it and the changes. """
+            sync = bugzilla_sync.BugzillaSync(
+                client, bugzilla_sync.ComponentCache(path), dry_run=dry_run,
+                rate=0)
+            return sync, sync.run(self.session)
+
+        try:
+            # The dry-run reports the changes without making them
+            sync, changes = run(dry_run=True)
+            self.assertEqual(sync.errors, [])
+            self.assertEqual(
+                [(chg['action'], chg['component']) for chg in changes],
+                [('add', 'geany'), ('edit', 'guake')])
+            self.assertEqual(
+                bugzilla_sync.describe_change(changes[1]),
+                ['[EDITCOMP] Fedora/guake',
+                 "    initialcclist: ['pingou@bz.o'] -> "
+                 "['pingou@bz.o', 'spot@bz.o']"])
+            self.assertEqual(client.added, [])
+            self.assertEqual(client.edited, [])
+            self.assertFalse(os.path.exists(path))
+
+            sync, changes = run()
+            self.assertEqual(client.gets, [
+                ('Fedora', ['fedocal', 'geany', 'guake']),
+                ('Fedora', ['fedocal', 'geany', 'guake'])])
+            self.assertEqual(client.added, [{
+                'product': 'Fedora',
+                'component': 'geany',
+                'initialowner': 'gtk@fp.o',
+                'description': 'A fast and lightweight IDE using GTK2',
+                'initialqacontact': bugzilla_sync.DEFAULT_QA_CONTACT,
+                'initialcclist': ['gtk@fp.o'],
+            }])
+            self.assertEqual(client.edited, [{
+                'product': 'Fedora',
+                'component': 'guake',
+                'initialowner': 'pingou@bz.o',
+                'initialcclist': ['pingou@bz.o', 'spot@bz.o'],
+            }])
+
+            # Nothing changed, bugzilla is not queried
+            client.gets = []
+            sync, changes = run()
+            self.assertEqual(changes, [])
+            self.assertEqual(client.gets, [])
+
+            # Only the component changed is retrieved and updated
+            package = model.Package.by_name(self.session, 'guake')
+            package.summary = 'Drop-down terminal for GNOME'
+            self.session.flush()
+            model.PackageAclSnapshot.refresh(
+                self.session, package_ids=[package.id])
+            self.session.commit()
+            sync, changes = run()
+            self.assertEqual(client.gets, [('Fedora', ['guake'])])
+            self.assertEqual(client.edited[-1], {
+                'product': 'Fedora',
+                'component': 'guake',
+                'initialowner': 'pingou@bz.o',
+                'description': 'Drop-down terminal for GNOME',
+            })
+        finally:
+            shutil.rmtree(tmpdir)
+            patcher.stop()
+            fas.set_client(None)
+            fas.REGION.backend = backend
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(PkgdbLibtests)
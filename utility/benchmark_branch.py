@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Script comparing the time needed to branch a collection one package at a
+time and in bulk, on a synthetic collection.
+
+The database used is created from scratch, do not point it to a production
+database.
+'''
+
+## These two lines are needed to run on EL6
+__requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
+import pkg_resources
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+try:
+    import pkgdb2
+except ImportError:
+    import sys
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    import pkgdb2
+
+import pkgdb2.lib
+from pkgdb2.lib import model
+
+
+class FakeFasUser(object):
+    ''' Fake FAS user member of the admin group. '''
+
+    def __init__(self):
+        self.username = 'admin'
+        self.groups = list(pkgdb2.APP.config['ADMIN_GROUP'])
+        self.cla_done = True
+
+
+def get_arguments():
+    ''' Set the command line parser and retrieve the arguments provided
+    by the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the branching of a collection')
+    parser.add_argument(
+        '--packages', dest='packages', type=int, default=20000,
+        help='Number of packages in the collection to branch (default: '
+        '20000)')
+    parser.add_argument(
+        '--acls', dest='acls', type=int, default=4,
+        help='Number of ACLs per package (default: 4)')
+    parser.add_argument(
+        '--db-url', dest='db_url', default=None,
+        help='URL of the empty database to use (default: a temporary '
+        'sqlite database)')
+
+    return parser.parse_args()
+
+
+def fill_database(session, nb_packages, nb_acls):
+    ''' Create the `master` collection with the specified number of
+    packages and ACLs per package, as well as the two collections the
+    benchmark branches to.
+    '''
+    for version, branchname in [
+            ('devel', 'master'), ('21', 'f21'), ('22', 'f22')]:
+        session.add(model.Collection(
+            name='Fedora',
+            version=version,
+            status='Active',
+            owner='admin',
+            branchname=branchname,
+            dist_tag='.fc%s' % version,
+        ))
+    session.commit()
+    master = model.Collection.by_name(session, 'master')
+
+    now = datetime.datetime.utcnow()
+    session.execute(
+        model.Package.__table__.insert(),
+        [dict(name='package-%05d' % cnt,
+              summary='Synthetic package %s' % cnt,
+              description='Synthetic package',
+              review_url=None,
+              upstream_url=None,
+              status='Approved')
+         for cnt in range(nb_packages)]
+    )
+    session.execute(
+        model.PackageListing.__table__.insert().from_select(
+            ['package_id', 'point_of_contact', 'collection_id', 'status',
+             'critpath', 'status_change'],
+            session.query(
+                model.Package.id,
+                sa.literal('admin'),
+                sa.literal(master.id),
+                sa.literal('Approved'),
+                sa.literal(False),
+                sa.literal(now, sa.DateTime),
+            ).subquery().select()
+        )
+    )
+    acls = ['commit', 'watchbugzilla', 'watchcommits', 'approveacls']
+    for cnt in range(nb_acls):
+        session.execute(
+            model.PackageListingAcl.__table__.insert().from_select(
+                ['fas_name', 'packagelisting_id', 'acl', 'status',
+                 'date_created'],
+                session.query(
+                    sa.literal('user%s' % (cnt // len(acls))),
+                    model.PackageListing.id,
+                    sa.literal(acls[cnt % len(acls)]),
+                    sa.literal('Approved'),
+                    sa.literal(now, sa.DateTime),
+                ).subquery().select()
+            )
+        )
+    session.commit()
+
+
+def main():
+    ''' Fill a database with a synthetic collection and time branching it
+    with and without the bulk mode.
+    '''
+    args = get_arguments()
+
+    db_url = args.db_url
+    if db_url is None:
+        dbfile = tempfile.NamedTemporaryFile(
+            prefix='pkgdb2_benchmark_', suffix='.sqlite', delete=False)
+        dbfile.close()
+        db_url = 'sqlite:///%s' % dbfile.name
+
+    # Do not bother the rest of the world with the benchmark
+    pkgdb2.APP.config['PKGDB2_FEDMSG_NOTIFICATION'] = False
+    pkgdb2.APP.config['PKGDB2_EMAIL_NOTIFICATION'] = False
+
+    session = model.create_tables(db_url)
+    print 'Creating %s packages with %s ACLs each in %s' % (
+        args.packages, args.acls, db_url)
+    fill_database(session, args.packages, args.acls)
+
+    user = FakeFasUser()
+    results = []
+    for clt_to, bulk in [('f21', False), ('f22', True)]:
+        start = time.time()
+        messages = pkgdb2.lib.add_branch(
+            session, clt_from='master', clt_to=clt_to, user=user, bulk=bulk)
+        session.commit()
+        duration = time.time() - start
+        failed = len([msg for msg in messages if msg.startswith('FAILED')])
+        results.append((bulk and 'bulk' or 'loop', duration, failed))
+
+    for mode, duration, failed in results:
+        print '%-5s %10.2f seconds, %s failed' % (mode, duration, failed)
+    print 'speedup: %.1fx' % (results[0][1] / max(results[1][1], 0.001))
+
+    if args.db_url is None:
+        os.unlink(dbfile.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Script comparing the time and memory needed to serialize the ACLs of a
+packager and a list of packages with their ACLs, from the objects of the
+model and from the read-only records of `pkgdb2.lib.readmodel`, on
+synthetic packages.
+
+Each measure runs in its own process, the memory reported is the growth of
+its peak resident memory.
+
+The database used is created from scratch, do not point it to a production
+database.
+'''
+
+## These two lines are needed to run on EL6
+__requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
+import pkg_resources
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+try:
+    import pkgdb2
+except ImportError:
+    import sys
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    import pkgdb2
+
+import pkgdb2.lib
+from pkgdb2.lib import model, readmodel
+
+
+BRANCHES = [('devel', 'master'), ('21', 'f21'), ('22', 'f22')]
+ACLS = ['commit', 'watchbugzilla', 'watchcommits', 'approveacls']
+
+
+def get_arguments():
+    ''' Set the command line parser and retrieve the arguments provided
+    by the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the serialization of the API listings')
+    parser.add_argument(
+        '--packages', dest='packages', type=int, default=20000,
+        help='Number of packages, each in %s collections (default: 20000)'
+        % len(BRANCHES))
+    parser.add_argument(
+        '--limit', dest='limit', type=int, default=5000,
+        help='Number of ACLs and of packages serialized (default: 5000)')
+    parser.add_argument(
+        '--runs', dest='runs', type=int, default=3,
+        help='Number of times each serialization is run (default: 3)')
+    parser.add_argument(
+        '--db-url', dest='db_url', default=None,
+        help='URL of the empty database to use (default: a temporary '
+        'sqlite database)')
+
+    return parser.parse_args()
+
+
+def fill_database(session, nb_packages):
+    ''' Create the packages, in each collection, with the ACLs of the
+    `admin` packager.
+    '''
+    for version, branchname in BRANCHES:
+        session.add(model.Collection(
+            name='Fedora',
+            version=version,
+            status='Active',
+            owner='admin',
+            branchname=branchname,
+            dist_tag='.fc%s' % version,
+        ))
+    session.commit()
+
+    now = datetime.datetime.utcnow()
+    session.execute(
+        model.Package.__table__.insert(),
+        [dict(name='package-%05d' % cnt,
+              summary='Synthetic package %s' % cnt,
+              description='Synthetic package with a longer description',
+              review_url=None,
+              upstream_url=None,
+              status='Approved')
+         for cnt in range(nb_packages)]
+    )
+    for _, branchname in BRANCHES:
+        collection = model.Collection.by_name(session, branchname)
+        session.execute(
+            model.PackageListing.__table__.insert().from_select(
+                ['package_id', 'point_of_contact', 'collection_id',
+                 'status', 'critpath', 'status_change'],
+                session.query(
+                    model.Package.id,
+                    sa.literal('admin'),
+                    sa.literal(collection.id),
+                    sa.literal('Approved'),
+                    sa.literal(False),
+                    sa.literal(now, sa.DateTime),
+                ).subquery().select()
+            )
+        )
+    for acl in ACLS:
+        session.execute(
+            model.PackageListingAcl.__table__.insert().from_select(
+                ['fas_name', 'packagelisting_id', 'acl', 'status',
+                 'date_created'],
+                session.query(
+                    sa.literal('admin'),
+                    model.PackageListing.id,
+                    sa.literal(acl),
+                    sa.literal('Approved'),
+                    sa.literal(now, sa.DateTime),
+                ).subquery().select()
+            )
+        )
+    session.commit()
+
+
+def packager_acls(session, limit, rows):
+    ''' Serialize the ACLs of the packager as `/api/packager/acl/`. '''
+    if rows:
+        acls = pkgdb2.lib.get_acl_packager(
+            session, 'admin', limit=limit, load='rows')
+        return [readmodel.acl_to_json(acl) for acl in acls]
+    acls = pkgdb2.lib.get_acl_packager(
+        session, 'admin', limit=limit, load='acl_listing')
+    return [acl.to_json() for acl in acls]
+
+
+def package_list(session, limit, rows):
+    ''' Serialize the packages with their ACLs as `/api/packages/`. '''
+    branches = [branchname for _, branchname in BRANCHES]
+    if rows:
+        packages = pkgdb2.lib.search_package(
+            session, '*', limit=limit, load='rows')
+        return readmodel.packages_to_json(
+            session, packages, acls=True, branches=branches)
+    packages = pkgdb2.lib.search_package(
+        session, '*', limit=limit, load='package_acls')
+    return [
+        pkg.to_json(acls=True, collection=branches, package=False)
+        for pkg in packages
+    ]
+
+
+def measure(db_url, function, limit, runs, rows, queue):
+    ''' Time the serialization and measure the growth of the peak resident
+    memory of the process while doing it, the results are put in the
+    queue. '''
+    session = sessionmaker(bind=sa.create_engine(db_url))()
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for _ in range(runs):
+        output = function(session, limit, rows)
+        session.rollback()
+        session.expunge_all()
+    duration = (time.time() - start) / runs
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    queue.put((duration, rss, len(output)))
+
+
+def main():
+    ''' Fill a database with synthetic packages and compare serializing
+    them from the objects of the model and from the read-only records.
+    '''
+    args = get_arguments()
+
+    db_url = args.db_url
+    if db_url is None:
+        dbfile = tempfile.NamedTemporaryFile(
+            prefix='pkgdb2_benchmark_', suffix='.sqlite', delete=False)
+        dbfile.close()
+        db_url = 'sqlite:///%s' % dbfile.name
+
+    session = model.create_tables(db_url)
+    print 'Creating %s packages in %s' % (args.packages, db_url)
+    fill_database(session, args.packages)
+    session.close()
+
+    print '%-16s %-5s %12s %12s %8s' % (
+        '', '', 'time', 'peak memory', 'results')
+    for label, function in [
+            ('packager ACLs', packager_acls),
+            ('package list', package_list)]:
+        results = []
+        for mode, rows in [('orm', False), ('rows', True)]:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=measure,
+                args=(db_url, function, args.limit, args.runs, rows, queue))
+            process.start()
+            duration, rss, found = queue.get()
+            process.join()
+            results.append(duration)
+            print '%-16s %-5s %9.1f ms %9.1f MB %8s' % (
+                label, mode, duration * 1000, rss / 1024.0, found)
+        print '%-16s speedup: %.1fx' % (
+            '', results[0] / max(results[1], 0.001))
+
+    if args.db_url is None:
+        os.unlink(dbfile.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Script comparing the time needed to search packages with a plain LIKE and
+with the search backend of the database (pg_trgm on PostgreSQL, FTS5 on
+SQLite), on synthetic packages.
+
+The database used is created from scratch, do not point it to a production
+database.
+'''
+
+## These two lines are needed to run on EL6
+__requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
+import pkg_resources
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+try:
+    import pkgdb2
+except ImportError:
+    import sys
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    import pkgdb2
+
+import pkgdb2.lib
+import pkgdb2.lib.search
+from pkgdb2.lib import model
+
+
+# Words the synthetic package names and summaries are made of
+WORDS = ['python', 'perl', 'ruby', 'gnome', 'kde', 'qt', 'gtk', 'xml',
+         'http', 'json', 'fonts', 'devel', 'tools', 'utils', 'libs']
+
+# The searches timed: (label, pattern, keyword arguments)
+SEARCHES = [
+    ('prefix', 'python-g*', {}),
+    ('infix', '*json*', {}),
+    ('selective infix', '*1234*', {}),
+    ('case insensitive', '*JSON*', {'case_sensitive': False}),
+    ('summary', '*library for json*', {'mode': 'summary'}),
+    ('ranked', '*json*', {'rank': True}),
+]
+
+
+def get_arguments():
+    ''' Set the command line parser and retrieve the arguments provided
+    by the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the search of packages')
+    parser.add_argument(
+        '--packages', dest='packages', type=int, default=20000,
+        help='Number of packages to search (default: 20000)')
+    parser.add_argument(
+        '--runs', dest='runs', type=int, default=10,
+        help='Number of times each search is run (default: 10)')
+    parser.add_argument(
+        '--db-url', dest='db_url', default=None,
+        help='URL of the empty database to use (default: a temporary '
+        'sqlite database)')
+
+    return parser.parse_args()
+
+
+def fill_database(session, nb_packages):
+    ''' Create the `master` collection with the specified number of
+    packages.
+    '''
+    session.add(model.Collection(
+        name='Fedora',
+        version='devel',
+        status='Under Development',
+        owner='admin',
+        branchname='master',
+        dist_tag='.fc22',
+    ))
+    session.commit()
+    master = model.Collection.by_name(session, 'master')
+
+    packages = []
+    for cnt in range(nb_packages):
+        first = WORDS[cnt % len(WORDS)]
+        second = WORDS[(cnt // len(WORDS)) % len(WORDS)]
+        packages.append(dict(
+            name='%s-%s-%05d' % (first, second, cnt),
+            summary='A %s library for %s' % (first, second),
+            description='Synthetic package %s' % cnt,
+            review_url=None,
+            upstream_url=None,
+            status='Approved'))
+    session.execute(model.Package.__table__.insert(), packages)
+
+    session.execute(
+        model.PackageListing.__table__.insert().from_select(
+            ['package_id', 'point_of_contact', 'collection_id', 'status',
+             'critpath', 'status_change'],
+            session.query(
+                model.Package.id,
+                sa.literal('admin'),
+                sa.literal(master.id),
+                sa.literal('Approved'),
+                sa.literal(False),
+                sa.literal(datetime.datetime.utcnow(), sa.DateTime),
+            ).subquery().select()
+        )
+    )
+    session.commit()
+
+
+def main():
+    ''' Fill a database with synthetic packages and time searching them
+    with each backend available.
+    '''
+    args = get_arguments()
+
+    db_url = args.db_url
+    if db_url is None:
+        dbfile = tempfile.NamedTemporaryFile(
+            prefix='pkgdb2_benchmark_', suffix='.sqlite', delete=False)
+        dbfile.close()
+        db_url = 'sqlite:///%s' % dbfile.name
+
+    if db_url.startswith('postgres'):
+        # The trigram indexes are only created if the extension is there
+        engine = sa.create_engine(db_url)
+        engine.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        engine.dispose()
+
+    session = model.create_tables(db_url)
+    print 'Creating %s packages in %s' % (args.packages, db_url)
+    fill_database(session, args.packages)
+
+    detected = pkgdb2.lib.search.detect_backend(session.get_bind())
+    backends = ['like']
+    if detected.name != 'like':
+        backends.append(detected.name)
+
+    print '%-18s %s' % ('', ''.join('%12s' % name for name in backends))
+    for label, pattern, kwargs in SEARCHES:
+        results = []
+        for name in backends:
+            pkgdb2.APP.config['PKGDB2_SEARCH_BACKEND'] = name
+            start = time.time()
+            for _ in range(args.runs):
+                found = pkgdb2.lib.search_package(
+                    session, pattern, limit=50, **kwargs)
+            duration = (time.time() - start) / args.runs
+            results.append('%9.1f ms' % (duration * 1000))
+            session.rollback()
+        print '%-18s %s   (%s found)' % (
+            label, ''.join('%12s' % res for res in results), len(found))
+
+    if args.db_url is None:
+        os.unlink(dbfile.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -262,6 +262,8 @@ def main(db_url_pkgdb1, db_url_pkgdb2):
     convert_packages(pkg1_sess, pkg2_sess)
     convert_packagelisting(pkg1_sess, pkg2_sess)
     convert_packagelistingacl(pkg1_sess, pkg2_sess)
+    model.PackageAclSnapshot.refresh(pkg2_sess)
+    pkg2_sess.commit()
     pkg1_sess.close()
     pkg2_sess.close()
 
@@ -82,6 +82,9 @@ install -m 644 utility/pkgdb2.cfg.sample $RPM_BUILD_ROOT/%{_sysconfdir}/pkgdb2/p
 
 mkdir -p $RPM_BUILD_ROOT/%{_datadir}/pkgdb2
 
+# Directory storing the state of the components pushed to bugzilla
+mkdir -p $RPM_BUILD_ROOT/%{_localstatedir}/cache/pkgdb2
+
 # Install WSGI file
 install -m 644 utility/pkgdb2.wsgi $RPM_BUILD_ROOT/%{_datadir}/pkgdb2/pkgdb2.wsgi
 
@@ -103,11 +106,14 @@ install -m 644 utility/alembic.ini $RPM_BUILD_ROOT/%{_sysconfdir}/pkgdb2/alembic
 %config(noreplace) %{_sysconfdir}/pkgdb2/alembic.ini
 %dir %{_sysconfdir}/pkgdb2/
 %{_datadir}/pkgdb2/
+%dir %{_localstatedir}/cache/pkgdb2/
 %{python_sitelib}/pkgdb2/
 %{python_sitelib}/%{name}*.egg-info
 %{_bindir}/pkgdb2_branch.py
 %{_bindir}/update_package_info.py
 %{_bindir}/pkgdb-sync-bugzilla
+%{_bindir}/pkgdb2_dispatch_notifications.py
+%{_bindir}/pkgdb2_bugzilla_jobs.py
 
 
 %changelog
@@ -95,6 +95,10 @@ def get_arguments():
     parser.add_argument(
         '--nomail', dest='nomail', action='store_true', default=False,
         help='Print the repo instead of sending it by email')
+    parser.add_argument(
+        '--bulk', dest='bulk', action='store_true', default=False,
+        help='Branch all the packages at once in a single transaction '
+        'instead of one package at a time')
 
     return parser.parse_args()
 
@@ -118,6 +122,7 @@ def main():
             clt_from='master',
             clt_to=args.new_branch,
             user=user,
+            bulk=args.bulk,
         )
     except pkgdb2.lib.PkgdbException, err:
         print err
@@ -125,7 +130,7 @@ def main():
 
     try:
         pkgdb2.SESSION.commit()
-    except SQLAlchemyError. err:
+    except SQLAlchemyError, err:
         print err
         return 1
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions
+# of the GNU General Public License v.2, or (at your option) any later
+# version.  This program is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY expressed or implied, including the
+# implied warranties of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.  You
+# should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# Any Red Hat trademarks that are incorporated in the source
+# code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission
+# of Red Hat, Inc.
+#
+
+'''
+Script reassigning the bugzilla bugs of the packages which changed owner,
+as queued in the database when ``PKGDB2_BUGZILLA_JOBS`` is set.
+
+It runs until interrupted, unless ``--once`` is specified, and can also
+report the number of jobs in each status with ``--status``. Only one
+instance of this script should run at a time.
+'''
+
+## These two lines are needed to run on EL6
+__requires__ = ['SQLAlchemy >= 0.7', 'jinja2 >= 2.4']
+import pkg_resources
+
+import argparse
+import os
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+
+if 'PKGDB2_CONFIG' not in os.environ \
+        and os.path.exists('/etc/pkgdb2/pkgdb2.cfg'):
+    print 'Using configuration file `/etc/pkgdb2/pkgdb2.cfg`'
+    os.environ['PKGDB2_CONFIG'] = '/etc/pkgdb2/pkgdb2.cfg'
+
+
+try:
+    import pkgdb2
+except ImportError:
+    import sys
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    import pkgdb2
+
+import pkgdb2.lib.bugzilla_jobs as bugzilla_jobs
+from pkgdb2.lib import model
+
+
+def get_arguments():
+    ''' Set the command line parser and retrieve the arguments provided
+    by the command line.
+    '''
+    parser = argparse.ArgumentParser(description='pkgdb2_bugzilla_jobs')
+    parser.add_argument(
+        '--status', dest='status', action='store_true', default=False,
+        help='Print the number of jobs in each status and exit')
+    parser.add_argument(
+        '--once', dest='once', action='store_true', default=False,
+        help='Exit once all the jobs pending have been run')
+    parser.add_argument(
+        '--interval', dest='interval', type=float, default=5,
+        help='Number of seconds to wait for new jobs when the queue is '
+        'empty (defaults to 5)')
+
+    return parser.parse_args()
+
+
+def print_status():
+    ''' Print the number of jobs in each status. '''
+    stats = model.BugzillaJob.get_stats(pkgdb2.SESSION)
+    pkgdb2.SESSION.commit()
+    for status in ('Pending', 'Done', 'Failed'):
+        print '%s: %s' % (status, stats[status])
+
+
+def main():
+    ''' Run the jobs queued, batch after batch. '''
+    args = get_arguments()
+
+    if args.status:
+        print_status()
+        return 0
+
+    batch_size = pkgdb2.APP.config.get('PKGDB2_BUGZILLA_BATCH_SIZE', 50)
+    while True:
+        try:
+            jobs = bugzilla_jobs.run_pending(
+                pkgdb2.SESSION, limit=batch_size)
+            pkgdb2.SESSION.commit()
+        except SQLAlchemyError, err:
+            pkgdb2.SESSION.rollback()
+            print err
+            return 1
+
+        for job in jobs:
+            print 'Job %s: %s, %s bugs reassigned%s' % (
+                job.id, job.status, job.bugs,
+                ' (%s)' % job.error if job.error else '')
+
+        if len(jobs) < batch_size:
+            # The queue is empty
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+    return 0
+
+
+if __name__ == '__main__':
+    main()